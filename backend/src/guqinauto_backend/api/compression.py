@@ -0,0 +1,154 @@
+"""
+响应压缩（gzip / brotli）：按 `Accept-Encoding` 协商，带大小阈值。
+
+定位：
+- score view、stage1 候选列表、stage2 方案都是高度重复的 JSON/MessagePack，动辄数 MB；
+  编辑器经常跑在远程链路上，传输时间占主导，压缩收益远大于 CPU 开销。
+- 两个入口：
+  - `CompressionMiddleware`：对所有路由的可压缩响应（JSON/MessagePack）按需压缩
+  - `negotiate_content_encoding` + `compress_body`：revision-keyed 路由自己压缩并缓存压缩后的 body
+    （响应已带 Content-Encoding，中间件不会重复处理）
+
+约束：
+- brotli 是可选依赖（`brotli`）；未安装时只协商 gzip，不影响其他行为。
+- 低于阈值的 body 不压缩（压缩头开销 + CPU 不划算）。
+- 原始 MusicXML（sendfile）不在可压缩类型内：那条路由依赖 304 再验证而不是压缩。
+"""
+
+from __future__ import annotations
+
+import gzip
+from typing import Literal
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # 可选依赖
+    import brotli  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - 取决于部署环境
+    brotli = None
+
+
+ContentCoding = Literal["br", "gzip"]
+
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 5 左右是 br 的“在线压缩”甜点：压缩率明显优于 gzip，耗时接近 gzip -6
+
+COMPRESSIBLE_MEDIA_TYPES = frozenset({"application/json", "application/msgpack"})
+
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+
+def negotiate_content_encoding(accept_encoding: str | None) -> ContentCoding | None:
+    """选择内容编码：优先 br（若可用且被接受），其次 gzip；都不接受则返回 None（identity）。"""
+
+    if not accept_encoding:
+        return None
+    q_by_coding: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        items = [x.strip() for x in part.split(";")]
+        coding = items[0].lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in items[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        q_by_coding[coding] = q
+
+    star = q_by_coding.get("*")
+
+    def accepted(coding: str) -> float:
+        q = q_by_coding.get(coding)
+        if q is None and coding == "gzip":
+            q = q_by_coding.get("x-gzip")
+        if q is None:
+            q = star
+        return q or 0.0
+
+    br_q = accepted("br") if brotli_available() else 0.0
+    gzip_q = accepted("gzip")
+    if br_q > 0.0 and br_q >= gzip_q:
+        return "br"
+    if gzip_q > 0.0:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, coding: ContentCoding) -> bytes:
+    if coding == "gzip":
+        # mtime=0：同一输入得到同一输出（便于缓存与比较）
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if coding == "br":
+        if brotli is None:
+            raise ValueError("brotli 未安装")
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    raise ValueError(f"未知 content coding：{coding!r}")
+
+
+def should_compress(body: bytes) -> bool:
+    return len(body) >= MIN_COMPRESS_BYTES
+
+
+class CompressionMiddleware:
+    """ASGI 中间件：缓冲可压缩类型的响应 body，超过阈值时按协商结果压缩。"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate_content_encoding(Headers(scope=scope).get("accept-encoding"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message | None = None
+        passthrough = False
+        chunks: list[bytes] = []
+
+        async def wrapped_send(message: Message) -> None:
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = (headers.get("content-type") or "").split(";")[0].strip().lower()
+                if (
+                    "content-encoding" in headers
+                    or media_type not in COMPRESSIBLE_MEDIA_TYPES
+                    or message["status"] in (204, 304)
+                    or message["status"] < 200
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            assert start_message is not None
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(scope=start_message)
+            headers.add_vary_header("Accept-Encoding")
+            if should_compress(body):
+                body = compress_body(body, coding)
+                headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, wrapped_send)
@@ -0,0 +1,96 @@
+"""
+API 响应编码：orjson（默认）与 MessagePack（按 `Accept` 显式 opt-in）。
+
+定位：
+- 大 payload 的路由直接返回已编码的 `Response`，绕过 FastAPI 的 `jsonable_encoder`/response_model 二次遍历。
+- 编码选择只看 `Accept`：
+  - 默认（含缺省/`*/*`/`application/json`）→ JSON（orjson）
+  - `application/msgpack`（或 `application/x-msgpack`）的 q 值严格高于 JSON → MessagePack
+
+约束：
+- MessagePack 是可选依赖（`msgpack`）。未安装时：若客户端仍接受 JSON 则返回 JSON；
+  若客户端只接受 MessagePack，则 406 明确失败（不静默换格式）。
+"""
+
+from __future__ import annotations
+
+from typing import Any, Literal
+
+import orjson
+
+try:  # 可选依赖
+    import msgpack  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - 取决于部署环境
+    msgpack = None
+
+
+Encoding = Literal["json", "msgpack"]
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+MEDIA_TYPE_BY_ENCODING: dict[Encoding, str] = {"json": JSON_MEDIA_TYPE, "msgpack": MSGPACK_MEDIA_TYPE}
+
+
+class NotAcceptableError(ValueError):
+    """客户端 Accept 中没有任何可提供的表示。"""
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def _parse_accept(accept: str) -> list[tuple[str, float]]:
+    out: list[tuple[str, float]] = []
+    for part in accept.split(","):
+        items = [x.strip() for x in part.split(";")]
+        media = items[0].lower()
+        if not media:
+            continue
+        q = 1.0
+        for param in items[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        out.append((media, q))
+    return out
+
+
+def negotiate_encoding(accept: str | None) -> Encoding:
+    """根据 Accept 选择编码（见模块说明）。"""
+
+    if not accept:
+        return "json"
+    ranges = _parse_accept(accept)
+    if not ranges:
+        return "json"
+
+    json_q = 0.0
+    msgpack_q = 0.0
+    for media, q in ranges:
+        if media in ("application/json", "application/*", "*/*"):
+            json_q = max(json_q, q)
+        if media in _MSGPACK_ALIASES:
+            msgpack_q = max(msgpack_q, q)
+
+    if msgpack_q > json_q and msgpack_available():
+        return "msgpack"
+    if json_q > 0.0:
+        return "json"
+    if msgpack_q > 0.0:
+        raise NotAcceptableError("客户端只接受 MessagePack，但服务端未安装 msgpack")
+    raise NotAcceptableError(f"不支持的 Accept：{accept!r}（可用：{JSON_MEDIA_TYPE}, {MSGPACK_MEDIA_TYPE}）")
+
+
+def encode_payload(payload: Any, encoding: Encoding) -> bytes:
+    if encoding == "json":
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise NotAcceptableError("服务端未安装 msgpack")
+        return msgpack.packb(payload, use_bin_type=True)
+    raise ValueError(f"未知 encoding：{encoding!r}")
+
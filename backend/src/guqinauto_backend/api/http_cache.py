@@ -0,0 +1,70 @@
+"""
+HTTP 条件请求（ETag / If-None-Match）工具。
+
+定位：
+- revision 是不可变快照（见 infra/workspace.py）：同一 (project_id, revision) 的 MusicXML 永不改变。
+  因此 ETag 可以直接由 revision 派生，无需读取/哈希文件内容。
+- 这里只放与 HTTP 语义相关的纯函数；路由本身仍在 server.py。
+- /score、/status 这类只依赖 (revision, tuning, 项目元数据) 的视图同样适用：
+  ETag 由 revision + 输入指纹派生，序列化后的 body 放进进程内缓存（见 `ResponseCache`）。
+
+约束：
+- ETag 一律为强校验器（不带 `W/`）；If-None-Match 按 RFC 9110 使用弱比较（忽略 `W/` 前缀）。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+
+from ..utils.ttl_lru import TtlLruCache
+
+
+# ETag -> 已序列化的响应 body（bytes）。ETag 已经编码了全部输入，因此可直接当缓存 key。
+ResponseCache = TtlLruCache[str, bytes]
+
+
+def new_response_cache(*, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024) -> ResponseCache:
+    return TtlLruCache(max_entries=max_entries, max_weight=max_bytes, weigh=len)
+
+
+def input_fingerprint(obj: Any) -> str:
+    """JSON 可序列化输入的稳定短指纹（用于 ETag variant / 缓存 key）。"""
+
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def revision_etag(project_id: str, revision: str, *, variant: str | None = None) -> str:
+    """由 (project_id, revision[, variant]) 派生强 ETag（带双引号）。
+
+    variant 用于区分同一 revision 的不同表示（例如不同 endpoint / 不同 tuning）。
+    """
+
+    if not project_id or not revision:
+        raise ValueError("project_id/revision 不能为空")
+    tag = f"{project_id}.{revision}"
+    if variant:
+        tag += f".{variant}"
+    if '"' in tag:
+        raise ValueError(f"ETag 不允许包含双引号：{tag!r}")
+    return f'"{tag}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match 是否命中（弱比较；支持 `*` 与逗号分隔的多个 ETag）。"""
+
+    if not if_none_match:
+        return False
+    value = if_none_match.strip()
+    if value == "*":
+        return True
+    want = etag[2:] if etag.startswith("W/") else etag
+    for part in value.split(","):
+        tag = part.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == want:
+            return True
+    return False
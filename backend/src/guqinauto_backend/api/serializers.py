@@ -0,0 +1,200 @@
+"""
+API 响应的预编译序列化器（dataclass → JSON/MessagePack 可编码的 dict）。
+
+定位：
+- `dataclasses.asdict` 会对每个字段递归 deepcopy（包括 staff1_notes/staff2_kv 等已是 dict/list 的字段），
+  对大型 score view / stage1 / stage2 payload 来说这部分开销与计算本身相当。
+- 这里按 dataclass 字段在导入时生成一次“字段直取”的序列化函数（exec 编译），运行时只做浅层构造：
+  dict/list 字段按引用放入输出，由编码器（orjson/msgpack）直接读取。
+
+约束：
+- 输出结构必须与 `asdict` 完全一致（前端契约不变）；tuple 字段保持 tuple（编码器按数组输出）。
+- 输出引用了原对象内部的 dict/list：调用方不得修改序列化结果。
+"""
+
+from __future__ import annotations
+
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable
+
+from ..domain.musicxml_profile_v0_2 import ProjectScoreEvent, ProjectScoreMeasure, ProjectScoreTime, ProjectScoreView
+from ..engines.position_engine import PositionCandidate
+from ..engines.stage1 import Stage1Result
+from ..engines.stage2_optimizer import (
+    AnytimeStats,
+    BeamStats,
+    EventMarginals,
+    EventScore,
+    MinMarginals,
+    PathScore,
+    RankedPath,
+    Solution,
+    StreamStep,
+)
+from ..infra.workspace import ProjectMeta, ProjectTuning
+
+
+Serializer = Callable[[Any], dict[str, Any]]
+
+
+def compile_dataclass_serializer(
+    cls: type,
+    *,
+    nested: dict[str, Serializer] | None = None,
+    nested_lists: dict[str, Serializer] | None = None,
+) -> Serializer:
+    """为 dataclass 生成字段直取的序列化函数。
+
+    - nested：字段值是（可为 None 的）dataclass，用给定序列化器展开
+    - nested_lists：字段值是 dataclass 列表，逐项用给定序列化器展开
+    - 其余字段按引用输出（要求本身已可编码：str/int/float/None/dict/list/tuple）
+    """
+
+    if not is_dataclass(cls):
+        raise TypeError(f"不是 dataclass：{cls!r}")
+    nested = dict(nested or {})
+    nested_lists = dict(nested_lists or {})
+    names = [f.name for f in fields(cls)]
+    unknown = (set(nested) | set(nested_lists)) - set(names)
+    if unknown:
+        raise ValueError(f"{cls.__name__} 不存在字段：{sorted(unknown)!r}")
+
+    env: dict[str, Any] = {}
+    items: list[str] = []
+    for name in names:
+        if name in nested:
+            env[f"_s_{name}"] = nested[name]
+            items.append(f"{name!r}: (None if o.{name} is None else _s_{name}(o.{name}))")
+        elif name in nested_lists:
+            env[f"_s_{name}"] = nested_lists[name]
+            items.append(f"{name!r}: [_s_{name}(x) for x in o.{name}]")
+        else:
+            items.append(f"{name!r}: o.{name}")
+    fn_name = f"serialize_{cls.__name__}"
+    src = f"def {fn_name}(o):\n    return {{{', '.join(items)}}}\n"
+    exec(compile(src, f"<serializer {cls.__name__}>", "exec"), env)  # noqa: S102 - 源码完全由字段名生成
+    return env[fn_name]
+
+
+serialize_project_tuning = compile_dataclass_serializer(ProjectTuning)
+serialize_project_meta = compile_dataclass_serializer(ProjectMeta, nested={"tuning": serialize_project_tuning})
+
+_serialize_score_event = compile_dataclass_serializer(ProjectScoreEvent)
+_serialize_score_time = compile_dataclass_serializer(ProjectScoreTime)
+_serialize_score_measure = compile_dataclass_serializer(
+    ProjectScoreMeasure,
+    nested={"time": _serialize_score_time},
+    nested_lists={"events": _serialize_score_event},
+)
+serialize_score_view = compile_dataclass_serializer(ProjectScoreView, nested_lists={"measures": _serialize_score_measure})
+
+
+def _serialize_choice(choice: Any) -> Any:
+    return serialize_stage1_candidate(choice) if isinstance(choice, PositionCandidate) else choice
+
+
+def serialize_assignment(a: dict[str, Any]) -> dict[str, Any]:
+    """stage2 assignment → API 结构：类型化候选（PositionCandidate）在这里才转成 stage1 候选 dict。"""
+
+    if "choice" in a:
+        return {"eid": a["eid"], "choice": _serialize_choice(a["choice"])}
+    return {"eid": a["eid"], "choices": [{"slot": it["slot"], "choice": _serialize_choice(it["choice"])} for it in a["choices"]]}
+
+
+serialize_solution = compile_dataclass_serializer(Solution, nested_lists={"assignments": serialize_assignment})
+serialize_beam_stats = compile_dataclass_serializer(BeamStats)
+serialize_anytime_stats = compile_dataclass_serializer(AnytimeStats)
+serialize_min_marginals = compile_dataclass_serializer(
+    MinMarginals, nested_lists={"events": compile_dataclass_serializer(EventMarginals)}
+)
+serialize_path_score = compile_dataclass_serializer(
+    PathScore, nested_lists={"events": compile_dataclass_serializer(EventScore, nested={"assignment": serialize_assignment})}
+)
+serialize_stream_step = compile_dataclass_serializer(
+    StreamStep, nested_lists={"decided": serialize_assignment, "tentative": serialize_assignment}
+)
+serialize_ranked_path = compile_dataclass_serializer(RankedPath)
+
+
+def serialize_solution_pool(pool: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """惰性解集的候选池：每个事件只输出一次 eid，候选只保留 choice/choices（解按下标引用）。"""
+
+    out: list[dict[str, Any]] = []
+    for ev in pool:
+        cands: list[dict[str, Any]] = []
+        for a in ev["candidates"]:
+            sa = serialize_assignment(a)
+            cands.append({"choice": sa["choice"]} if "choice" in sa else {"choices": sa["choices"]})
+        out.append({"eid": ev["eid"], "candidates": cands})
+    return out
+
+
+# stage1 候选的 source 元信息只取决于 technique（harmonic 额外带 n），预先构造常量避免逐条拼装。
+_STAGE1_SOURCE_BY_TECHNIQUE: dict[str, dict[str, Any]] = {
+    "open": {"method": "open_string"},
+    "press": {"method": "12tet_press"},
+}
+_STAGE1_POS_SOURCE_BY_TECHNIQUE: dict[str, str | None] = {
+    "open": None,
+    "press": "pos_ratio=12tet; hui_real=table",
+    "harmonic": "pos_ratio=k/n; hui_real=interp_from_press_table",
+}
+
+
+def serialize_stage1_candidate(c: PositionCandidate) -> dict[str, Any]:
+    """PositionCandidate → stage1 API 结构（保持层次清晰，便于前端消费）。"""
+
+    technique = c.technique
+    if technique == "harmonic":
+        source: dict[str, Any] = {"method": "natural_harmonic", "harmonic_n": c.harmonic_n}
+    else:
+        source = _STAGE1_SOURCE_BY_TECHNIQUE.get(technique) or {"method": "unknown"}
+    out: dict[str, Any] = {
+        "string": c.string,
+        "technique": technique,
+        "pitch_midi": c.pitch_midi,
+        "d_semitones_from_open": c.d_semitones_from_open,
+        "pos": {"pos_ratio": c.pos_ratio, "hui_real": c.hui_real, "source": _STAGE1_POS_SOURCE_BY_TECHNIQUE.get(technique)},
+        "temperament": c.temperament,
+        "harmonic_n": c.harmonic_n,
+        "harmonic_k": c.harmonic_k,
+        "cents_error": c.cents_error,
+        "source": source,
+    }
+    if c.harmonic_nodes is not None:
+        # 分组泛音：只在分组时出现（未分组的输出结构不变）
+        out["harmonic_nodes"] = [{"k": x.k, "pos_ratio": x.pos_ratio, "hui_real": x.hui_real} for x in c.harmonic_nodes]
+    return out
+
+
+def serialize_stage1_result(
+    result: Stage1Result,
+    *,
+    project_id: str,
+    revision: str,
+    tuning: dict[str, Any],
+    options: dict[str, Any],
+    include_errors: bool,
+) -> dict[str, Any]:
+    """Stage1Result → stage1 API 结构（只在 HTTP 边界调用）。"""
+
+    events: list[dict[str, Any]] = []
+    for e in result.events:
+        targets = [
+            {
+                "slot": t.slot,
+                "target_pitch": {"midi": t.target_midi},
+                "candidates": [serialize_stage1_candidate(c) for c in t.candidates],
+                **({"errors": list(t.errors)} if include_errors else {}),
+            }
+            for t in e.targets
+        ]
+        events.append({"eid": e.eid, "targets": targets})
+    return {
+        "project_id": project_id,
+        "revision": revision,
+        "tuning": tuning,
+        "options": options,
+        "events": events,
+        "warnings": list(result.warnings),
+    }
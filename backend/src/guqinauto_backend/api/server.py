@@ -12,12 +12,17 @@ API 设计原则：
 
 from __future__ import annotations
 
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import asdict
-from typing import Any
+from typing import Any, Callable
 
 from fastapi import FastAPI, HTTPException
-from fastapi import File, Form, UploadFile
+from fastapi import File, Form, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from pydantic import BaseModel, Field
 
 from ..domain.musicxml_profile_v0_2 import EditOp, apply_edit_ops, build_score_view
@@ -25,7 +30,45 @@ from ..domain.musicxml_staff1_pitch import PitchValue, Staff1PitchAssignment, ap
 from ..domain.jianpu_pitch_compiler import compile_degree_to_pitch, parse_degree
 from ..domain.pitch import MusicXmlPitch
 from ..engines.position_engine import PositionEngine, PositionEngineOptions
+from ..engines.stage1 import Stage1PitchUnresolved, Stage1Result, run_stage1, stage1_event
+from ..engines.stage2_optimizer import IncrementalTopK, SolutionEnumerator, Stage2Infeasible, StreamingTop1, Weights, Window
+from ..domain.guqin_fingering_pitch import read_fingering_v0_3
 from ..domain.status import compute_status, status_to_dict
+from .compression import CompressionMiddleware, compress_body, negotiate_content_encoding, should_compress
+from .encoding import MEDIA_TYPE_BY_ENCODING, Encoding, NotAcceptableError, encode_payload, negotiate_encoding
+from .http_cache import etag_matches, input_fingerprint, new_response_cache, revision_etag
+from .serializers import (
+    serialize_anytime_stats,
+    serialize_assignment,
+    serialize_beam_stats,
+    serialize_min_marginals,
+    serialize_path_score,
+    serialize_project_meta,
+    serialize_ranked_path,
+    serialize_score_view,
+    serialize_solution,
+    serialize_solution_pool,
+    serialize_stream_step,
+)
+from .sessions import (
+    STAGE2_RESULT_MAX_RANK,
+    Stage1Session,
+    Stage2CachedSolve,
+    Stage2ResultSet,
+    Stage2Stream,
+    new_stage1_session_cache,
+    new_stage2_optimum_cache,
+    new_stage2_result_cache,
+    new_stage2_solution_cache,
+    new_stage2_solver_cache,
+    new_stage2_stream_cache,
+    new_stage2_stream_id,
+    stage1_handle,
+    stage2_optimum_key,
+    stage2_result_handle,
+    stage2_result_rank_limit,
+    stage2_solution_key,
+)
 from ..infra.workspace import (
     ProjectMeta,
     ProjectTuning,
@@ -34,12 +77,14 @@ from ..infra.workspace import (
     list_projects,
     load_project_meta,
     load_revision_bytes,
+    revision_path,
     save_project_meta,
     save_new_revision,
 )
 
 
-app = FastAPI(title="GuqinAuto Backend", version="0.1.0")
+# 小 payload 路由也走 orjson；大 payload 路由直接返回已编码的 Response（见 `_encoded_response`）
+app = FastAPI(title="GuqinAuto Backend", version="0.1.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -47,7 +92,55 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 浏览器跨域时需要显式暴露，前端才能读到 ETag/revision（用于条件请求与对齐 revision）
+    expose_headers=["ETag", "X-GuqinAuto-Revision"],
 )
+# gzip/brotli（按 Accept-Encoding 协商；revision-keyed 路由自行压缩并缓存压缩后的 body）
+app.add_middleware(CompressionMiddleware)
+
+MUSICXML_MEDIA_TYPE = "application/vnd.recordare.musicxml+xml"
+
+# /score、/status 的序列化（及压缩后）响应缓存（key=ETag；revision 不可变，因此无需 TTL）
+_RESPONSE_CACHE = new_response_cache()
+# stage1 会话（候选图），供 stage2 复用
+_STAGE1_SESSIONS = new_stage1_session_cache()
+# stage2 增量求解器（前向/后向 Top-K 表），按 (项目, tuning, stage1 options, weights, k) 复用
+_STAGE2_SOLVERS = new_stage2_solver_cache()
+# stage2 Top-K 结果（同一 stage1 会话 + locks/偏好/window/k/solver 的重复请求直接复用）
+_STAGE2_SOLUTIONS = new_stage2_solution_cache()
+# stage2 最优代价（全曲、无 lock、精确求解），供给定指法打分报告差距
+_STAGE2_OPTIMA = new_stage2_optimum_cache()
+# stage2 流式会话（逐音输入的在线 Viterbi），按随机 stream_id 存取
+_STAGE2_STREAMS = new_stage2_stream_cache()
+# stage2 惰性解集（分页枚举），按 (stage1 会话, locks, weights, window) 派生的 handle 复用
+_STAGE2_RESULTS = new_stage2_result_cache()
+# stage2 段并行的进程池（首次需要时创建；spawn 避免在多线程服务进程里 fork）
+_STAGE2_POOL: ProcessPoolExecutor | None = None
+_STAGE2_POOL_LOCK = threading.Lock()
+# 段并行进程池的进程数上限：每个服务进程各有一个池，默认不按 CPU 数铺满；可用环境变量覆盖（正整数）
+STAGE2_POOL_WORKERS_ENV = "GUQINAUTO_STAGE2_WORKERS"
+STAGE2_POOL_DEFAULT_WORKERS = 4
+
+
+def stage2_pool_max_workers() -> int:
+    """段并行进程池的进程数：环境变量 `GUQINAUTO_STAGE2_WORKERS`，缺省为 min(4, CPU 数)；非法值明确失败。"""
+
+    raw = os.environ.get(STAGE2_POOL_WORKERS_ENV)
+    if raw is None:
+        return min(STAGE2_POOL_DEFAULT_WORKERS, os.cpu_count() or 1)
+    if not raw.strip().isdigit() or int(raw) <= 0:
+        raise RuntimeError(f"{STAGE2_POOL_WORKERS_ENV} 必须为正整数：{raw!r}")
+    return int(raw)
+
+
+def _stage2_executor() -> ProcessPoolExecutor:
+    global _STAGE2_POOL
+    with _STAGE2_POOL_LOCK:
+        if _STAGE2_POOL is None:
+            _STAGE2_POOL = ProcessPoolExecutor(
+                max_workers=stage2_pool_max_workers(), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _STAGE2_POOL
 
 
 class CreateProjectRequest(BaseModel):
@@ -75,6 +168,8 @@ class Stage1Options(BaseModel):
     include_harmonics: bool = False
     max_harmonic_n: int = Field(default=12, ge=2, le=32)
     max_harmonic_cents_error: float = Field(default=25.0, ge=0.0, le=100.0)
+    # 每个 (弦, n) 只输出一个泛音候选（节点列在 harmonic_nodes）；stage2 只展开离相邻事件最近的节点
+    group_harmonics: bool = False
     include_errors: bool = True
 
 
@@ -84,36 +179,62 @@ class Stage1Request(BaseModel):
     options: Stage1Options = Stage1Options()
 
 
-def _stage1_candidate_to_dict(c: Any) -> dict[str, Any]:
-    # PositionCandidate 序列化为 API 结构（保持层次清晰，便于前端消费）。
-    technique = c.technique
-    if technique == "open":
-        source = {"method": "open_string"}
-    elif technique == "press":
-        source = {"method": "12tet_press"}
-    elif technique == "harmonic":
-        source = {"method": "natural_harmonic", "harmonic_n": c.harmonic_n}
-    else:
-        source = {"method": "unknown"}
-
-    pos_source = None
-    if technique == "press":
-        pos_source = "pos_ratio=12tet; hui_real=table"
-    elif technique == "harmonic":
-        pos_source = "pos_ratio=k/n; hui_real=interp_from_press_table"
+def _negotiate(request: Request) -> Encoding:
+    try:
+        return negotiate_encoding(request.headers.get("accept"))
+    except NotAcceptableError as e:
+        raise HTTPException(status_code=406, detail=str(e)) from e
 
-    return {
-        "string": c.string,
-        "technique": technique,
-        "pitch_midi": c.pitch_midi,
-        "d_semitones_from_open": c.d_semitones_from_open,
-        "pos": {"pos_ratio": c.pos_ratio, "hui_real": c.hui_real, "source": pos_source},
-        "temperament": c.temperament,
-        "harmonic_n": c.harmonic_n,
-        "harmonic_k": c.harmonic_k,
-        "cents_error": c.cents_error,
-        "source": source,
-    }
+
+def _encoded_response(request: Request, payload: Any) -> Response:
+    """大 payload 的统一出口：按 Accept 选择 JSON/MessagePack，直接编码（不经 jsonable_encoder）。"""
+
+    encoding = _negotiate(request)
+    return Response(
+        content=encode_payload(payload, encoding),
+        media_type=MEDIA_TYPE_BY_ENCODING[encoding],
+        headers={"Vary": "Accept"},
+    )
+
+
+def _cached_response(request: Request, *, project_id: str, revision: str, variant: str, build: Callable[[], Any]) -> Response:
+    """revision-keyed 视图的统一出口：304 / 缓存命中只花一次元数据读取，未命中才 build + 序列化。"""
+
+    encoding = _negotiate(request)
+    coding = negotiate_content_encoding(request.headers.get("accept-encoding"))
+    # 不同编码是不同表示：ETag（也是缓存 key）必须区分；压缩后的 body 单独缓存，命中时无需重新压缩
+    tag = variant if encoding == "json" else f"{variant}.{encoding}"
+    etag = revision_etag(project_id, revision, variant=tag)
+    coded_etag = revision_etag(project_id, revision, variant=f"{tag}.{coding}") if coding is not None else None
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Accept, Accept-Encoding"}
+    inm = request.headers.get("if-none-match")
+    if coded_etag is not None and etag_matches(inm, coded_etag):
+        return Response(status_code=304, headers={**headers, "ETag": coded_etag})
+    if etag_matches(inm, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+
+    if coded_etag is not None:
+        coded = _RESPONSE_CACHE.get(coded_etag)
+        if coded is not None:
+            return Response(
+                content=coded,
+                media_type=MEDIA_TYPE_BY_ENCODING[encoding],
+                headers={**headers, "ETag": coded_etag, "Content-Encoding": coding},
+            )
+
+    body = _RESPONSE_CACHE.get(etag)
+    if body is None:
+        body = encode_payload(build(), encoding)
+        _RESPONSE_CACHE.put(etag, body)
+    if coded_etag is not None and should_compress(body):
+        coded = compress_body(body, coding)
+        _RESPONSE_CACHE.put(coded_etag, coded)
+        return Response(
+            content=coded,
+            media_type=MEDIA_TYPE_BY_ENCODING[encoding],
+            headers={**headers, "ETag": coded_etag, "Content-Encoding": coding},
+        )
+    return Response(content=body, media_type=MEDIA_TYPE_BY_ENCODING[encoding], headers={**headers, "ETag": etag})
 
 
 @app.get("/health")
@@ -121,6 +242,23 @@ def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def api_metrics() -> dict[str, Any]:
+    """进程内缓存统计（命中率/淘汰数等），用于观察缓存是否生效。"""
+
+    return {
+        "caches": {
+            "responses": _RESPONSE_CACHE.stats(),
+            "stage1_sessions": _STAGE1_SESSIONS.stats(),
+            "stage2_solvers": _STAGE2_SOLVERS.stats(),
+            "stage2_solutions": _STAGE2_SOLUTIONS.stats(),
+            "stage2_optima": _STAGE2_OPTIMA.stats(),
+            "stage2_streams": _STAGE2_STREAMS.stats(),
+            "stage2_results": _STAGE2_RESULTS.stats(),
+        }
+    }
+
+
 @app.get("/projects")
 def api_list_projects() -> list[dict[str, Any]]:
     return [asdict(p) for p in list_projects()]
@@ -135,9 +273,10 @@ def api_create_project(req: CreateProjectRequest) -> dict[str, Any]:
 
 @app.post("/projects/import_musicxml")
 async def api_import_musicxml(
+    request: Request,
     file: UploadFile = File(...),
     name: str | None = Form(default=None),
-) -> dict[str, Any]:
+) -> Response:
     """上传 MusicXML 并创建工程（严格校验 Profile，不做隐式补全）。"""
 
     raw = await file.read()
@@ -163,7 +302,7 @@ async def api_import_musicxml(
     meta = create_project_from_musicxml_bytes(name=project_name, musicxml_bytes=raw)
     xml_bytes = load_revision_bytes(meta.project_id, meta.current_revision)
     view = build_score_view(project_id=meta.project_id, revision=meta.current_revision, musicxml_bytes=xml_bytes)
-    return {"project": asdict(meta), "score": asdict(view)}
+    return _encoded_response(request, {"project": serialize_project_meta(meta), "score": serialize_score_view(view)})
 
 
 @app.get("/projects/{project_id}")
@@ -179,31 +318,82 @@ def api_get_musicxml(project_id: str) -> dict[str, Any]:
     return {"project_id": project_id, "revision": meta.current_revision, "musicxml": xml_bytes.decode("utf-8")}
 
 
-@app.get("/projects/{project_id}/score")
-def api_get_score(project_id: str) -> dict[str, Any]:
-    meta = load_project_meta(project_id)
-    xml_bytes = load_revision_bytes(project_id, meta.current_revision)
+def _musicxml_file_response(request: Request, *, project_id: str, revision: str, cache_control: str) -> Response:
+    """从 revision 快照直接 sendfile（不解码/不 JSON 转义）；If-None-Match 命中时返回 304。
+
+    先确认快照存在再派生/比较 ETag：不存在的工程或 revision 不能因 `If-None-Match: *` 得到 304。
+    """
+
     try:
-        view = build_score_view(project_id=project_id, revision=meta.current_revision, musicxml_bytes=xml_bytes)
-        return asdict(view)
+        path = revision_path(project_id, revision)
+        etag = revision_etag(project_id, revision, variant="musicxml")
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"MusicXML 不符合当前 Profile（无法解析为事件流）：{e}") from e
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"revision 不存在：{project_id}/{revision}") from e
+    headers = {"ETag": etag, "Cache-Control": cache_control, "X-GuqinAuto-Revision": revision}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=MUSICXML_MEDIA_TYPE, headers=headers, filename=f"{project_id}_{revision}.musicxml", content_disposition_type="inline")
+
+
+@app.get("/projects/{project_id}/musicxml/raw")
+def api_get_musicxml_raw(project_id: str, request: Request) -> Response:
+    """当前 revision 的原始 MusicXML（ETag 由 revision 派生；current 会随编辑前移，因此要求每次再验证）。"""
+
+    meta = load_project_meta(project_id)
+    return _musicxml_file_response(request, project_id=project_id, revision=meta.current_revision, cache_control="no-cache")
+
+
+@app.get("/projects/{project_id}/revisions/{revision}/musicxml")
+def api_get_revision_musicxml(project_id: str, revision: str, request: Request) -> Response:
+    """指定 revision 的原始 MusicXML（revision 不可变，可长期缓存）。"""
+
+    return _musicxml_file_response(
+        request,
+        project_id=project_id,
+        revision=revision,
+        cache_control="private, max-age=31536000, immutable",
+    )
+
+
+@app.get("/projects/{project_id}/score")
+def api_get_score(project_id: str, request: Request) -> Response:
+    # score view 只依赖 revision（不依赖 tuning/项目名等元数据）
+    meta = load_project_meta(project_id)
+
+    def build() -> dict[str, Any]:
+        xml_bytes = load_revision_bytes(project_id, meta.current_revision)
+        try:
+            view = build_score_view(project_id=project_id, revision=meta.current_revision, musicxml_bytes=xml_bytes)
+            return serialize_score_view(view)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"MusicXML 不符合当前 Profile（无法解析为事件流）：{e}") from e
+
+    return _cached_response(request, project_id=project_id, revision=meta.current_revision, variant="score", build=build)
 
 
 @app.get("/projects/{project_id}/status")
-def api_get_status(project_id: str) -> dict[str, Any]:
+def api_get_status(project_id: str, request: Request) -> Response:
+    # status 依赖 revision + tuning，且回显项目元数据：三者一起进入 ETag
     meta = load_project_meta(project_id)
-    xml_bytes = load_revision_bytes(project_id, meta.current_revision)
-    try:
-        view = build_score_view(project_id=project_id, revision=meta.current_revision, musicxml_bytes=xml_bytes)
-        status = compute_status(view, tuning=meta.tuning)
-        return {"project": asdict(meta), "status": status_to_dict(status)}
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"MusicXML 不符合当前 Profile（无法解析为事件流）：{e}") from e
+    meta_dict = serialize_project_meta(meta)
+
+    def build() -> dict[str, Any]:
+        xml_bytes = load_revision_bytes(project_id, meta.current_revision)
+        try:
+            view = build_score_view(project_id=project_id, revision=meta.current_revision, musicxml_bytes=xml_bytes)
+            status = compute_status(view, tuning=meta.tuning)
+            return {"project": meta_dict, "status": status_to_dict(status)}
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"MusicXML 不符合当前 Profile（无法解析为事件流）：{e}") from e
+
+    variant = f"status.{input_fingerprint(meta_dict)}"
+    return _cached_response(request, project_id=project_id, revision=meta.current_revision, variant=variant, build=build)
 
 
 @app.post("/projects/{project_id}/apply")
-def api_apply_edits(project_id: str, req: ApplyEditsRequest) -> dict[str, Any]:
+def api_apply_edits(project_id: str, req: ApplyEditsRequest, request: Request) -> Response:
     meta = load_project_meta(project_id)
     if meta.current_revision != req.base_revision:
         raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
@@ -241,7 +431,7 @@ def api_apply_edits(project_id: str, req: ApplyEditsRequest) -> dict[str, Any]:
         )
 
         view = build_score_view(project_id=project_id, revision=new_meta.current_revision, musicxml_bytes=new_xml_bytes)
-        return {"project": asdict(new_meta), "score": asdict(view)}
+        return _encoded_response(request, {"project": serialize_project_meta(new_meta), "score": serialize_score_view(view)})
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
@@ -263,7 +453,7 @@ class ResolvePitchRequest(BaseModel):
 
 
 @app.post("/projects/{project_id}/resolve_pitch")
-def api_resolve_pitch(project_id: str, req: ResolvePitchRequest) -> dict[str, Any]:
+def api_resolve_pitch(project_id: str, req: ResolvePitchRequest, request: Request) -> Response:
     meta = load_project_meta(project_id)
     if meta.current_revision != req.base_revision:
         raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
@@ -297,7 +487,7 @@ def api_resolve_pitch(project_id: str, req: ResolvePitchRequest) -> dict[str, An
         )
 
         view2 = build_score_view(project_id=project_id, revision=new_meta.current_revision, musicxml_bytes=new_xml_bytes)
-        return {"project": asdict(new_meta), "score": asdict(view2)}
+        return _encoded_response(request, {"project": serialize_project_meta(new_meta), "score": serialize_score_view(view2)})
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
@@ -319,7 +509,7 @@ class CompilePitchFromJianpuRequest(BaseModel):
 
 
 @app.post("/projects/{project_id}/compile_pitch_from_jianpu")
-def api_compile_pitch_from_jianpu(project_id: str, req: CompilePitchFromJianpuRequest) -> dict[str, Any]:
+def api_compile_pitch_from_jianpu(project_id: str, req: CompilePitchFromJianpuRequest, request: Request) -> Response:
     meta = load_project_meta(project_id)
     if meta.current_revision != req.base_revision:
         raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
@@ -372,7 +562,7 @@ def api_compile_pitch_from_jianpu(project_id: str, req: CompilePitchFromJianpuRe
         )
 
         view3 = build_score_view(project_id=project_id, revision=new_meta.current_revision, musicxml_bytes=new_xml_bytes)
-        return {"project": asdict(new_meta), "score": asdict(view3)}
+        return _encoded_response(request, {"project": serialize_project_meta(new_meta), "score": serialize_score_view(view3)})
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
@@ -391,116 +581,399 @@ class Stage2Preferences(BaseModel):
     cents_error: float = 0.01
 
 
+class Stage2Window(BaseModel):
+    """局部重优化窗口：只求解 [from_eid, to_eid]。
+
+    left/right：窗口前/后一个事件的固定选择（每项与 `Stage2Lock.fields` 同结构；chord 每个 slot 一项）。
+    给出时计入与该边界的衔接代价，且边界必须被收窄到唯一候选；省略则该侧不计衔接代价。
+    """
+
+    from_eid: str = Field(min_length=1)
+    to_eid: str = Field(min_length=1)
+    left: list[dict[str, Any]] | None = None
+    right: list[dict[str, Any]] | None = None
+
+
 class Stage2Request(BaseModel):
     base_revision: str
     k: int = Field(default=5, ge=1, le=50)
     tuning: Stage1Tuning | None = None
     stage1_options: Stage1Options = Stage1Options()
+    # stage1 会话 handle（来自 stage1/stage2 响应）；给出时直接复用其候选图
+    stage1_handle: str | None = None
     locks: list[Stage2Lock] = []
     preferences: Stage2Preferences = Stage2Preferences()
+    # 给出时只重优化窗口内事件；commit_best 也只写回窗口内事件
+    window: Stage2Window | None = None
+    # topk：Top-K 方案；marginals：每个事件每个候选的 min-marginal 代价（候选面板用，不可与 commit_best 同用）
+    mode: str = Field(default="topk", pattern="^(topk|marginals)$")
+    # exact：精确 DP；beam：每个事件只保留 beam_width 个状态（可选按 beam_threshold 再剪枝），延迟可预期但不保证最优
+    solver: str = Field(default="exact", pattern="^(exact|beam)$")
+    beam_width: int = Field(default=64, ge=1, le=5000)
+    beam_threshold: float | None = Field(default=None, ge=0.0)
+    # 时间预算（毫秒，仅 solver=exact）：greedy → beam → 精确 DP 逐级求解，返回预算内最好的结果与最优性/gap 上界
+    budget_ms: int | None = Field(default=None, ge=1, le=600_000)
+    # 精确 DP 前的 dominance 剪枝（仅 optimize_topk 路径）：on（默认）/off/verify（额外做不剪枝求解并比对，调试用）
+    prune: str = Field(default="on", pattern="^(off|on|verify)$")
     apply_mode: str = Field(default="none", pattern="^(none|commit_best)$")
     message: str | None = None
 
 
-@app.post("/projects/{project_id}/stage1")
-def api_stage1(project_id: str, req: Stage1Request) -> dict[str, Any]:
-    meta = load_project_meta(project_id)
-    if meta.current_revision != req.base_revision:
-        raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
+class Stage2ScoreRequest(BaseModel):
+    """给定指法（staff2 当前 v0.3 真值）的路径代价：只做线性打分，不求解。"""
 
-    xml_bytes = load_revision_bytes(project_id, meta.current_revision)
+    base_revision: str
+    tuning: Stage1Tuning | None = None
+    stage1_options: Stage1Options = Stage1Options()
+    stage1_handle: str | None = None
+    preferences: Stage2Preferences = Stage2Preferences()
+
+
+class Stage2StreamRequest(BaseModel):
+    """新建 stage2 流式会话（逐音输入）：tuning/stage1 options/偏好/lag 在会话内固定。"""
+
+    tuning: Stage1Tuning | None = None
+    stage1_options: Stage1Options = Stage1Options()
+    preferences: Stage2Preferences = Stage2Preferences()
+    # 固定延迟：第 i 个事件在第 i+lag 个事件输入后定稿（0 表示每个事件输入即定稿）
+    lag: int = Field(default=8, ge=0, le=256)
+
+
+class Stage2StreamNote(BaseModel):
+    slot: str | None = None
+    pitch: dict[str, Any]  # MusicXML pitch：{"step","alter","octave"}（与 score view 的 staff1_notes 同形）
+
+
+class Stage2StreamEvent(BaseModel):
+    eid: str = Field(min_length=1)
+    notes: list[Stage2StreamNote] = Field(min_length=1)
+    # 该事件的 lock fields（同 Stage2Lock.fields；可多条）
+    locks: list[dict[str, Any]] = []
+
+
+class Stage2StreamEventsRequest(BaseModel):
+    events: list[Stage2StreamEvent] = Field(min_length=1, max_length=1024)
+
+
+class Stage2ResultsRequest(BaseModel):
+    """按代价升序惰性枚举的 stage2 解集（不设 K 上限；解按候选下标编码，引用共享候选池）。"""
+
+    base_revision: str
+    tuning: Stage1Tuning | None = None
+    stage1_options: Stage1Options = Stage1Options()
+    stage1_handle: str | None = None
+    locks: list[Stage2Lock] = []
+    preferences: Stage2Preferences = Stage2Preferences()
+    window: Stage2Window | None = None
+    # 随创建响应一起返回的第一页条数（0 表示只返回 handle 与候选池）
+    limit: int = Field(default=10, ge=0, le=500)
+
+
+class Stage2BatchRequest(BaseModel):
+    """同一输入（revision/locks/window）下对多组偏好各求 Top-K（偏好对比用）。"""
+
+    base_revision: str
+    k: int = Field(default=5, ge=1, le=50)
+    tuning: Stage1Tuning | None = None
+    stage1_options: Stage1Options = Stage1Options()
+    stage1_handle: str | None = None
+    locks: list[Stage2Lock] = []
+    profiles: list[Stage2Preferences] = Field(min_length=1, max_length=64)
+    window: Stage2Window | None = None
+
+
+def _stage1_tuning(meta: ProjectMeta, tuning: Stage1Tuning | None) -> ProjectTuning:
+    return ProjectTuning.from_dict(tuning.model_dump() if tuning is not None else meta.tuning.to_dict())
+
+
+def _stage1_session(project_id: str, meta: ProjectMeta, tuning: Stage1Tuning | None, options: Stage1Options) -> Stage1Session:
+    """按 (project_id, revision, tuning, options) 取 stage1 会话；未命中才计算并登记。"""
+
+    project_tuning = _stage1_tuning(meta, tuning)
+    tuning_dict = project_tuning.to_dict()
+    options_dict = options.model_dump()
+    handle = stage1_handle(project_id=project_id, revision=meta.current_revision, tuning=tuning_dict, options=options_dict)
+    session = _STAGE1_SESSIONS.get(handle)
+    if session is not None:
+        return session
+
+    result = _run_stage1(project_id, meta.current_revision, project_tuning, options)
+    session = Stage1Session(
+        handle=handle,
+        project_id=project_id,
+        revision=meta.current_revision,
+        tuning=tuning_dict,
+        options=options_dict,
+        result=result,
+    )
+    _STAGE1_SESSIONS.put(handle, session)
+    return session
+
+
+def _position_engine(tuning: ProjectTuning, options: Stage1Options) -> tuple[PositionEngine, PositionEngineOptions]:
+    engine = PositionEngine(open_pitches_midi=list(tuning.open_pitches_midi), transpose_semitones=tuning.transpose_semitones)
+    opt = PositionEngineOptions(
+        temperament="equal" if options.temperament == "equal" else "just",
+        max_d_semitones=options.max_d_semitones,
+        include_harmonics=options.include_harmonics,
+        max_harmonic_n=options.max_harmonic_n,
+        max_harmonic_cents_error=options.max_harmonic_cents_error,
+        group_harmonics=options.group_harmonics,
+    )
+    return engine, opt
+
+
+def _run_stage1(project_id: str, revision: str, tuning: ProjectTuning, options: Stage1Options) -> Stage1Result:
+    xml_bytes = load_revision_bytes(project_id, revision)
     try:
-        view = build_score_view(project_id=project_id, revision=meta.current_revision, musicxml_bytes=xml_bytes)
+        view = build_score_view(project_id=project_id, revision=revision, musicxml_bytes=xml_bytes)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"MusicXML 不符合当前 Profile（无法解析为事件流）：{e}") from e
 
-    tuning_dict = req.tuning.model_dump() if req.tuning is not None else meta.tuning.to_dict()
-    tuning = ProjectTuning.from_dict(tuning_dict)
-    engine = PositionEngine(open_pitches_midi=list(tuning.open_pitches_midi), transpose_semitones=tuning.transpose_semitones)
-    opt = PositionEngineOptions(
-        temperament="equal" if req.options.temperament == "equal" else "just",
-        max_d_semitones=req.options.max_d_semitones,
-        include_harmonics=req.options.include_harmonics,
-        max_harmonic_n=req.options.max_harmonic_n,
-        max_harmonic_cents_error=req.options.max_harmonic_cents_error,
+    engine, opt = _position_engine(tuning, options)
+    try:
+        return run_stage1(view=view, engine=engine, options=opt)
+    except (Stage1PitchUnresolved, NotImplementedError) as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+def compute_stage1(project_id: str, req: Stage1Request) -> dict[str, Any]:
+    """stage1 的计算本体（返回 API 结构 dict）；HTTP 编码在 `api_stage1` 中完成。
+
+    结果登记为 stage1 会话：返回的 `stage1_handle` 可在 stage2 请求中复用（见 api/sessions.py）。
+    """
+
+    meta = load_project_meta(project_id)
+    if meta.current_revision != req.base_revision:
+        raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
+
+    session = _stage1_session(project_id, meta, req.tuning, req.options)
+    return {**session.payload(), "stage1_handle": session.handle}
+
+
+@app.post("/projects/{project_id}/stage1")
+def api_stage1(project_id: str, req: Stage1Request, request: Request) -> Response:
+    return _encoded_response(request, compute_stage1(project_id, req))
+
+
+def _resolve_stage1_session(
+    project_id: str, meta: ProjectMeta, req: Stage2Request | Stage2BatchRequest | Stage2ScoreRequest | Stage2ResultsRequest
+) -> Stage1Session:
+    if req.stage1_handle is None:
+        return _stage1_session(project_id, meta, req.tuning, req.stage1_options)
+
+    session = _STAGE1_SESSIONS.get(req.stage1_handle)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"stage1 会话不存在或已过期（请重新调用 stage1）：{req.stage1_handle}")
+    if session.project_id != project_id or session.revision != meta.current_revision:
+        raise HTTPException(
+            status_code=409,
+            detail=f"stage1 会话与当前项目/revision 不一致：session={session.project_id}@{session.revision} current={project_id}@{meta.current_revision}",
+        )
+    # handle 已确定 tuning/options；若请求同时显式给出，必须一致（不允许静默忽略其中一方）
+    if "tuning" in req.model_fields_set and _stage1_tuning(meta, req.tuning).to_dict() != session.tuning:
+        raise HTTPException(status_code=400, detail="stage1_handle 与请求中的 tuning 不一致")
+    if "stage1_options" in req.model_fields_set and req.stage1_options.model_dump() != session.options:
+        raise HTTPException(status_code=400, detail="stage1_handle 与请求中的 stage1_options 不一致")
+    return session
+
+
+def _solve_incremental(
+    project_id: str, session: Stage1Session, weights: Weights, k: int, locks: list[Any], *, prune: bool
+) -> list[Any]:
+    """用（或新建）增量求解器求解。
+
+    key 不含 revision：编辑产生新 revision 后，同一求解器会按事件比较新旧候选图，只重算变化的事件。
+    key 含 prune：结果逐位一致，但剪枝与否的表不同（prune=off 用于排查剪枝本身）。
+    求解后再登记：缓存按常驻表项数限重，表在求解时才建立。
+    """
+
+    key = input_fingerprint(
+        {
+            "project_id": project_id,
+            "tuning": session.tuning,
+            "options": session.options,
+            "weights": weights.__dict__,
+            "k": k,
+            "prune": prune,
+        }
     )
+    solver = _STAGE2_SOLVERS.get(key)
+    if solver is None:
+        solver = IncrementalTopK(graph=session.graph(), k=k, weights=weights, prune=prune)
+    sols = solver.solve(locks=locks, graph=session.graph())
+    _STAGE2_SOLVERS.put(key, solver)
+    return sols
 
-    events_out: list[dict[str, Any]] = []
-    warnings: list[str] = []
-    for m in view.measures:
-        for e in m.events:
-            if not e.staff1_notes:
-                raise HTTPException(status_code=400, detail=f"pitch-unresolved：eid={e.eid}（staff1 缺少音符，无法 stage1）")
-
-            targets: list[dict[str, Any]] = []
-            for n in e.staff1_notes:
-                slot = n.get("slot")
-                p = n.get("pitch")
-                if not isinstance(p, dict) or "step" not in p or "octave" not in p:
-                    raise HTTPException(status_code=400, detail=f"pitch-unresolved：eid={e.eid} slot={slot!r}（staff1 缺少绝对 pitch，无法 stage1）")
-
-                pitch = MusicXmlPitch(step=str(p["step"]), octave=int(p["octave"]), alter=int(p.get("alter", 0)))
-                target_midi = pitch.to_midi()
-                try:
-                    candidates = engine.enumerate_candidates(pitch_midi=target_midi, options=opt)
-                except NotImplementedError as ex:
-                    raise HTTPException(status_code=400, detail=str(ex)) from ex
-                errors: list[str] = []
-                if not candidates:
-                    errors.append("no_candidates_for_tuning_or_transpose")
-                    warnings.append(f"eid={e.eid} slot={slot!r}: no candidates (consider tuning/transpose/max_d)")
-
-                targets.append(
-                    {
-                        "slot": slot,
-                        "target_pitch": {"midi": target_midi},
-                        "candidates": [_stage1_candidate_to_dict(c) for c in candidates],
-                        **({"errors": errors} if req.options.include_errors else {}),
-                    }
-                )
 
-            events_out.append({"eid": e.eid, "targets": targets})
+def _remember_optimum(session: Stage1Session, weights: Weights, cost: float) -> None:
+    """登记全曲、无 lock、精确求解的 Top-1 代价（调用方保证这三个条件）。"""
 
-    return {
-        "project_id": project_id,
-        "revision": meta.current_revision,
-        "tuning": tuning.to_dict(),
-        "options": req.options.model_dump(),
-        "events": events_out,
-        "warnings": warnings,
+    _STAGE2_OPTIMA.put(stage2_optimum_key(handle=session.handle, weights=weights.__dict__), float(cost))
+
+
+def _stage2_solution_key(session: Stage1Session, req: Stage2Request) -> str | None:
+    """Top-K 结果缓存 key；None 表示不缓存。
+
+    - budget_ms：结果取决于实际耗时，不可复现
+    - prune=verify：调试用途是真正做一次比对，命中缓存会跳过比对
+    - prune on/off 结果逐位一致，不进 key；beam 参数只在 solver=beam 时进 key
+    """
+
+    if req.budget_ms is not None or req.prune == "verify":
+        return None
+    inputs: dict[str, Any] = {
+        "k": req.k,
+        "locks": [l.model_dump() for l in req.locks],
+        "preferences": req.preferences.model_dump(),
+        "window": req.window.model_dump() if req.window is not None else None,
+        "solver": req.solver,
     }
+    if req.solver == "beam":
+        inputs["beam"] = {"width": req.beam_width, "threshold": req.beam_threshold}
+    return stage2_solution_key(handle=session.handle, inputs=inputs)
+
+
+def _stage2_weights(p: Stage2Preferences) -> Weights:
+    return Weights(
+        shift=p.shift,
+        string_change=p.string_change,
+        technique_change=p.technique_change,
+        harmonic_penalty=p.harmonic_penalty,
+        cents_error=p.cents_error,
+    )
 
 
-@app.post("/projects/{project_id}/stage2")
-def api_stage2(project_id: str, req: Stage2Request) -> dict[str, Any]:
+def _stage2_window(w: Stage2Window | None) -> Window | None:
+    if w is None:
+        return None
+    return Window(
+        from_eid=w.from_eid,
+        to_eid=w.to_eid,
+        left=tuple(w.left) if w.left is not None else None,
+        right=tuple(w.right) if w.right is not None else None,
+    )
+
+
+def _infeasible_error(e: Stage2Infeasible) -> HTTPException:
+    """不可行：400，detail 一次性列出全部冲突（前端可逐条定位到 eid/slot/字段）。"""
+
+    return HTTPException(status_code=400, detail={"message": str(e), "conflicts": [asdict(c) for c in e.conflicts]})
+
+
+def compute_stage2(project_id: str, req: Stage2Request) -> dict[str, Any]:
+    """stage2 的计算本体（返回 API 结构 dict）；HTTP 编码在 `api_stage2` 中完成。"""
+
     meta = load_project_meta(project_id)
     if meta.current_revision != req.base_revision:
         raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
 
-    # 复用 stage1 的输出结构作为输入图
-    stage1 = api_stage1(project_id, Stage1Request(base_revision=req.base_revision, tuning=req.tuning, options=req.stage1_options))
-
-    from ..engines.stage2_optimizer import Lock, Weights, optimize_topk
+    # 复用 stage1 会话（显式 handle，或按相同输入隐式命中）作为输入图
+    session = _resolve_stage1_session(project_id, meta, req)
+
+    from ..engines.stage2_optimizer import (
+        INCREMENTAL_MAX_STATES,
+        BeamOptions,
+        Lock,
+        min_marginals,
+        optimize_anytime,
+        optimize_beam,
+        optimize_top1_memo,
+        optimize_topk,
+        segment_cut_count,
+        table_states,
+    )
 
     locks = [Lock(eid=l.eid, fields=l.fields) for l in req.locks]
-    weights = Weights(
-        shift=req.preferences.shift,
-        string_change=req.preferences.string_change,
-        technique_change=req.preferences.technique_change,
-        harmonic_penalty=req.preferences.harmonic_penalty,
-        cents_error=req.preferences.cents_error,
-    )
+    window = _stage2_window(req.window)
+    weights = _stage2_weights(req.preferences)
 
     try:
-        sols = optimize_topk(events=stage1["events"], k=req.k, locks=locks, weights=weights)
+        if req.mode == "marginals":
+            if req.apply_mode != "none":
+                raise HTTPException(status_code=400, detail="mode=marginals 不产出方案，不能与 apply_mode=commit_best 同用")
+            if req.solver != "exact":
+                raise HTTPException(status_code=400, detail="mode=marginals 只支持 solver=exact")
+            if req.budget_ms is not None:
+                raise HTTPException(status_code=400, detail="mode=marginals 不支持 budget_ms")
+            marginals = min_marginals(graph=session.graph(), locks=locks, weights=weights, window=window)
+            return {
+                "project_id": project_id,
+                "revision": meta.current_revision,
+                "tuning": session.tuning,
+                "stage1_handle": session.handle,
+                "stage1_warnings": list(session.result.warnings),
+                "stage2": {"mode": "marginals", **serialize_min_marginals(marginals)},
+            }
+
+        search: dict[str, Any] = {"solver": req.solver}
+        exact = req.solver == "exact"
+        if req.budget_ms is not None and req.solver != "exact":
+            raise HTTPException(status_code=400, detail="budget_ms 只支持 solver=exact（预算内自行选择 beam 宽度）")
+        cache_key = _stage2_solution_key(session, req)
+        cached = _STAGE2_SOLUTIONS.get(cache_key) if cache_key is not None else None
+        top1 = None
+        if cached is None and req.budget_ms is None and exact and req.k == 1 and window is None and req.prune != "verify":
+            # k=1 全曲求解：重复材料足够时按候选签名缓存转移代价（与普通 DP 逐位一致，含同代价时的路径选择）；
+            # 重复材料不足时返回 None，按下面的路由求解
+            top1 = optimize_top1_memo(graph=session.graph(), locks=locks, weights=weights, prune=req.prune)  # type: ignore[arg-type]
+        if cached is not None:
+            sols, search, exact = list(cached.solutions), cached.search, cached.exact
+        elif top1 is not None:
+            sols = top1
+        elif req.budget_ms is not None:
+            anytime = optimize_anytime(
+                graph=session.graph(), k=req.k, locks=locks, weights=weights, budget_ms=req.budget_ms, window=window
+            )
+            sols = anytime.solutions
+            search.update(serialize_anytime_stats(anytime.stats))
+            exact = anytime.stats.optimal
+        elif req.solver == "beam":
+            beam = optimize_beam(
+                graph=session.graph(),
+                k=req.k,
+                locks=locks,
+                weights=weights,
+                beam=BeamOptions(width=req.beam_width, threshold=req.beam_threshold),
+                window=window,
+            )
+            sols = beam.solutions
+            search.update(serialize_beam_stats(beam.stats))
+        elif (
+            window is None
+            and req.prune != "verify"
+            and table_states(session.graph(), req.k) <= INCREMENTAL_MAX_STATES
+            and segment_cut_count(session.graph(), locks) == 0
+        ):
+            # 全曲求解：走增量求解器（反复 lock/求解时只重算变化附近的事件；按 prune 做 dominance 剪枝）。
+            # 折算状态数超过 INCREMENTAL_MAX_STATES 时改走下面的 optimize_topk（常驻表太大；更大时自动检查点），
+            # lock 能切出独立段时改走段并行（长曲目、锁定较多时整曲重算本身就要数秒）
+            sols = _solve_incremental(project_id, session, weights, req.k, locks, prune=req.prune == "on")
+        else:
+            sols = optimize_topk(
+                graph=session.graph(),
+                k=req.k,
+                locks=locks,
+                weights=weights,
+                window=window,
+                executor=_stage2_executor(),
+                prune=req.prune,  # type: ignore[arg-type]
+                memo=req.k == 1,
+            )
+        if cached is None and cache_key is not None:
+            _STAGE2_SOLUTIONS.put(cache_key, Stage2CachedSolve(solutions=tuple(sols), search=search, exact=exact))
+        if exact and sols and not locks and window is None:
+            _remember_optimum(session, weights, sols[0].total_cost)
 
+        stage2_payload = {"k": req.k, "solutions": [serialize_solution(s) for s in sols], "search": search, "cached": cached is not None}
         if req.apply_mode == "none":
             return {
                 "project_id": project_id,
                 "revision": meta.current_revision,
-                "tuning": stage1["tuning"],
-                "stage1_warnings": stage1.get("warnings", []),
-                "stage2": {"k": req.k, "solutions": [s.__dict__ for s in sols]},
+                "tuning": session.tuning,
+                "stage1_handle": session.handle,
+                "stage1_warnings": list(session.result.warnings),
+                "stage2": stage2_payload,
             }
 
         # commit_best：把 Top-1 推荐显式写回 staff2（生成新 revision）
@@ -719,7 +1192,8 @@ def api_stage2(project_id: str, req: Stage2Request) -> dict[str, Any]:
             raise ValueError(f"commit_best: chord 写回要求 staff2 form 为 simple/complex，收到：{form!r}")
 
         ops: list[EditOp] = []
-        for a in sol0.assignments:
+        # 写回按 stage1 API 结构（与客户端看到的 choice 一致）解释候选
+        for a in map(serialize_assignment, sol0.assignments):
             eid = str(a.get("eid") or "")
             if not eid:
                 raise ValueError("solution assignment 缺少 eid")
@@ -757,9 +1231,10 @@ def api_stage2(project_id: str, req: Stage2Request) -> dict[str, Any]:
             return {
                 "project_id": project_id,
                 "revision": meta.current_revision,
-                "tuning": stage1["tuning"],
-                "stage1_warnings": stage1.get("warnings", []),
-                "stage2": {"k": req.k, "solutions": [s.__dict__ for s in sols]},
+                "tuning": session.tuning,
+                "stage1_handle": session.handle,
+                "stage1_warnings": list(session.result.warnings),
+                "stage2": stage2_payload,
                 "commit": {"skipped": True, "reason": "no_ops_after_filters_or_no_changes"},
             }
 
@@ -769,6 +1244,7 @@ def api_stage2(project_id: str, req: Stage2Request) -> dict[str, Any]:
                 "op": "stage2_commit_best",
                 "solution_id": sol0.solution_id,
                 "k": req.k,
+                **({"window": req.window.model_dump()} if req.window is not None else {}),
                 "written_ops": [{"op": o.op, "eid": o.eid, "changes": o.changes} for o in ops],
             }
         ]
@@ -783,13 +1259,320 @@ def api_stage2(project_id: str, req: Stage2Request) -> dict[str, Any]:
         return {
             "project_id": project_id,
             "revision": meta.current_revision,
-            "tuning": stage1["tuning"],
-            "stage1_warnings": stage1.get("warnings", []),
-            "stage2": {"k": req.k, "solutions": [s.__dict__ for s in sols]},
-            "commit": {"project": asdict(new_meta), "score": asdict(view2)},
+            "tuning": session.tuning,
+            "stage1_handle": session.handle,
+            "stage1_warnings": list(session.result.warnings),
+            "stage2": stage2_payload,
+            "commit": {"project": serialize_project_meta(new_meta), "score": serialize_score_view(view2)},
         }
+    except Stage2Infeasible as e:
+        raise _infeasible_error(e) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@app.post("/projects/{project_id}/stage2")
+def api_stage2(project_id: str, req: Stage2Request, request: Request) -> Response:
+    return _encoded_response(request, compute_stage2(project_id, req))
+
+
+def compute_stage2_batch(project_id: str, req: Stage2BatchRequest) -> dict[str, Any]:
+    """多组偏好的 stage2（只推荐，不写回）：候选图与未加权代价项只构建一次。"""
+
+    meta = load_project_meta(project_id)
+    if meta.current_revision != req.base_revision:
+        raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
+    session = _resolve_stage1_session(project_id, meta, req)
+
+    from ..engines.stage2_optimizer import Lock, optimize_topk_batch
+
+    try:
+        results = optimize_topk_batch(
+            graph=session.graph(),
+            k=req.k,
+            locks=[Lock(eid=l.eid, fields=l.fields) for l in req.locks],
+            profiles=[_stage2_weights(p) for p in req.profiles],
+            window=_stage2_window(req.window),
+        )
+    except Stage2Infeasible as e:
+        raise _infeasible_error(e) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if not req.locks and req.window is None:
+        for p, sols in zip(req.profiles, results):
+            if sols:
+                _remember_optimum(session, _stage2_weights(p), sols[0].total_cost)
+    return {
+        "project_id": project_id,
+        "revision": meta.current_revision,
+        "tuning": session.tuning,
+        "stage1_handle": session.handle,
+        "stage1_warnings": list(session.result.warnings),
+        "stage2_batch": {
+            "k": req.k,
+            "profiles": [
+                {"preferences": p.model_dump(), "solutions": [serialize_solution(s) for s in sols]}
+                for p, sols in zip(req.profiles, results)
+            ],
+        },
+    }
+
+
+@app.post("/projects/{project_id}/stage2/batch")
+def api_stage2_batch(project_id: str, req: Stage2BatchRequest, request: Request) -> Response:
+    return _encoded_response(request, compute_stage2_batch(project_id, req))
+
+
+def _stage2_result_page(results: Stage2ResultSet, *, offset: int, limit: int) -> list[Any]:
+    """取一页解：名次超过上限时 400（不开始枚举）；取页后重新登记，使缓存权重反映新求出的名次。"""
+
+    cap = stage2_result_rank_limit(results.enumerator.events)
+    if offset + limit > cap:
+        raise HTTPException(
+            status_code=400,
+            detail=f"offset+limit 超过解集的名次上限：{offset + limit} > {cap}（{results.enumerator.events} 个事件）",
+        )
+    page = results.enumerator.page(offset=offset, limit=limit)
+    _STAGE2_RESULTS.put(results.handle, results)
+    return page
+
+
+def compute_stage2_results(project_id: str, req: Stage2ResultsRequest) -> dict[str, Any]:
+    """创建（或按相同输入复用）stage2 惰性解集；返回 handle、候选池与第一页。"""
+
+    meta = load_project_meta(project_id)
+    if meta.current_revision != req.base_revision:
+        raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
+    session = _resolve_stage1_session(project_id, meta, req)
+
+    from ..engines.stage2_optimizer import Lock
+
+    weights = _stage2_weights(req.preferences)
+    handle = stage2_result_handle(
+        stage1_handle=session.handle,
+        locks=[l.model_dump() for l in req.locks],
+        weights=weights.__dict__,
+        window=req.window.model_dump() if req.window is not None else None,
+    )
+    results = _STAGE2_RESULTS.get(handle)
+    try:
+        if results is None:
+            enumerator = SolutionEnumerator(
+                graph=session.graph(),
+                locks=[Lock(eid=l.eid, fields=l.fields) for l in req.locks],
+                weights=weights,
+                window=_stage2_window(req.window),
+            )
+            results = Stage2ResultSet(
+                handle=handle, project_id=project_id, revision=meta.current_revision, stage1_handle=session.handle, enumerator=enumerator
+            )
+            _STAGE2_RESULTS.put(handle, results)
+        page = _stage2_result_page(results, offset=0, limit=req.limit)
+    except Stage2Infeasible as e:
+        raise _infeasible_error(e) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return {
+        "project_id": project_id,
+        "revision": meta.current_revision,
+        "tuning": session.tuning,
+        "stage1_handle": session.handle,
+        "stage1_warnings": list(session.result.warnings),
+        "result_handle": handle,
+        "explain": results.enumerator.explain,
+        "pool": serialize_solution_pool(results.enumerator.pool()),
+        "solutions": [serialize_ranked_path(p) for p in page],
+        "exhausted": len(page) < req.limit,
+    }
+
+
+@app.post("/projects/{project_id}/stage2/results")
+def api_stage2_results(project_id: str, req: Stage2ResultsRequest, request: Request) -> Response:
+    return _encoded_response(request, compute_stage2_results(project_id, req))
+
+
+@app.get("/projects/{project_id}/stage2/results/{result_handle}/solutions")
+def api_stage2_result_solutions(
+    project_id: str,
+    result_handle: str,
+    request: Request,
+    offset: int = Query(default=0, ge=0, le=STAGE2_RESULT_MAX_RANK),
+    limit: int = Query(default=20, ge=1, le=500),
+) -> Response:
+    """按代价升序的第 offset+1 .. offset+limit 条解（只求到所需名次为止）；解的 index 引用创建时返回的候选池。
+
+    offset+limit 不得超过 `stage2_result_rank_limit`（随事件数降低），超过时 400。
+    """
+
+    results = _STAGE2_RESULTS.get(result_handle)
+    if results is None or results.project_id != project_id:
+        raise HTTPException(status_code=404, detail=f"stage2 解集不存在或已过期（请重新创建）：{result_handle}")
+    page = _stage2_result_page(results, offset=offset, limit=limit)
+    return _encoded_response(
+        request,
+        {
+            "project_id": project_id,
+            "revision": results.revision,
+            "result_handle": result_handle,
+            "offset": offset,
+            "limit": limit,
+            "solutions": [serialize_ranked_path(p) for p in page],
+            "exhausted": len(page) < limit,
+        },
+    )
+
+
+_SOUND_TO_TECHNIQUE = {"open": "open", "pressed": "press", "harmonic": "harmonic"}
+
+
+def compute_stage2_score(project_id: str, req: Stage2ScoreRequest) -> dict[str, Any]:
+    """给定指法打分：读 staff2 当前 v0.3 真值，映射到 stage1 候选，一次线性扫描得到路径代价与逐事件分项。
+
+    - 读不出真值、推导音高与 staff1 目标音不一致、或映射不到候选的事件记为未打分（给出原因，不猜）
+    - 只有全部事件都已打分时，才与缓存的 stage2 最优（同一 stage1 会话与 weights）比较；不为此触发求解
+    """
+
+    meta = load_project_meta(project_id)
+    if meta.current_revision != req.base_revision:
+        raise HTTPException(status_code=409, detail=f"revision 冲突：current={meta.current_revision} base={req.base_revision}")
+    session = _resolve_stage1_session(project_id, meta, req)
+    tuning = ProjectTuning.from_dict(session.tuning)
+
+    from ..engines.stage2_optimizer import score_fingering
+
+    xml_bytes = load_revision_bytes(project_id, meta.current_revision)
+    view = build_score_view(project_id=project_id, revision=meta.current_revision, musicxml_bytes=xml_bytes)
+    kv_by_eid = {e.eid: e.staff2_kv for m in view.measures for e in m.events}
+    fingering: dict[str, list[dict[str, Any]]] = {}
+    reasons: dict[str, str] = {}
+    for ev in session.result.events:
+        try:
+            readings, notes = read_fingering_v0_3(kv_by_eid.get(ev.eid, {}), tuning=tuning)
+        except ValueError as e:
+            reasons[ev.eid] = f"invalid_truth:{e}"
+            continue
+        if not readings:
+            reasons[ev.eid] = "truth_unreadable:" + ",".join(notes or ["unknown"])
+            continue
+        targets = {t.slot or None: t.target_midi for t in ev.targets}
+        mismatch = [r for r in readings if targets.get(r.slot) not in (None, r.expected_midi)]
+        if mismatch:
+            reasons[ev.eid] = "pitch_mismatch:" + ",".join(f"{r.slot or '-'}={r.expected_midi}/{targets[r.slot]}" for r in mismatch)
+            continue
+        fingering[ev.eid] = [
+            {
+                "slot": r.slot,
+                "string": r.string,
+                "technique": _SOUND_TO_TECHNIQUE[r.sound],
+                **({"pos_ratio": r.pos_ratio} if r.pos_ratio is not None else {}),
+                **({"harmonic_n": r.harmonic_n} if r.harmonic_n is not None else {}),
+            }
+            for r in readings
+        ]
+
+    weights = _stage2_weights(req.preferences)
+    try:
+        score = score_fingering(graph=session.graph(), fingering=fingering, weights=weights, reasons=reasons)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    optimum = _STAGE2_OPTIMA.get(stage2_optimum_key(handle=session.handle, weights=weights.__dict__))
+    comparison: dict[str, Any] | None = None
+    if optimum is not None and score.complete:
+        comparison = {"total_cost": optimum, "gap": float(score.total_cost - optimum)}
+    return {
+        "project_id": project_id,
+        "revision": meta.current_revision,
+        "tuning": session.tuning,
+        "stage1_handle": session.handle,
+        "stage1_warnings": list(session.result.warnings),
+        "score": {**serialize_path_score(score), "weights": weights.__dict__, "optimum": comparison},
+    }
+
+
+@app.post("/projects/{project_id}/stage2/score")
+def api_stage2_score(project_id: str, req: Stage2ScoreRequest, request: Request) -> Response:
+    return _encoded_response(request, compute_stage2_score(project_id, req))
+
+
+def _stage2_stream(project_id: str, stream_id: str) -> Stage2Stream:
+    stream = _STAGE2_STREAMS.get(stream_id)
+    if stream is None or stream.project_id != project_id:
+        raise HTTPException(status_code=404, detail=f"stage2 流式会话不存在或已过期（请重新创建）：{stream_id}")
+    return stream
+
+
+@app.post("/projects/{project_id}/stage2/stream")
+def api_stage2_stream_open(project_id: str, req: Stage2StreamRequest) -> dict[str, Any]:
+    """新建 stage2 流式会话：之后逐个输入事件，每次只做 O(lag + 候选数²) 的增量计算。"""
+
+    meta = load_project_meta(project_id)
+    tuning = _stage1_tuning(meta, req.tuning)
+    engine, opt = _position_engine(tuning, req.stage1_options)
+    stream = Stage2Stream(
+        stream_id=new_stage2_stream_id(),
+        project_id=project_id,
+        tuning=tuning.to_dict(),
+        options=req.stage1_options.model_dump(),
+        engine=engine,
+        engine_options=opt,
+        solver=StreamingTop1(weights=_stage2_weights(req.preferences), lag=req.lag),
+    )
+    _STAGE2_STREAMS.put(stream.stream_id, stream)
+    return {"project_id": project_id, "stream_id": stream.stream_id, "lag": req.lag, "tuning": stream.tuning, "stage1_options": stream.options}
+
+
+@app.post("/projects/{project_id}/stage2/stream/{stream_id}/events")
+def api_stage2_stream_events(project_id: str, stream_id: str, req: Stage2StreamEventsRequest) -> dict[str, Any]:
+    """按顺序输入事件（原子：任一事件失败时整批不生效），返回定稿与暂定建议。"""
+
+    stream = _stage2_stream(project_id, stream_id)
+
+    from ..engines.stage2_optimizer import Lock, stream_graph_event
+
+    items = []
+    warnings: list[str] = []
+    try:
+        for e in req.events:
+            ev, ev_warnings = stage1_event(
+                eid=e.eid, staff1_notes=[n.model_dump() for n in e.notes], engine=stream.engine, options=stream.engine_options
+            )
+            warnings.extend(ev_warnings)
+            items.append((stream_graph_event(ev), [Lock(eid=e.eid, fields=f) for f in e.locks]))
+        steps = stream.solver.extend(items)
+    except Stage2Infeasible as e:
+        raise _infeasible_error(e) from e
+    except ValueError as e:
+        # 含 Stage1PitchUnresolved
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return {
+        "project_id": project_id,
+        "stream_id": stream_id,
+        "events": stream.solver.size,
+        "stage1_warnings": warnings,
+        "steps": [serialize_stream_step(s) for s in steps],
+    }
+
+
+@app.post("/projects/{project_id}/stage2/stream/{stream_id}/flush")
+def api_stage2_stream_flush(project_id: str, stream_id: str, request: Request) -> Response:
+    """已输入事件的精确 Top-1（explain.revised：定稿与精确最优不同的事件）；会话保留，可继续输入。"""
+
+    stream = _stage2_stream(project_id, stream_id)
+    try:
+        sol = stream.solver.flush()
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
+    return _encoded_response(
+        request, {"project_id": project_id, "stream_id": stream_id, "events": len(sol.assignments), "solution": serialize_solution(sol)}
+    )
+
+
+@app.delete("/projects/{project_id}/stage2/stream/{stream_id}")
+def api_stage2_stream_close(project_id: str, stream_id: str) -> dict[str, Any]:
+    _stage2_stream(project_id, stream_id)
+    _STAGE2_STREAMS.pop(stream_id)
+    return {"project_id": project_id, "stream_id": stream_id, "closed": True}
 
 
 @app.get("/projects/{project_id}/tuning")
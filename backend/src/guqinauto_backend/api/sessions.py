@@ -0,0 +1,238 @@
+"""
+stage1 会话（服务端缓存的候选图），供 stage2 复用。
+
+定位：
+- stage2 的典型交互是“同一 revision / tuning / stage1 options 下反复调整 locks 与偏好”。
+  stage1（解析 MusicXML + 枚举音位 + 候选解析）与 locks/偏好无关，每次重算是纯浪费。
+- stage1 的结果按 (project_id, revision, tuning, options) 存为会话，返回 handle；
+  stage2 可显式携带 handle，也会按同样的 key 隐式命中。
+
+约束：
+- handle 由输入确定性派生（同一输入得到同一 handle），但服务端只认缓存中存在的 handle：
+  过期/淘汰后必须明确失败，由客户端重新调用 stage1（不做“猜测式重建”）。
+- revision 是不可变快照，因此会话内容不会失效；TTL 只用于回收内存。
+- 会话保存类型化的 `Stage1Result`：stage2 直接由它构建候选图；stage1 的 API 结构（dict）
+  只在 stage1 响应需要时惰性生成一次（进程内不做 dict 往返）。
+
+stage2 增量求解器（`IncrementalTopK`）同样按会话式缓存：key 不含 revision，
+编辑生成新 revision 后由求解器自行比较新旧候选图、只重算变化的事件。
+
+stage2 流式会话（`StreamingTop1`，逐音输入）不对应任何 revision：id 随机生成，只认缓存中存在的 id。
+
+stage2 惰性解集（`SolutionEnumerator`，分页枚举）的 handle 由 (stage1 会话, locks, weights, window) 派生：
+已枚举出的前缀表随 handle 复用，再次请求同一输入时从已求出的名次继续。
+
+stage2 Top-K 结果缓存：key 为 (stage1 会话, 求解输入) 的稳定指纹；stage1 handle 已包含 revision，
+因此编辑产生新 revision 后旧条目自然不再命中（由 LRU/TTL 回收）。
+"""
+
+from __future__ import annotations
+
+import secrets
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+
+from ..engines.stage1 import Stage1Result
+from ..engines.position_engine import PositionEngine, PositionEngineOptions
+from ..engines.stage2_optimizer import (
+    INCREMENTAL_MAX_STATES,
+    CandidateGraph,
+    IncrementalTopK,
+    Solution,
+    SolutionEnumerator,
+    StreamingTop1,
+    candidate_graph_from_stage1_result,
+)
+from ..utils.ttl_lru import TtlLruCache
+from .http_cache import input_fingerprint
+from .serializers import serialize_stage1_result
+
+
+STAGE1_SESSION_TTL_SECONDS = 15 * 60
+
+
+@dataclass
+class Stage1Session:
+    """一次 stage1 计算的类型化结果，及其惰性构建的候选图与 API 结构。"""
+
+    handle: str
+    project_id: str
+    revision: str
+    tuning: dict[str, Any]
+    options: dict[str, Any]
+    result: Stage1Result
+    _graph: CandidateGraph | None = field(default=None, repr=False)
+    _payload: dict[str, Any] | None = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def graph(self) -> CandidateGraph:
+        """stage2 输入图：首次使用时构建（失败按 ValueError 抛出，且不缓存失败结果）。"""
+
+        with self._lock:
+            if self._graph is None:
+                self._graph = candidate_graph_from_stage1_result(self.result)
+            return self._graph
+
+    def payload(self) -> dict[str, Any]:
+        """stage1 API 结构（仅 stage1 响应使用；首次调用时序列化，之后复用；调用方不得修改）。"""
+
+        with self._lock:
+            if self._payload is None:
+                self._payload = serialize_stage1_result(
+                    self.result,
+                    project_id=self.project_id,
+                    revision=self.revision,
+                    tuning=self.tuning,
+                    options=self.options,
+                    include_errors=bool(self.options.get("include_errors", True)),
+                )
+            return self._payload
+
+
+Stage1SessionCache = TtlLruCache[str, Stage1Session]
+
+
+def new_stage1_session_cache(*, max_entries: int = 32, ttl_seconds: float = STAGE1_SESSION_TTL_SECONDS) -> Stage1SessionCache:
+    return TtlLruCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+
+def stage1_handle(*, project_id: str, revision: str, tuning: dict[str, Any], options: dict[str, Any]) -> str:
+    """stage1 会话 handle（由全部输入派生）。"""
+
+    fp = input_fingerprint({"project_id": project_id, "revision": revision, "tuning": tuning, "options": options})
+    return f"s1.{fp}"
+
+
+Stage2SolverCache = TtlLruCache[str, IncrementalTopK]
+
+
+def new_stage2_solver_cache(
+    *, max_entries: int = 16, max_states: int = 2 * INCREMENTAL_MAX_STATES, ttl_seconds: float = STAGE1_SESSION_TTL_SECONDS
+) -> Stage2SolverCache:
+    """按常驻表折算的状态数（`IncrementalTopK.resident_states`）限重：求解器的前向/后向表是进程内最大的常驻派生物。
+
+    权重在 put 时计算：调用方应在求解之后（表已建立）再登记。
+    """
+
+    return TtlLruCache(
+        max_entries=max_entries,
+        ttl_seconds=ttl_seconds,
+        max_weight=max_states,
+        weigh=lambda s: s.resident_states,
+    )
+
+
+@dataclass(frozen=True)
+class Stage2CachedSolve:
+    """一次 stage2 Top-K 求解的结果（命中时原样复用，含 commit_best 写回所用的 Top-1）。"""
+
+    solutions: tuple[Solution, ...]
+    search: dict[str, Any]
+    exact: bool  # 是否为精确最优（决定能否登记最优代价）
+
+
+Stage2SolutionCache = TtlLruCache[str, Stage2CachedSolve]
+
+
+def new_stage2_solution_cache(
+    *, max_entries: int = 64, max_assignments: int = 1_000_000, ttl_seconds: float = STAGE1_SESSION_TTL_SECONDS
+) -> Stage2SolutionCache:
+    """按 assignment 总数限重（每条 assignment 引用一个候选；K×N 大的结果会挤掉更多条目）。"""
+
+    return TtlLruCache(
+        max_entries=max_entries,
+        ttl_seconds=ttl_seconds,
+        max_weight=max_assignments,
+        weigh=lambda e: sum(len(s.assignments) for s in e.solutions),
+    )
+
+
+def stage2_solution_key(*, handle: str, inputs: dict[str, Any]) -> str:
+    return input_fingerprint({"stage1_handle": handle, **inputs})
+
+
+# 全曲、无 lock、精确求解得到的 stage2 最优代价：key=(stage1 会话, weights)；给定指法打分时据此报告与最优的差距
+Stage2OptimumCache = TtlLruCache[str, float]
+
+
+def new_stage2_optimum_cache(*, max_entries: int = 256, ttl_seconds: float = STAGE1_SESSION_TTL_SECONDS) -> Stage2OptimumCache:
+    return TtlLruCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+
+def stage2_optimum_key(*, handle: str, weights: dict[str, Any]) -> str:
+    return input_fingerprint({"stage1_handle": handle, "weights": weights})
+
+
+@dataclass
+class Stage2Stream:
+    """逐事件输入的 stage2 会话：tuning/stage1 options 固定，每个事件单独做 stage1 后推入在线求解器。"""
+
+    stream_id: str
+    project_id: str
+    tuning: dict[str, Any]
+    options: dict[str, Any]
+    engine: PositionEngine
+    engine_options: PositionEngineOptions
+    solver: StreamingTop1
+
+
+Stage2StreamCache = TtlLruCache[str, Stage2Stream]
+
+
+def new_stage2_stream_cache(*, max_entries: int = 64, ttl_seconds: float = STAGE1_SESSION_TTL_SECONDS) -> Stage2StreamCache:
+    return TtlLruCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+
+def new_stage2_stream_id() -> str:
+    return f"s2s.{secrets.token_hex(12)}"
+
+
+@dataclass
+class Stage2ResultSet:
+    """一组 stage2 输入（stage1 会话 + locks/weights/window）的惰性解集：按代价升序分页取解。"""
+
+    handle: str
+    project_id: str
+    revision: str
+    stage1_handle: str
+    enumerator: SolutionEnumerator
+
+
+Stage2ResultCache = TtlLruCache[str, Stage2ResultSet]
+
+# 惰性解集可取到的最大名次：枚举器常驻全部已求出的名次，深处取解的耗时也随名次线性增长
+STAGE2_RESULT_MAX_RANK = 2000
+# 解集缓存的总权重（已求出的名次 × 事件数；实测约 50 字节/单位，即约 50 MiB）
+STAGE2_RESULT_MAX_WEIGHT = 1_000_000
+
+
+def stage2_result_rank_limit(events: int) -> int:
+    """单个解集可取到的最大名次：不超过 STAGE2_RESULT_MAX_RANK，且名次 × 事件数不超过总权重的一半。"""
+
+    return min(STAGE2_RESULT_MAX_RANK, STAGE2_RESULT_MAX_WEIGHT // 2 // max(1, events))
+
+
+def new_stage2_result_cache(
+    *, max_entries: int = 32, max_weight: int = STAGE2_RESULT_MAX_WEIGHT, ttl_seconds: float = STAGE1_SESSION_TTL_SECONDS
+) -> Stage2ResultCache:
+    """按已求出的名次 × 事件数限重（枚举器的常驻前缀随取页增长）。
+
+    权重在 put 时计算：调用方应在每次取页之后重新登记。
+    """
+
+    return TtlLruCache(
+        max_entries=max_entries,
+        ttl_seconds=ttl_seconds,
+        max_weight=max_weight,
+        weigh=lambda r: r.enumerator.ranks * r.enumerator.events,
+    )
+
+
+def stage2_result_handle(
+    *, stage1_handle: str, locks: list[dict[str, Any]], weights: dict[str, Any], window: dict[str, Any] | None
+) -> str:
+    """stage2 惰性解集 handle（由全部输入派生；stage1 handle 已包含 revision）。"""
+
+    fp = input_fingerprint({"stage1_handle": stage1_handle, "locks": locks, "weights": weights, "window": window})
+    return f"s2r.{fp}"
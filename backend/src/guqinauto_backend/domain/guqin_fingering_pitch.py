@@ -259,6 +259,83 @@ def _derive_v0_3(kv: dict[str, str], *, tuning: ProjectTuning) -> tuple[list[Der
     return ([], ["uncheckable_form_requires_v0_3_truth"])
 
 
+@dataclass(frozen=True)
+class FingeringReading:
+    """staff2 v0.3 真值中一个 slot 的音位读法（附推导出的期望音高），供 stage2 给定指法打分。"""
+
+    slot: str | None
+    string: int
+    sound: Sound
+    pos_ratio: float | None  # open 为 0；泛音节点未知时为 None
+    harmonic_n: int | None
+    harmonic_k: int | None
+    expected_midi: int
+
+
+def read_fingering_v0_3(
+    staff2_kv: dict[str, str],
+    *,
+    tuning: ProjectTuning,
+) -> tuple[list[FingeringReading], list[str]]:
+    """读取 staff2 的 v0.3 音位真值（每个 slot 一项）。
+
+    - 只认 v0.3 字段（不从 v0.2 读法层推断）；不可读时返回空列表与 notes（同 `derive_expected_pitches`）
+    - 泛音节点：harmonic_k 优先（pos=k/n），其次缓存的 pos_ratio；都没有时 pos_ratio=None（节点未知，不猜）
+    - 多弦 simple 的泛音只有共享的 harmonic_n，节点总是未知
+    """
+
+    form = staff2_kv.get("form")
+    if form not in ("simple", "complex") or not _has_any_v0_3_sound_fields(staff2_kv):
+        return ([], ["missing_v0_3_truth"])
+    derived, notes = _derive_v0_3(staff2_kv, tuning=tuning)
+    if not derived:
+        return ([], notes)
+
+    kv = staff2_kv
+    xian = [int(s) for s in kv.get("xian", "").split(",") if s != ""] if form == "simple" else []
+    out: list[FingeringReading] = []
+    for dp in derived:
+        if form == "complex":
+            prefix = "l_" if dp.slot == "L" else "r_"
+            string = _parse_int(kv[f"{prefix}xian"], name=f"{prefix}xian")
+            pos_key: str = f"{prefix}pos_ratio"
+            k_key: str | None = f"{prefix}harmonic_k"
+        elif dp.slot is None:
+            prefix, string, pos_key, k_key = "", xian[0], "pos_ratio", "harmonic_k"
+        else:
+            prefix, string, pos_key, k_key = "", xian[int(dp.slot) - 1], f"pos_ratio_{dp.slot}", None
+        sound: Sound = kv[f"{prefix}sound"]  # type: ignore[assignment]
+
+        pos: float | None = None
+        hn: int | None = None
+        hk: int | None = None
+        if sound == "open":
+            pos = 0.0
+        elif sound == "pressed":
+            pos = _parse_float(kv[pos_key], name=pos_key)
+        else:
+            hn = _parse_int(kv[f"{prefix}harmonic_n"], name=f"{prefix}harmonic_n")
+            if k_key is not None and k_key in kv:
+                hk = _parse_int(kv[k_key], name=k_key)
+                if not (1 <= hk < hn):
+                    raise ValueError(f"{k_key} 超界（期望 1<=k<n）：k={hk} n={hn}")
+                pos = hk / hn
+            elif pos_key in kv:
+                pos = _parse_float(kv[pos_key], name=pos_key)
+        out.append(
+            FingeringReading(
+                slot=dp.slot,
+                string=string,
+                sound=sound,
+                pos_ratio=pos,
+                harmonic_n=hn,
+                harmonic_k=hk,
+                expected_midi=dp.expected_midi,
+            )
+        )
+    return (out, notes)
+
+
 def _derive_v0_2_open_only(kv: dict[str, str], *, tuning: ProjectTuning) -> tuple[list[DerivedPitch], list[str]]:
     form = kv.get("form")
     if form not in ("simple", "complex"):
@@ -162,6 +162,15 @@ def hui_real_from_pos_ratio(pos_ratio: float, *, temperament: Temperament) -> fl
     return None
 
 
+@dataclass(frozen=True)
+class HarmonicNode:
+    """泛音节点：弦长比例 k/n 处（gcd(k, n) = 1）。"""
+
+    k: int
+    pos_ratio: float
+    hui_real: float | None
+
+
 @dataclass(frozen=True)
 class PositionCandidate:
     string: int  # 1..7
@@ -175,6 +184,9 @@ class PositionCandidate:
     harmonic_n: int | None = None
     harmonic_k: int | None = None
     cents_error: float | None = None
+    # 分组泛音（group_harmonics=True）：同一 (弦, n) 的全部等价节点（音高、cents_error 相同，只差位置）；
+    # pos_ratio/harmonic_k 取第一个节点（k=1）作为代表。未分组时为 None
+    harmonic_nodes: tuple[HarmonicNode, ...] | None = None
 
 
 @dataclass(frozen=True)
@@ -184,6 +196,8 @@ class PositionEngineOptions:
     include_harmonics: bool = False
     max_harmonic_n: int = 12
     max_harmonic_cents_error: float = 25.0
+    # True：每个 (弦, n) 只输出一个泛音候选，节点位置列在 harmonic_nodes 中（否则每个 k 一个候选）
+    group_harmonics: bool = False
 
 
 class PositionEngine:
@@ -252,23 +266,30 @@ class PositionEngine:
                     if abs(cents_error) > float(options.max_harmonic_cents_error):
                         continue
 
-                    for k in range(1, n):
-                        if math.gcd(k, n) != 1:
-                            continue
-                        pr = float(k) / float(n)
-                        hr = hui_real_from_pos_ratio(pr, temperament=options.temperament)
+                    nodes = tuple(
+                        HarmonicNode(
+                            k=k,
+                            pos_ratio=float(k) / float(n),
+                            hui_real=hui_real_from_pos_ratio(float(k) / float(n), temperament=options.temperament),
+                        )
+                        for k in range(1, n)
+                        if math.gcd(k, n) == 1
+                    )
+                    # 分组时只输出一个候选（代表节点 + 全部节点）；否则每个节点一个候选
+                    for node in nodes[:1] if options.group_harmonics else nodes:
                         out.append(
                             PositionCandidate(
                                 string=s,
                                 technique="harmonic",
                                 pitch_midi=pitch_midi,
                                 d_semitones_from_open=int(interval),
-                                pos_ratio=pr,
-                                hui_real=hr,
+                                pos_ratio=node.pos_ratio,
+                                hui_real=node.hui_real,
                                 temperament=options.temperament,
                                 harmonic_n=n,
-                                harmonic_k=k,
+                                harmonic_k=node.k,
                                 cents_error=float(cents_error),
+                                harmonic_nodes=nodes if options.group_harmonics else None,
                             )
                         )
 
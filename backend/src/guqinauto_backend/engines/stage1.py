@@ -0,0 +1,96 @@
+"""
+stage1 流水线：score view → 每个事件、每个 slot 的候选音位（类型化结果）。
+
+定位：
+- `PositionEngine` 只负责“一个音高 → 候选音位”；这里把它铺到整首曲子的事件流上，
+  产出 stage2 可直接消费的 `Stage1Result`（候选保持为 `PositionCandidate`，不转成 API dict）。
+- API 结构（dict）只在 HTTP 边界生成（见 api/serializers.py 的 `serialize_stage1_result`），
+  进程内 stage1 → stage2 不做 dict 往返。
+
+约束：
+- staff1 缺少音符/绝对音高的事件无法做 stage1：按 `Stage1PitchUnresolved` 显式失败（不跳过、不猜测）。
+- 某个 slot 没有任何候选不是错误：记录在 target.errors 与 warnings 中，由 stage2 的可行性预检报告。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+from ..domain.musicxml_profile_v0_2 import ProjectScoreView
+from ..domain.pitch import MusicXmlPitch
+from .position_engine import PositionCandidate, PositionEngine, PositionEngineOptions
+
+
+class Stage1PitchUnresolved(ValueError):
+    """事件缺少可用于 stage1 的绝对音高（pitch-unresolved）。"""
+
+
+@dataclass(frozen=True)
+class Stage1Target:
+    """事件中的一个目标音（slot）及其全部候选音位。"""
+
+    slot: str | None
+    target_midi: int
+    candidates: tuple[PositionCandidate, ...]
+    errors: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Stage1Event:
+    eid: str
+    targets: tuple[Stage1Target, ...]
+
+
+@dataclass(frozen=True)
+class Stage1Result:
+    """整首曲子的 stage1 结果（stage2 的输入）。"""
+
+    events: tuple[Stage1Event, ...]
+    warnings: tuple[str, ...] = ()
+
+
+def run_stage1(*, view: ProjectScoreView, engine: PositionEngine, options: PositionEngineOptions) -> Stage1Result:
+    """对 score view 的每个事件枚举候选音位。
+
+    失败：
+    - Stage1PitchUnresolved：staff1 缺少音符或绝对 pitch
+    - NotImplementedError：PositionEngine 不支持的选项组合（原样抛出）
+    """
+
+    events: list[Stage1Event] = []
+    warnings: list[str] = []
+    for m in view.measures:
+        for e in m.events:
+            ev, ev_warnings = stage1_event(eid=e.eid, staff1_notes=e.staff1_notes, engine=engine, options=options)
+            events.append(ev)
+            warnings.extend(ev_warnings)
+    return Stage1Result(events=tuple(events), warnings=tuple(warnings))
+
+
+def stage1_event(
+    *, eid: str, staff1_notes: list[dict[str, Any]], engine: PositionEngine, options: PositionEngineOptions
+) -> tuple[Stage1Event, list[str]]:
+    """单个事件的 stage1（`run_stage1` 的逐事件部分；逐事件输入的 stage2 流式会话也直接调用）。
+
+    返回 (事件, warnings)；失败同 `run_stage1`。
+    """
+
+    if not staff1_notes:
+        raise Stage1PitchUnresolved(f"pitch-unresolved：eid={eid}（staff1 缺少音符，无法 stage1）")
+    targets: list[Stage1Target] = []
+    warnings: list[str] = []
+    for n in staff1_notes:
+        slot = n.get("slot")
+        p = n.get("pitch")
+        if not isinstance(p, dict) or "step" not in p or "octave" not in p:
+            raise Stage1PitchUnresolved(f"pitch-unresolved：eid={eid} slot={slot!r}（staff1 缺少绝对 pitch，无法 stage1）")
+
+        target_midi = MusicXmlPitch(step=str(p["step"]), octave=int(p["octave"]), alter=int(p.get("alter", 0))).to_midi()
+        candidates = engine.enumerate_candidates(pitch_midi=target_midi, options=options)
+        errors: tuple[str, ...] = ()
+        if not candidates:
+            errors = ("no_candidates_for_tuning_or_transpose",)
+            warnings.append(f"eid={eid} slot={slot!r}: no candidates (consider tuning/transpose/max_d)")
+        targets.append(Stage1Target(slot=slot, target_midi=target_midi, candidates=tuple(candidates), errors=errors))
+    return Stage1Event(eid=eid, targets=tuple(targets)), warnings
@@ -3,26 +3,46 @@ stage2：在 stage1 候选图上做序列级优化（Top-K 推荐，不写回）
 
 定位：
 - 这是 GuqinAuto 的“自动推荐”核心之一：在每个事件的候选音位集合上选择一条可弹路径。
-- 目前实现的是最小可用子集：
-  - 仅支持单音事件（每个 eid 只有 1 个 target）
+- 当前范围：
+  - 单音事件（1 个 target，slot 为空）与 N-note chord（targets>=2，每个 target 有唯一 slot）
   - 仅使用 stage1 的 open/press/harmonic 候选（是否包含 harmonic 由调用方决定）
-  - 只做“推荐结果”返回，不直接写回 MusicXML（写回属于下一步：Profile v0.3 + 写回协议）
-  - 增量支持：2-note chord（targets=2）可做推荐；chord 锁定要求显式指定 slot（避免语义歧义）
+  - 只做“推荐结果”返回，不直接写回 MusicXML（写回由 API 层的 apply 协议完成）
+  - chord 按 intrinsic 代价分支定界惰性生成组合（各 slot 弦号互不相同），最多取前 CHORD_MAX_PRODUCTS=1200 个；
+    chord 锁定要求显式指定 slot（避免语义歧义）
+- stage1 输出先解析为 `CandidateGraph`（与 locks/weights 无关），可被同一 stage1 会话下的多次求解复用。
+  进程内直接由类型化的 `Stage1Result` 构建（`candidate_graph_from_stage1_result`），不经 API dict；
+  此时 assignments 中的 choice 是 `PositionCandidate`，由 API 层在 HTTP 边界序列化。
 
 学术级要求：
 - 锁定导致无解必须失败，不允许“尽量凑一个”。
-- 对不支持的情况（chord/缺 pitch/空候选）必须失败。
-  - 3+ 音 chord 仍必须失败（直到有明确的组合剪枝与代价定义）。
+- 对不支持的情况（缺 pitch/空候选/chord 缺 slot 或 slot 重复/单音事件带 slot）必须失败。
+- chord 组合被 max_products 截断时必须在 explain.chord_truncated 中显式标注（截断是启发式，不保证全局最优）。
 """
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Literal
+import bisect
+import heapq
+import itertools
+import math
+import operator
+import threading
+import time
+from array import array
+from concurrent.futures import Executor
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Any, Callable, Iterator, Literal, TypeVar
+
+from .position_engine import PositionCandidate
+from .stage1 import Stage1Event, Stage1Result
 
 
 Technique = Literal["open", "press", "harmonic"]
 
+# lock.pos_ratio 的匹配容差（pos_ratio 来自 stage1 输出的浮点数，JSON 往返后应逐位一致；容差只防御格式化误差）
+POS_RATIO_LOCK_TOLERANCE = 1e-6
+
 
 @dataclass(frozen=True)
 class Candidate:
@@ -32,7 +52,9 @@ class Candidate:
     technique: Technique
     pos_ratio: float  # open 视为 0
     cents_error: float
-    raw: dict[str, Any]  # 原始 stage1 candidate（便于返回给前端/诊断）
+    raw: PositionCandidate | dict[str, Any]  # 原始 stage1 candidate（类型化结果或 API dict；原样放入 assignments）
+    # 分组泛音展开出的节点：是否离相邻事件最近（False 的节点只在 pos_ratio lock 命中时参与求解，见 `_expand_harmonic_groups`）
+    nearest: bool = True
 
 
 @dataclass(frozen=True)
@@ -46,6 +68,118 @@ class ChordCandidate:
     raw_by_slot: dict[str, Any]
 
 
+def _string_bit(string: int) -> int:
+    """弦号的位（1 弦 = bit 0；7 根弦占低 7 位）。"""
+
+    return 1 << (string - 1)
+
+
+@dataclass(frozen=True)
+class CandidateMasks:
+    """一个 slot 的候选属性位集：bit j 对应该 slot 的第 j 个候选。
+
+    lock 过滤 = 按字段取位集后按位与（整组候选一次运算，不逐字段重建候选列表）；
+    弦号集合用 7 位弦位表示，chord 的弦号互斥检查同样是位运算。
+    """
+
+    full: int
+    nearest: int
+    by_string: dict[int, int]
+    by_technique: dict[str, int]
+    # pos_ratio 升序排列的 (位置, 下标)：pos_ratio lock 二分取区间
+    pos_sorted: tuple[float, ...]
+    pos_index: tuple[int, ...]
+
+    @classmethod
+    def build(cls, cands: tuple[Candidate, ...]) -> CandidateMasks:
+        nearest = 0
+        by_string: dict[int, int] = {}
+        by_technique: dict[str, int] = {}
+        for j, c in enumerate(cands):
+            bit = 1 << j
+            if c.nearest:
+                nearest |= bit
+            by_string[c.string] = by_string.get(c.string, 0) | bit
+            by_technique[c.technique] = by_technique.get(c.technique, 0) | bit
+        order = sorted(range(len(cands)), key=lambda j: cands[j].pos_ratio)
+        return cls(
+            full=(1 << len(cands)) - 1,
+            nearest=nearest,
+            by_string=by_string,
+            by_technique=by_technique,
+            pos_sorted=tuple(cands[j].pos_ratio for j in order),
+            pos_index=tuple(order),
+        )
+
+    def field(self, name: str, v: Any) -> int:
+        """单个 lock 字段命中的候选位集。"""
+
+        if name == "string":
+            return self.by_string.get(int(v), 0)
+        if name == "technique":
+            return self.by_technique.get(str(v), 0)
+        if name == "pos_ratio":
+            x = float(v)
+            # 区间放宽一倍容差后逐个精确比较：与 |pos_ratio - x| <= 容差 的语义逐位一致
+            lo = bisect.bisect_left(self.pos_sorted, x - 2 * POS_RATIO_LOCK_TOLERANCE)
+            hi = bisect.bisect_right(self.pos_sorted, x + 2 * POS_RATIO_LOCK_TOLERANCE)
+            out = 0
+            for k in range(lo, hi):
+                if abs(self.pos_sorted[k] - x) <= POS_RATIO_LOCK_TOLERANCE:
+                    out |= 1 << self.pos_index[k]
+            return out
+        raise ValueError(f"不支持的 lock 字段：{name!r}")
+
+    def strings(self, sel: int) -> int:
+        """位集 sel 中候选的弦位并集。"""
+
+        out = 0
+        for s, m in self.by_string.items():
+            if m & sel:
+                out |= _string_bit(s)
+        return out
+
+
+def _pick(cands: tuple[Candidate, ...], sel: int) -> list[Candidate]:
+    """位集 sel 选中的候选（保持原顺序）。"""
+
+    if sel == (1 << len(cands)) - 1:
+        return list(cands)
+    out: list[Candidate] = []
+    while sel:
+        low = sel & -sel
+        out.append(cands[low.bit_length() - 1])
+        sel ^= low
+    return out
+
+
+@dataclass(frozen=True)
+class GraphEvent:
+    """候选图中的一个事件：每个 target（slot）一组已解析的候选（与 stage1 targets 一一对应）。"""
+
+    eid: str
+    slots: tuple[str | None, ...]
+    candidates: tuple[tuple[Candidate, ...], ...]
+    # candidates[si][j] 在 stage1 targets[si].candidates 中的下标；None 表示一一对应（没有展开分组泛音）
+    stage1_index: tuple[tuple[int, ...], ...] | None = None
+
+    @cached_property
+    def masks(self) -> tuple[CandidateMasks, ...]:
+        """每个 slot 的候选属性位集（首次施加 lock 时建立，随事件对象复用）。"""
+
+        return tuple(CandidateMasks.build(cs) for cs in self.candidates)
+
+
+@dataclass(frozen=True)
+class CandidateGraph:
+    """stage1 候选图（已解析为 stage2 内部表示）。
+
+    同一 (revision, tuning, stage1 options) 下候选图不变：可以解析一次后被多次 stage2（不同 locks/weights）复用。
+    """
+
+    events: tuple[GraphEvent, ...]
+
+
 @dataclass(frozen=True)
 class Lock:
     eid: str
@@ -86,21 +220,171 @@ def _cand_to_internal(c: dict[str, Any]) -> Candidate:
     return Candidate(string=string, technique=technique, pos_ratio=pr, cents_error=cents_error, raw=c)
 
 
-def _apply_locks(eid: str, candidates: list[Candidate], locks: list[Lock]) -> list[Candidate]:
-    out = candidates
+def _position_to_internal(c: PositionCandidate) -> Candidate:
+    if c.technique == "open":
+        pr = 0.0
+    else:
+        if c.pos_ratio is None:
+            raise ValueError(f"候选缺少 pos_ratio：{c!r}")
+        pr = float(c.pos_ratio)
+    if c.technique not in ("open", "press", "harmonic"):
+        raise ValueError(f"未知 technique：{c.technique!r}")
+    cents_error = float(c.cents_error or 0.0)
+    return Candidate(string=int(c.string), technique=c.technique, pos_ratio=pr, cents_error=cents_error, raw=c)
+
+
+def candidate_graph_from_stage1_result(result: Stage1Result) -> CandidateGraph:
+    """把类型化的 stage1 结果直接构建为 CandidateGraph（与 `candidate_graph_from_stage1` 等价，但不经 dict）。"""
+
+    if not result.events:
+        raise ValueError("空 events")
+    out: list[GraphEvent] = []
+    for e in result.events:
+        if not e.eid:
+            raise ValueError("事件缺少 eid")
+        if not e.targets:
+            raise ValueError(f"事件 targets 非法：eid={e.eid}")
+        slots = tuple(t.slot or None for t in e.targets)
+        per_slot = tuple(tuple(_position_to_internal(c) for c in t.candidates) for t in e.targets)
+        out.append(GraphEvent(eid=e.eid, slots=slots, candidates=per_slot))
+    return CandidateGraph(events=_expand_harmonic_groups(out))
+
+
+def candidate_graph_from_stage1(events: list[dict[str, Any]]) -> CandidateGraph:
+    """把 stage1 输出的 events（API 结构）解析为 CandidateGraph（只做结构校验与类型转换）。"""
+
+    if not events:
+        raise ValueError("空 events")
+    out: list[GraphEvent] = []
+    for e in events:
+        eid = str(e.get("eid") or "")
+        if not eid:
+            raise ValueError("事件缺少 eid")
+        targets = e.get("targets")
+        if not isinstance(targets, list) or not targets:
+            raise ValueError(f"事件 targets 非法：eid={eid}")
+
+        slots: list[str | None] = []
+        per_slot: list[tuple[Candidate, ...]] = []
+        for t in targets:
+            raw = t.get("candidates")
+            if not isinstance(raw, list):
+                if len(targets) == 1:
+                    raise ValueError(f"targets[0].candidates 非 list：eid={eid}")
+                raise ValueError(f"stage2 chord targets.candidates 非 list：eid={eid}")
+            slots.append(t.get("slot") or None)
+            per_slot.append(tuple(_cand_to_internal(c) for c in raw))
+        out.append(GraphEvent(eid=eid, slots=tuple(slots), candidates=tuple(per_slot)))
+    return CandidateGraph(events=_expand_harmonic_groups(out))
+
+
+def _node_variants(c: Candidate) -> list[Candidate]:
+    """分组泛音候选（带 harmonic_nodes）→ 每个节点一个 Candidate（raw 换成该节点）；其他候选原样返回。"""
+
+    raw = c.raw
+    if isinstance(raw, PositionCandidate):
+        if raw.harmonic_nodes is None:
+            return [c]
+        return [
+            replace(
+                c,
+                pos_ratio=float(n.pos_ratio),
+                raw=replace(raw, pos_ratio=n.pos_ratio, hui_real=n.hui_real, harmonic_k=n.k),
+            )
+            for n in raw.harmonic_nodes
+        ]
+    nodes = raw.get("harmonic_nodes")
+    if nodes is None:
+        return [c]
+    if not isinstance(nodes, list) or not nodes:
+        raise ValueError(f"候选 harmonic_nodes 非法：{raw!r}")
+    out: list[Candidate] = []
+    for n in nodes:
+        if not isinstance(n, dict) or not isinstance(n.get("pos_ratio"), (int, float)) or "k" not in n:
+            raise ValueError(f"候选 harmonic_nodes 节点缺少 k/pos_ratio：{n!r}")
+        pos = {**(raw.get("pos") or {}), "pos_ratio": n["pos_ratio"], "hui_real": n.get("hui_real")}
+        out.append(replace(c, pos_ratio=float(n["pos_ratio"]), raw={**raw, "pos": pos, "harmonic_k": n["k"]}))
+    return out
+
+
+def _nearest_nodes(nodes: list[float], neighbours: list[float]) -> set[float]:
+    """离邻居位置最近的节点：每个邻居位置两侧各取相邻的一个节点，外加两端节点。
+
+    单音事件经过节点 x 的 shift 代价为 w·(|a - x| + |x - d|)（a/d 为前后邻居位置，其余各项同组节点都相同）：
+    w ≥ 0 时关于 x 是凸的，最小值取在离区间 [a, d] 最近的节点上，即 a 或 d 两侧相邻的节点之一；
+    w < 0 时取在两端节点上。因此只展开这些节点不改变最优路径代价。
+    """
+
+    xs = sorted(nodes)
+    keep = {xs[0], xs[-1]}
+    for p in neighbours:
+        i = bisect.bisect_left(xs, p)
+        if i < len(xs):
+            keep.add(xs[i])
+        if i > 0:
+            keep.add(xs[i - 1])
+    return keep
+
+
+def _expand_harmonic_groups(events: list[GraphEvent]) -> tuple[GraphEvent, ...]:
+    """把分组泛音候选展开为节点候选；只有离相邻事件最近的节点 nearest=True（见 `_nearest_nodes`）。
+
+    其余节点保留在候选图中（nearest=False）：只在 pos_ratio lock 命中时参与求解，lock 任一节点都可行。
+    邻居位置取相邻事件全部候选（含全部节点）的位置，对任意 locks/window 都成立。
+    chord 的代表位置是各 slot 的均值，上述论证不成立：chord 事件及其相邻事件的节点全部保留。
+    """
+
+    variants = [[[_node_variants(c) for c in cs] for cs in ev.candidates] for ev in events]
+    if all(len(v) == 1 for ev in variants for cs in ev for v in cs):
+        return tuple(events)
+
+    positions = [[x.pos_ratio for cs in ev for v in cs for x in v] for ev in variants]
+    is_chord = [len(ev.slots) > 1 for ev in events]
+    out: list[GraphEvent] = []
+    for i, ev in enumerate(events):
+        near_chord = any(is_chord[j] for j in (i - 1, i, i + 1) if 0 <= j < len(events))
+        neighbours = [p for j in (i - 1, i + 1) if 0 <= j < len(events) for p in positions[j]]
+        per_slot: list[tuple[Candidate, ...]] = []
+        index: list[tuple[int, ...]] = []
+        for slot_variants in variants[i]:
+            cands: list[Candidate] = []
+            idx: list[int] = []
+            for j, v in enumerate(slot_variants):
+                if len(v) > 1 and not near_chord:
+                    keep = _nearest_nodes([x.pos_ratio for x in v], neighbours)
+                    v = [x if x.pos_ratio in keep else replace(x, nearest=False) for x in v]
+                cands.extend(v)
+                idx.extend([j] * len(v))
+            per_slot.append(tuple(cands))
+            index.append(tuple(idx))
+        out.append(GraphEvent(eid=ev.eid, slots=ev.slots, candidates=tuple(per_slot), stage1_index=tuple(index)))
+    return tuple(out)
+
+
+def _lock_selection(masks: CandidateMasks, fields: list[tuple[str, Any]]) -> int:
+    """一组 lock 字段作用后的候选位集（各字段命中位集按位与）。
+
+    同弦同技法仍可能有多个位置（例如泛音的不同节点 k/n）：pos_ratio 按位置精确收窄；
+    没有 pos_ratio 字段时只保留 nearest 节点（见 `_expand_harmonic_groups`）。
+    """
+
+    sel = masks.full
+    pos_locked = False
+    for name, v in fields:
+        sel &= masks.field(name, v)
+        pos_locked = pos_locked or name == "pos_ratio"
+    return sel if pos_locked else sel & masks.nearest
+
+
+def _single_lock_fields(eid: str, locks: list[Lock]) -> list[tuple[str, Any]]:
+    fields: list[tuple[str, Any]] = []
     for lk in locks:
         if lk.eid != eid:
             continue
-        for k, v in lk.fields.items():
-            if k == "slot":
-                raise ValueError("单音事件 lock 不支持 slot 字段（请移除 slot）")
-            if k == "string":
-                out = [c for c in out if c.string == int(v)]
-            elif k == "technique":
-                out = [c for c in out if c.technique == str(v)]
-            else:
-                raise ValueError(f"不支持的 lock 字段：{k!r}")
-    return out
+        if "slot" in lk.fields:
+            raise ValueError("单音事件 lock 不支持 slot 字段（请移除 slot）")
+        fields.extend(lk.fields.items())
+    return fields
 
 
 def _transition_cost(a: Candidate, b: Candidate, w: Weights) -> tuple[float, dict[str, float]]:
@@ -151,229 +435,2855 @@ def _transition_cost_chord(a: Candidate | ChordCandidate, b: Candidate | ChordCa
     return total, {"shift": shift, "string_change": sc, "technique_change": tc, "harmonic": hp, "cents_error": ce}
 
 
-def _top_m_candidates(cands: list[Candidate], m: int) -> list[Candidate]:
-    if m <= 0:
-        return []
-    # 优先更纯的匹配（cents_error 小），其次避免 harmonic（MVP：轻微偏好）
-    return sorted(cands, key=lambda c: (abs(c.cents_error), 1 if c.technique == "harmonic" else 0))[:m]
+def _chord_combinations(per_slot: list[list[Candidate]], w: Weights) -> Iterator[tuple[float, tuple[Candidate, ...]]]:
+    """按 intrinsic 代价非降序惰性产出 chord 组合（best-first 分支定界）。
+
+    intrinsic 代价 = harmonic 惩罚（任一 slot 为 harmonic）+ cents_error 惩罚（|Σ cents_error|），
+    与 `_transition_cost_chord` 中只取决于目标事件自身的两项一致。
+
+    - 剪枝：同一时刻一根弦不能发两个音（已用弦位与候选弦位按位与非零的分支直接丢弃）
+    - 下界：已选部分 + 剩余 slot 的可达区间（cents 取值范围、是否必然/可能含 harmonic），完整组合时下界即精确值，
+      因此出堆顺序就是代价顺序
+    """
+
+    n = len(per_slot)
+    lo_suffix = [0.0] * (n + 1)
+    hi_suffix = [0.0] * (n + 1)
+    forced_h = [False] * (n + 1)  # 剩余 slot 中是否有“只能选 harmonic”的
+    maybe_h = [False] * (n + 1)  # 剩余 slot 中是否有 harmonic 可选
+    for i in range(n - 1, -1, -1):
+        ces = [c.cents_error for c in per_slot[i]]
+        lo_suffix[i] = lo_suffix[i + 1] + min(ces)
+        hi_suffix[i] = hi_suffix[i + 1] + max(ces)
+        forced_h[i] = forced_h[i + 1] or all(c.technique == "harmonic" for c in per_slot[i])
+        maybe_h[i] = maybe_h[i + 1] or any(c.technique == "harmonic" for c in per_slot[i])
+
+    def bound(depth: int, ce_sum: float, has_h: bool) -> float:
+        lo = ce_sum + lo_suffix[depth]
+        hi = ce_sum + hi_suffix[depth]
+        min_abs = 0.0 if lo <= 0.0 <= hi else min(abs(lo), abs(hi))
+        max_abs = max(abs(lo), abs(hi))
+        ce = w.cents_error * (min_abs if w.cents_error >= 0 else max_abs)
+        if has_h or forced_h[depth]:
+            hp = w.harmonic_penalty
+        elif maybe_h[depth]:
+            hp = min(0.0, w.harmonic_penalty)
+        else:
+            hp = 0.0
+        return float(hp + ce)
+
+    # 并列时偏好更纯的匹配（cents_error 小），其次避免 harmonic：出堆顺序稳定
+    ordered = [
+        [
+            (c, _string_bit(c.string), c.technique == "harmonic")
+            for c in sorted(cs, key=lambda c: (abs(c.cents_error), 1 if c.technique == "harmonic" else 0))
+        ]
+        for cs in per_slot
+    ]
+    seq = itertools.count()
+    heap: list[tuple[float, int, int, float, bool, tuple[Candidate, ...], int]] = [
+        (bound(0, 0.0, False), next(seq), 0, 0.0, False, (), 0)
+    ]
+    while heap:
+        lb, _n, depth, ce_sum, has_h, chosen, used = heapq.heappop(heap)
+        if depth == n:
+            yield lb, chosen
+            continue
+        for c, bit, is_h in ordered[depth]:
+            if used & bit:
+                continue
+            ce2 = ce_sum + c.cents_error
+            h2 = has_h or is_h
+            heapq.heappush(heap, (bound(depth + 1, ce2, h2), next(seq), depth + 1, ce2, h2, chosen + (c,), used | bit))
+
+
+def _chord_candidate(slot_names: list[str], combo: tuple[Candidate, ...]) -> ChordCandidate:
+    return ChordCandidate(
+        slot_to_cand=dict(zip(slot_names, combo)),
+        pos_ratio=float(sum(float(c.pos_ratio) for c in combo) / len(combo)),
+        cents_error_sum=float(sum(float(c.cents_error) for c in combo)),
+        has_harmonic=any(c.technique == "harmonic" for c in combo),
+        raw_by_slot={name: c.raw for name, c in zip(slot_names, combo)},
+    )
+
+
+# chord 组合数上限（超过时截断并在 explain.chord_truncated 中标注）
+CHORD_MAX_PRODUCTS = 1200
 
 
 def _build_chord_candidates(
     *,
-    targets: list[dict[str, Any]],
-    eid: str,
+    event: GraphEvent,
     locks: list[Lock],
-    max_per_slot: int = 25,
-    max_products: int = 1200,
-) -> list[ChordCandidate]:
-    """把 stage1 的 targets（2-note chord）组合成 stage2 的 chord 候选列表。"""
-
-    if len(targets) != 2:
-        raise ValueError(f"stage2 chord 当前仅支持 2-note：eid={eid} targets={len(targets)}")
-
-    t0, t1 = targets
-    slot0 = t0.get("slot")
-    slot1 = t1.get("slot")
-    if not isinstance(slot0, str) or not slot0:
-        raise ValueError(f"stage2 chord 缺少 slot：eid={eid} slot0={slot0!r}")
-    if not isinstance(slot1, str) or not slot1:
-        raise ValueError(f"stage2 chord 缺少 slot：eid={eid} slot1={slot1!r}")
-    if slot0 == slot1:
-        raise ValueError(f"stage2 chord slot 重复：eid={eid} slot={slot0!r}")
-
-    raw0 = t0.get("candidates")
-    raw1 = t1.get("candidates")
-    if not isinstance(raw0, list) or not isinstance(raw1, list):
-        raise ValueError(f"stage2 chord targets.candidates 非 list：eid={eid}")
-
-    c0 = _top_m_candidates([_cand_to_internal(c) for c in raw0], max_per_slot)
-    c1 = _top_m_candidates([_cand_to_internal(c) for c in raw1], max_per_slot)
+    weights: Weights,
+    max_products: int = CHORD_MAX_PRODUCTS,
+) -> tuple[list[ChordCandidate], bool]:
+    """把候选图中的 chord 事件（N-note）组合成 stage2 的 chord 候选列表。
+
+    组合按 intrinsic 代价从低到高惰性生成，最多取 max_products 个；返回 (候选, 是否被截断)。
+    截断是显式的启发式（intrinsic 代价不含事件间代价），调用方必须把截断信息带到输出中。
+    """
+
+    eid = event.eid
+    slots = event.slots
+    for slot in slots:
+        if not isinstance(slot, str) or not slot:
+            raise ValueError(f"stage2 chord 缺少 slot：eid={eid} slots={list(slots)!r}")
+    if len(set(slots)) != len(slots):
+        raise ValueError(f"stage2 chord slot 重复：eid={eid} slots={list(slots)!r}")
+    slot_names = [str(x) for x in slots]
+
+    fields: list[list[tuple[str, Any]]] = [[] for _ in slot_names]
 
     # chord 锁定：必须显式指定 slot（避免语义歧义）
     for lk in locks:
         if lk.eid != eid:
             continue
         lk_slot = lk.fields.get("slot")
-        if lk_slot not in (str(slot0), str(slot1)):
-            raise ValueError(f"stage2 chord lock 必须指定 slot={slot0!r}/{slot1!r} 之一：eid={eid} got={lk_slot!r}")
-        extra = set(lk.fields.keys()) - {"slot", "string", "technique"}
+        if lk_slot not in slot_names:
+            raise ValueError(f"stage2 chord lock 必须指定 slot（{'/'.join(slot_names)} 之一）：eid={eid} got={lk_slot!r}")
+        extra = set(lk.fields.keys()) - {"slot", "string", "technique", "pos_ratio"}
         if extra:
             raise ValueError(f"stage2 chord lock 含不支持字段：eid={eid} extra={sorted(extra)!r}")
-        reduced = {k: v for k, v in lk.fields.items() if k != "slot"}
-        if str(lk_slot) == str(slot0):
-            c0 = _apply_locks(eid, c0, [Lock(eid=eid, fields=reduced)])
-        else:
-            c1 = _apply_locks(eid, c1, [Lock(eid=eid, fields=reduced)])
-    if not c0 or not c1:
-        raise ValueError(f"stage2 chord 无候选：eid={eid} (slot0={slot0!r} slot1={slot1!r})")
+        fields[slot_names.index(str(lk_slot))].extend((k, v) for k, v in lk.fields.items() if k != "slot")
+    per_slot = [
+        _pick(cs, _lock_selection(masks, fs)) for cs, masks, fs in zip(event.candidates, event.masks, fields)
+    ]
+    empty = [name for name, cs in zip(slot_names, per_slot) if not cs]
+    if empty:
+        raise ValueError(f"stage2 chord 无候选：eid={eid} slots={empty!r}")
 
     out: list[ChordCandidate] = []
-    for a in c0:
-        for b in c1:
-            if len(out) >= max_products:
-                raise ValueError(f"stage2 chord 组合候选过多（>{max_products}），需要更强的剪枝策略：eid={eid}")
-            # 物理约束：同一时刻一根弦不能发两个音
-            if a.string == b.string:
-                continue
-            pr = (float(a.pos_ratio) + float(b.pos_ratio)) / 2.0
-            ce = float(a.cents_error) + float(b.cents_error)
-            has_h = (a.technique == "harmonic") or (b.technique == "harmonic")
-            out.append(
-                ChordCandidate(
-                    slot_to_cand={str(slot0): a, str(slot1): b},
-                    pos_ratio=float(pr),
-                    cents_error_sum=float(ce),
-                    has_harmonic=bool(has_h),
-                    raw_by_slot={str(slot0): a.raw, str(slot1): b.raw},
-                )
-            )
+    truncated = False
+    for _cost, combo in _chord_combinations(per_slot, weights):
+        if len(out) >= max_products:
+            truncated = True
+            break
+        out.append(_chord_candidate(slot_names, combo))
     if not out:
-        raise ValueError(f"stage2 chord 无可用组合（弦号冲突/锁定过强）：eid={eid} slot0={slot0!r} slot1={slot1!r}")
+        raise ValueError(f"stage2 chord 无可用组合（弦号冲突/锁定过强）：eid={eid} slots={slot_names!r}")
+    return out, truncated
+
+
+@dataclass(frozen=True)
+class Window:
+    """局部窗口：只对 [from_eid, to_eid] 重新求解。
+
+    left/right：窗口前/后一个事件的固定选择（与 Lock.fields 同结构的列表，chord 每个 slot 一项），
+    与该事件已有的 locks 合并后必须收窄到唯一候选，否则失败（不替用户挑选边界）。
+    None 表示该侧不计衔接代价（窗口按独立片段求解）。
+    """
+
+    from_eid: str
+    to_eid: str
+    left: tuple[dict[str, Any], ...] | None = None
+    right: tuple[dict[str, Any], ...] | None = None
+
+
+StageCandidate = Candidate | ChordCandidate
+
+
+def _event_candidates(
+    ev: GraphEvent, locks: list[Lock], weights: Weights, truncated: list[str] | None = None
+) -> list[StageCandidate]:
+    """单个事件施加 locks 后的 stage2 候选（单音或 chord 组合）。
+
+    truncated：若给出，chord 组合被 max_products 截断时把 eid 追加进去。
+    """
+
+    eid = ev.eid
+    if len(ev.slots) == 1:
+        if ev.slots[0] is not None:
+            raise ValueError(f"stage2 单音事件 slot 非空（当前不支持该形态）：eid={eid} slot={ev.slots[0]!r}")
+        cands0 = _pick(ev.candidates[0], _lock_selection(ev.masks[0], _single_lock_fields(eid, locks)))
+        if not cands0:
+            raise ValueError(f"锁定/约束导致无候选：eid={eid}")
+        return list(cands0)
+    chords, was_truncated = _build_chord_candidates(event=ev, locks=locks, weights=weights)
+    if was_truncated and truncated is not None:
+        truncated.append(eid)
+    return list(chords)
+
+
+def _node_cost(c: StageCandidate, w: Weights) -> dict[str, float]:
+    """序列首事件（无前驱）的代价：只有 harmonic/cents_error 两项。"""
+
+    if isinstance(c, Candidate):
+        harmonic = (1.0 if c.technique == "harmonic" else 0.0) * w.harmonic_penalty
+        ce = abs(c.cents_error) * w.cents_error
+    else:
+        harmonic = (1.0 if c.has_harmonic else 0.0) * w.harmonic_penalty
+        ce = abs(c.cents_error_sum) * w.cents_error
+    return {"shift": 0.0, "string_change": 0.0, "technique_change": 0.0, "harmonic": harmonic, "cents_error": ce}
+
+
+def _boundary_candidate(
+    ev: GraphEvent, fields: tuple[dict[str, Any], ...], locks: list[Lock], weights: Weights, side: str
+) -> StageCandidate:
+    cands = _event_candidates(ev, locks + [Lock(eid=ev.eid, fields=dict(f)) for f in fields], weights)
+    if len(cands) != 1:
+        raise ValueError(f"窗口{side}边界事件必须被 locks 固定到唯一候选：eid={ev.eid} candidates={len(cands)}")
+    return cands[0]
+
+
+def _add_breakdown(a: dict[str, float], b: dict[str, float]) -> dict[str, float]:
+    out = dict(a)
+    for kk, vv in b.items():
+        out[kk] = float(out.get(kk, 0.0) + vv)
     return out
 
 
-def optimize_topk(
+class _BudgetExceeded(Exception):
+    """anytime 求解中某一轮超出时间预算（内部信号，不外泄）。"""
+
+
+def _check_deadline(deadline: float | None) -> None:
+    if deadline is not None and time.perf_counter() >= deadline:
+        raise _BudgetExceeded
+
+
+# 表项数（Σ候选数 × K）超过该值时 `_topk_paths` 自动改用检查点模式（完整表约 12 字节/项，即约 24 MiB）
+CHECKPOINT_MIN_STATES = 2_000_000
+
+
+@dataclass(frozen=True)
+class _LayerCosts:
+    """预先按一组 weights 加权好的各层代价（`_topk_paths` 直接查表，不再逐对调用 `_transition_cost_chord`）。
+
+    first[j]：首事件候选 j 的代价（有左边界时为衔接代价，否则为 `_node_cost` 之和）。
+    trans[i]：事件 i-1 → i 的扁平转移代价表，下标 pj * M_i + j；trans[0] 为空。
+    right[j]：末事件候选 j 到右边界的衔接代价（无右边界时为 None）。
+    各项与 `_transition_cost_chord` / `_node_cost` 的相加顺序一致，查表与现算逐位相同。
+    """
+
+    first: list[float]
+    trans: tuple[list[float], ...]
+    right: list[float] | None
+
+
+def _topk_first_layer(
+    first: list[StageCandidate], k: int, w: Weights, left: StageCandidate | None, init: list[float] | None = None
+) -> array:
+    cost = array("d", [float("inf")]) * (len(first) * k)
+    for j, c in enumerate(first):
+        if init is not None:
+            cost[j * k] = init[j]
+        elif left is None:
+            cost[j * k] = float(sum(_node_cost(c, w).values()))
+        else:
+            cost[j * k] = float(_transition_cost_chord(left, c, w)[0])
+    return cost
+
+
+def _topk_next_layer(
+    prev_cands: list[StageCandidate],
+    cur_cands: list[StageCandidate],
+    prev_cost: array,
+    k: int,
+    w: Weights,
+    tcs: list[float] | None = None,
+) -> tuple[array, array]:
+    """由上一层的代价表算出下一层的 (代价表, 回溯指针表)；tcs 为预先加权的转移代价表（见 `_LayerCosts.trans`）。"""
+
+    inf = float("inf")
+    # 前一层每个候选的有效前缀（升序、连续存放）
+    prev_lists = [
+        [(prev_cost[flat], flat) for flat in range(pj * k, pj * k + k) if prev_cost[flat] != inf]
+        for pj in range(len(prev_cands))
+    ]
+    cur_cost = array("d", [inf]) * (len(cur_cands) * k)
+    cur_back = array("i", [-1]) * (len(cur_cands) * k)
+    m = len(cur_cands)
+    for j, cur_c in enumerate(cur_cands):
+        items: list[tuple[float, int]] = []
+        for pj, prev_c in enumerate(prev_cands):
+            tc = _transition_cost_chord(prev_c, cur_c, w)[0] if tcs is None else tcs[pj * m + j]
+            for prev_c_cost, flat in prev_lists[pj]:
+                items.append((float(prev_c_cost + tc), flat))
+        # 取最小 k 条（同代价按来源下标，即 (pj, r) 的枚举顺序）
+        items.sort()
+        for r, (c_cost, flat) in enumerate(items[:k]):
+            cur_cost[j * k + r] = c_cost
+            cur_back[j * k + r] = flat
+    return cur_cost, cur_back
+
+
+def _topk_ends(
+    last_cands: list[StageCandidate],
+    last_cost: array,
+    k: int,
+    w: Weights,
+    right: StageCandidate | None,
+    rtcs: list[float] | None = None,
+) -> list[tuple[float, int]]:
+    """全局 Top-K 终止状态（有右边界时加上“离开窗口”的衔接代价；rtcs 为预先加权的衔接代价）。"""
+
+    inf = float("inf")
+    ends: list[tuple[float, int]] = []
+    for j, last_c in enumerate(last_cands):
+        if right is None:
+            rtc = None
+        else:
+            rtc = _transition_cost_chord(last_c, right, w)[0] if rtcs is None else rtcs[j]
+        for flat in range(j * k, j * k + k):
+            c_cost = last_cost[flat]
+            if c_cost == inf:
+                break
+            ends.append((float(c_cost + rtc) if rtc is not None else c_cost, flat))
+    ends.sort()
+    return ends[:k]
+
+
+def _use_checkpoint(seq_cands: list[list[StageCandidate]], k: int) -> bool:
+    return sum(len(cs) for cs in seq_cands) * k >= CHECKPOINT_MIN_STATES
+
+
+def _topk_paths(
+    seq_cands: list[list[StageCandidate]],
     *,
-    events: list[dict[str, Any]],
     k: int,
-    locks: list[Lock],
     weights: Weights,
-) -> list[Solution]:
-    """在事件序列上做 Top-K 路径推荐。
+    left: StageCandidate | None = None,
+    right: StageCandidate | None = None,
+    breakdown: bool = True,
+    checkpoint: bool | None = None,
+    deadline: float | None = None,
+    layer_costs: _LayerCosts | None = None,
+) -> list[tuple[list[int], dict[str, float], float]]:
+    """Top-K DP：返回 [(每事件候选下标, cost_breakdown, total_cost)]，按 total_cost 升序。
+
+    left/right：序列外的固定边界候选（只贡献衔接代价，不出现在路径里）。
 
-    events 结构要求（来自 stage1 输出）：
-    - 每个元素形如 {"eid": "...", "targets": [ { "slot": null, "candidates": [...] } ]}
-    - 当前仅支持 len(targets)==1，且 slot 为空（单音事件）
+    表结构（内存与 N·M·K 成正比，每个状态 12 字节）：每个事件一层，状态 (j, r)（以候选 j 结尾的第 r 条前缀）
+    平铺为下标 j*k + r；cost 存在 array('d')（缺失的前缀为 +inf），回溯指针存上一层的平铺下标（array('i')，首层为 -1）。
+    分项不进表，只沿最终路径重算（`_path_cost` 与 DP 的累加顺序一致，数值逐位相同）；breakdown=False 时返回空 dict。
+
+    checkpoint：None 表示按表项数自动选择（见 `CHECKPOINT_MIN_STATES`），结果与完整表模式逐位一致。
+    deadline：perf_counter 时刻；前向 DP 每层检查一次，到达时按 `_BudgetExceeded` 中止（供 anytime 求解）。
+    layer_costs：预先加权好的各层代价（见 `_LayerCosts`，供批量求解共享候选与代价项），结果与现算逐位一致。
     """
 
-    if k <= 0:
-        raise ValueError("k 必须为正")
-    if not events:
-        raise ValueError("空 events")
+    w = weights
+    n = len(seq_cands)
+    lc = layer_costs
+    if checkpoint is None:
+        checkpoint = _use_checkpoint(seq_cands, k)
+
+    if checkpoint:
+        ends, idxs_list = _topk_backtrack_checkpointed(
+            seq_cands, k=k, w=w, left=left, right=right, deadline=deadline, layer_costs=lc
+        )
+    else:
+        costs = [_topk_first_layer(seq_cands[0], k, w, left, lc.first if lc else None)]
+        backs = [array("i", [-1]) * (len(seq_cands[0]) * k)]
+        for i in range(1, n):
+            _check_deadline(deadline)
+            cost, back = _topk_next_layer(seq_cands[i - 1], seq_cands[i], costs[-1], k, w, lc.trans[i] if lc else None)
+            costs.append(cost)
+            backs.append(back)
+        ends = _topk_ends(seq_cands[-1], costs[-1], k, w, right, lc.right if lc else None)
+        idxs_list = []
+        for _total, end_flat in ends:
+            idxs = [0] * n
+            flat = end_flat
+            for i in range(n - 1, -1, -1):
+                idxs[i] = flat // k
+                flat = backs[i][flat]
+            idxs_list.append(idxs)
 
-    seq_eids: list[str] = []
-    # 每个事件可为单音 Candidate 或 chord ChordCandidate（统一存为 object）
-    seq_cands: list[list[Candidate | ChordCandidate]] = []
-    seq_kind: list[str] = []
+    out: list[tuple[list[int], dict[str, float], float]] = []
+    for (total_cost, _flat), idxs in zip(ends, idxs_list):
+        bd = _path_cost(seq_cands, idxs, w, left=left, right=right)[1] if breakdown else {}
+        out.append((idxs, bd, float(total_cost)))
+    return out
 
-    for e in events:
-        eid = str(e.get("eid") or "")
-        if not eid:
-            raise ValueError("事件缺少 eid")
-        targets = e.get("targets")
-        if not isinstance(targets, list) or not targets:
-            raise ValueError(f"事件 targets 非法：eid={eid}")
 
-        if len(targets) == 1:
-            t0 = targets[0]
-            if t0.get("slot") not in (None, ""):
-                raise ValueError(f"stage2 单音事件 slot 非空（当前不支持该形态）：eid={eid} slot={t0.get('slot')!r}")
-
-            raw_cands = t0.get("candidates")
-            if not isinstance(raw_cands, list):
-                raise ValueError(f"targets[0].candidates 非 list：eid={eid}")
-            cands0 = [_cand_to_internal(c) for c in raw_cands]
-            cands0 = _apply_locks(eid, cands0, locks)
-            if not cands0:
-                raise ValueError(f"锁定/约束导致无候选：eid={eid}")
-            seq_eids.append(eid)
-            seq_cands.append(cands0)
-            seq_kind.append("single")
+def _topk_backtrack_checkpointed(
+    seq_cands: list[list[StageCandidate]],
+    *,
+    k: int,
+    w: Weights,
+    left: StageCandidate | None,
+    right: StageCandidate | None,
+    deadline: float | None = None,
+    layer_costs: _LayerCosts | None = None,
+) -> tuple[list[tuple[float, int]], list[list[int]]]:
+    """检查点模式：前向只保留每 ⌈√N⌉ 层的代价/回溯表，回溯时按块从检查点重算块内各层。
+
+    内存 O(√N·M·K)，代价是前向 DP 约多算一遍；每层的计算与完整表模式完全相同，结果逐位一致。
+    """
+
+    n = len(seq_cands)
+    step = max(1, math.isqrt(n - 1) + 1) if n > 1 else 1
+    lc = layer_costs
+    cost = _topk_first_layer(seq_cands[0], k, w, left, lc.first if lc else None)
+    cp_cost: dict[int, array] = {0: cost}
+    cp_back: dict[int, array] = {0: array("i", [-1]) * (len(seq_cands[0]) * k)}
+    for i in range(1, n):
+        _check_deadline(deadline)
+        cost, back = _topk_next_layer(seq_cands[i - 1], seq_cands[i], cost, k, w, lc.trans[i] if lc else None)
+        if i % step == 0:
+            cp_cost[i] = cost
+            cp_back[i] = back
+    ends = _topk_ends(seq_cands[-1], cost, k, w, right, lc.right if lc else None)
+
+    flats = [flat for _c, flat in ends]
+    idxs_list = [[0] * n for _ in ends]
+    hi = n - 1
+    while hi >= 0:
+        _check_deadline(deadline)
+        lo = (hi // step) * step
+        block_backs = [cp_back[lo]]
+        cost = cp_cost[lo]
+        for i in range(lo + 1, hi + 1):
+            cost, back = _topk_next_layer(seq_cands[i - 1], seq_cands[i], cost, k, w, lc.trans[i] if lc else None)
+            block_backs.append(back)
+        for i in range(hi, lo - 1, -1):
+            back = block_backs[i - lo]
+            for p, flat in enumerate(flats):
+                idxs_list[p][i] = flat // k
+                flats[p] = back[flat]
+        hi = lo - 1
+    return ends, idxs_list
+
+
+def _assignment(eid: str, chosen: StageCandidate) -> dict[str, Any]:
+    if isinstance(chosen, Candidate):
+        return {"eid": eid, "choice": chosen.raw}
+    by_slot = [{"slot": slot, "choice": raw} for slot, raw in chosen.raw_by_slot.items()]
+    return {"eid": eid, "choices": by_slot}
+
+
+def _window_range(graph: CandidateGraph, window: Window) -> tuple[int, int]:
+    index = {ev.eid: i for i, ev in enumerate(graph.events)}
+    if window.from_eid not in index:
+        raise ValueError(f"窗口起点 eid 不存在：{window.from_eid}")
+    if window.to_eid not in index:
+        raise ValueError(f"窗口终点 eid 不存在：{window.to_eid}")
+    start, end = index[window.from_eid], index[window.to_eid]
+    if start > end:
+        raise ValueError(f"窗口起点在终点之后：from={window.from_eid} to={window.to_eid}")
+    if window.left is not None and start == 0:
+        raise ValueError(f"窗口左侧没有事件，无法固定左边界：from={window.from_eid}")
+    if window.right is not None and end == len(graph.events) - 1:
+        raise ValueError(f"窗口右侧没有事件，无法固定右边界：to={window.to_eid}")
+    return start, end
+
+
+_LOCK_FIELDS = ("string", "technique", "pos_ratio")
+
+
+@dataclass(frozen=True)
+class LockConflict:
+    """一处不可行原因（定位到 eid，以及可能的 slot / lock 字段）。
+
+    reason：
+    - no_candidates：stage1 本身没有候选
+    - lock_empty：单个 lock 字段即排除全部候选（field 为该字段）
+    - locks_combined_empty：各字段单独可行、合起来无候选（field 为逗号分隔的字段列表）
+    - string_collision：chord 各 slot 剩余候选无法取到互不相同的弦
+    - unknown_eid / invalid_lock / invalid_event：lock 或事件结构本身不合法
+    """
+
+    eid: str
+    reason: str
+    detail: str
+    field: str | None = None
+    slot: str | None = None
+
+
+class Stage2Infeasible(ValueError):
+    """stage2 输入不可行：一次性携带全部冲突（而不是只报第一个）。"""
+
+    def __init__(self, conflicts: list[LockConflict]):
+        self.conflicts = tuple(conflicts)
+        head = "; ".join(
+            f"eid={c.eid}" + (f" slot={c.slot}" if c.slot else "") + f" {c.detail}" for c in self.conflicts[:20]
+        )
+        more = f"（另有 {len(self.conflicts) - 20} 处）" if len(self.conflicts) > 20 else ""
+        super().__init__(f"stage2 不可行（{len(self.conflicts)} 处冲突）：{head}{more}")
+
+
+def _lock_value_ok(field_name: str, v: Any) -> bool:
+    try:
+        if field_name == "string":
+            int(v)
+        elif field_name == "pos_ratio":
+            float(v)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _field_conflicts(
+    eid: str, slot: str | None, masks: CandidateMasks, fields: list[tuple[str, Any]]
+) -> tuple[list[LockConflict], int]:
+    """对一组候选逐字段检查 lock：返回 (冲突, 全部字段合并后的剩余候选位集)。
+
+    nearest 过滤与求解一致（`_lock_selection`）：该 slot 有 pos_ratio 字段时不过滤。
+    """
+
+    if not masks.full:
+        return [LockConflict(eid=eid, reason="no_candidates", detail="stage1 无候选", slot=slot)], 0
+    out: list[LockConflict] = []
+    base = masks.full if any(name == "pos_ratio" for name, _v in fields) else masks.nearest
+    remaining = base
+    for name, v in fields:
+        hit = masks.field(name, v)
+        if not hit & base:
+            detail = f"{name}={v!r} 排除了全部 {masks.full.bit_length()} 个候选"
+            out.append(LockConflict(eid=eid, reason="lock_empty", detail=detail, field=name, slot=slot))
+        remaining &= hit
+    if not out and not remaining:
+        names = ",".join(name for name, _v in fields)
+        out.append(
+            LockConflict(eid=eid, reason="locks_combined_empty", detail=f"字段 {names} 合起来无候选", field=names, slot=slot)
+        )
+    return out, remaining
+
+
+def _distinct_strings_possible(strings: list[int]) -> bool:
+    """chord 各 slot 能否取到互不相同的弦（二分图完美匹配，slot 数很小）：strings[si] 为该 slot 可用的弦位。"""
+
+    owner: dict[int, int] = {}
+
+    def augment(si: int, seen: list[int]) -> bool:
+        free = strings[si] & ~seen[0]
+        while free:
+            bit = free & -free
+            free ^= bit
+            seen[0] |= bit
+            if bit not in owner or augment(owner[bit], seen):
+                owner[bit] = si
+                return True
+            free &= ~seen[0]
+        return False
+
+    return all(augment(si, [0]) for si in range(len(strings)))
+
+
+def _event_conflicts(ev: GraphEvent, locks: list[Lock]) -> list[LockConflict]:
+    eid = ev.eid
+    out: list[LockConflict] = []
+
+    def invalid(detail: str, field_name: str, slot: str | None = None) -> None:
+        out.append(LockConflict(eid=eid, reason="invalid_lock", detail=detail, field=field_name, slot=slot))
+
+    if len(ev.slots) == 1:
+        if ev.slots[0] is not None:
+            return [LockConflict(eid=eid, reason="invalid_event", detail=f"单音事件 slot 非空：{ev.slots[0]!r}")]
+        fields: list[tuple[str, Any]] = []
+        for lk in locks:
+            for name, v in lk.fields.items():
+                if name == "slot":
+                    invalid("单音事件 lock 不支持 slot 字段", name)
+                elif name not in _LOCK_FIELDS:
+                    invalid(f"不支持的 lock 字段：{name!r}", name)
+                elif not _lock_value_ok(name, v):
+                    invalid(f"lock 字段值非法：{name}={v!r}", name)
+                else:
+                    fields.append((name, v))
+        if out:
+            return out
+        return _field_conflicts(eid, None, ev.masks[0], fields)[0]
+
+    slots = ev.slots
+    if any(not isinstance(x, str) or not x for x in slots) or len(set(slots)) != len(slots):
+        return [LockConflict(eid=eid, reason="invalid_event", detail=f"chord slot 缺失或重复：{list(slots)!r}")]
+    by_slot: dict[str, list[tuple[str, Any]]] = {str(x): [] for x in slots}
+    for lk in locks:
+        lk_slot = lk.fields.get("slot")
+        if lk_slot not in by_slot:
+            invalid(f"chord lock 必须指定 slot（{'/'.join(by_slot)} 之一），收到 {lk_slot!r}", "slot")
             continue
+        for name, v in lk.fields.items():
+            if name == "slot":
+                continue
+            if name not in _LOCK_FIELDS:
+                invalid(f"chord lock 含不支持字段：{name!r}", name, lk_slot)
+            elif not _lock_value_ok(name, v):
+                invalid(f"lock 字段值非法：{name}={v!r}", name, lk_slot)
+            else:
+                by_slot[lk_slot].append((name, v))
+    if out:
+        return out
+    remaining: list[int] = []
+    for slot, masks in zip(by_slot, ev.masks):
+        conflicts, rest = _field_conflicts(eid, slot, masks, by_slot[slot])
+        out.extend(conflicts)
+        remaining.append(rest)
+    if not out and not _distinct_strings_possible([m.strings(r) for m, r in zip(ev.masks, remaining)]):
+        detail = ", ".join(
+            f"{slot}:{sorted(s for s, b in m.by_string.items() if b & r)}" for slot, m, r in zip(by_slot, ev.masks, remaining)
+        )
+        out.append(LockConflict(eid=eid, reason="string_collision", detail=f"各 slot 无法取到互不相同的弦（{detail}）"))
+    return out
+
+
+def check_feasibility(*, graph: CandidateGraph, locks: list[Lock], window: Window | None = None) -> list[LockConflict]:
+    """O(N + locks) 的可行性预检：在计算任何转移代价之前收集全部冲突。
+
+    只检查待求解的事件（window 时为窗口内事件与固定边界事件，边界的固定选择按 lock 处理）；
+    lock 指向不存在的 eid 同样视为冲突（不静默忽略）。
+    """
 
-        if len(targets) == 2:
-            cands2 = _build_chord_candidates(targets=targets, eid=eid, locks=locks)
-            seq_eids.append(eid)
-            seq_cands.append(cands2)
-            seq_kind.append("chord2")
+    index = {ev.eid: i for i, ev in enumerate(graph.events)}
+    by_eid: dict[str, list[Lock]] = {}
+    conflicts: list[LockConflict] = []
+    for lk in locks:
+        if lk.eid not in index:
+            conflicts.append(LockConflict(eid=lk.eid, reason="unknown_eid", detail="lock 指向不存在的事件"))
             continue
+        by_eid.setdefault(lk.eid, []).append(lk)
 
-        raise ValueError(f"stage2 暂不支持 3+ 音 chord：eid={eid} targets={len(targets)}")
+    start, end = (0, len(graph.events) - 1) if window is None else _window_range(graph, window)
+    for side, fields, i in (
+        ("left", window.left if window is not None else None, start - 1),
+        ("right", window.right if window is not None else None, end + 1),
+    ):
+        if fields is not None:
+            ev = graph.events[i]
+            by_eid[ev.eid] = by_eid.get(ev.eid, []) + [Lock(eid=ev.eid, fields=dict(f)) for f in fields]
+            conflicts.extend(_event_conflicts(ev, by_eid[ev.eid]))
+    for ev in graph.events[start : end + 1]:
+        conflicts.extend(_event_conflicts(ev, by_eid.get(ev.eid, [])))
+    return conflicts
 
-    # DP：dp[i][j] = topK partial paths ending at candidate j
-    # 用结构：list of (cost, breakdown_sums, back_ptr)
-    # back_ptr: (prev_j, prev_k_idx)
-    dp: list[list[list[tuple[float, dict[str, float], tuple[int, int] | None]]]] = []
 
-    # init
-    dp0: list[list[tuple[float, dict[str, float], tuple[int, int] | None]]] = []
-    for _j, c in enumerate(seq_cands[0]):
-        if isinstance(c, Candidate):
-            harmonic = (1.0 if c.technique == "harmonic" else 0.0) * weights.harmonic_penalty
-            ce = abs(c.cents_error) * weights.cents_error
+def _require_feasible(graph: CandidateGraph, locks: list[Lock], window: Window | None) -> None:
+    conflicts = check_feasibility(graph=graph, locks=locks, window=window)
+    if conflicts:
+        raise Stage2Infeasible(conflicts)
+
+
+@dataclass(frozen=True)
+class _Sequence:
+    """施加 locks/window 后待求解的事件序列（以及窗口外的固定边界候选）。"""
+
+    events: tuple[GraphEvent, ...]
+    cands: list[list[StageCandidate]]
+    left: StageCandidate | None
+    right: StageCandidate | None
+    window_explain: dict[str, Any] | None
+    chord_truncated: tuple[str, ...]  # chord 组合被 max_products 截断的 eid
+    pruned: int = 0  # dominance 剪枝移除的候选数（见 `_prune_dominated`）
+
+
+# dominance 判定的数值余量：替换后每条路径至少便宜这么多才算严格支配（抵消路径代价累加的舍入）
+DOMINANCE_EPS = 1e-9
+# 邻居按 (弦集合, 技法集合) 分组的上限；超过时（chord 组合很多）合并为一组，换弦/换技法按最坏情况计
+DOMINANCE_MAX_GROUPS = 32
+# 两两判定时每个候选最多尝试的支配者个数（另加 k）：按 hi 升序取最有希望的保留候选，使开销为 O(M·组数)
+DOMINANCE_MAX_TRIES = 8
+# 候选数少于该值的事件不剪枝：判定开销约为一层 DP，小事件上即使剪掉大半也收不回来
+# （`scripts/bench_stage2_prune.py`：M≤32 时偏重 harmonic 的 weights 剪掉 40%~70% 也只快 1.0~1.7 倍，
+# M≥48 时快 1.4~4.9 倍）
+DOMINANCE_MIN_CANDIDATES = 48
+# 先对这么多个达到门槛的事件判定；剪掉的候选比例低于 DOMINANCE_MIN_PROBE_FRACTION 时其余事件不再判定
+# （shift 主导的默认 weights 下只剪掉 0~5%，每个事件都判定会慢 1.3~1.7 倍；探测后与不剪枝持平）
+DOMINANCE_PROBE_EVENTS = 8
+DOMINANCE_MIN_PROBE_FRACTION = 0.1
+
+PruneMode = Literal["off", "on", "verify"]
+
+# 邻居分组：(弦集合, 技法集合, 最小 pos, 最大 pos)；集合为 None 表示合并组（集合未知）
+_NeighbourGroup = tuple[frozenset[int] | None, frozenset[str] | None, float, float]
+
+
+def _neighbour_groups(neighbours: list[StageCandidate]) -> list[_NeighbourGroup]:
+    spans: dict[tuple[frozenset[int], frozenset[str]], tuple[float, float]] = {}
+    for x in neighbours:
+        key = (frozenset(_strings_of(x)), frozenset(_techniques_of(x)))
+        lo, hi = spans.get(key, (x.pos_ratio, x.pos_ratio))
+        spans[key] = (min(lo, x.pos_ratio), max(hi, x.pos_ratio))
+    if len(spans) > DOMINANCE_MAX_GROUPS:
+        return [(None, None, min(lo for lo, _hi in spans.values()), max(hi for _lo, hi in spans.values()))]
+    return [(g_str, g_tech, lo, hi) for (g_str, g_tech), (lo, hi) in spans.items()]
+
+
+def _switch_gap(
+    b: tuple[float, frozenset[int], frozenset[str]],
+    c: tuple[float, frozenset[int], frozenset[str]],
+    groups: list[_NeighbourGroup],
+    w: Weights,
+) -> float:
+    """把 b 换成 c 时，与这一侧任一邻居之间的衔接代价（shift/换弦/换技法，不含目标自身项）最多增加多少。
+
+    b/c 为 (pos, 弦集合, 技法集合)。shift：|p - p_c| - |p - p_b| 关于邻居位置 p 单调，组内最值取在组的 pos 端点；
+    换弦/换技法只取决于集合，组内为常数（合并组按集合是否相同取最坏情况）。
+    """
+
+    b_pos, b_str, b_tech = b
+    c_pos, c_str, c_tech = c
+    worst = float("-inf")
+    for g_str, g_tech, lo, hi in groups:
+        d_lo = abs(lo - c_pos) - abs(lo - b_pos)
+        d_hi = abs(hi - c_pos) - abs(hi - b_pos)
+        gap = w.shift * (max(d_lo, d_hi) if w.shift >= 0 else min(d_lo, d_hi))
+        if g_str is None:
+            gap += abs(w.string_change) if b_str != c_str else 0.0
         else:
-            harmonic = (1.0 if c.has_harmonic else 0.0) * weights.harmonic_penalty
-            ce = abs(c.cents_error_sum) * weights.cents_error
-        base = {"shift": 0.0, "string_change": 0.0, "technique_change": 0.0, "harmonic": harmonic, "cents_error": ce}
-        cost = sum(base.values())
-        dp0.append([(float(cost), base, None)])
-    dp.append(dp0)
-
-    # transitions
-    for i in range(1, len(seq_cands)):
-        cur_states: list[list[tuple[float, dict[str, float], tuple[int, int]]]] = []
-        for j, cur_c in enumerate(seq_cands[i]):
-            candidates_for_state: list[tuple[float, dict[str, float], tuple[int, int]]] = []
-            for pj, prev_c in enumerate(seq_cands[i - 1]):
-                prev_paths = dp[i - 1][pj]
-                for pk, (prev_cost, prev_bd, _prev_ptr) in enumerate(prev_paths):
-                    tc, bd = _transition_cost_chord(prev_c, cur_c, weights)
-                    new_bd = dict(prev_bd)
-                    for kk, vv in bd.items():
-                        new_bd[kk] = float(new_bd.get(kk, 0.0) + vv)
-                    new_cost = float(prev_cost + tc)
-                    candidates_for_state.append((new_cost, new_bd, (pj, pk)))
-
-            # 取最小 k 条（稳定：按 cost，再按来源索引）
-            candidates_for_state.sort(key=lambda x: x[0])
-            cur_states.append(candidates_for_state[:k])
-        dp.append(cur_states)
-
-    # 收集全局 topK 终止路径
-    end_candidates: list[tuple[float, dict[str, float], int, int]] = []  # cost, bd, end_j, end_kidx
-    last_i = len(seq_cands) - 1
-    for j in range(len(seq_cands[last_i])):
-        for kk, (cost, bd, _ptr) in enumerate(dp[last_i][j]):
-            end_candidates.append((cost, bd, j, kk))
-    end_candidates.sort(key=lambda x: x[0])
-    end_candidates = end_candidates[:k]
-
-    def reconstruct(end_j: int, end_k: int) -> tuple[list[int], dict[str, float], float]:
-        idxs = [0] * len(seq_cands)
-        i = last_i
-        j = end_j
-        kidx = end_k
-        cost, bd, ptr = dp[i][j][kidx]
-        idxs[i] = j
-        while ptr is not None:
-            pj, pk = ptr
-            i -= 1
-            j = pj
-            kidx = pk
-            cost, bd, ptr = dp[i][j][kidx]
-            idxs[i] = j
-        final_cost, final_bd, _ = dp[last_i][end_j][end_k]
-        return idxs, final_bd, final_cost
+            gap += w.string_change * ((0.0 if g_str & c_str else 1.0) - (0.0 if g_str & b_str else 1.0))
+        if g_tech is None:
+            gap += abs(w.technique_change) if b_tech != c_tech else 0.0
+        else:
+            gap += w.technique_change * ((0.0 if g_tech == c_tech else 1.0) - (0.0 if g_tech == b_tech else 1.0))
+        if gap > worst:
+            worst = gap
+    return worst
 
-    solutions: list[Solution] = []
-    for si, (_cost, _bd, end_j, end_k) in enumerate(end_candidates, start=1):
-        idxs, bd, total_cost = reconstruct(end_j, end_k)
-        assignments: list[dict[str, Any]] = []
-        for eid, cand_list, kind, j in zip(seq_eids, seq_cands, seq_kind, idxs):
-            chosen = cand_list[j]
-            if isinstance(chosen, Candidate):
-                assignments.append({"eid": eid, "choice": chosen.raw})
-            else:
-                by_slot = [{"slot": slot, "choice": raw} for slot, raw in chosen.raw_by_slot.items()]
-                assignments.append({"eid": eid, "choices": by_slot})
 
-        solutions.append(
-            Solution(
-                solution_id=f"S{si:04d}",
-                total_cost=float(total_cost),
-                assignments=assignments,
-                explain={"cost_breakdown": bd, "weights": weights.__dict__},
-            )
-        )
+def _endpoint_costs(
+    shape: tuple[float, frozenset[int], frozenset[str]], groups: list[_NeighbourGroup], w: Weights
+) -> list[float]:
+    """候选与每组两个 pos 端点处邻居的衔接代价（合并组不计换弦/换技法）。"""
 
-    return solutions
+    pos, strs, techs = shape
+    out: list[float] = []
+    for g_str, g_tech, lo, hi in groups:
+        const = 0.0
+        if g_str is not None and not g_str & strs:
+            const += w.string_change
+        if g_tech is not None and g_tech != techs:
+            const += w.technique_change
+        out.append(w.shift * abs(lo - pos) + const)
+        out.append(w.shift * abs(hi - pos) + const)
+    return out
+
+
+def _cost_interval(
+    shape: tuple[float, frozenset[int], frozenset[str]],
+    own: float,
+    sides: list[list[_NeighbourGroup]],
+    w: Weights,
+) -> tuple[float, float]:
+    """经过该候选的局部代价（自身项 + 与两侧任一邻居的衔接项）的区间 [lo, hi]。"""
+
+    pos, strs, techs = shape
+    lo_total = hi_total = own
+    for groups in sides:
+        side_lo = float("inf")
+        side_hi = float("-inf")
+        for g_str, g_tech, g_lo, g_hi in groups:
+            far = max(abs(g_lo - pos), abs(g_hi - pos))
+            near = 0.0 if g_lo <= pos <= g_hi else min(abs(g_lo - pos), abs(g_hi - pos))
+            lo, hi = sorted((w.shift * near, w.shift * far))
+            if g_str is None:
+                lo += min(0.0, w.string_change)
+                hi += max(0.0, w.string_change)
+            else:
+                v = 0.0 if g_str & strs else w.string_change
+                lo += v
+                hi += v
+            if g_tech is None:
+                lo += min(0.0, w.technique_change)
+                hi += max(0.0, w.technique_change)
+            else:
+                v = 0.0 if g_tech == techs else w.technique_change
+                lo += v
+                hi += v
+            side_lo = min(side_lo, lo)
+            side_hi = max(side_hi, hi)
+        lo_total += side_lo
+        hi_total += side_hi
+    return lo_total, hi_total
+
+
+def _prune_dominated(
+    cands: list[StageCandidate],
+    w: Weights,
+    k: int,
+    prev: list[StageCandidate] | None,
+    nxt: list[StageCandidate] | None,
+) -> list[StageCandidate]:
+    """移除在当前 weights 下被至少 k 个保留候选严格支配的候选（保持原有相对顺序）。
+
+    prev/nxt：相邻事件（或窗口边界）未剪枝的候选；None 表示该侧没有邻居。
+    c 严格支配 b：对两侧邻居的任意组合，经过 c 的局部代价都严格低于经过 b。两级判定：
+    1) 区间：lo(b) 高于第 k 小的 hi（`_cost_interval`），O(M·组数)；
+    2) 两两：own(b) - own(c) > gap_prev(b→c) + gap_next(b→c)（`_switch_gap`），只在 hi(c) < hi(b) 的对上计算。
+    有 k 个支配者就有 k 条互不相同、严格更便宜的路径；多个事件同时剪枝时逐个替换仍成立
+    （界对邻居集合中的任意候选有效，替换后的邻居仍在集合内）。
+    因此被剪掉的路径不可能进入 Top-K，剪枝前后的 Top-K（代价、路径、同代价的先后）逐位一致。
+    """
+
+    if len(cands) <= k or len(cands) < DOMINANCE_MIN_CANDIDATES:
+        return cands
+    sides = [g for g in (_neighbour_groups(prev) if prev else None, _neighbour_groups(nxt) if nxt else None) if g]
+    own = []
+    for c in cands:
+        h, ce = _own_terms(c)
+        own.append(h * w.harmonic_penalty + ce * w.cents_error)
+    shape = [(c.pos_ratio, frozenset(_strings_of(c)), frozenset(_techniques_of(c))) for c in cands]
+
+    if w.shift >= 0:
+        # shift 权重非负时每组的最值取在两个 pos 端点上（到区间的距离 = (|p-lo| + |p-hi| - 宽度) / 2）：
+        # 预先算好每个候选对各端点的衔接代价，区间与两两判定都化为向量运算（合并组的换弦/换技法另按最坏情况计）
+        vectors = [[_endpoint_costs(x, groups, w) for groups in sides] for x in shape]
+        widths = [[w.shift * (hi - lo) for _s, _t, lo, hi in groups] for groups in sides]
+        is_merged = [groups[0][0] is None for groups in sides]
+        m_lo = min(0.0, w.string_change) + min(0.0, w.technique_change)
+        m_hi = max(0.0, w.string_change) + max(0.0, w.technique_change)
+        bounds = []
+        for j, vec in enumerate(vectors):
+            lo = hi = own[j]
+            for v, width, merged in zip(vec, widths, is_merged):
+                hi += max(v) + (m_hi if merged else 0.0)
+                lo += min(map(operator.sub, map(operator.add, v[0::2], v[1::2]), width)) / 2 + (m_lo if merged else 0.0)
+            bounds.append((lo, hi))
+
+        def gap(j: int, i: int) -> float:
+            total = 0.0
+            for vi, vj, merged in zip(vectors[i], vectors[j], is_merged):
+                total += max(map(operator.sub, vi, vj))
+                if merged:
+                    total += abs(w.string_change) if shape[i][1] != shape[j][1] else 0.0
+                    total += abs(w.technique_change) if shape[i][2] != shape[j][2] else 0.0
+            return total
+
+    else:
+        bounds = [_cost_interval(shape[j], own[j], sides, w) for j in range(len(cands))]
+
+        def gap(j: int, i: int) -> float:
+            return sum(_switch_gap(shape[j], shape[i], groups, w) for groups in sides)
+
+    kth_hi = sorted(hi for _lo, hi in bounds)[k - 1]
+    alive = [j for j in range(len(cands)) if bounds[j][0] <= kth_hi + DOMINANCE_EPS]
+
+    kept: list[int] = []
+    for j in sorted(alive, key=lambda x: (bounds[x][1], x)):
+        hi_j = bounds[j][1]
+        dominators = 0
+        for i in kept[: DOMINANCE_MAX_TRIES + k]:
+            if bounds[i][1] >= hi_j:
+                break
+            if own[j] - own[i] - DOMINANCE_EPS > gap(j, i):
+                dominators += 1
+                if dominators >= k:
+                    break
+        if dominators < k:
+            kept.append(j)
+    if len(kept) == len(cands):
+        return cands
+    return [cands[j] for j in sorted(kept)]
+
+
+class _DominancePruner:
+    """逐事件调用 `_prune_dominated`，并统计前几个事件上的收益：剪得太少时停止判定（只影响耗时，不影响结果）。
+
+    一次求解（或一个增量求解器）用同一个实例：weights 与 k 固定，前几个事件的剪枝比例足以代表整曲。
+    """
+
+    def __init__(self, weights: Weights, k: int):
+        self.weights = weights
+        self.k = k
+        self.probed_events = 0
+        self.probed_candidates = 0
+        self.removed = 0
+
+    @property
+    def active(self) -> bool:
+        return (
+            self.probed_events < DOMINANCE_PROBE_EVENTS
+            or self.removed >= DOMINANCE_MIN_PROBE_FRACTION * self.probed_candidates
+        )
+
+    def prune(
+        self, cands: list[StageCandidate], prev: list[StageCandidate] | None, nxt: list[StageCandidate] | None
+    ) -> list[StageCandidate]:
+        if not self.active:
+            return cands
+        kept = _prune_dominated(cands, self.weights, self.k, prev, nxt)
+        if len(cands) > self.k and len(cands) >= DOMINANCE_MIN_CANDIDATES:
+            self.probed_events += 1
+            self.probed_candidates += len(cands)
+            self.removed += len(cands) - len(kept)
+        return kept
+
+
+def _prepare_sequence(
+    graph: CandidateGraph, locks: list[Lock], window: Window | None, weights: Weights, prune_k: int | None = None
+) -> _Sequence:
+    """施加 locks/window 得到待求解序列；prune_k 给出时按 Top-K 安全的 dominance 规则剪枝（见 `_prune_dominated`）。"""
+
+    _require_feasible(graph, locks, window)
+    start, end = (0, len(graph.events) - 1) if window is None else _window_range(graph, window)
+    left: StageCandidate | None = None
+    right: StageCandidate | None = None
+    if window is not None and window.left is not None:
+        left = _boundary_candidate(graph.events[start - 1], window.left, locks, weights, "左")
+    if window is not None and window.right is not None:
+        right = _boundary_candidate(graph.events[end + 1], window.right, locks, weights, "右")
+
+    seq_events = graph.events[start : end + 1]
+    by_eid: dict[str, list[Lock]] = {}
+    for lk in locks:
+        by_eid.setdefault(lk.eid, []).append(lk)
+    # 每个事件可为单音 Candidate 或 chord ChordCandidate
+    truncated: list[str] = []
+    seq_cands = [_event_candidates(ev, by_eid.get(ev.eid, []), weights, truncated) for ev in seq_events]
+    pruned = 0
+    if prune_k is not None:
+        # 支配判定针对邻居的未剪枝候选集合：先固定全部原始集合再逐事件剪枝
+        originals = list(seq_cands)
+        n = len(originals)
+        pruner = _DominancePruner(weights, prune_k)
+        for i in range(n):
+            prev = originals[i - 1] if i > 0 else ([left] if left is not None else None)
+            nxt = originals[i + 1] if i < n - 1 else ([right] if right is not None else None)
+            seq_cands[i] = pruner.prune(originals[i], prev, nxt)
+            pruned += len(originals[i]) - len(seq_cands[i])
+
+    window_explain: dict[str, Any] | None = None
+    if window is not None:
+        window_explain = {
+            "from_eid": window.from_eid,
+            "to_eid": window.to_eid,
+            "left_eid": graph.events[start - 1].eid if left is not None else None,
+            "right_eid": graph.events[end + 1].eid if right is not None else None,
+        }
+    return _Sequence(
+        events=seq_events,
+        cands=seq_cands,
+        left=left,
+        right=right,
+        window_explain=window_explain,
+        chord_truncated=tuple(truncated),
+        pruned=pruned,
+    )
+
+
+def optimize_topk(
+    *,
+    events: list[dict[str, Any]] | None = None,
+    graph: CandidateGraph | None = None,
+    k: int,
+    locks: list[Lock],
+    weights: Weights,
+    window: Window | None = None,
+    executor: Executor | None = None,
+    prune: PruneMode = "on",
+    memo: bool = False,
+) -> list[Solution]:
+    """在事件序列上做 Top-K 路径推荐。
+
+    输入二选一：
+    - events：stage1 输出（API 结构），每个元素形如 {"eid": "...", "targets": [ { "slot": null, "candidates": [...] } ]}
+    - graph：已解析的 CandidateGraph（复用 stage1 会话时跳过解析）
+
+    window：只求解窗口内事件（代价与窗口长度成正比）；assignments 只包含窗口内事件。
+    executor：若给出（通常是 ProcessPoolExecutor），在切点处把序列拆成独立段并行求解，见 `_segmented_topk_paths`。
+    prune：DP 之前的 dominance 剪枝（见 `_prune_dominated`，结果与不剪枝逐位一致）；
+      "verify" 额外做一次不剪枝的求解并比对，不一致时按 RuntimeError 失败（调试用，代价翻倍）。
+    memo：k=1 且重复材料足够时按候选签名缓存转移代价（见 `_top1_memo_path`），结果与普通 DP 逐位一致；k>1 时不起作用。
+    """
+
+    if k <= 0:
+        raise ValueError("k 必须为正")
+    if (events is None) == (graph is None):
+        raise ValueError("optimize_topk 需要且只能提供 events 或 graph 之一")
+    if prune not in ("off", "on", "verify"):
+        raise ValueError(f"未知 prune 模式：{prune!r}")
+    if graph is None:
+        graph = candidate_graph_from_stage1(events or [])
+
+    sols = _topk_solutions(graph, k, locks, weights, window, executor, prune_k=None if prune == "off" else k, memo=memo)
+    if prune == "verify":
+        reference = _topk_solutions(graph, k, locks, weights, window, executor, prune_k=None, memo=memo)
+        _verify_pruning(sols, reference, same_order=executor is None)
+    return sols
+
+
+def optimize_top1_memo(
+    *,
+    graph: CandidateGraph,
+    locks: list[Lock],
+    weights: Weights,
+    window: Window | None = None,
+    prune: PruneMode = "on",
+) -> list[Solution] | None:
+    """k=1 的重复材料记忆化求解（见 `_top1_memo_path`）；重复材料不足时返回 None，由调用方改走其他求解器。
+
+    结果与 `optimize_topk(k=1)` 逐位一致（同代价时选同一条路径）。prune 只支持 "off"/"on"（比对请用 optimize_topk）。
+    """
+
+    if prune not in ("off", "on"):
+        raise ValueError(f"optimize_top1_memo 不支持 prune={prune!r}")
+    seq = _prepare_sequence(graph, locks, window, weights, prune_k=None if prune == "off" else 1)
+    return _top1_memo_solutions(seq, weights)
+
+
+def _topk_solutions(
+    graph: CandidateGraph,
+    k: int,
+    locks: list[Lock],
+    weights: Weights,
+    window: Window | None,
+    executor: Executor | None,
+    *,
+    prune_k: int | None,
+    memo: bool = False,
+) -> list[Solution]:
+    seq = _prepare_sequence(graph, locks, window, weights, prune_k=prune_k)
+    if memo and k == 1:
+        sols = _top1_memo_solutions(seq, weights)
+        if sols is not None:
+            return sols
+    if executor is not None:
+        paths, cut_eids = _segmented_topk_paths(seq, k=k, weights=weights, executor=executor)
+        segments = {"segments": {"count": len(cut_eids) + 1, "cut_eids": cut_eids}} if cut_eids else None
+        return _solutions(seq, paths, weights, segments)
+    return _solutions(seq, _topk_paths(seq.cands, k=k, weights=weights, left=seq.left, right=seq.right), weights)
+
+
+def _verify_pruning(pruned: list[Solution], reference: list[Solution], *, same_order: bool) -> None:
+    """剪枝调试模式：与不剪枝的求解比对（段并行时切点可能因剪枝改变，只比对代价）。"""
+
+    if [s.total_cost for s in pruned] != [s.total_cost for s in reference]:
+        raise RuntimeError(
+            f"dominance 剪枝校验失败：Top-K 代价不一致 pruned={[s.total_cost for s in pruned]!r} "
+            f"reference={[s.total_cost for s in reference]!r}"
+        )
+    if same_order and [s.assignments for s in pruned] != [s.assignments for s in reference]:
+        raise RuntimeError("dominance 剪枝校验失败：Top-K 路径不一致")
+
+
+# 段并行的粒度：每段至少这么多事件（段太短时进程间传输与调度开销超过 DP 本身）
+SEGMENT_MIN_EVENTS = 64
+
+
+# 段内第 K 名处有并列时最多把该段的 K 加倍到这个倍数；并列更多时不拆段
+SEGMENT_MAX_TIE_FACTOR = 8
+
+
+def _segment_cuts(seq_cands: list[list[StageCandidate]], *, min_events: int = SEGMENT_MIN_EVENTS) -> list[int]:
+    """选择切点：只有 1 个候选的事件（通常由 lock 固定）。
+
+    路径必经切点事件的唯一候选，因此总代价 = 切点及之前的前缀代价 + 切点之后的后缀代价，
+    两侧互不影响；全局 Top-K 恰好是各段 Top-K 的 k-best 和。
+    相邻切点至少间隔 min_events 个事件（贪心从左到右），首尾事件不作切点。
+
+    不在休止符或段落边界处切：代价模型跨休止/段落仍计转移代价，在那里切开会改变结果；
+    只有单候选事件能让两侧精确解耦（段并行的结果与串行逐位一致）。
+    """
+
+    return _cut_indices([len(cs) == 1 for cs in seq_cands], min_events)
+
+
+def _cut_indices(single: list[bool], min_events: int) -> list[int]:
+    cuts: list[int] = []
+    last = -1
+    n = len(single)
+    for i in range(min_events - 1, n - min_events):
+        if single[i] and i - last >= min_events:
+            cuts.append(i)
+            last = i
+    return cuts
+
+
+def _pinned(ev: GraphEvent, locks: list[Lock]) -> bool:
+    """事件施加 locks 后是否只剩 1 个候选（只看 lock 位集，不构建 chord 组合；lock 非法时为 False）。"""
+
+    single = len(ev.slots) == 1
+    fields: list[list[tuple[str, Any]]] = [[] for _ in ev.slots]
+    for lk in locks:
+        slot = lk.fields.get("slot")
+        if single:
+            if "slot" in lk.fields:
+                return False
+            si = 0
+        elif slot in ev.slots and slot is not None:
+            si = ev.slots.index(slot)
+        else:
+            return False
+        for name, v in lk.fields.items():
+            if name == "slot":
+                continue
+            if name not in _LOCK_FIELDS or not _lock_value_ok(name, v):
+                return False
+            fields[si].append((name, v))
+    return all(bin(_lock_selection(m, fs)).count("1") == 1 for m, fs in zip(ev.masks, fields))
+
+
+def segment_cut_count(graph: CandidateGraph, locks: list[Lock]) -> int:
+    """全曲求解时段并行可用的切点数（规则同 `_segment_cuts`），O(N + locks)，不构建 stage2 候选。
+
+    单候选事件按 lock 位集判断：单音事件剩 1 个候选，或 chord 每个 slot 各剩 1 个候选。
+    剪枝还可能产生更多切点，因此这是下界；调用方据此决定是否走段并行。
+    """
+
+    by_eid: dict[str, list[Lock]] = {}
+    for lk in locks:
+        by_eid.setdefault(lk.eid, []).append(lk)
+    return len(_cut_indices([_pinned(ev, by_eid.get(ev.eid, [])) for ev in graph.events], SEGMENT_MIN_EVENTS))
+
+
+def _solve_segment(
+    seq_cands: list[list[StageCandidate]],
+    k: int,
+    weights: Weights,
+    left: StageCandidate | None,
+    right: StageCandidate | None,
+) -> list[tuple[float, list[int]]]:
+    """段求解（进程池任务，必须是模块级函数）：只回传 (段代价, 段内下标)，分项在合并后沿路径重算。"""
+
+    paths = _topk_paths(seq_cands, k=k, weights=weights, left=left, right=right, breakdown=False)
+    return [(total, idxs) for idxs, _bd, total in paths]
+
+
+def _merge_kbest(
+    a: list[tuple[float, list[int]]], b: list[tuple[float, list[int]]], k: int
+) -> list[tuple[float, list[int]]]:
+    """两个升序列表的 k-best 和（best-first 枚举下标对 (i, j)）。
+
+    第 k 条之后与之只差舍入误差的组合也一并返回：段代价相加与从左到右累加可能差在末位，
+    由调用方按 `_topk_rank_key` 重排后再截断。
+    """
+
+    out: list[tuple[float, list[int]]] = []
+    heap = [(a[0][0] + b[0][0], 0, 0)]
+    seen = {(0, 0)}
+    while heap:
+        if len(out) >= k and heap[0][0] > out[k - 1][0] + 1e-9 * (1.0 + abs(out[k - 1][0])):
+            break
+        cost, i, j = heapq.heappop(heap)
+        out.append((cost, a[i][1] + b[j][1]))
+        for ni, nj in ((i + 1, j), (i, j + 1)):
+            if ni < len(a) and nj < len(b) and (ni, nj) not in seen:
+                seen.add((ni, nj))
+                heapq.heappush(heap, (a[ni][0] + b[nj][0], ni, nj))
+    return out
+
+
+def _tie_group(paths: list[tuple[float, list[int]]], k: int) -> list[tuple[float, list[int]]]:
+    """前 k 条及与第 k 条并列（或只差舍入误差）的后续条目。"""
+
+    if len(paths) <= k:
+        return paths
+    kth = paths[k - 1][0]
+    return paths[:k] + [p for p in paths[k:] if p[0] <= kth + 1e-9 * (1.0 + abs(kth))]
+
+
+def _segmented_topk_paths(
+    seq: _Sequence, *, k: int, weights: Weights, executor: Executor
+) -> tuple[list[tuple[list[int], dict[str, float], float]], list[str]]:
+    """在切点处拆段、并行求解各段 Top-K，再按 k-best 和合并为全局 Top-K。
+
+    返回 (paths, 切点 eid)。无切点时直接在当前进程求解（不经过进程池）。
+    合并后的路径沿全序列从左到右重算代价与分项，数值与不拆段的 DP 逐位一致；
+    同代价次序按 `_topk_rank_key` 重排，与不拆段一致。
+    各段多求 1 条：某段第 K 名处有并列时加倍重求，直到取全与第 K 名并列的解（全局保留哪几条由 `_topk_rank_key` 决定）；
+    并列超过 SEGMENT_MAX_TIE_FACTOR × K 条时改为不拆段求解（不报告切点）。
+    """
+
+    cands = seq.cands
+    cuts = _segment_cuts(cands)
+    if not cuts:
+        return _topk_paths(cands, k=k, weights=weights, left=seq.left, right=seq.right), []
+
+    bounds = [-1, *cuts, len(cands) - 1]
+    tasks = []
+    for si in range(len(bounds) - 1):
+        lo, hi = bounds[si] + 1, bounds[si + 1]
+        left = seq.left if si == 0 else cands[bounds[si]][0]
+        right = seq.right if si == len(bounds) - 2 else None
+        tasks.append((cands[lo : hi + 1], left, right))
+    # 每段取到第 K 名及与之并列的全部解：先多求 1 条，第 K 名处仍有并列的段加倍重求
+    kk = [k + 1] * len(tasks)
+    results: list[list[tuple[float, list[int]]] | None] = [None] * len(tasks)
+    while True:
+        pending = [si for si, r in enumerate(results) if r is None]
+        if not pending:
+            break
+        futures = {si: executor.submit(_solve_segment, tasks[si][0], kk[si], weights, tasks[si][1], tasks[si][2]) for si in pending}
+        for si, fut in futures.items():
+            r = fut.result()
+            group = _tie_group(r, k)
+            if len(group) < len(r) or len(r) < kk[si]:
+                results[si] = group
+            elif kk[si] > SEGMENT_MAX_TIE_FACTOR * k:
+                # 并列过多：拆段合并要保留的组合太多，改为不拆段求解（不报告切点）
+                return _topk_paths(cands, k=k, weights=weights, left=seq.left, right=seq.right), []
+            else:
+                kk[si] *= 2
+
+    merged = results[0]
+    assert merged is not None
+    for r in results[1:]:
+        assert r is not None
+        merged = _merge_kbest(merged, r, k)
+
+    ranked = sorted(
+        (_topk_rank_key(cands, idxs, weights, left=seq.left, right=seq.right), idxs) for _approx, idxs in merged
+    )
+    paths: list[tuple[list[int], dict[str, float], float]] = []
+    for _key, idxs in ranked[:k]:
+        total, bd = _path_cost(cands, idxs, weights, left=seq.left, right=seq.right)
+        paths.append((idxs, bd, total))
+    return paths, [seq.events[i].eid for i in cuts]
+
+
+# 重复片段记忆化（仅 k=1，见 `_top1_memo_path`）
+# 不同的相邻事件对（按候选签名）占转移总数的比例不超过该值时，才认为有足够的重复材料
+MEMO_MAX_UNIQUE_RATIO = 0.5
+
+
+def _cand_signature(c: StageCandidate) -> tuple[Any, ...]:
+    """决定事件间代价的全部字段：签名相同的两个候选与任意候选之间的转移代价都相同。"""
+
+    if isinstance(c, Candidate):
+        return (c.string, c.technique, c.pos_ratio, c.cents_error)
+    parts = c.slot_to_cand.values()
+    return (
+        tuple(sorted({x.string for x in parts})),
+        tuple(sorted({x.technique for x in parts})),
+        c.pos_ratio,
+        c.cents_error_sum,
+        c.has_harmonic,
+    )
+
+
+def _event_signature_ids(seq_cands: list[list[StageCandidate]]) -> list[int]:
+    """每个事件的候选签名序列 → 整数 id（相同 id 的事件候选逐个同构，下标一一对应）。"""
+
+    table: dict[tuple[Any, ...], int] = {}
+    return [table.setdefault(tuple(_cand_signature(c) for c in cs), len(table)) for cs in seq_cands]
+
+
+def _top1_memo_path(
+    seq_cands: list[list[StageCandidate]],
+    w: Weights,
+    left: StageCandidate | None,
+    right: StageCandidate | None,
+) -> tuple[list[int], dict[str, int]] | None:
+    """利用重复材料的 Top-1 DP；重复材料不足时返回 None（由调用方走普通 DP）。
+
+    - 相邻事件的转移代价只取决于两侧的候选签名：按 (id_prev, id_cur) 缓存转移代价（按列存放），重复材料只算一次
+    - 逐事件做向量 + 列的 min：累加顺序与 `_topk_paths(k=1)` 相同（前缀代价 + 转移代价），同代价时取下标最小的前驱、
+      末层取下标最小的候选（与 `_topk_next_layer` / `_topk_ends` 的排序一致），因此路径与代价都与普通 DP 逐位一致
+    - 不合成多事件的整段矩阵：min-plus 合成会改变加法结合顺序，末位舍入可能让同代价路径的选择与普通 DP 不同
+    """
+
+    n = len(seq_cands)
+    if n < 2:
+        return None
+    ids = _event_signature_ids(seq_cands)
+    pairs = {(ids[i - 1], ids[i]) for i in range(1, n)}
+    if len(pairs) > MEMO_MAX_UNIQUE_RATIO * (n - 1):
+        return None
+
+    add = operator.add
+    trans: dict[tuple[int, int], list[list[float]]] = {}
+
+    def columns(i: int) -> list[list[float]]:
+        """事件 i-1 → i 的转移代价，按列存放：cols[l][m] = cost(prev[m], cur[l])。"""
+
+        key = (ids[i - 1], ids[i])
+        cols = trans.get(key)
+        if cols is None:
+            prev = seq_cands[i - 1]
+            cols = [[_transition_cost_chord(p, c, w)[0] for p in prev] for c in seq_cands[i]]
+            trans[key] = cols
+        return cols
+
+    first_cands = seq_cands[0]
+    if left is None:
+        vec = [float(sum(_node_cost(c, w).values())) for c in first_cands]
+    else:
+        vec = [float(_transition_cost_chord(left, c, w)[0]) for c in first_cands]
+    # back[i][l]：事件 i 选 l 时事件 i-1 的候选
+    back: list[list[int]] = [[]]
+    for i in range(1, n):
+        new_vec: list[float] = []
+        arg: list[int] = []
+        for col in columns(i):
+            s = list(map(add, vec, col))
+            v = min(s)
+            new_vec.append(v)
+            arg.append(s.index(v))
+        back.append(arg)
+        vec = new_vec
+
+    if right is not None:
+        vec = [v + _transition_cost_chord(c, right, w)[0] for v, c in zip(vec, seq_cands[-1])]
+    cur = vec.index(min(vec))
+    idxs = [0] * n
+    for i in range(n - 1, -1, -1):
+        idxs[i] = cur
+        if i > 0:
+            cur = back[i][cur]
+    stats = {"transitions": n - 1, "unique_transitions": len(trans)}
+    return idxs, stats
+
+
+def _top1_memo_solutions(seq: _Sequence, weights: Weights) -> list[Solution] | None:
+    found = _top1_memo_path(seq.cands, weights, seq.left, seq.right)
+    if found is None:
+        return None
+    idxs, _stats = found
+    total, bd = _path_cost(seq.cands, idxs, weights, left=seq.left, right=seq.right)
+    return _solutions(seq, [(idxs, bd, total)], weights)
+
+
+def _solutions(
+    seq: _Sequence,
+    paths: list[tuple[list[int], dict[str, float], float]],
+    weights: Weights,
+    extra: dict[str, Any] | None = None,
+) -> list[Solution]:
+    explain_extra: dict[str, Any] = {"window": seq.window_explain} if seq.window_explain is not None else {}
+    explain_extra.update(extra or {})
+    if seq.chord_truncated:
+        explain_extra["chord_truncated"] = list(seq.chord_truncated)
+    solutions: list[Solution] = []
+    for si, (idxs, bd, total_cost) in enumerate(paths, start=1):
+        assignments = [_assignment(ev.eid, cands[j]) for ev, cands, j in zip(seq.events, seq.cands, idxs)]
+        solutions.append(
+            Solution(
+                solution_id=f"S{si:04d}",
+                total_cost=float(total_cost),
+                assignments=assignments,
+                explain={"cost_breakdown": bd, "weights": weights.__dict__, **explain_extra},
+            )
+        )
+    return solutions
+
+
+def _path_cost(
+    seq_cands: list[list[StageCandidate]],
+    idxs: list[int],
+    w: Weights,
+    *,
+    left: StageCandidate | None = None,
+    right: StageCandidate | None = None,
+) -> tuple[float, dict[str, float]]:
+    """沿给定路径从左到右重算总代价与分项（与 DP 的累加顺序一致，因此数值逐位相同）。"""
+
+    if left is None:
+        bd = _node_cost(seq_cands[0][idxs[0]], w)
+        cost = float(sum(bd.values()))
+    else:
+        cost, bd = _transition_cost_chord(left, seq_cands[0][idxs[0]], w)
+        cost = float(cost)
+    for i in range(1, len(seq_cands)):
+        tc, step = _transition_cost_chord(seq_cands[i - 1][idxs[i - 1]], seq_cands[i][idxs[i]], w)
+        cost = float(cost + tc)
+        bd = _add_breakdown(bd, step)
+    if right is not None:
+        tc, step = _transition_cost_chord(seq_cands[-1][idxs[-1]], right, w)
+        cost = float(cost + tc)
+        bd = _add_breakdown(bd, step)
+    return cost, bd
+
+
+def _topk_rank_key(
+    seq_cands: list[list[StageCandidate]],
+    idxs: list[int],
+    w: Weights,
+    *,
+    left: StageCandidate | None = None,
+    right: StageCandidate | None = None,
+) -> tuple[float | int, ...]:
+    """`_topk_paths` 对整条路径的排序键（其他求解器据此复现同代价次序）。
+
+    `_topk_paths` 的表项按 (前缀代价, 前驱候选, 前驱名次) 排序、终止状态按 (总代价, 末事件候选, 名次) 排序，
+    展开后即 (总代价, j[N-1], C[N-1], j[N-2], C[N-2], ..., j[1], C[1], j[0])：
+    C[i] 为从左到右累加到事件 i 的前缀代价（浮点数值与 DP 逐位相同），j[i] 为事件 i 的候选下标。
+    """
+
+    if left is None:
+        cost = float(sum(_node_cost(seq_cands[0][idxs[0]], w).values()))
+    else:
+        cost = float(_transition_cost_chord(left, seq_cands[0][idxs[0]], w)[0])
+    prefix = [cost]
+    for i in range(1, len(seq_cands)):
+        cost = float(cost + _transition_cost_chord(seq_cands[i - 1][idxs[i - 1]], seq_cands[i][idxs[i]], w)[0])
+        prefix.append(cost)
+    total = float(cost + _transition_cost_chord(seq_cands[-1][idxs[-1]], right, w)[0]) if right is not None else cost
+    key: list[float | int] = [total]
+    for i in range(len(seq_cands) - 1, 0, -1):
+        key += [idxs[i], prefix[i]]
+    key.append(idxs[0])
+    return tuple(key)
+
+
+def _lock_signature(locks: list[Lock]) -> tuple[tuple[tuple[str, str], ...], ...]:
+    return tuple(tuple(sorted((str(k), repr(v)) for k, v in lk.fields.items())) for lk in locks)
+
+
+# (cost, back_ptr)：前向表 back_ptr 指向上一事件 (j, k)，后向表指向下一事件 (j, k)
+_TableEntry = tuple[float, tuple[int, int] | None]
+
+
+# IncrementalTopK 常驻表每个状态（候选 j 的第 r 条）的字节数：与 `_topk_paths` 一样平铺在 array 里，
+# 前向表 cost(8) + 回溯指针(4)，后向表 cost(8) + 指针(4) + 后缀名次(4)
+INCREMENTAL_STATE_BYTES = 28
+
+
+# 每个事件的固定开销（前向 2 个、后向 3 个 array 的对象头与缓冲区、层对象、候选列表与 lock 签名，
+# 实测约 750 字节），折算成状态数
+INCREMENTAL_EVENT_STATES = 32
+
+
+# 单个求解器常驻表的内存上限（与 CHECKPOINT_MIN_STATES 时 `_topk_paths` 的完整表同一量级）
+INCREMENTAL_MAX_TABLE_BYTES = 24 * 1024 * 1024
+
+
+# 折算状态数（见 `table_states`）超过该值（约 90 万）时调用方应改用 optimize_topk
+# （更大时按 CHECKPOINT_MIN_STATES 自动进入检查点模式），不常驻求解器
+INCREMENTAL_MAX_STATES = INCREMENTAL_MAX_TABLE_BYTES // INCREMENTAL_STATE_BYTES
+
+
+# 后向表每状态在第 K 条之后最多再保留这么多倍 K 的近似并列项（见 `IncrementalTopK._backward_layer`）；
+# 更多时求解改在更靠后、未截断的事件汇合
+INCREMENTAL_MAX_TIE_FACTOR = 8
+
+
+def table_states(graph: CandidateGraph, k: int) -> int:
+    """不施加 lock 时 IncrementalTopK 常驻表折算的状态数：Σ 候选数 × K + 事件数 × INCREMENTAL_EVENT_STATES。
+
+    只数 nearest 节点，chord 组合数按 CHORD_MAX_PRODUCTS 封顶。
+    """
+
+    total = 0
+    for ev in graph.events:
+        if len(ev.masks) == 1:
+            total += bin(ev.masks[0].nearest).count("1")
+            continue
+        n = 1
+        for m in ev.masks:
+            n = min(n * bin(m.nearest).count("1"), CHORD_MAX_PRODUCTS)
+        total += n
+    return total * k + len(graph.events) * INCREMENTAL_EVENT_STATES
+
+
+_T = TypeVar("_T")
+
+
+@dataclass(frozen=True)
+class _BackwardLayer:
+    """IncrementalTopK 后向表的一层：状态 (j, r)（从候选 j 出发的第 r 条后缀）平铺为下标 j*width + r。
+
+    width ≥ K（保留近似并列项时更宽；末层为 1），缺失的后缀 cost 为 +inf；back 存下一层的平铺下标（末层为 -1），
+    rank 存该后缀（事件 i+1..N-1 的候选，从末事件往回比较）在本层全部状态中的字典序名次。
+    clipped：本层或更靠后的层截掉过与第 K 条只差舍入误差的后缀。
+    """
+
+    width: int
+    cost: array
+    back: array
+    rank: array
+    clipped: bool
+
+
+class IncrementalTopK:
+    """跨 lock/候选变化复用前向、后向 Top-K 表的 stage2 求解器（固定 weights 与 k）。
+
+    - 前向表 F[i]：以事件 i 的各候选结尾的前缀 Top-K（含首事件 node cost），与 `_topk_paths` 的层逐项相同
+    - 后向表 B[i]：从事件 i 的各候选出发、事件 i+1..N-1 的后缀 Top-K（不含事件 i 自身），见 `_BackwardLayer`
+    - 只重算“失效区间”：事件 i 变化使 F[i..] 与 B[..i] 失效；求解时在失效区间内选一个汇合点 m，
+      补算 F 到 m、B 到 m，再按状态合并前缀/后缀 Top-K（每状态各保留 K 条时合并结果是精确的全局 Top-K）。
+    - 反复在同一区域 lock/求解（编辑器的主交互）时，每次只需重算该区域附近的少量事件。
+
+    同代价次序与 `optimize_topk` 一致：`_topk_paths` 的表按 (代价, 前驱候选, 前驱名次) 排序，
+    对整条路径等价于按 (代价, 末事件候选, 倒数第二个事件候选, ..., 首事件候选) 排序。前向表同序；
+    后向表的后缀从末事件往回比较，无法只看下一事件的 (候选, 名次)，因此每个表项另存其后缀在该事件全部表项中的
+    字典序名次，按 (代价, 下一表项的后缀名次, 下一事件候选) 排序。
+
+    两张表都平铺在 array 里（约 INCREMENTAL_STATE_BYTES 字节/状态），常驻量见 `resident_states`。
+
+    prune：与 `optimize_topk` 相同的 dominance 剪枝（按相邻事件施加 lock 后的未剪枝候选判定）；
+    事件的候选变化时重新判定它与两侧相邻事件，剪枝结果变了的事件才使表失效。
+
+    与 `optimize_topk` 的关系：不支持 window；代价、分项与同代价次序一致。
+    """
+
+    def __init__(self, *, graph: CandidateGraph, k: int, weights: Weights, prune: bool = True):
+        if k <= 0:
+            raise ValueError("k 必须为正")
+        if not graph.events:
+            raise ValueError("空 events")
+        self.k = k
+        self.weights = weights
+        self._pruner = _DominancePruner(weights, k) if prune else None
+        self._mutex = threading.Lock()
+        self._graph = graph
+        self._reset()
+        self.last_solve: dict[str, int] = {}
+
+    def _reset(self) -> None:
+        n = len(self._graph.events)
+        self._sigs: list[tuple[tuple[tuple[str, str], ...], ...] | None] = [None] * n
+        self._raw: list[list[StageCandidate] | None] = [None] * n  # 施加 lock 后、剪枝前的候选
+        self._cands: list[list[StageCandidate] | None] = [None] * n  # 剪枝后的候选（表的下标按它）
+        self._truncated: list[bool] = [False] * n
+        self._fwd: list[tuple[array, array] | None] = [None] * n  # (cost, 回溯指针)，布局同 `_topk_next_layer`
+        self._bwd: list[_BackwardLayer | None] = [None] * n
+        self._fv = -1  # F[0..fv] 有效
+        self._bv = n  # B[bv..N-1] 有效
+
+    def _replace_graph(self, graph: CandidateGraph) -> None:
+        old = self._graph.events
+        self._graph = graph
+        if [ev.eid for ev in old] != [ev.eid for ev in graph.events]:
+            # 事件序列本身变了（增删事件）：表的下标不再对齐，整体重建
+            self._reset()
+            return
+        for i, (a, b) in enumerate(zip(old, graph.events)):
+            if a != b:
+                self._sigs[i] = None
+                self._raw[i] = None
+                self._truncated[i] = False
+
+    @property
+    def resident_states(self) -> int:
+        """当前常驻表折算的状态数：逐事件取前向、后向表槽位数的较大者，加上每事件 INCREMENTAL_EVENT_STATES。
+
+        不施加 lock、后向表没有近似并列项时与 `table_states` 相同。
+        """
+
+        total = 0
+        for f, b in zip(self._fwd, self._bwd):
+            if f is None and b is None:
+                continue
+            total += max(len(f[0]) if f is not None else 0, len(b.cost) if b is not None else 0) + INCREMENTAL_EVENT_STATES
+        return total
+
+    def solve(self, *, locks: list[Lock], graph: CandidateGraph | None = None) -> list[Solution]:
+        with self._mutex:
+            if graph is not None and graph is not self._graph:
+                if not graph.events:
+                    raise ValueError("空 events")
+                self._replace_graph(graph)
+            events = self._graph.events
+            n = len(events)
+
+            _require_feasible(self._graph, locks, None)
+            by_eid: dict[str, list[Lock]] = {}
+            for lk in locks:
+                by_eid.setdefault(lk.eid, []).append(lk)
+
+            # 先算出全部变化事件的新候选（可能失败）；全部成功后才修改表，失败不破坏已缓存状态
+            changed: dict[int, tuple[Any, list[StageCandidate], bool]] = {}
+            for i, ev in enumerate(events):
+                ev_locks = by_eid.get(ev.eid, [])
+                sig = _lock_signature(ev_locks)
+                if self._raw[i] is None or sig != self._sigs[i]:
+                    truncated: list[str] = []
+                    changed[i] = (sig, _event_candidates(ev, ev_locks, self.weights, truncated), bool(truncated))
+            # 剪枝看相邻事件的未剪枝候选：候选变化的事件及其两侧重新判定，剪枝结果变了才算表失效
+            raw = [changed[i][1] if i in changed else self._raw[i] for i in range(n)]
+            rebuilt: dict[int, list[StageCandidate]] = {}
+            for j in sorted({j for i in changed for j in (i - 1, i, i + 1) if 0 <= j < n}):
+                cands_j = self._layer(raw, j)
+                if self._pruner is not None:
+                    cands_j = self._pruner.prune(cands_j, raw[j - 1] if j > 0 else None, raw[j + 1] if j < n - 1 else None)
+                old = self._cands[j]
+                if j in changed or old is None or len(old) != len(cands_j) or any(a is not b for a, b in zip(old, cands_j)):
+                    rebuilt[j] = cands_j
+            for i, (sig, cands, was_truncated) in changed.items():
+                self._sigs[i] = sig
+                self._raw[i] = cands
+                self._truncated[i] = was_truncated
+            for j, cands in rebuilt.items():
+                self._cands[j] = cands
+            if rebuilt:
+                self._fv = min(self._fv, min(rebuilt) - 1)
+                self._bv = max(self._bv, max(rebuilt) + 1)
+
+            # 汇合点：F[m] 与 B[m] 都必须有效；重算量 = bv - fv，与 m 的位置无关，
+            # m 取最后一个变化事件（下一次在附近编辑时前后两侧的表都可复用）
+            target = max(rebuilt) if rebuilt else self._fv
+            if self._bv <= self._fv:
+                m = min(max(target, self._bv), self._fv)
+            else:
+                m = min(max(target, self._fv + 1), self._bv - 1)
+            forward_steps = 0
+            for i in range(self._fv + 1, m + 1):
+                self._fwd[i] = self._forward_layer(i)
+                forward_steps += 1
+            backward_steps = 0
+            for i in range(min(self._bv, n) - 1, m - 1, -1):
+                self._bwd[i] = self._backward_layer(i)
+                backward_steps += 1
+            self._fv = max(self._fv, m)
+            self._bv = min(self._bv, m)
+            if self._layer(self._bwd, m).clipped:
+                # 后向表截掉过同代价（仅差舍入）的后缀：clipped 从截断处一路向左传递，
+                # 改在其右侧第一个未截断的事件汇合（末事件不会截断），补算前向表到该处
+                c = m
+                while self._layer(self._bwd, c).clipped:
+                    c += 1
+                for i in range(self._fv + 1, c + 1):
+                    self._fwd[i] = self._forward_layer(i)
+                    forward_steps += 1
+                self._fv = m = max(self._fv, c)
+            self.last_solve = {
+                "events_rebuilt": len(changed),
+                "forward_steps": forward_steps,
+                "backward_steps": backward_steps,
+                "meet_index": m,
+                "pruned": sum(len(r) - len(c) for r, c in zip(raw, self._cands)),  # type: ignore[arg-type]
+            }
+            return self._collect(m)
+
+    @staticmethod
+    def _layer(tables: list[_T | None], i: int) -> _T:
+        """已构建的第 i 层（候选或表）；调用方保证有效。"""
+
+        layer = tables[i]
+        assert layer is not None
+        return layer
+
+    def _forward_layer(self, i: int) -> tuple[array, array]:
+        cur = self._layer(self._cands, i)
+        if i == 0:
+            return _topk_first_layer(cur, self.k, self.weights, None), array("i", [-1]) * (len(cur) * self.k)
+        prev = self._layer(self._cands, i - 1)
+        prev_cost, _back = self._layer(self._fwd, i - 1)
+        return _topk_next_layer(prev, cur, prev_cost, self.k, self.weights)
+
+    def _backward_layer(self, i: int) -> _BackwardLayer:
+        w = self.weights
+        k = self.k
+        inf = float("inf")
+        cur = self._layer(self._cands, i)
+        if i == len(self._cands) - 1:
+            n = len(cur)
+            return _BackwardLayer(
+                width=1, cost=array("d", [0.0]) * n, back=array("i", [-1]) * n, rank=array("i", [0]) * n, clipped=False
+            )
+        nxt = self._layer(self._cands, i + 1)
+        nl = self._layer(self._bwd, i + 1)
+        # 下一层每个候选的有效后缀（升序、连续存放）
+        nxt_lists = [
+            [(nl.cost[flat], nl.rank[flat], flat) for flat in range(nj * nl.width, (nj + 1) * nl.width) if nl.cost[flat] != inf]
+            for nj in range(len(nxt))
+        ]
+        clipped = nl.clipped
+        cap = INCREMENTAL_MAX_TIE_FACTOR * k
+        per_cand: list[list[tuple[float, int, int, int]]] = []
+        for cur_c in cur:
+            items: list[tuple[float, int, int, int]] = []  # cost, 下一表项的后缀名次, nj, 下一表项的平铺下标
+            for nj, nxt_c in enumerate(nxt):
+                tc = _transition_cost_chord(cur_c, nxt_c, w)[0]
+                for nxt_cost, nxt_rank, flat in nxt_lists[nj]:
+                    items.append((float(tc + nxt_cost), nxt_rank, nj, flat))
+            items.sort()
+            kept = items[:k]
+            if len(items) > k:
+                # 后缀和从右往左累加，与 `_topk_paths` 从左到右的累加可能差在末位：与第 K 条只差舍入误差的后缀
+                # 在从左到右的次序里可能排在前面，也保留（每状态至多 INCREMENTAL_MAX_TIE_FACTOR × K 条）；超出时记为 clipped，
+                # 求解时改在右侧第一个未截断的事件汇合（前向表与 `_topk_paths` 的表逐项相同）
+                kth = kept[-1][0]
+                tol = 1e-9 * (1.0 + abs(kth))
+                kept += [e for e in items[k:cap] if e[0] <= kth + tol]
+                clipped = clipped or (len(items) > cap and items[cap][0] <= kth + tol)
+            per_cand.append(kept)
+        # 本事件各表项的后缀 = 下一表项的后缀 + 下一事件候选：先比下一表项的后缀名次，再比 nj（同后缀同名次）
+        rank_of = {key: r for r, key in enumerate(sorted({(nr, nj) for kept in per_cand for _c, nr, nj, _f in kept}))}
+        width = max(k, max(len(kept) for kept in per_cand))
+        cost = array("d", [inf]) * (len(cur) * width)
+        back = array("i", [-1]) * (len(cur) * width)
+        rank = array("i", [0]) * (len(cur) * width)
+        for j, kept in enumerate(per_cand):
+            for r, (c_cost, nr, nj, flat) in enumerate(kept):
+                cost[j * width + r] = c_cost
+                back[j * width + r] = flat
+                rank[j * width + r] = rank_of[(nr, nj)]
+        return _BackwardLayer(width=width, cost=cost, back=back, rank=rank, clipped=clipped)
+
+    def _collect(self, m: int) -> list[Solution]:
+        k = self.k
+        inf = float("inf")
+        fcost, _fback = self._layer(self._fwd, m)
+        bl = self._layer(self._bwd, m)
+        # 汇合：按 (代价, 后缀名次, 汇合事件候选, 前缀名次) 排序，即 `_topk_paths` 的同代价次序
+        joined: list[tuple[float, int, int, int, int]] = []  # cost, 后缀名次, j, 前向平铺下标, 后向平铺下标
+        for j in range(len(self._layer(self._cands, m))):
+            for fflat in range(j * k, (j + 1) * k):
+                fc = fcost[fflat]
+                if fc == inf:
+                    break
+                for bflat in range(j * bl.width, (j + 1) * bl.width):
+                    bc = bl.cost[bflat]
+                    if bc == inf:
+                        break
+                    joined.append((float(fc + bc), bl.rank[bflat], j, fflat, bflat))
+        joined.sort()
+        # 汇合处的代价是“前缀和 + 后缀和”，与从左到右累加可能差在末位：
+        # 第 K 条之后与之只差舍入误差的条目也取出，按 `_topk_rank_key` 重排后取前 K
+        picked = joined[:k]
+        if len(joined) > k:
+            kth = picked[-1][0]
+            tol = 1e-9 * (1.0 + abs(kth))
+            picked += [e for e in joined[k:] if e[0] <= kth + tol]
+
+        seq_cands = [c for c in self._cands if c is not None]
+        events = self._graph.events
+        n = len(events)
+        paths: list[tuple[tuple[float | int, ...], list[int]]] = []
+        for _cost, _rank, _j, fflat, bflat in picked:
+            idxs = [0] * n
+            flat = fflat
+            for i in range(m, -1, -1):
+                idxs[i] = flat // k
+                flat = self._layer(self._fwd, i)[1][flat]
+            flat = bflat
+            for i in range(m, n):
+                layer = self._layer(self._bwd, i)
+                idxs[i] = flat // layer.width
+                flat = layer.back[flat]
+            paths.append((_topk_rank_key(seq_cands, idxs, self.weights), idxs))
+        paths.sort(key=lambda x: x[0])
+        del paths[k:]
+
+        truncated = [ev.eid for ev, t in zip(events, self._truncated) if t]
+        explain_extra: dict[str, Any] = {"chord_truncated": truncated} if truncated else {}
+        out: list[Solution] = []
+        for si, (_key, idxs) in enumerate(paths, start=1):
+            total, bd = _path_cost(seq_cands, idxs, self.weights)
+            out.append(
+                Solution(
+                    solution_id=f"S{si:04d}",
+                    total_cost=total,
+                    assignments=[_assignment(ev.eid, cands[j]) for ev, cands, j in zip(events, seq_cands, idxs)],
+                    explain={"cost_breakdown": bd, "weights": self.weights.__dict__, **explain_extra},
+                )
+            )
+        return out
+
+
+def _top1_layer(
+    prev_cands: list[StageCandidate], prev_cost: array, cur_cands: list[StageCandidate], w: Weights
+) -> tuple[array, array]:
+    """Top-1 前向 DP 的一层：(代价, 回溯指针)；同代价取前一事件下标最小者（与 `_topk_next_layer` 的排序一致）。"""
+
+    cost = array("d", [float("inf")]) * len(cur_cands)
+    back = array("i", [-1]) * len(cur_cands)
+    for j, cur_c in enumerate(cur_cands):
+        for pj, prev_c in enumerate(prev_cands):
+            c_cost = float(prev_cost[pj] + _transition_cost_chord(prev_c, cur_c, w)[0])
+            if c_cost < cost[j]:
+                cost[j] = c_cost
+                back[j] = pj
+    return cost, back
+
+
+def stream_graph_event(ev: Stage1Event) -> GraphEvent:
+    """逐事件输入时的候选图事件：分组泛音展开全部节点（都 nearest=True）。
+
+    `_expand_harmonic_groups` 只保留离相邻事件最近的节点，而逐事件输入时后继事件尚未出现；
+    展开全部节点与不分组逐位等价（候选更多，但不丢最优）。
+    """
+
+    if not ev.eid:
+        raise ValueError("事件缺少 eid")
+    if not ev.targets:
+        raise ValueError(f"事件 targets 非法：eid={ev.eid}")
+    per_slot: list[tuple[Candidate, ...]] = []
+    index: list[tuple[int, ...]] = []
+    for t in ev.targets:
+        cands: list[Candidate] = []
+        idx: list[int] = []
+        for j, c in enumerate(t.candidates):
+            v = _node_variants(_position_to_internal(c))
+            cands.extend(v)
+            idx.extend([j] * len(v))
+        per_slot.append(tuple(cands))
+        index.append(tuple(idx))
+    expanded = any(len(idx) != len(t.candidates) for idx, t in zip(index, ev.targets))
+    return GraphEvent(
+        eid=ev.eid,
+        slots=tuple(t.slot or None for t in ev.targets),
+        candidates=tuple(per_slot),
+        stage1_index=tuple(index) if expanded else None,
+    )
+
+
+@dataclass(frozen=True)
+class StreamStep:
+    """流式输入一个事件后的建议。"""
+
+    eid: str
+    events: int  # 已输入事件数
+    # 本次定稿的事件（第 events-1-lag 个；之后不再改变）；前 lag 个事件输入时为空
+    decided: list[dict[str, Any]]
+    # 尚未定稿的事件（最近 lag 个，含本事件）在当前最优前缀上的选择（暂定，后续输入可能改变）
+    tentative: list[dict[str, Any]]
+    frontier_cost: float  # 已输入事件的最优前缀代价
+
+
+class StreamingTop1:
+    """逐事件输入的 stage2 Top-1：固定延迟（fixed-lag）的在线 Viterbi（固定 weights）。
+
+    - 每输入一个事件只做一层前向 DP（O(M_prev·M_cur)）并沿当前最优前缀回溯 lag 步，与已输入事件数无关
+    - 第 i 个事件在第 i+lag 个事件输入后定稿：取当时最优前缀在事件 i 上的选择；
+      后续输入仍可能让全局最优在该处改道，定稿只是延迟 lag 个事件的近似
+    - `flush` 回溯出全部已输入事件的精确 Top-1：与 `optimize_topk(k=1)` 的 DP 同序累加，
+      同代价时取同一路径；explain.revised 列出定稿与精确最优不同的事件
+
+    状态：每个事件保留候选与回溯指针（O(N·M)），代价只保留最后一层（前沿）。
+    不支持 window（流式输入没有固定的右侧上下文）。
+    """
+
+    def __init__(self, *, weights: Weights, lag: int):
+        if lag < 0:
+            raise ValueError("lag 不能为负")
+        self.weights = weights
+        self.lag = lag
+        self._mutex = threading.Lock()
+        self._events: list[GraphEvent] = []
+        self._eids: set[str] = set()
+        self._cands: list[list[StageCandidate]] = []
+        self._backs: list[array] = []
+        self._cost = array("d")
+        self._decided: list[int] = []
+        self._truncated: list[str] = []
+
+    @property
+    def size(self) -> int:
+        return len(self._events)
+
+    def push(self, event: GraphEvent, locks: list[Lock] | None = None) -> StreamStep:
+        return self.extend([(event, list(locks or []))])[0]
+
+    def extend(self, items: list[tuple[GraphEvent, list[Lock]]]) -> list[StreamStep]:
+        """按顺序输入多个事件（原子：任一事件不可行/非法时整体失败，状态不变）。"""
+
+        with self._mutex:
+            seen = set(self._eids)
+            prepared: list[tuple[GraphEvent, list[StageCandidate], bool]] = []
+            for ev, locks in items:
+                if ev.eid in seen:
+                    raise ValueError(f"事件 eid 重复：{ev.eid}")
+                seen.add(ev.eid)
+                for lk in locks:
+                    if lk.eid != ev.eid:
+                        raise ValueError(f"lock 必须指向所输入的事件：lock.eid={lk.eid} eid={ev.eid}")
+                _require_feasible(CandidateGraph(events=(ev,)), locks, None)
+                truncated: list[str] = []
+                prepared.append((ev, _event_candidates(ev, locks, self.weights, truncated), bool(truncated)))
+            return [self._step(ev, cands, was_truncated) for ev, cands, was_truncated in prepared]
+
+    def _step(self, ev: GraphEvent, cur: list[StageCandidate], was_truncated: bool) -> StreamStep:
+        if not self._cands:
+            cost = array("d", [float(sum(_node_cost(c, self.weights).values())) for c in cur])
+            back = array("i", [-1]) * len(cur)
+        else:
+            cost, back = _top1_layer(self._cands[-1], self._cost, cur, self.weights)
+        self._events.append(ev)
+        self._eids.add(ev.eid)
+        self._cands.append(cur)
+        self._backs.append(back)
+        self._cost = cost
+        if was_truncated:
+            self._truncated.append(ev.eid)
+
+        # 沿当前最优前缀回溯：最近 lag 个事件是暂定建议，再往前一个事件定稿
+        n = len(self._events)
+        end = min(range(len(cost)), key=lambda j: (cost[j], j))
+        path: list[int] = []
+        j = end
+        for i in range(n - 1, max(n - 2 - self.lag, -1), -1):
+            path.append(j)
+            j = self._backs[i][j]
+        path.reverse()
+        start = n - len(path)
+        decided: list[dict[str, Any]] = []
+        if n - 1 - self.lag >= 0:
+            d = n - 1 - self.lag
+            self._decided.append(path[0])
+            decided.append(_assignment(self._events[d].eid, self._cands[d][path[0]]))
+            path, start = path[1:], start + 1
+        tentative = [_assignment(self._events[start + t].eid, self._cands[start + t][j]) for t, j in enumerate(path)]
+        return StreamStep(eid=ev.eid, events=n, decided=decided, tentative=tentative, frontier_cost=float(cost[end]))
+
+    def flush(self) -> Solution:
+        """全部已输入事件的精确 Top-1（不结束会话：之后仍可继续输入）。"""
+
+        with self._mutex:
+            if not self._events:
+                raise ValueError("空 events")
+            n = len(self._events)
+            cost = self._cost
+            idxs = [0] * n
+            j = min(range(len(cost)), key=lambda jj: (cost[jj], jj))
+            for i in range(n - 1, -1, -1):
+                idxs[i] = j
+                j = self._backs[i][j]
+            total, bd = _path_cost(self._cands, idxs, self.weights)
+            revised = [self._events[i].eid for i, j in enumerate(self._decided) if idxs[i] != j]
+            explain: dict[str, Any] = {"cost_breakdown": bd, "weights": self.weights.__dict__, "revised": revised}
+            if self._truncated:
+                explain["chord_truncated"] = list(self._truncated)
+            return Solution(
+                solution_id="S0001",
+                total_cost=total,
+                assignments=[_assignment(ev.eid, cands[j]) for ev, cands, j in zip(self._events, self._cands, idxs)],
+                explain=explain,
+            )
+
+
+@dataclass(frozen=True)
+class RankedPath:
+    """惰性枚举出的一条解：按候选下标编码（index[i] 指向 `SolutionEnumerator.pool()` 中第 i 个事件的候选）。"""
+
+    solution_id: str
+    rank: int  # 1 起
+    total_cost: float
+    cost_breakdown: dict[str, float]
+    index: list[int]
+
+
+# 惰性 k-best 前缀表项：(代价, 前一事件的候选下标, 该前缀在前一事件该候选上的名次)；首事件为 (代价, -1, -1)
+_RankEntry = tuple[float, int, int]
+
+
+class SolutionEnumerator:
+    """按代价升序惰性枚举 stage2 解（Jiménez–Marzal 递归枚举算法 REA，显式栈实现）。
+
+    - 构造时只做一遍 Top-1 前向 DP；第 r 条解按需求出，之后每条解只沿路径向左补算少量次优前缀
+      （每个状态第一次需要次优前缀时把全部前驱放入候选堆，O(M)；之后每条 O(log M)）
+    - 状态 (事件 i, 候选 j) 保存按代价升序的前缀列表；第 r 条前缀的后继只需要其前驱的下一名次前缀；
+      末事件之后有一个虚拟终点（有窗口右边界时计入离开窗口的衔接代价），其前缀列表即全局解序列
+    - 同代价按 (前驱候选, 前驱名次) 排序，与 `_topk_paths` 的表排序一致：
+      前 K 条与 optimize_topk(k=K, prune="off") 逐位相同
+    - 不做 dominance 剪枝（剪枝规则依赖 K）；支持 locks 与 window
+    """
+
+    def __init__(self, *, graph: CandidateGraph, locks: list[Lock], weights: Weights, window: Window | None = None):
+        self.weights = weights
+        self._mutex = threading.Lock()
+        seq = _prepare_sequence(graph, locks, window, weights)
+        self._seq = seq
+        cands = seq.cands
+        w = weights
+        if seq.left is None:
+            cost = array("d", [float(sum(_node_cost(c, w).values())) for c in cands[0]])
+        else:
+            cost = array("d", [float(_transition_cost_chord(seq.left, c, w)[0]) for c in cands[0]])
+        self._paths: list[list[list[_RankEntry]]] = [[[(cost[j], -1, -1)] for j in range(len(cands[0]))]]
+        for i in range(1, len(cands)):
+            cost, back = _top1_layer(cands[i - 1], cost, cands[i], w)
+            self._paths.append([[(cost[j], back[j], 0)] for j in range(len(cands[i]))])
+        ends = [(self._step_cost(len(cands), pj, 0, c[0][0]), pj, 0) for pj, c in enumerate(self._paths[-1])]
+        self._paths.append([[min(ends)]])
+        self._heaps: dict[tuple[int, int], list[_RankEntry]] = {}
+        self._done: set[tuple[int, int]] = set()
+        self._pool: list[dict[str, Any]] | None = None
+
+    @property
+    def explain(self) -> dict[str, Any]:
+        """所有解共用的 explain（weights/window/chord_truncated；逐解只有代价与分项）。"""
+
+        out: dict[str, Any] = {"weights": self.weights.__dict__}
+        if self._seq.window_explain is not None:
+            out["window"] = self._seq.window_explain
+        if self._seq.chord_truncated:
+            out["chord_truncated"] = list(self._seq.chord_truncated)
+        return out
+
+    @property
+    def events(self) -> int:
+        """解覆盖的事件数（有窗口时只计窗口内事件）。"""
+
+        return len(self._seq.events)
+
+    @property
+    def ranks(self) -> int:
+        """已求出的全局名次数：每个名次沿路径常驻各事件的前缀，内存约与 ranks × events 成正比。"""
+
+        return len(self._paths[-1][0])
+
+    def pool(self) -> list[dict[str, Any]]:
+        """各事件的候选池：[{"eid", "candidates": [assignment, ...]}]，RankedPath.index 指向其中的下标。"""
+
+        with self._mutex:
+            if self._pool is None:
+                self._pool = [
+                    {"eid": ev.eid, "candidates": [_assignment(ev.eid, c) for c in cs]}
+                    for ev, cs in zip(self._seq.events, self._seq.cands)
+                ]
+            return self._pool
+
+    def page(self, *, offset: int, limit: int) -> list[RankedPath]:
+        """第 offset+1 .. offset+limit 条解（按代价升序；解的总数不足时返回更少）。"""
+
+        if offset < 0 or limit < 0:
+            raise ValueError("offset/limit 不能为负")
+        with self._mutex:
+            end = len(self._paths) - 1
+            out: list[RankedPath] = []
+            for r in range(offset, offset + limit):
+                if not self._ensure(end, 0, r):
+                    break
+                idxs = self._backtrack(r)
+                _total, bd = _path_cost(self._seq.cands, idxs, self.weights, left=self._seq.left, right=self._seq.right)
+                out.append(
+                    RankedPath(
+                        solution_id=f"S{r + 1:04d}",
+                        rank=r + 1,
+                        total_cost=float(self._paths[end][0][r][0]),
+                        cost_breakdown=bd,
+                        index=idxs,
+                    )
+                )
+            return out
+
+    def _step_cost(self, i: int, pj: int, j: int, prev_cost: float) -> float:
+        """前驱前缀代价 + 事件 i-1 的候选 pj → 事件 i 的候选 j 的转移代价（i 为事件数时是虚拟终点）。"""
+
+        cands = self._seq.cands
+        if i == len(cands):
+            right = self._seq.right
+            return prev_cost if right is None else float(prev_cost + _transition_cost_chord(cands[-1][pj], right, self.weights)[0])
+        return float(prev_cost + _transition_cost_chord(cands[i - 1][pj], cands[i][j], self.weights)[0])
+
+    def _ensure(self, i: int, j: int, r: int) -> bool:
+        """保证状态 (i, j) 的第 r 条前缀已求出（依次补算之前缺少的名次）；不存在时返回 False。"""
+
+        lst = self._paths[i][j]
+        while len(lst) <= r and (i, j) not in self._done and i > 0:
+            self._extend(i, j, len(lst))
+        return len(lst) > r
+
+    def _extend(self, i: int, j: int, r: int) -> None:
+        """求状态 (i, j) 的下一条前缀（r = 已求出的条数）；依赖的前驱前缀按显式栈向左补算。"""
+
+        stack = [(i, j, r)]
+        while stack:
+            i, j, r = stack[-1]
+            lst = self._paths[i][j]
+            if len(lst) > r or i == 0 or (i, j) in self._done:
+                stack.pop()
+                continue
+            heap = self._heaps.get((i, j))
+            if heap is None:
+                # 第一次需要次优前缀：放入各前驱的最优前缀（最优前缀所用的前驱由下面的“后继”补入）
+                _c0, pj0, _pr0 = lst[0]
+                heap = [(self._step_cost(i, pj, j, p[0][0]), pj, 0) for pj, p in enumerate(self._paths[i - 1]) if pj != pj0]
+                heapq.heapify(heap)
+                self._heaps[(i, j)] = heap
+            _c, pj, pr = lst[-1]
+            pred = self._paths[i - 1][pj]
+            if len(pred) <= pr + 1 and i - 1 > 0 and (i - 1, pj) not in self._done:
+                stack.append((i - 1, pj, pr + 1))
+                continue
+            if len(pred) > pr + 1:
+                heapq.heappush(heap, (self._step_cost(i, pj, j, pred[pr + 1][0]), pj, pr + 1))
+            if heap:
+                lst.append(heapq.heappop(heap))
+            else:
+                self._done.add((i, j))
+            stack.pop()
+
+    def _backtrack(self, r: int) -> list[int]:
+        n = len(self._seq.cands)
+        idxs = [0] * n
+        _c, j, rank = self._paths[n][0][r]
+        for i in range(n - 1, -1, -1):
+            idxs[i] = j
+            _c, j, rank = self._paths[i][j][rank]
+        return idxs
+
+
+@dataclass(frozen=True)
+class EventMarginals:
+    """单个事件的 min-marginal：强制选某候选时的全局最优代价。
+
+    index[j]：候选在 stage1 targets[*].candidates 中的下标（按 slot 顺序；单音为 1 元组）。
+    只列出 locks 之后仍可选的候选。
+    """
+
+    eid: str
+    slots: tuple[str | None, ...]
+    index: list[tuple[int, ...]]
+    cost: list[float]
+    delta: list[float]  # cost - optimum（>= 0；0 表示该候选在某条最优路径上）
+
+
+@dataclass(frozen=True)
+class MinMarginals:
+    optimum: float
+    events: list[EventMarginals]
+    chord_truncated: list[str] = field(default_factory=list)  # chord 组合被截断的 eid（截断组合不出现在 index 中）
+
+
+def _stage1_indexer(ev: GraphEvent) -> Callable[[StageCandidate], tuple[int, ...]]:
+    """stage2 候选 → stage1 targets[*].candidates 下标（locks 只过滤不复制，可按对象身份查找）。"""
+
+    by_slot = [
+        {id(x): (i if ev.stage1_index is None else ev.stage1_index[si][i]) for i, x in enumerate(cs)}
+        for si, cs in enumerate(ev.candidates)
+    ]
+
+    def index(c: StageCandidate) -> tuple[int, ...]:
+        if isinstance(c, Candidate):
+            return (by_slot[0][id(c)],)
+        return tuple(by_slot[si][id(c.slot_to_cand[str(slot)])] for si, slot in enumerate(ev.slots))
+
+    return index
+
+
+def min_marginals(
+    *,
+    graph: CandidateGraph,
+    locks: list[Lock],
+    weights: Weights,
+    window: Window | None = None,
+) -> MinMarginals:
+    """一次前向 + 一次后向 Viterbi，得到每个事件每个候选的 min-marginal 代价。
+
+    marginal[i][j] = F[i][j] + B[i][j]：F 为以 (i, j) 结尾的最优前缀，B 为从 (i, j) 出发的最优后缀。
+    等价于“对每个候选分别 lock 后求 Top-1”，但总代价只有一次 O(N·M²) 的 DP。
+    """
+
+    seq = _prepare_sequence(graph, locks, window, weights)
+    cands = seq.cands
+    n = len(cands)
+    w = weights
+
+    fwd: list[list[float]] = []
+    if seq.left is None:
+        fwd.append([float(sum(_node_cost(c, w).values())) for c in cands[0]])
+    else:
+        fwd.append([_transition_cost_chord(seq.left, c, w)[0] for c in cands[0]])
+    for i in range(1, n):
+        prev = fwd[i - 1]
+        fwd.append(
+            [min(prev[pj] + _transition_cost_chord(pc, c, w)[0] for pj, pc in enumerate(cands[i - 1])) for c in cands[i]]
+        )
+
+    bwd: list[list[float]] = [[] for _ in range(n)]
+    if seq.right is None:
+        bwd[n - 1] = [0.0 for _c in cands[n - 1]]
+    else:
+        bwd[n - 1] = [_transition_cost_chord(c, seq.right, w)[0] for c in cands[n - 1]]
+    for i in range(n - 2, -1, -1):
+        nxt = bwd[i + 1]
+        bwd[i] = [min(_transition_cost_chord(c, nc, w)[0] + nxt[nj] for nj, nc in enumerate(cands[i + 1])) for c in cands[i]]
+
+    optimum = min(f + b for f, b in zip(fwd[0], bwd[0]))
+    events: list[EventMarginals] = []
+    for ev, ev_cands, f_row, b_row in zip(seq.events, cands, fwd, bwd):
+        cost = [float(f + b) for f, b in zip(f_row, b_row)]
+        index = _stage1_indexer(ev)
+        events.append(
+            EventMarginals(
+                eid=ev.eid,
+                slots=ev.slots,
+                index=[index(c) for c in ev_cands],
+                cost=cost,
+                # 前缀和 + 后缀和 与 optimum 的求和顺序不同，可能差在末位：截断到 0
+                delta=[max(0.0, x - optimum) for x in cost],
+            )
+        )
+    return MinMarginals(optimum=float(optimum), events=events, chord_truncated=list(seq.chord_truncated))
+
+
+@dataclass(frozen=True)
+class EventScore:
+    """给定指法打分（`score_fingering`）中的一个事件。"""
+
+    eid: str
+    assignment: dict[str, Any] | None  # 映射到的候选（与 Solution.assignments 同结构）；None 表示未打分
+    reason: str | None = None  # 未打分的原因
+    cost: float = 0.0  # 计入的代价：与前一事件的衔接代价；段首（首事件或前一事件未打分）为 node cost
+    cost_breakdown: dict[str, float] = field(default_factory=dict)
+    segment_start: bool = False
+    assumed: tuple[str, ...] = ()  # 映射时做出的显式假设（见 `_match_fingering`）
+
+
+@dataclass(frozen=True)
+class PathScore:
+    total_cost: float
+    cost_breakdown: dict[str, float]
+    events: list[EventScore]
+    complete: bool  # 全部事件都已打分：total_cost 与 stage2 路径代价同口径，可直接比较
+
+
+def _raw_harmonic_n(c: Candidate) -> Any:
+    raw = c.raw
+    return raw.harmonic_n if isinstance(raw, PositionCandidate) else raw.get("harmonic_n")
+
+
+def _match_fingering(
+    cands: tuple[Candidate, ...], fields: dict[str, Any], anchor: float | None
+) -> tuple[Candidate | None, tuple[str, ...]]:
+    """把一个 slot 的指法读法映射到候选；同弦同技法（同 harmonic_n）的候选中没有则返回 None。
+
+    - pos_ratio 超出 lock 容差时取最近的位置并标注 pos_ratio_snapped
+      （调用方须先确认读法推导出的音高与目标音一致：同弦同技法的候选即同一个音）
+    - 泛音未给出节点（pos_ratio 缺省）时取离前一事件位置最近的节点并标注 harmonic_node（无前一事件时取最低节点）
+    """
+
+    hn = fields.get("harmonic_n")
+    pool = [
+        c
+        for c in cands
+        if c.string == int(fields["string"]) and c.technique == fields["technique"] and (hn is None or _raw_harmonic_n(c) == hn)
+    ]
+    if not pool:
+        return None, ()
+    pr = fields.get("pos_ratio")
+    if pr is None:
+        if len(pool) == 1:
+            return pool[0], ()
+        x = 0.0 if anchor is None else anchor
+        return min(pool, key=lambda c: (abs(c.pos_ratio - x), c.pos_ratio)), ("harmonic_node",)
+    best = min(pool, key=lambda c: abs(c.pos_ratio - float(pr)))
+    if abs(best.pos_ratio - float(pr)) <= POS_RATIO_LOCK_TOLERANCE:
+        return best, ()
+    return best, ("pos_ratio_snapped",)
+
+
+def score_fingering(
+    *,
+    graph: CandidateGraph,
+    fingering: dict[str, list[dict[str, Any]]],
+    weights: Weights,
+    reasons: dict[str, str] | None = None,
+) -> PathScore:
+    """给定指法的路径代价：沿候选图线性扫描一次（O(N·每事件候选数)，不做任何搜索）。
+
+    fingering[eid]：每个 slot 一项，字段同 lock（slot/string/technique/pos_ratio），另可带 harmonic_n。
+    不在 fingering 中的事件记为未打分（原因取 reasons[eid]，缺省 missing_fingering）；
+    任一 slot 映射不到候选时整个事件未打分。未打分事件处路径断开，其后的事件按段首计 node cost。
+    全部事件都已打分时，累加顺序与 `_path_cost` 相同：指法恰为某条 stage2 解时代价逐位一致。
+    chord 直接由各 slot 的候选组成（不受 chord 组合截断影响）。
+    """
+
+    unknown = set(fingering) - {ev.eid for ev in graph.events}
+    if unknown:
+        raise ValueError(f"指法引用未知 eid：{sorted(unknown)!r}")
+    w = weights
+    reasons = reasons or {}
+    events: list[EventScore] = []
+    total = 0.0
+    bd: dict[str, float] = {}
+    prev: StageCandidate | None = None
+    for ev in graph.events:
+        readings = fingering.get(ev.eid)
+        chosen: StageCandidate | None = None
+        reason: str | None = None
+        assumed: list[str] = []
+        if readings is None:
+            reason = reasons.get(ev.eid, "missing_fingering")
+        else:
+            by_slot = {r.get("slot") or None: r for r in readings}
+            if len(by_slot) != len(readings) or set(by_slot) != set(ev.slots):
+                reason = "slot_mismatch"
+            else:
+                picked: list[Candidate] = []
+                for slot, cs in zip(ev.slots, ev.candidates):
+                    c, notes = _match_fingering(cs, by_slot[slot], None if prev is None else prev.pos_ratio)
+                    if c is None:
+                        reason = "not_a_candidate"
+                        break
+                    picked.append(c)
+                    assumed.extend(notes if slot is None else [f"{slot}:{x}" for x in notes])
+                if reason is None and len(picked) > 1 and len({c.string for c in picked}) != len(picked):
+                    reason = "chord_strings_not_distinct"
+                if reason is None:
+                    chosen = picked[0] if len(picked) == 1 else _chord_candidate([str(s) for s in ev.slots], tuple(picked))
+        if chosen is None:
+            events.append(EventScore(eid=ev.eid, assignment=None, reason=reason))
+            prev = None
+            continue
+        if prev is None:
+            step = _node_cost(chosen, w)
+            cost = float(sum(step.values()))
+        else:
+            cost, step = _transition_cost_chord(prev, chosen, w)
+        total = float(total + cost)
+        bd = _add_breakdown(bd, step)
+        events.append(
+            EventScore(
+                eid=ev.eid,
+                assignment=_assignment(ev.eid, chosen),
+                cost=float(cost),
+                cost_breakdown=step,
+                segment_start=prev is None,
+                assumed=tuple(assumed),
+            )
+        )
+        prev = chosen
+    return PathScore(
+        total_cost=total, cost_breakdown=bd, events=events, complete=all(e.assignment is not None for e in events)
+    )
+
+
+# 小输入时额外跑一次精确 DP（Top-1）来报告 beam 的代价差；按精确 DP 的转移次数判定“小”
+BEAM_EXACT_CHECK_MAX_TRANSITIONS = 200_000
+
+
+@dataclass(frozen=True)
+class BeamOptions:
+    """beam search 参数。
+
+    width：每个事件最多保留的状态（候选）数；threshold：丢弃最优前缀代价高于当前最优 + threshold 的状态。
+    """
+
+    width: int = 64
+    threshold: float | None = None
+
+
+@dataclass(frozen=True)
+class BeamStats:
+    width: int
+    threshold: float | None
+    states_total: int  # 全部事件的候选数之和（精确 DP 的状态数）
+    states_kept: int
+    pruned_by_width: int
+    pruned_by_threshold: int
+    pruned_fraction: float
+    transitions_evaluated: int
+    transitions_exact: int  # 精确 DP 需要的转移次数（对照 beam 的节省）
+    exact_total_cost: float | None  # 小输入时的精确最优代价；None 表示输入过大未校验
+    gap: float | None  # beam 最优 - 精确最优（>= 0）
+
+
+@dataclass(frozen=True)
+class BeamResult:
+    solutions: list[Solution]
+    stats: BeamStats
+
+
+@dataclass(frozen=True)
+class _BeamRun:
+    paths: list[tuple[list[int], dict[str, float], float]]
+    states_kept: int
+    pruned_by_width: int
+    pruned_by_threshold: int
+    transitions: int
+
+
+def _beam_paths(
+    cands: list[list[StageCandidate]],
+    *,
+    k: int,
+    w: Weights,
+    beam: BeamOptions,
+    left: StageCandidate | None = None,
+    right: StageCandidate | None = None,
+    deadline: float | None = None,
+) -> _BeamRun:
+    """beam search 本体（见 `optimize_beam`）；deadline（perf_counter 时刻）到达时按 `_BudgetExceeded` 中止。"""
+
+    pruned_by_width = 0
+    pruned_by_threshold = 0
+    transitions = 0
+
+    # layer：{候选下标 -> Top-K 前缀 [(cost, back_ptr)]}；back_ptr=(上一事件候选下标, 上一条目下标)
+    # 不随状态携带分项：只对最终保留的路径沿路重算一次（见 `_path_cost`，与 DP 的累加顺序一致）
+    Layer = dict[int, list[_TableEntry]]
+
+    def prune(layer: Layer) -> Layer:
+        nonlocal pruned_by_width, pruned_by_threshold
+        ranked = sorted(layer.items(), key=lambda kv: kv[1][0][0])
+        if beam.threshold is not None and ranked:
+            limit = ranked[0][1][0][0] + beam.threshold
+            kept = [kv for kv in ranked if kv[1][0][0] <= limit]
+            pruned_by_threshold += len(ranked) - len(kept)
+            ranked = kept
+        if len(ranked) > beam.width:
+            pruned_by_width += len(ranked) - beam.width
+            ranked = ranked[: beam.width]
+        return dict(ranked)
+
+    layers: list[Layer] = []
+    first: Layer = {}
+    for j, c in enumerate(cands[0]):
+        if left is None:
+            cost = float(sum(_node_cost(c, w).values()))
+        else:
+            cost = float(_transition_cost_chord(left, c, w)[0])
+        first[j] = [(cost, None)]
+    layers.append(prune(first))
+
+    for i in range(1, len(cands)):
+        _check_deadline(deadline)
+        prev_layer = layers[i - 1]
+        cur: Layer = {}
+        for j, cur_c in enumerate(cands[i]):
+            items: list[_TableEntry] = []
+            for pj, prev_paths in prev_layer.items():
+                tc = _transition_cost_chord(cands[i - 1][pj], cur_c, w)[0]
+                transitions += 1
+                for pk, (prev_cost, _ptr) in enumerate(prev_paths):
+                    items.append((float(prev_cost + tc), (pj, pk)))
+            items.sort(key=lambda x: x[0])
+            cur[j] = items[:k]
+        layers.append(prune(cur))
+
+    last = len(cands) - 1
+    ends: list[tuple[float, int, int]] = []
+    for j, paths in layers[last].items():
+        rtc = _transition_cost_chord(cands[last][j], right, w)[0] if right is not None else None
+        for kk, (cost, _ptr) in enumerate(paths):
+            ends.append((float(cost + rtc) if rtc is not None else cost, j, kk))
+    ends.sort(key=lambda x: x[0])
+
+    out: list[tuple[list[int], dict[str, float], float]] = []
+    for total, end_j, end_k in ends[:k]:
+        idxs = [0] * len(cands)
+        i, j, kk = last, end_j, end_k
+        idxs[i] = j
+        ptr = layers[i][j][kk][1]
+        while ptr is not None:
+            i -= 1
+            j, kk = ptr
+            idxs[i] = j
+            ptr = layers[i][j][kk][1]
+        out.append((idxs, _path_cost(cands, idxs, w, left=left, right=right)[1], float(total)))
+
+    return _BeamRun(
+        paths=out,
+        states_kept=sum(len(layer) for layer in layers),
+        pruned_by_width=pruned_by_width,
+        pruned_by_threshold=pruned_by_threshold,
+        transitions=transitions,
+    )
+
+
+def optimize_beam(
+    *,
+    graph: CandidateGraph,
+    k: int,
+    locks: list[Lock],
+    weights: Weights,
+    beam: BeamOptions,
+    window: Window | None = None,
+) -> BeamResult:
+    """beam search 版 Top-K：每个事件只保留前缀代价最优的 width 个状态（不保证全局最优）。
+
+    状态内部仍保留 Top-K 前缀（与精确 DP 相同的表结构），因此 width >= 候选数时结果与精确 DP 一致。
+    适用于 harmonic + chord 组合导致候选很多的段落：每步代价从 M² 降到 width·M。
+    """
+
+    if k <= 0:
+        raise ValueError("k 必须为正")
+    if beam.width <= 0:
+        raise ValueError("beam width 必须为正")
+    if beam.threshold is not None and beam.threshold < 0:
+        raise ValueError("beam threshold 不能为负")
+
+    seq = _prepare_sequence(graph, locks, window, weights)
+    cands = seq.cands
+    w = weights
+    states_total = sum(len(c) for c in cands)
+    transitions_exact = sum(len(a) * len(b) for a, b in zip(cands, cands[1:]))
+    run = _beam_paths(cands, k=k, w=w, beam=beam, left=seq.left, right=seq.right)
+    out = run.paths
+
+    exact_cost: float | None = None
+    gap: float | None = None
+    if transitions_exact <= BEAM_EXACT_CHECK_MAX_TRANSITIONS and out:
+        exact = _topk_paths(cands, k=1, weights=w, left=seq.left, right=seq.right, breakdown=False)
+        exact_cost = exact[0][2]
+        gap = max(0.0, out[0][2] - exact_cost)
+
+    stats = BeamStats(
+        width=beam.width,
+        threshold=beam.threshold,
+        states_total=states_total,
+        states_kept=run.states_kept,
+        pruned_by_width=run.pruned_by_width,
+        pruned_by_threshold=run.pruned_by_threshold,
+        pruned_fraction=(1.0 - run.states_kept / states_total) if states_total else 0.0,
+        transitions_evaluated=run.transitions,
+        transitions_exact=transitions_exact,
+        exact_total_cost=exact_cost,
+        gap=gap,
+    )
+    return BeamResult(solutions=_solutions(seq, out, weights), stats=stats)
+
+
+# anytime 求解的 beam 宽度阶梯（greedy 即宽度 1；宽度不小于最大候选数时 beam 与精确 DP 等价，直接升级为精确求解）
+ANYTIME_BEAM_WIDTHS = (1, 8, 64, 512)
+
+
+@dataclass(frozen=True)
+class AnytimeStats:
+    """anytime 求解的过程与质量保证。
+
+    optimal：精确 DP 在预算内完成（Top-K 即精确 Top-K），或 k=1 且 Top-1 已达到下界。
+    lower_bound：全局最优代价的下界（松弛 DP，见 `_cost_lower_bound`；optimal 时为最优代价本身）。
+    gap_bound：返回的 Top-1 代价 - lower_bound（>= 0）；Top-1 与全局最优的差不超过该值。
+    """
+
+    budget_ms: int
+    elapsed_ms: float
+    passes: list[str]  # 已完成的轮次，如 ["beam:1", "beam:8", "exact"]
+    interrupted: str | None  # 被预算截断的轮次（None 表示没有轮次被截断）
+    best_pass: str
+    optimal: bool
+    bound_method: str  # "exact" | "relaxed_dp" | "per_step"（下界来源，见 `optimize_anytime`）
+    lower_bound: float
+    gap_bound: float
+
+
+@dataclass(frozen=True)
+class AnytimeResult:
+    solutions: list[Solution]
+    stats: AnytimeStats
+
+
+# 下界 DP 中前驱按 (弦集合, 技法集合) 分组；组数超过该值（chord 组合很多）时合并为一组并对换弦/换技法取保守值
+ANYTIME_LB_MAX_GROUPS = 32
+
+
+def _group_min_plus(
+    group: list[tuple[float, float]], targets: list[tuple[float, int]], w_shift: float, out: list[float]
+) -> None:
+    """out[t] = min(out[t], min_{(p, c) ∈ group} c + w_shift·|p - q_t|)（targets 为按 q 升序的 (q_t, t)）。
+
+    w_shift >= 0 时是 L1 距离变换（前后各扫一遍，精确）；w_shift < 0 时取 min c + w_shift·最大距离（下界）。
+    """
+
+    inf = float("inf")
+    if w_shift < 0:
+        lo = min(p for p, _c in group)
+        hi = max(p for p, _c in group)
+        cmin = min(c for _p, c in group)
+        for q, t in targets:
+            v = cmin + w_shift * max(q - lo, hi - q)
+            if v < out[t]:
+                out[t] = v
+        return
+    pts = sorted(group)
+    # 向右扫：p <= q 的 min(c - w·p) + w·q
+    best = inf
+    i = 0
+    for q, t in targets:
+        while i < len(pts) and pts[i][0] <= q:
+            best = min(best, pts[i][1] - w_shift * pts[i][0])
+            i += 1
+        if best != inf and best + w_shift * q < out[t]:
+            out[t] = best + w_shift * q
+    # 向左扫：p >= q 的 min(c + w·p) - w·q
+    best = inf
+    i = len(pts) - 1
+    for q, t in reversed(targets):
+        while i >= 0 and pts[i][0] >= q:
+            best = min(best, pts[i][1] + w_shift * pts[i][0])
+            i -= 1
+        if best != inf and best - w_shift * q < out[t]:
+            out[t] = best - w_shift * q
+
+
+def _cost_lower_bound(
+    cands: list[list[StageCandidate]],
+    w: Weights,
+    left: StageCandidate | None,
+    right: StageCandidate | None,
+    deadline: float | None = None,
+) -> float:
+    """全局最优代价的下界：按前驱分组的松弛 DP（每步 O(G·M + M log M)，G 为组数，远低于精确 DP 的 O(M²)）。
+
+    前驱按 (弦集合, 技法集合) 分组后，换弦/换技法两项在组内为常数，shift 项用 L1 距离变换精确求组内最小，
+    因此 shift 权重非负且组数未超限时，下界就是最优代价本身；其余情况（负 shift 权重、组被合并）是严格下界。
+    """
+
+    def key(c: StageCandidate) -> tuple[frozenset[int], frozenset[str]]:
+        return frozenset(_strings_of(c)), frozenset(_techniques_of(c))
+
+    if left is None:
+        dp = [float(sum(_node_cost(c, w).values())) for c in cands[0]]
+    else:
+        dp = [float(_transition_cost_chord(left, c, w)[0]) for c in cands[0]]
+    for i in range(1, len(cands)):
+        _check_deadline(deadline)
+        prev, cur = cands[i - 1], cands[i]
+        groups: dict[tuple[frozenset[int], frozenset[str]], list[tuple[float, float]]] = {}
+        for a, cost in zip(prev, dp):
+            groups.setdefault(key(a), []).append((a.pos_ratio, cost))
+        cur_keys = [key(b) for b in cur]
+        targets = sorted((b.pos_ratio, t) for t, b in enumerate(cur))
+        nxt = [float("inf")] * len(cur)
+        if len(groups) <= ANYTIME_LB_MAX_GROUPS:
+            for (g_str, g_tech), members in groups.items():
+                # 组内常数项：按目标候选分别计入（先按常数项分桶，桶内共享一次距离变换）
+                buckets: dict[float, list[tuple[float, int]]] = {}
+                for q, t in targets:
+                    b_str, b_tech = cur_keys[t]
+                    const = (0.0 if g_str & b_str else w.string_change) + (0.0 if g_tech == b_tech else w.technique_change)
+                    buckets.setdefault(const, []).append((q, t))
+                for const, ts in buckets.items():
+                    shifted = [(p, c + const) for p, c in members]
+                    _group_min_plus(shifted, ts, w.shift, nxt)
+        else:
+            merged = [(a.pos_ratio, cost) for a, cost in zip(prev, dp)]
+            const = min(0.0, w.string_change) + min(0.0, w.technique_change)
+            _group_min_plus([(p, c + const) for p, c in merged], targets, w.shift, nxt)
+        dp = [v + h * w.harmonic_penalty + ce * w.cents_error for v, (h, ce) in zip(nxt, map(_own_terms, cur))]
+    if right is not None:
+        return min(cost + float(_transition_cost_chord(c, right, w)[0]) for c, cost in zip(cands[-1], dp))
+    return min(dp)
+
+
+def _per_step_lower_bound(
+    cands: list[list[StageCandidate]], w: Weights, left: StageCandidate | None, right: StageCandidate | None
+) -> float:
+    """更松但更快的下界（O(N·M)）：每一步的转移代价各分项独立取最小（min(x+y) >= min x + min y）。
+
+    负权重的分项取“未加权值的最大可能”（换弦/换技法保守取 1）。
+    """
+
+    if left is None:
+        lb = min(float(sum(_node_cost(c, w).values())) for c in cands[0])
+    else:
+        lb = min(float(_transition_cost_chord(left, c, w)[0]) for c in cands[0])
+    for prev, cur in zip(cands, cands[1:]):
+        prev_pos = [c.pos_ratio for c in prev]
+        cur_pos = [c.pos_ratio for c in cur]
+        if w.shift >= 0:
+            lo = max(min(prev_pos), min(cur_pos))
+            hi = min(max(prev_pos), max(cur_pos))
+            # 两组区间不相交时最小距离为区间间隙；相交时按 0（仍是下界）
+            lb += w.shift * max(0.0, lo - hi)
+        else:
+            lb += w.shift * max(max(prev_pos) - min(cur_pos), max(cur_pos) - min(prev_pos))
+        lb += min(0.0, w.string_change) + min(0.0, w.technique_change)
+        lb += min(h * w.harmonic_penalty + ce * w.cents_error for h, ce in map(_own_terms, cur))
+    if right is not None:
+        lb += min(float(_transition_cost_chord(c, right, w)[0]) for c in cands[-1])
+    return lb
+
+
+def optimize_anytime(
+    *,
+    graph: CandidateGraph,
+    k: int,
+    locks: list[Lock],
+    weights: Weights,
+    budget_ms: int,
+    window: Window | None = None,
+) -> AnytimeResult:
+    """在时间预算内返回找到的最好 Top-K：greedy（宽度 1 的 beam）→ 下界 → 逐级加宽的 beam → 精确 DP。
+
+    - greedy 总会完成（即使超出预算），保证总有结果；之后每一步在预算到达时中止并丢弃，保留此前最好的结果。
+    - 下界先用松弛 DP（`_cost_lower_bound`）；被预算截断时退回逐步分项下界（`_per_step_lower_bound`，很松但总能算完）。
+    - 按上一轮的实测速度估算下一轮耗时，预计超出剩余预算的轮次不再启动（尽早返回）。
+    """
+
+    if k <= 0:
+        raise ValueError("k 必须为正")
+    if budget_ms <= 0:
+        raise ValueError("budget_ms 必须为正")
+
+    t0 = time.perf_counter()
+    deadline = t0 + budget_ms / 1000.0
+    seq = _prepare_sequence(graph, locks, window, weights)
+    cands = seq.cands
+    w = weights
+    max_m = max(len(cs) for cs in cands)
+
+    def transitions_for(width: int | None) -> int:
+        total = 0
+        for a, b in zip(cands, cands[1:]):
+            total += (len(a) if width is None else min(width, len(a))) * len(b)
+        return max(total, 1)
+
+    def run(width: int | None, pass_deadline: float | None) -> list[tuple[list[int], dict[str, float], float]]:
+        if width is None:
+            return _topk_paths(cands, k=k, weights=w, left=seq.left, right=seq.right, deadline=pass_deadline)
+        beam = BeamOptions(width=width)
+        return _beam_paths(cands, k=k, w=w, beam=beam, left=seq.left, right=seq.right, deadline=pass_deadline).paths
+
+    ladder: list[int | None] = [*(x for x in ANYTIME_BEAM_WIDTHS if x < max_m), None]
+    first = ladder.pop(0)
+    started = time.perf_counter()
+    best = run(first, None)
+    rate = transitions_for(first) * (k if first is None else 1) / max(time.perf_counter() - started, 1e-6)
+    best_pass = "exact" if first is None else f"beam:{first}"
+    passes = [best_pass]
+    interrupted: str | None = None
+    optimal = first is None
+
+    if optimal:
+        bound_method = "exact"
+        raw_bound = best[0][2]
+    else:
+        try:
+            raw_bound = _cost_lower_bound(cands, w, seq.left, seq.right, deadline=deadline)
+            bound_method = "relaxed_dp"
+        except _BudgetExceeded:
+            raw_bound = _per_step_lower_bound(cands, w, seq.left, seq.right)
+            bound_method = "per_step"
+    # 下界与 DP 的累加顺序不同：留出数值容差，保证报告的下界不因舍入高于真实最优
+    tol = 1e-9 * (1.0 + abs(raw_bound))
+    if k == 1 and best[0][2] <= raw_bound + tol:
+        optimal = True
+
+    for width in ladder if not optimal else []:
+        name = "exact" if width is None else f"beam:{width}"
+        work = transitions_for(width) * (k if width is None else 1)
+        if time.perf_counter() + work / rate > deadline:
+            break
+        started = time.perf_counter()
+        try:
+            paths = run(width, deadline)
+        except _BudgetExceeded:
+            interrupted = name
+            break
+        rate = work / max(time.perf_counter() - started, 1e-6)
+        passes.append(name)
+        if width is None:
+            best, best_pass, optimal = paths, name, True
+            raw_bound, tol, bound_method = paths[0][2], 0.0, "exact"
+            break
+        if paths[0][2] <= best[0][2]:
+            best, best_pass = paths, name
+        if k == 1 and best[0][2] <= raw_bound + tol:
+            optimal = True
+            break
+
+    lower_bound = raw_bound - tol
+    stats = AnytimeStats(
+        budget_ms=int(budget_ms),
+        elapsed_ms=(time.perf_counter() - t0) * 1000.0,
+        passes=passes,
+        interrupted=interrupted,
+        best_pass=best_pass,
+        optimal=optimal,
+        bound_method=bound_method,
+        lower_bound=float(lower_bound),
+        gap_bound=0.0 if optimal else max(0.0, best[0][2] - lower_bound),
+    )
+    return AnytimeResult(solutions=_solutions(seq, best, weights), stats=stats)
+
+
+def _strings_of(x: StageCandidate) -> set[int]:
+    return {x.string} if isinstance(x, Candidate) else {c.string for c in x.slot_to_cand.values()}
+
+
+def _techniques_of(x: StageCandidate) -> set[str]:
+    return {x.technique} if isinstance(x, Candidate) else {c.technique for c in x.slot_to_cand.values()}
+
+
+def _own_terms(c: StageCandidate) -> tuple[float, float]:
+    """只取决于目标候选自身的两项（未加权）：(是否 harmonic, |cents_error|)。"""
+
+    if isinstance(c, Candidate):
+        return (1.0 if c.technique == "harmonic" else 0.0), abs(c.cents_error)
+    return (1.0 if c.has_harmonic else 0.0), abs(c.cents_error_sum)
+
+
+@dataclass(frozen=True)
+class _TermTables:
+    """与 weights 无关的未加权代价项（定义与 `_transition_cost_chord` / `_node_cost` 一致）。
+
+    pair[i]：事件 i-1 → i 的 (|Δpos|, 换弦, 换技法) 三张扁平表，下标 pj * M_i + j；pair[0] 为空。
+    own[i]：事件 i 每个候选的 (harmonic, |cents_error|)。
+    left/right：窗口边界的衔接项（无边界时为 None；right 的 own 项取自边界候选本身）。
+    """
+
+    sizes: tuple[int, ...]
+    pair: tuple[tuple[list[float], list[float], list[float]], ...]
+    own: tuple[tuple[list[float], list[float]], ...]
+    left: tuple[list[float], list[float], list[float]] | None
+    right: tuple[list[float], list[float], list[float], float, float] | None
+
+
+def _pair_terms(prev: list[StageCandidate], cur: list[StageCandidate]) -> tuple[list[float], list[float], list[float]]:
+    cur_str = [_strings_of(c) for c in cur]
+    cur_tech = [_techniques_of(c) for c in cur]
+    shift: list[float] = []
+    sc: list[float] = []
+    tc: list[float] = []
+    for a in prev:
+        a_str = _strings_of(a)
+        a_tech = _techniques_of(a)
+        for b, b_str, b_tech in zip(cur, cur_str, cur_tech):
+            shift.append(abs(a.pos_ratio - b.pos_ratio))
+            sc.append(0.0 if (a_str & b_str) else 1.0)
+            tc.append(0.0 if a_tech == b_tech else 1.0)
+    return shift, sc, tc
+
+
+def _term_tables(seq: _Sequence) -> _TermTables:
+    cands = seq.cands
+    own = tuple(tuple(map(list, zip(*[_own_terms(c) for c in cs]))) for cs in cands)
+    pair = (([], [], []),) + tuple(_pair_terms(cands[i - 1], cands[i]) for i in range(1, len(cands)))
+    left = _pair_terms([seq.left], cands[0]) if seq.left is not None else None
+    right = None
+    if seq.right is not None:
+        rh, rce = _own_terms(seq.right)
+        right = (*_pair_terms(cands[-1], [seq.right]), rh, rce)
+    return _TermTables(
+        sizes=tuple(len(cs) for cs in cands),
+        pair=pair,  # type: ignore[arg-type]
+        own=own,  # type: ignore[arg-type]
+        left=left,
+        right=right,
+    )
+
+
+def _weighted_layers(t: _TermTables, w: Weights) -> _LayerCosts:
+    """按一组 weights 把未加权代价项折算成 `_topk_paths` 直接查表的各层代价。
+
+    每项按 shift + string_change + technique_change + harmonic + cents_error 的顺序相加（与 `_transition_cost_chord`
+    一致），首事件无左边界时为 0.0 + 0.0 + 0.0 + harmonic + cents_error（与 `sum(_node_cost(...).values())` 一致）。
+    """
+
+    own_w = [([h * w.harmonic_penalty for h in hs], [x * w.cents_error for x in xs]) for hs, xs in t.own]
+
+    def weighted(terms: tuple[list[float], list[float], list[float]], hw: list[float], xw: list[float]) -> list[float]:
+        shift, sc, tc = terms
+        m = len(hw)
+        return [
+            shift[q] * w.shift + sc[q] * w.string_change + tc[q] * w.technique_change + hw[q % m] + xw[q % m]
+            for q in range(len(shift))
+        ]
+
+    hw0, xw0 = own_w[0]
+    first = [0.0 + 0.0 + 0.0 + h + x for h, x in zip(hw0, xw0)] if t.left is None else weighted(t.left, hw0, xw0)
+    trans = ([],) + tuple(weighted(t.pair[i], *own_w[i]) for i in range(1, len(t.sizes)))
+    right: list[float] | None = None
+    if t.right is not None:
+        shift, sc, tc, rh, rce = t.right
+        right = weighted((shift, sc, tc), [rh * w.harmonic_penalty], [rce * w.cents_error])
+    return _LayerCosts(first=first, trans=trans, right=right)
+
+
+def optimize_topk_batch(
+    *,
+    graph: CandidateGraph,
+    k: int,
+    locks: list[Lock],
+    profiles: list[Weights],
+    window: Window | None = None,
+) -> list[list[Solution]]:
+    """对多组 weights 各求 Top-K（结果与逐个调用 `optimize_topk` 逐位一致，同代价解的先后也相同）。
+
+    候选与五项未加权代价表只构建一次；每组 weights 只做加权求和（`_weighted_layers`），
+    再用同一个 `_topk_paths` 查表求解（表结构、检查点模式与同代价的排序规则都与逐个求解相同）。
+    不做 dominance 剪枝：支配关系取决于 weights，剪掉的候选无法在各组间共享（剪枝不改变结果）。
+    例外：chord 组合被截断时，保留哪些组合取决于 harmonic_penalty/cents_error，
+    此时按这两个权重分组分别构建候选（不同组不共享截断结果）。
+    """
+
+    if k <= 0:
+        raise ValueError("k 必须为正")
+    if not profiles:
+        raise ValueError("profiles 不能为空")
+
+    seq0 = _prepare_sequence(graph, locks, window, profiles[0])
+    groups: dict[tuple[float, float], list[int]] = {}
+    for pi, w in enumerate(profiles):
+        key = (w.harmonic_penalty, w.cents_error) if seq0.chord_truncated else (0.0, 0.0)
+        groups.setdefault(key, []).append(pi)
+
+    out: list[list[Solution]] = [[] for _ in profiles]
+    for members in groups.values():
+        seq = seq0 if members[0] == 0 else _prepare_sequence(graph, locks, window, profiles[members[0]])
+        tables = _term_tables(seq)
+        for pi in members:
+            w = profiles[pi]
+            paths = _topk_paths(
+                seq.cands, k=k, weights=w, left=seq.left, right=seq.right, layer_costs=_weighted_layers(tables, w)
+            )
+            out[pi] = _solutions(seq, paths, w)
+    return out
@@ -254,6 +254,21 @@ def create_project_from_musicxml_bytes(*, name: str, musicxml_bytes: bytes, tuni
     return meta
 
 
+def revision_path(project_id: str, revision: str) -> Path:
+    """revision 快照文件路径（文件必须存在；revision 不可变，可直接用于 sendfile/缓存）。
+
+    revision 来自 URL 路径（按 revision 取快照的 HTTP 路由），因此先按 `R<数字>` 校验，非法时 ValueError；
+    `load_revision_bytes` 只接受服务端自己生成的 revision，不做这项校验。
+    """
+
+    if not revision.startswith("R") or not revision[1:].isdigit():
+        raise ValueError(f"非法 revision：{revision}")
+    p = revisions_dir(project_id) / f"{revision}.musicxml"
+    if not p.exists():
+        raise FileNotFoundError(str(p))
+    return p
+
+
 def load_revision_bytes(project_id: str, revision: str) -> bytes:
     p = revisions_dir(project_id) / f"{revision}.musicxml"
     if not p.exists():
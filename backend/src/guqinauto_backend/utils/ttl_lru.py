@@ -0,0 +1,124 @@
+"""
+进程内有界缓存（LRU + 可选 TTL + 可选总权重上限）。
+
+定位：
+- 后端的各类“派生物缓存”（序列化响应、stage1 会话、stage2 结果等）共用这一实现。
+- 只缓存可由真源重复生成的派生物：缓存丢失不影响正确性，只影响延迟。
+
+约束：
+- 线程安全：FastAPI 的同步路由运行在线程池中，多个请求可能并发访问同一缓存。
+- 统计信息（hits/misses/evictions/expirations）通过 `stats()` 暴露给 `/metrics`。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TtlLruCache(Generic[K, V]):
+    """LRU 淘汰的有界缓存；可选按条目 TTL 过期、按总权重（例如字节数）淘汰。"""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        ttl_seconds: float | None = None,
+        max_weight: int | None = None,
+        weigh: Callable[[V], int] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries 必须为正")
+        if ttl_seconds is not None and ttl_seconds <= 0:
+            raise ValueError("ttl_seconds 必须为正（或 None 表示不过期）")
+        if max_weight is not None and weigh is None:
+            raise ValueError("指定 max_weight 时必须提供 weigh")
+        self._max_entries = int(max_entries)
+        self._ttl = ttl_seconds
+        self._max_weight = max_weight
+        self._weigh = weigh
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at | None, weight, value)
+        self._data: OrderedDict[K, tuple[float | None, int, V]] = OrderedDict()
+        self._weight = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            expires_at, weight, value = item
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._data[key]
+                self._weight -= weight
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        weight = int(self._weigh(value)) if self._weigh is not None else 0
+        if self._max_weight is not None and weight > self._max_weight:
+            # 单条超过总上限：不缓存（否则会把其他条目全部挤掉后仍放不下）；
+            # 已有同 key 条目时一并移除（重新登记意味着它已长大，不能按旧权重继续占位）
+            self.pop(key)
+            return
+        expires_at = (self._clock() + self._ttl) if self._ttl is not None else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._weight -= old[1]
+            self._data[key] = (expires_at, weight, value)
+            self._weight += weight
+            while len(self._data) > self._max_entries or (self._max_weight is not None and self._weight > self._max_weight):
+                _k, (_exp, w, _v) = self._data.popitem(last=False)
+                self._weight -= w
+                self._evictions += 1
+
+    def pop(self, key: K) -> V | None:
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+            self._weight -= item[1]
+            return item[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> dict[str, int | float | None]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self._max_entries,
+                "weight": self._weight,
+                "max_weight": self._max_weight,
+                "ttl_seconds": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / lookups) if lookups else None,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
@@ -8,7 +8,7 @@ import { OsmdViewer } from "@/components/score/osmd-viewer";
 import { DualScoreView, ProjectScoreView } from "@/components/score/dual-score-view";
 import { parseMusicXmlToDualView } from "@/lib/musicxml/parse-dual-view";
 import { stripMusicXmlToStaff1 } from "@/lib/musicxml/strip-to-staff1";
-import { http, HttpError } from "@/lib/http";
+import { http, httpText, HttpError } from "@/lib/http";
 import { useEffect, useMemo, useState } from "react";
 
 type InspectorTab = "简谱属性" | "减字属性" | "候选与诊断" | "回放表现";
@@ -169,10 +169,10 @@ export function EditorShell(props: { projectId?: string | null }) {
 
       // OSMD 视图需要 XML：只在用户切换到 OSMD 时再拉取，避免无意义的额外请求。
       if (centerView === "OSMD") {
-        const xmlData = await http<{ musicxml: string }>(
-          `/api/backend/projects/${encodeURIComponent(projectId)}/musicxml`
+        const xmlText = await httpText(
+          `/api/backend/projects/${encodeURIComponent(projectId)}/musicxml/raw`
         );
-        setMusicxml(xmlData.musicxml);
+        setMusicxml(xmlText);
       }
     } catch (err) {
       const e = err as HttpError;
@@ -226,10 +226,10 @@ export function EditorShell(props: { projectId?: string | null }) {
       setProjectStatus(st.status);
 
       if (centerView === "OSMD") {
-        const xmlData = await http<{ musicxml: string }>(
-          `/api/backend/projects/${encodeURIComponent(commit.project.project_id)}/musicxml`
+        const xmlText = await httpText(
+          `/api/backend/projects/${encodeURIComponent(commit.project.project_id)}/musicxml/raw`
         );
-        setMusicxml(xmlData.musicxml);
+        setMusicxml(xmlText);
       }
     } catch (err) {
       const e = err as HttpError;
@@ -384,10 +384,10 @@ export function EditorShell(props: { projectId?: string | null }) {
       setProjectStatus(st.status);
 
       if (centerView === "OSMD") {
-        const xmlData = await http<{ musicxml: string }>(
-          `/api/backend/projects/${encodeURIComponent(commit.project.project_id)}/musicxml`
+        const xmlText = await httpText(
+          `/api/backend/projects/${encodeURIComponent(commit.project.project_id)}/musicxml/raw`
         );
-        setMusicxml(xmlData.musicxml);
+        setMusicxml(xmlText);
       }
     } catch (err) {
       const e = err as HttpError;
@@ -409,10 +409,10 @@ export function EditorShell(props: { projectId?: string | null }) {
     if (musicxml) return;
     void (async () => {
       try {
-        const xmlData = await http<{ musicxml: string }>(
-          `/api/backend/projects/${encodeURIComponent(props.projectId!)}/musicxml`
+        const xmlText = await httpText(
+          `/api/backend/projects/${encodeURIComponent(props.projectId!)}/musicxml/raw`
         );
-        setMusicxml(xmlData.musicxml);
+        setMusicxml(xmlText);
       } catch {
         // 这里不吞错：由 loadError 主路径负责显示。
       }
@@ -750,10 +750,10 @@ export function EditorShell(props: { projectId?: string | null }) {
                           setStage1ByEid(null);
 
                           if (centerView === "OSMD") {
-                            const xmlData = await http<{ musicxml: string }>(
-                              `/api/backend/projects/${encodeURIComponent(data.project.project_id)}/musicxml`
+                            const xmlText = await httpText(
+                              `/api/backend/projects/${encodeURIComponent(data.project.project_id)}/musicxml/raw`
                             );
-                            setMusicxml(xmlData.musicxml);
+                            setMusicxml(xmlText);
                           }
                         } catch (err) {
                           const e = err as HttpError;
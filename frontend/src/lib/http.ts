@@ -6,6 +6,17 @@ export type HttpError = {
 };
 
 export async function http<T>(input: RequestInfo | URL, init?: RequestInit) {
+  const res = await fetchOk(input, init);
+  return (await res.json()) as T;
+}
+
+// 原始文本响应（例如 /musicxml/raw）。浏览器 HTTP 缓存会自动带 If-None-Match，命中时后端回 304。
+export async function httpText(input: RequestInfo | URL, init?: RequestInit) {
+  const res = await fetchOk(input, init);
+  return await res.text();
+}
+
+async function fetchOk(input: RequestInfo | URL, init?: RequestInit) {
   const res = await fetch(input, init);
   if (!res.ok) {
     const bodyText = await safeText(res);
@@ -17,7 +28,7 @@ export async function http<T>(input: RequestInfo | URL, init?: RequestInit) {
     };
     throw err;
   }
-  return (await res.json()) as T;
+  return res;
 }
 
 async function safeText(res: Response) {
@@ -3,7 +3,7 @@ stage2（Top-K 推荐，不写回）开发期尝试脚本。
 
 目标：
 - 用 v0.2 的 stage2 序列示例创建项目
-- 调用 /stage2 等价逻辑（直接调用 api_stage2）拿到 top-K 推荐
+- 调用 /stage2 等价逻辑（直接调用 compute_stage2）拿到 top-K 推荐
 
 运行：
   python scripts/backend_stage2_try.py
@@ -28,7 +28,7 @@ def main() -> None:
     _ensure_backend_src_on_path(repo_root)
 
     from guqinauto_backend.infra.workspace import create_project_from_example
-    from guqinauto_backend.api.server import Stage2Request, Stage2Preferences, api_stage2
+    from guqinauto_backend.api.server import Stage2Request, Stage2Preferences, compute_stage2
 
     meta = create_project_from_example(name="temp-stage2-try", example_filename="guqin_jzp_profile_v0.2_stage2_sequence.musicxml")
 
@@ -39,7 +39,7 @@ def main() -> None:
         apply_mode="none",
         preferences=Stage2Preferences(shift=1.0, string_change=0.6, technique_change=0.2, harmonic_penalty=0.2, cents_error=0.01),
     )
-    out = api_stage2(meta.project_id, req)
+    out = compute_stage2(meta.project_id, req)
 
     # 打印第一条方案的前 5 个 eid 的选择摘要（string/technique/pos_ratio）
     sol0 = out["stage2"]["solutions"][0]
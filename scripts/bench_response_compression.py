@@ -0,0 +1,119 @@
+"""
+响应编码/压缩基准：传输大小与编码耗时（score view / stage1 / stage2 payload）。
+
+定位：
+- 给 `api/compression.py` 的阈值与压缩级别选择提供依据：在典型大 payload 上比较
+  identity / gzip / brotli（若已安装）的大小与耗时，以及 JSON 与 MessagePack 的差异。
+- payload 由仓库示例合成：把示例的小节按 eid 重命名后重复 N 次，得到多 MB 的输入
+  （真实作品同样高度重复，这个近似对压缩率是偏保守的）。
+
+运行：
+  python scripts/bench_response_compression.py
+  python scripts/bench_response_compression.py --repeat 200 --rounds 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _best_time(fn: Callable[[], Any], rounds: int) -> tuple[float, Any]:
+    best = float("inf")
+    out: Any = None
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def _build_payloads(repeat: int) -> dict[str, Any]:
+    from dataclasses import replace
+
+    from guqinauto_backend.api.serializers import serialize_score_view, serialize_solution, serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage2_optimizer import Weights, optimize_topk
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    base = build_score_view(project_id="BENCH", revision="R000001", musicxml_bytes=EXAMPLE.read_bytes())
+    measures = []
+    for r in range(repeat):
+        for m in base.measures:
+            events = [replace(e, eid=f"{e.eid}_{r:04d}") for e in m.events]
+            measures.append(replace(m, number=f"{m.number}_{r:04d}", events=events))
+    view = replace(base, measures=measures)
+
+    tuning = ProjectTuning.default_demo()
+    engine = PositionEngine(open_pitches_midi=list(tuning.open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=True)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            p = e.staff1_notes[0]["pitch"]
+            midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+            cands = [serialize_stage1_candidate(c) for c in engine.enumerate_candidates(pitch_midi=midi, options=opt)]
+            events.append({"eid": e.eid, "targets": [{"slot": None, "target_pitch": {"midi": midi}, "candidates": cands}]})
+
+    sols = optimize_topk(events=events, k=5, locks=[], weights=Weights())
+    return {
+        "score": serialize_score_view(view),
+        "stage1": {"events": events, "warnings": []},
+        "stage2": {"k": 5, "solutions": [serialize_solution(s) for s in sols]},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument("--repeat", type=int, default=100, help="示例小节重复次数（控制 payload 大小）")
+    parser.add_argument("--rounds", type=int, default=3, help="每项计时取最好的一轮")
+    args = parser.parse_args()
+
+    _ensure_backend_src_on_path(REPO_ROOT)
+    from guqinauto_backend.api import compression
+    from guqinauto_backend.api.encoding import encode_payload, msgpack_available
+
+    payloads = _build_payloads(args.repeat)
+    encodings = ["json"] + (["msgpack"] if msgpack_available() else [])
+
+    codings: list[tuple[str, Callable[[bytes], bytes]]] = [
+        ("gzip-1", lambda b: gzip.compress(b, compresslevel=1, mtime=0)),
+        (f"gzip-{compression.GZIP_LEVEL}", lambda b: compression.compress_body(b, "gzip")),
+    ]
+    if compression.brotli_available():
+        import brotli  # type: ignore[import-not-found]
+
+        codings.append((f"br-{compression.BROTLI_QUALITY}", lambda b: compression.compress_body(b, "br")))
+        codings.append(("br-11", lambda b: brotli.compress(b, quality=11)))
+
+    print(f"repeat={args.repeat} rounds={args.rounds} brotli_available={compression.brotli_available()}")
+    print(f"{'payload':<8} {'encoding':<8} {'coding':<9} {'bytes':>12} {'ratio':>7} {'encode_ms':>10} {'compress_ms':>12}")
+    for name, payload in payloads.items():
+        for enc in encodings:
+            enc_t, body = _best_time(lambda: encode_payload(payload, enc), args.rounds)  # noqa: B023
+            print(f"{name:<8} {enc:<8} {'identity':<9} {len(body):>12} {1.0:>7.3f} {enc_t * 1e3:>10.2f} {0.0:>12.2f}")
+            for cname, fn in codings:
+                c_t, out = _best_time(lambda: fn(body), args.rounds)  # noqa: B023
+                print(
+                    f"{name:<8} {enc:<8} {cname:<9} {len(out):>12} {len(out) / len(body):>7.3f} {enc_t * 1e3:>10.2f} {c_t * 1e3:>12.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+stage2 重复材料记忆化（`_top1_memo_path`）的耗时基准。
+
+定位：
+- 输入由仓库示例合成：把示例事件按 eid 重命名后重复 N 次（含 harmonic 候选），即“唯一材料”固定、总长随 N 增长。
+- 对比普通 Top-1 DP（`_topk_paths(k=1)`）与 memo 的耗时，并给出转移代价缓存的统计（不同转移数 / 转移总数）。
+- 两种实现的 Top-1 路径必须逐项一致（否则基准无意义，直接失败）。
+
+运行：
+  python scripts/bench_stage2_memo.py
+  python scripts/bench_stage2_memo.py --repeats 10,40,160
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _base_sequence() -> list[list[Any]]:
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import run_stage1
+    from guqinauto_backend.engines.stage2_optimizer import candidate_graph_from_stage1_result
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="BENCH", revision="R000001", musicxml_bytes=EXAMPLE.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    graph = candidate_graph_from_stage1_result(run_stage1(view=view, engine=engine, options=PositionEngineOptions(include_harmonics=True)))
+    return [list(ev.candidates[0]) for ev in graph.events]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeats", default="4,16,64,256", help="示例重复次数（逗号分隔；事件数 = 26 × repeat）")
+    args = ap.parse_args()
+
+    _ensure_backend_src_on_path(REPO_ROOT)
+    from guqinauto_backend.engines.stage2_optimizer import Weights, _top1_memo_path, _topk_paths
+
+    base = _base_sequence()
+    w = Weights()
+    print(f"{'events':>7} {'plain_ms':>9} {'memo_ms':>8} {'speedup':>8} {'uniq_trans':>10} {'trans':>6}")
+    for repeat in (int(x) for x in args.repeats.split(",")):
+        seq = base * repeat
+        t0 = time.perf_counter()
+        plain = _topk_paths(seq, k=1, weights=w, breakdown=False)[0][0]
+        t1 = time.perf_counter()
+        found = _top1_memo_path(seq, w, None, None)
+        t2 = time.perf_counter()
+        if found is None:
+            print(f"{len(seq):>7} {(t1 - t0) * 1e3:>9.1f} {'-':>8} (重复材料不足，不走 memo)")
+            continue
+        idxs, stats = found
+        assert idxs == plain, "memo 与普通 DP 的 Top-1 路径不一致"
+        print(
+            f"{len(seq):>7} {(t1 - t0) * 1e3:>9.1f} {(t2 - t1) * 1e3:>8.1f} {(t1 - t0) / (t2 - t1):>7.1f}x "
+            f"{stats['unique_transitions']:>10} {stats['transitions']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
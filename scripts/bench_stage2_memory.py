@@ -0,0 +1,138 @@
+"""
+stage2 Top-K DP 的峰值内存基准（tracemalloc）。
+
+定位：
+- 对比两种 DP 表结构在长曲上的峰值内存与耗时：
+  - legacy：每个状态每条前缀存 Python 元组 (cost, breakdown_dict, (pj, pk))（`_topk_paths` 旧实现的表结构，这里保留一份对照）
+  - typed：cost 存 array('d')、回溯指针存 array('i')，分项只沿最终路径重算（当前 `_topk_paths`）
+- 输入由仓库示例合成：把示例事件按 eid 重命名后重复 N 次（含 harmonic 候选）。
+- 两种实现的 Top-K 代价与路径必须一致（否则基准无意义，直接失败）。
+
+运行：
+  python scripts/bench_stage2_memory.py
+  python scripts/bench_stage2_memory.py --repeat 80 --k 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _build_sequence(repeat: int) -> list[list[Any]]:
+    from dataclasses import replace
+
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage2_optimizer import CandidateGraph, candidate_graph_from_stage1
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="BENCH", revision="R000001", musicxml_bytes=EXAMPLE.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=True)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            p = e.staff1_notes[0]["pitch"]
+            midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+            cands = [serialize_stage1_candidate(c) for c in engine.enumerate_candidates(pitch_midi=midi, options=opt)]
+            events.append({"eid": e.eid, "targets": [{"slot": None, "candidates": cands}]})
+    base = candidate_graph_from_stage1(events)
+    graph = CandidateGraph(events=tuple(replace(ev, eid=f"{ev.eid}_{r:04d}") for r in range(repeat) for ev in base.events))
+    return [list(ev.candidates[0]) for ev in graph.events]
+
+
+def _legacy_topk_paths(seq_cands: list[list[Any]], *, k: int, weights: Any) -> list[tuple[list[int], dict[str, float], float]]:
+    """对照：旧的 tuple + breakdown dict 表结构（无窗口边界）。"""
+
+    from guqinauto_backend.engines.stage2_optimizer import _add_breakdown, _node_cost, _transition_cost_chord
+
+    dp: list[list[list[tuple[float, dict[str, float], tuple[int, int] | None]]]] = []
+    dp0 = []
+    for c in seq_cands[0]:
+        base = _node_cost(c, weights)
+        dp0.append([(float(sum(base.values())), base, None)])
+    dp.append(dp0)
+    for i in range(1, len(seq_cands)):
+        cur_states = []
+        for cur_c in seq_cands[i]:
+            items = []
+            for pj, prev_c in enumerate(seq_cands[i - 1]):
+                for pk, (prev_cost, prev_bd, _ptr) in enumerate(dp[i - 1][pj]):
+                    tc, bd = _transition_cost_chord(prev_c, cur_c, weights)
+                    items.append((float(prev_cost + tc), _add_breakdown(prev_bd, bd), (pj, pk)))
+            items.sort(key=lambda x: x[0])
+            cur_states.append(items[:k])
+        dp.append(cur_states)
+    last = len(seq_cands) - 1
+    ends = sorted(
+        ((cost, bd, j, kk) for j in range(len(seq_cands[last])) for kk, (cost, bd, _p) in enumerate(dp[last][j])),
+        key=lambda x: x[0],
+    )[:k]
+    out = []
+    for total, bd, j, kk in ends:
+        idxs = [0] * len(seq_cands)
+        i = last
+        idxs[i] = j
+        ptr = dp[i][j][kk][2]
+        while ptr is not None:
+            i -= 1
+            j, kk = ptr
+            idxs[i] = j
+            ptr = dp[i][j][kk][2]
+        out.append((idxs, bd, float(total)))
+    return out
+
+
+def _measure(fn: Callable[[], Any]) -> tuple[float, float, Any]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024), out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=40, help="示例重复次数（事件数 = 26 × repeat）")
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    _ensure_backend_src_on_path(REPO_ROOT)
+    from guqinauto_backend.engines.stage2_optimizer import Weights, _topk_paths
+
+    seq = _build_sequence(args.repeat)
+    w = Weights()
+    states = sum(len(cs) for cs in seq)
+    print(f"events={len(seq)} states={states} k={args.k}")
+
+    t_legacy, mb_legacy, legacy = _measure(lambda: _legacy_topk_paths(seq, k=args.k, weights=w))
+    t_typed, mb_typed, typed = _measure(lambda: _topk_paths(seq, k=args.k, weights=w))
+    assert [(p[0], p[2]) for p in legacy] == [(p[0], p[2]) for p in typed], "两种实现结果不一致"
+
+    print(f"{'impl':<8} {'peak_MiB':>10} {'time_s':>8}")
+    print(f"{'legacy':<8} {mb_legacy:>10.2f} {t_legacy:>8.3f}")
+    print(f"{'typed':<8} {mb_typed:>10.2f} {t_typed:>8.3f}")
+    print(f"peak memory ratio legacy/typed = {mb_legacy / mb_typed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
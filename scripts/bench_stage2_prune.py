@@ -0,0 +1,101 @@
+"""
+stage2 dominance 剪枝（`_prune_dominated` / `_DominancePruner`）的耗时基准：DOMINANCE_MIN_CANDIDATES 与探测参数的依据。
+
+定位：
+- 输入为合成的密集单音序列：每个事件 M 个随机候选（open/press/harmonic，随机弦、位置与 cents_error）。
+- 对每个 M、weights（默认 = shift 主导；harm = 偏重 harmonic/cents 惩罚）与 K，给出：
+  - 每个事件都判定（取消候选数门槛与探测）时的“判定 + DP”耗时、剪掉的比例；
+  - 按当前门槛与探测（即 optimize_topk 的实际行为）的耗时；
+  - 不剪枝的 DP 耗时。
+- 每项取 3 次中最快的一次；剪枝前后的 Top-K 代价必须一致（否则基准无意义，直接失败）。
+
+运行：
+  python scripts/bench_stage2_prune.py
+  python scripts/bench_stage2_prune.py --sizes 32,64 --events 80
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _dense_graph(m: int, events: int, seed: int) -> Any:
+    from guqinauto_backend.engines.stage2_optimizer import Candidate, CandidateGraph, GraphEvent
+
+    rng = random.Random(seed)
+
+    def cand() -> Any:
+        string = rng.randint(1, 7)
+        technique = rng.choice(["open", "press", "harmonic"])
+        pos = 0.0 if technique == "open" else round(rng.uniform(0.1, 0.9), 4)
+        return Candidate(string=string, technique=technique, pos_ratio=pos, cents_error=round(rng.uniform(-30, 30), 3), raw={"string": string})
+
+    return CandidateGraph(
+        events=tuple(GraphEvent(eid=f"S{e:04d}", slots=(None,), candidates=(tuple(cand() for _ in range(m)),)) for e in range(events))
+    )
+
+
+def _timed(fn: Any, repeats: int = 3) -> tuple[float, Any]:
+    """(最快一次的毫秒数, 结果)。"""
+
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e3, out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="16,32,48,64,128", help="每事件候选数 M（逗号分隔）")
+    ap.add_argument("--events", type=int, default=40, help="事件数")
+    args = ap.parse_args()
+
+    _ensure_backend_src_on_path(REPO_ROOT)
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.engines.stage2_optimizer import Weights, _prepare_sequence, _topk_paths
+
+    profiles = {"default": Weights(), "harm": Weights(harmonic_penalty=1.0, cents_error=0.1)}
+    print(f"{'M':>4} {'weights':>8} {'K':>2} {'off_ms':>7} {'all_ms':>7} {'pruned':>7} {'speedup':>8} {'gated_ms':>9} {'speedup':>8}")
+    for m in (int(x) for x in args.sizes.split(",")):
+        graph = _dense_graph(m, args.events, seed=m)
+        for name, w in profiles.items():
+            for k in (1, 5):
+                plain = _prepare_sequence(graph, [], None, w)
+                off_ms, ref = _timed(lambda: _topk_paths(plain.cands, k=k, weights=w, breakdown=False))
+
+                saved = (so.DOMINANCE_MIN_CANDIDATES, so.DOMINANCE_PROBE_EVENTS)
+                so.DOMINANCE_MIN_CANDIDATES, so.DOMINANCE_PROBE_EVENTS = 0, len(graph.events)
+                try:
+                    all_ms, seq = _timed(lambda: _prepare_sequence(graph, [], None, w, prune_k=k))
+                finally:
+                    so.DOMINANCE_MIN_CANDIDATES, so.DOMINANCE_PROBE_EVENTS = saved
+                dp_ms, got = _timed(lambda: _topk_paths(seq.cands, k=k, weights=w, breakdown=False))
+                all_ms += dp_ms
+                assert [c for _i, _b, c in got] == [c for _i, _b, c in ref], (m, name, k)
+
+                gated_ms, gated = _timed(lambda: _prepare_sequence(graph, [], None, w, prune_k=k))
+                gated_ms += _timed(lambda: _topk_paths(gated.cands, k=k, weights=w, breakdown=False))[0]
+                print(
+                    f"{m:>4} {name:>8} {k:>2} {off_ms:>7.0f} {all_ms:>7.0f} {seq.pruned / (m * args.events):>7.0%} "
+                    f"{off_ms / all_ms:>7.2f}x {gated_ms:>9.0f} {off_ms / gated_ms:>7.2f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
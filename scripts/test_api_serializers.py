@@ -0,0 +1,96 @@
+"""
+API 预编译序列化器与 `dataclasses.asdict` 的结构一致性回归测试。
+
+定位：
+- 大 payload 路由已改用 `api/serializers.py` 的字段直取序列化器 + orjson/msgpack 编码；
+  前端契约不允许因此改变：这里对示例 MusicXML 逐字段比较两者的 JSON 结果。
+- 同时检查 Accept 协商的边界（默认 JSON、msgpack opt-in、只接受未知类型时失败）。
+  Accept-Encoding 协商与压缩见 scripts/test_response_compression.py。
+
+用法：
+  python scripts/test_api_serializers.py
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import asdict
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_simple_multistring_li.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _normalize(obj: object) -> object:
+    # tuple/list 在 JSON 中同为数组：统一经过一次 JSON 往返再比较
+    return json.loads(json.dumps(obj, ensure_ascii=False))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import orjson
+
+    from guqinauto_backend.api.encoding import NotAcceptableError, encode_payload, msgpack_available, negotiate_encoding
+    from guqinauto_backend.api.serializers import serialize_project_meta, serialize_score_view, serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectMeta, ProjectTuning
+
+    for p in EXAMPLES:
+        view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=p.read_bytes())
+        fast = serialize_score_view(view)
+        assert _normalize(fast) == _normalize(asdict(view)), f"score view 序列化不一致：{p.name}"
+        assert orjson.loads(encode_payload(fast, "json")) == _normalize(asdict(view))
+
+    meta = ProjectMeta(
+        project_id="P0",
+        name="n",
+        created_at="t0",
+        updated_at="t1",
+        current_revision="R000001",
+        tuning=ProjectTuning.default_demo(),
+    )
+    assert _normalize(serialize_project_meta(meta)) == _normalize(asdict(meta))
+
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    cands = engine.enumerate_candidates(pitch_midi=67, options=PositionEngineOptions(include_harmonics=True))
+    techniques = {c.technique for c in cands}
+    assert techniques == {"open", "press", "harmonic"}, techniques
+    for c in cands:
+        d = serialize_stage1_candidate(c)
+        assert d["string"] == c.string and d["technique"] == c.technique
+        assert d["pos"]["pos_ratio"] == c.pos_ratio
+        if c.technique == "harmonic":
+            assert d["source"] == {"method": "natural_harmonic", "harmonic_n": c.harmonic_n}
+
+    # Accept 协商
+    assert negotiate_encoding(None) == "json"
+    assert negotiate_encoding("*/*") == "json"
+    assert negotiate_encoding("application/json, application/msgpack;q=0.5") == "json"
+    want_msgpack = negotiate_encoding("application/msgpack, application/json;q=0.1")
+    assert want_msgpack == ("msgpack" if msgpack_available() else "json")
+    try:
+        negotiate_encoding("text/html")
+    except NotAcceptableError:
+        pass
+    else:
+        raise AssertionError("只接受 text/html 时应当失败（406）")
+
+    print(f"[OK] api serializers: {len(EXAMPLES)} examples match asdict; msgpack_available={msgpack_available()}")
+
+
+if __name__ == "__main__":
+    main()
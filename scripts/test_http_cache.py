@@ -0,0 +1,106 @@
+"""
+HTTP 条件请求（api/http_cache.py 的 revision_etag / etag_matches 与 MusicXML 原文端点的 304）的回归测试。
+
+覆盖：
+- revision_etag：强 ETag、variant 区分表示；空值与双引号明确失败
+- etag_matches：`*`、逗号分隔多个 ETag、`W/` 弱比较、空头不命中
+- /musicxml/raw 与 /revisions/{revision}/musicxml：200 带 ETag；If-None-Match 命中返回 304（无 body）
+- 先校验快照再比较 ETag：不存在的工程/revision 即使 `If-None-Match: *` 也是 404；非法 revision（含双引号）是 400
+- revision 格式校验只在 revision_path（HTTP 路由）中：load_revision_bytes 的行为不变（只按文件是否存在）
+
+用法：
+  python scripts/test_http_cache.py
+
+注意：
+- 测试工程写入 backend/workspace，结束时删除。
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import shutil
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from fastapi.testclient import TestClient
+
+    from guqinauto_backend.api.http_cache import etag_matches, revision_etag
+    from guqinauto_backend.api.server import app
+    from guqinauto_backend.infra.workspace import (
+        create_project_from_musicxml_bytes,
+        load_revision_bytes,
+        project_dir,
+        revision_path,
+        revisions_dir,
+    )
+
+    # 纯函数
+    assert revision_etag("P1", "R000001") == '"P1.R000001"'
+    assert revision_etag("P1", "R000001", variant="musicxml") == '"P1.R000001.musicxml"'
+    for bad in [("", "R000001"), ("P1", ""), ("P1", 'R0"')]:
+        try:
+            revision_etag(*bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"应当失败：{bad!r}")
+    tag = '"P1.R000001"'
+    assert etag_matches("*", tag) and etag_matches(f" {tag} ", tag)
+    assert etag_matches(f'"x", W/{tag}', tag) and etag_matches(tag, f"W/{tag}")
+    assert not etag_matches(None, tag) and not etag_matches("", tag) and not etag_matches('"P1.R000002"', tag)
+
+    raw = EXAMPLE.read_bytes()
+    meta = create_project_from_musicxml_bytes(name="test_http_cache", musicxml_bytes=raw)
+    pid, rev = meta.project_id, meta.current_revision
+    try:
+        client = TestClient(app)
+        for url in (f"/projects/{pid}/musicxml/raw", f"/projects/{pid}/revisions/{rev}/musicxml"):
+            r = client.get(url)
+            assert r.status_code == 200 and r.content == raw, (url, r.status_code)
+            etag = r.headers["etag"]
+            assert etag == revision_etag(pid, rev, variant="musicxml")
+            for inm in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+                r304 = client.get(url, headers={"If-None-Match": inm})
+                assert r304.status_code == 304 and r304.content == b"" and r304.headers["etag"] == etag, (url, inm)
+            assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+        # 不存在的工程/revision：不因 `*` 得到 304
+        for url in ("/projects/NOPE/revisions/R000001/musicxml", f"/projects/{pid}/revisions/R999999/musicxml"):
+            r = client.get(url, headers={"If-None-Match": "*"})
+            assert r.status_code == 404, (url, r.status_code)
+        for bad in ("R0%22", "X000001"):
+            r = client.get(f"/projects/{pid}/revisions/{bad}/musicxml", headers={"If-None-Match": "*"})
+            assert r.status_code == 400, (bad, r.status_code)
+
+        # load_revision_bytes 不做格式校验：已有快照按文件读取，不存在时 FileNotFoundError
+        assert load_revision_bytes(pid, rev) == raw
+        (revisions_dir(pid) / "manual.musicxml").write_bytes(raw)
+        assert load_revision_bytes(pid, "manual") == raw
+        for fn, exc in ((load_revision_bytes, FileNotFoundError), (revision_path, ValueError)):
+            try:
+                fn(pid, "X000001")
+            except exc:
+                pass
+            else:
+                raise AssertionError(f"{fn.__name__}(X000001) 应抛出 {exc.__name__}")
+    finally:
+        shutil.rmtree(project_dir(pid))
+
+    print("[OK] http cache: etag helpers; 304 only for existing revisions; 400/404 before etag comparison")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+响应压缩（api/compression.py：CompressionMiddleware 与 revision-keyed 路由的压缩 body 缓存）的回归测试。
+
+覆盖：
+- Accept-Encoding 协商与压缩往返（gzip 必有；brotli 仅在安装时参与）；gzip 输出确定
+- 中间件：≥ 阈值的 JSON 带 Content-Encoding 与 Vary: Accept-Encoding；低于阈值的 body 原样返回
+- 原始 MusicXML（sendfile）不压缩
+- /score：压缩表示有独立的 ETag；带该 ETag 再验证返回 304；再次取用直接复用缓存的压缩 body（不重新压缩）
+
+用法：
+  python scripts/test_response_compression.py
+
+注意：
+- 测试工程写入 backend/workspace，结束时删除。
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+import shutil
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from fastapi.testclient import TestClient
+
+    import guqinauto_backend.api.server as server
+    from guqinauto_backend.api.compression import (
+        MIN_COMPRESS_BYTES,
+        brotli_available,
+        compress_body,
+        negotiate_content_encoding,
+    )
+    from guqinauto_backend.infra.workspace import create_project_from_musicxml_bytes, project_dir
+
+    # Accept-Encoding 协商与压缩往返
+    assert negotiate_content_encoding(None) is None
+    assert negotiate_content_encoding("identity") is None
+    assert negotiate_content_encoding("gzip") == "gzip"
+    assert negotiate_content_encoding("gzip;q=0, identity") is None
+    assert negotiate_content_encoding("br, gzip") == ("br" if brotli_available() else "gzip")
+    assert negotiate_content_encoding("br;q=0.5, gzip") == "gzip"
+    assert negotiate_content_encoding("*") == ("br" if brotli_available() else "gzip")
+    body = json.dumps({"x": list(range(2000))}).encode("utf-8")
+    assert gzip.decompress(compress_body(body, "gzip")) == body
+    assert compress_body(body, "gzip") == compress_body(body, "gzip"), "gzip 输出应确定（便于缓存）"
+
+    raw = EXAMPLE.read_bytes()
+    meta = create_project_from_musicxml_bytes(name="test_response_compression", musicxml_bytes=raw)
+    pid, rev = meta.project_id, meta.current_revision
+    gz = {"Accept-Encoding": "gzip"}
+    try:
+        client = TestClient(server.app)
+
+        def fetch(method: str, url: str, **kw: object) -> tuple[object, bytes]:
+            with client.stream(method, url, **kw) as r:  # type: ignore[arg-type]
+                return r, b"".join(r.iter_raw())
+
+        # 中间件：大 JSON 压缩，小 JSON 原样
+        stage1 = {"base_revision": rev, "options": {"include_harmonics": True}}
+        r, body = fetch("POST", f"/projects/{pid}/stage1", json=stage1, headers=gz)
+        assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in r.headers["vary"].lower()
+        plain = gzip.decompress(body)
+        assert len(plain) >= MIN_COMPRESS_BYTES and json.loads(plain)["events"]
+        r, body = fetch("POST", f"/projects/{pid}/stage1", json=stage1, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in r.headers and body == plain
+
+        r, body = fetch("GET", f"/projects/{pid}", headers=gz)
+        assert r.status_code == 200 and len(body) < MIN_COMPRESS_BYTES
+        assert "content-encoding" not in r.headers and json.loads(body)["project_id"] == pid
+
+        # 原始 MusicXML 不压缩
+        r, body = fetch("GET", f"/projects/{pid}/musicxml/raw", headers=gz)
+        assert r.status_code == 200 and "content-encoding" not in r.headers and body == raw
+
+        # /score：压缩 body 进缓存，ETag 再验证 304，再次取用不重新压缩
+        calls = [0]
+        saved = server.compress_body
+
+        def counting(b: bytes, coding: str) -> bytes:
+            calls[0] += 1
+            return saved(b, coding)  # type: ignore[arg-type]
+
+        server.compress_body = counting  # type: ignore[assignment]
+        try:
+            r, first = fetch("GET", f"/projects/{pid}/score", headers=gz)
+            assert r.status_code == 200 and r.headers["content-encoding"] == "gzip" and calls[0] == 1
+            coded_etag = r.headers["etag"]
+            assert coded_etag.endswith('.gzip"'), coded_etag
+            assert json.loads(gzip.decompress(first))["revision"] == rev
+
+            r, body = fetch("GET", f"/projects/{pid}/score", headers={**gz, "If-None-Match": coded_etag})
+            assert r.status_code == 304 and body == b"" and r.headers["etag"] == coded_etag
+
+            hits = server._RESPONSE_CACHE.stats()["hits"]
+            r, again = fetch("GET", f"/projects/{pid}/score", headers=gz)
+            assert r.status_code == 200 and again == first and r.headers["etag"] == coded_etag
+            assert calls[0] == 1, "缓存命中时不应重新压缩"
+            assert server._RESPONSE_CACHE.stats()["hits"] == hits + 1
+
+            r, body = fetch("GET", f"/projects/{pid}/score", headers={"Accept-Encoding": "identity"})
+            assert "content-encoding" not in r.headers and body == gzip.decompress(first)
+            assert r.headers["etag"] != coded_etag
+        finally:
+            server.compress_body = saved  # type: ignore[assignment]
+    finally:
+        shutil.rmtree(project_dir(pid))
+
+    print("[OK] response compression: middleware threshold/Vary; MusicXML passthrough; /score coded ETag 304 + cached body")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+分组泛音候选（PositionEngineOptions.group_harmonics）的回归测试。
+
+覆盖：
+- stage1：每个 (弦, n) 只输出一个泛音候选，harmonic_nodes 与不分组时的全部节点一致，代表节点为 k=1
+- stage2：展开后的最优代价与不分组逐位一致（随机 weights，含负 shift 权重；合成的高音序列 + 示例曲）
+- 离邻居最近的节点之外的节点不参与求解（nearest=False），但 pos_ratio lock 命中时可选；assignment 给出所选节点
+- 类型化结果与 API dict 两条路径展开一致；min-marginals 的 index 指向分组候选在 stage1 中的下标
+
+用法：
+  python scripts/test_stage1_grouped_harmonics.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _synthetic_result(pitches: list[int], *, group: bool) -> Any:
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import Stage1Event, Stage1Result, Stage1Target
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=True, max_harmonic_n=32, max_harmonic_cents_error=100.0, group_harmonics=group)
+    events = []
+    for i, p in enumerate(pitches):
+        cands = tuple(engine.enumerate_candidates(pitch_midi=p, options=opt))
+        events.append(Stage1Event(eid=f"E{i:04d}", targets=(Stage1Target(slot=None, target_midi=p, candidates=cands),)))
+    return Stage1Result(events=tuple(events))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.api.serializers import serialize_assignment, serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.engines.position_engine import PositionCandidate, PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import Stage1Event, Stage1Result, Stage1Target, run_stage1
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Lock,
+        Weights,
+        candidate_graph_from_stage1,
+        candidate_graph_from_stage1_result,
+        min_marginals,
+        optimize_topk,
+    )
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    # stage1：分组输出
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    flat_opt = PositionEngineOptions(include_harmonics=True, max_harmonic_n=32, max_harmonic_cents_error=100.0)
+    group_opt = PositionEngineOptions(include_harmonics=True, max_harmonic_n=32, max_harmonic_cents_error=100.0, group_harmonics=True)
+    for pitch in range(55, 101):
+        flat = [c for c in engine.enumerate_candidates(pitch_midi=pitch, options=flat_opt) if c.technique == "harmonic"]
+        grouped = [c for c in engine.enumerate_candidates(pitch_midi=pitch, options=group_opt) if c.technique == "harmonic"]
+        assert len({(c.string, c.harmonic_n) for c in grouped}) == len(grouped)
+        assert sorted((c.string, c.harmonic_n, n.k, n.pos_ratio) for c in grouped for n in c.harmonic_nodes or ()) == sorted(
+            (c.string, c.harmonic_n, c.harmonic_k, c.pos_ratio) for c in flat
+        ), pitch
+        assert all(c.harmonic_k == 1 and c.pos_ratio == c.harmonic_nodes[0].pos_ratio for c in grouped)  # type: ignore[index]
+        assert all("harmonic_nodes" not in serialize_stage1_candidate(c) for c in flat)
+
+    # stage2：最优代价与不分组一致
+    rng = random.Random(44)
+    profiles = [Weights(), Weights(harmonic_penalty=-0.5, shift=0.3), Weights(shift=-0.3)]
+    profiles += [Weights(*(round(rng.uniform(-0.5, 2.0), 3) for _ in range(5))) for _ in range(8)]
+    pitches = [rng.randint(70, 100) for _ in range(120)]
+    flat_graph = candidate_graph_from_stage1_result(_synthetic_result(pitches, group=False))
+    grouped_result = _synthetic_result(pitches, group=True)
+    grouped_graph = candidate_graph_from_stage1_result(grouped_result)
+    for w in profiles:
+        a = optimize_topk(graph=flat_graph, k=1, locks=[], weights=w)[0]
+        b = optimize_topk(graph=grouped_graph, k=1, locks=[], weights=w)[0]
+        assert abs(a.total_cost - b.total_cost) <= 1e-9 * (1 + abs(a.total_cost)), (w, a.total_cost, b.total_cost)
+        for asg in b.assignments:
+            c = asg["choice"]
+            assert isinstance(c, PositionCandidate)
+            if c.technique == "harmonic":
+                assert abs(c.pos_ratio - c.harmonic_k / c.harmonic_n) < 1e-12  # type: ignore[operator]
+    for path in EXAMPLES:
+        view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+        a_graph = candidate_graph_from_stage1_result(run_stage1(view=view, engine=engine, options=flat_opt))
+        b_graph = candidate_graph_from_stage1_result(run_stage1(view=view, engine=engine, options=group_opt))
+        for w in profiles[:4]:
+            a = optimize_topk(graph=a_graph, k=1, locks=[], weights=w)[0].total_cost
+            b = optimize_topk(graph=b_graph, k=1, locks=[], weights=w)[0].total_cost
+            assert abs(a - b) <= 1e-9 * (1 + abs(a)), (path.name, w, a, b)
+
+    # dict 路径与类型化路径展开一致
+    payload = [
+        {"eid": e.eid, "targets": [{"slot": t.slot, "candidates": [serialize_stage1_candidate(c) for c in t.candidates]} for t in e.targets]}
+        for e in grouped_result.events
+    ]
+    parsed = candidate_graph_from_stage1(payload)
+    assert [
+        [[(c.string, c.technique, c.pos_ratio, c.nearest) for c in cs] for cs in ev.candidates] for ev in parsed.events
+    ] == [[[(c.string, c.technique, c.pos_ratio, c.nearest) for c in cs] for cs in ev.candidates] for ev in grouped_graph.events]
+    assert [ev.stage1_index for ev in parsed.events] == [ev.stage1_index for ev in grouped_graph.events]
+    sol_typed = optimize_topk(graph=grouped_graph, k=3, locks=[], weights=Weights())
+    sol_dict = optimize_topk(graph=parsed, k=3, locks=[], weights=Weights())
+    assert [list(map(serialize_assignment, s.assignments)) for s in sol_typed] == [s.assignments for s in sol_dict]
+
+    # 相邻事件都只有散音（pos=0）：多节点的组只展开端点节点，其余节点需 pos_ratio lock 才可选
+    open_only = [c for c in engine.enumerate_candidates(pitch_midi=55, options=PositionEngineOptions()) if c.technique == "open"]
+    high = [c for c in engine.enumerate_candidates(pitch_midi=98, options=group_opt) if c.technique == "harmonic"]
+    group = max(high, key=lambda c: len(c.harmonic_nodes or ()))
+    assert len(group.harmonic_nodes or ()) >= 4, group
+    events = (
+        Stage1Event(eid="A", targets=(Stage1Target(slot=None, target_midi=55, candidates=tuple(open_only)),)),
+        Stage1Event(eid="B", targets=(Stage1Target(slot=None, target_midi=98, candidates=(group,)),)),
+        Stage1Event(eid="C", targets=(Stage1Target(slot=None, target_midi=55, candidates=tuple(open_only)),)),
+    )
+    graph = candidate_graph_from_stage1_result(Stage1Result(events=events))
+    nodes = graph.events[1].candidates[0]
+    assert len(nodes) == len(group.harmonic_nodes or ()) and sum(c.nearest for c in nodes) == 2
+    assert graph.events[1].stage1_index == ((0,) * len(nodes),)
+    best = optimize_topk(graph=graph, k=5, locks=[], weights=Weights())
+    assert all(s.assignments[1]["choice"].pos_ratio == min(c.pos_ratio for c in nodes) for s in best[:1])
+    assert {s.assignments[1]["choice"].pos_ratio for s in best} <= {c.pos_ratio for c in nodes if c.nearest}
+    far = next(c for c in nodes if not c.nearest)
+    locked = optimize_topk(graph=graph, k=1, locks=[Lock(eid="B", fields={"pos_ratio": far.pos_ratio})], weights=Weights())
+    chosen = locked[0].assignments[1]["choice"]
+    assert chosen.pos_ratio == far.pos_ratio and chosen.harmonic_k == far.raw.harmonic_k  # type: ignore[union-attr]
+
+    marg = min_marginals(graph=graph, locks=[], weights=Weights())
+    assert marg.events[1].index == [(0,), (0,)], marg.events[1].index
+
+    print(f"[OK] grouped harmonics: optimum unchanged on {len(profiles)} profiles; far nodes only via pos_ratio lock")
+
+
+if __name__ == "__main__":
+    main()
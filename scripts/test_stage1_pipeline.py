@@ -0,0 +1,126 @@
+"""
+类型化 stage1 → stage2 流水线（Stage1Result / candidate_graph_from_stage1_result）的回归测试。
+
+覆盖：
+- 由 Stage1Result 直接构建的候选图与经 API dict 解析的候选图（除 raw 外）逐项一致
+- 两条路径上 optimize_topk 的代价/explain 一致；assignments 经 `serialize_assignment` 后与 dict 路径完全一致
+- 进程内 assignments 保持 PositionCandidate（不做 dict 往返）
+- `serialize_stage1_result` 输出与 stage1 API 结构一致
+- staff1 缺少音高时按 Stage1PitchUnresolved 显式失败
+
+用法：
+  python scripts/test_stage1_pipeline.py
+"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _strip_raw(graph: Any) -> list[Any]:
+    return [
+        (ev.eid, ev.slots, [[(c.string, c.technique, c.pos_ratio, c.cents_error) for c in cs] for cs in ev.candidates])
+        for ev in graph.events
+    ]
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.api.serializers import serialize_assignment, serialize_stage1_result, serialize_solution
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.engines.position_engine import PositionCandidate, PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import Stage1PitchUnresolved, run_stage1
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Weights,
+        candidate_graph_from_stage1,
+        candidate_graph_from_stage1_result,
+        optimize_topk,
+    )
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=True)
+    for path in EXAMPLES:
+        view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+        result = run_stage1(view=view, engine=engine, options=opt)
+        typed = candidate_graph_from_stage1_result(result)
+        parsed = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+        assert _strip_raw(typed) == _strip_raw(parsed), path.name
+        assert all(isinstance(c.raw, PositionCandidate) for ev in typed.events for cs in ev.candidates for c in cs)
+
+        a = optimize_topk(graph=typed, k=5, locks=[], weights=Weights())
+        b = optimize_topk(graph=parsed, k=5, locks=[], weights=Weights())
+        assert [(s.total_cost, s.explain) for s in a] == [(s.total_cost, s.explain) for s in b], path.name
+        assert [serialize_solution(s) for s in a] == [serialize_solution(s) for s in b], path.name
+        first = a[0].assignments[0]
+        inner = first["choice"] if "choice" in first else first["choices"][0]["choice"]
+        assert isinstance(inner, PositionCandidate)
+        assert serialize_assignment(b[0].assignments[0]) == b[0].assignments[0]
+
+        payload = serialize_stage1_result(
+            result, project_id="TEST", revision="R000001", tuning={}, options={}, include_errors=False
+        )
+        slim = [
+            {"eid": e["eid"], "targets": [{"slot": t["slot"], "candidates": t["candidates"]} for t in e["targets"]]}
+            for e in payload["events"]
+        ]
+        assert slim == _stage1_events(path, include_harmonics=True), path.name
+        assert all("errors" not in t for e in payload["events"] for t in e["targets"])
+
+    # 缺少音高：显式失败
+    measure = view.measures[0]
+    broken_event = replace(measure.events[0], staff1_notes=[])
+    broken = replace(view, measures=[replace(measure, events=[broken_event, *measure.events[1:]]), *view.measures[1:]])
+    try:
+        run_stage1(view=broken, engine=engine, options=opt)
+    except Stage1PitchUnresolved as e:
+        assert "pitch-unresolved" in str(e)
+        assert isinstance(e, ValueError)
+    else:
+        raise AssertionError("缺少音高应当失败")
+
+    print(f"[OK] stage1 pipeline: typed graph matches dict graph on {len(EXAMPLES)} examples; dicts only at the boundary")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+stage2 anytime 求解（optimize_anytime：时间预算 + 最优性标记 + gap 上界）的回归测试。
+
+覆盖：
+- 预算充足时升级到精确 DP：结果与 optimize_topk 逐项一致，optimal=True、gap_bound=0
+- 两种下界（松弛 DP / 逐步分项）在随机权重（含负权重）、chord、window 下都不超过精确最优；
+  shift 权重非负时松弛 DP 下界等于最优代价
+- 预算极小时仍返回 greedy 结果；gap_bound = Top-1 代价 - lower_bound，且真实最优落在 [lower_bound, Top-1] 内
+- 中途被预算截断的轮次被丢弃（interrupted 标注），不会返回半成品
+
+用法：
+  python scripts/test_stage2_anytime.py
+"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _pin(choice: dict[str, Any]) -> dict[str, Any]:
+    return {"string": choice["string"], "technique": choice["technique"], "pos_ratio": choice["pos"]["pos_ratio"] or 0.0}
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.engines.stage2_optimizer import (
+        CandidateGraph,
+        Weights,
+        Window,
+        _cost_lower_bound,
+        _per_step_lower_bound,
+        _prepare_sequence,
+        candidate_graph_from_stage1,
+        optimize_anytime,
+        optimize_topk,
+    )
+
+    rng = random.Random(42)
+    profiles = [Weights()] + [Weights(*(round(rng.uniform(-0.3, 2.0), 3) for _ in range(5))) for _ in range(8)]
+    for path in EXAMPLES:
+        graph = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+        eids = [ev.eid for ev in graph.events]
+        best = optimize_topk(graph=graph, k=1, locks=[], weights=Weights())[0].assignments
+        windows: list[Any] = [None]
+        if len(eids) > 8 and "choice" in best[1] and "choice" in best[6]:
+            left, right = (_pin(best[1]["choice"]),), (_pin(best[6]["choice"]),)
+            windows.append(Window(from_eid=eids[2], to_eid=eids[5], left=left, right=right))
+        for w in profiles:
+            for win in windows:
+                exact = optimize_topk(graph=graph, k=4, locks=[], weights=w, window=win)
+                got = optimize_anytime(graph=graph, k=4, locks=[], weights=w, budget_ms=60_000, window=win)
+                assert got.stats.optimal and got.stats.gap_bound == 0.0 and got.stats.passes[-1] == "exact"
+                assert [(s.total_cost, s.assignments, s.explain) for s in got.solutions] == [
+                    (s.total_cost, s.assignments, s.explain) for s in exact
+                ]
+
+                seq = _prepare_sequence(graph, [], win, w)
+                opt = exact[0].total_cost
+                tight = _cost_lower_bound(seq.cands, w, seq.left, seq.right)
+                loose = _per_step_lower_bound(seq.cands, w, seq.left, seq.right)
+                eps = 1e-9 * (1 + abs(opt))
+                assert tight <= opt + eps and loose <= tight + eps, (path.name, w, loose, tight, opt)
+                if w.shift >= 0 and len(seq.cands[0]) <= 32:
+                    assert abs(tight - opt) <= eps, (path.name, w, tight, opt)
+
+    # 长曲 + 极小预算：greedy 必定完成，并给出有效的 gap 上界
+    base = candidate_graph_from_stage1(_stage1_events(EXAMPLES[0], include_harmonics=True))
+    graph = CandidateGraph(events=tuple(replace(ev, eid=f"{ev.eid}_{r:03d}") for r in range(40) for ev in base.events))
+    w = Weights(shift=1.0, string_change=0.5, technique_change=0.2, harmonic_penalty=-0.05, cents_error=0.01)
+    exact = optimize_topk(graph=graph, k=3, locks=[], weights=w)
+    quick = optimize_anytime(graph=graph, k=3, locks=[], weights=w, budget_ms=1)
+    st = quick.stats
+    assert quick.solutions and st.passes == ["beam:1"] and st.best_pass == "beam:1", st
+    assert not st.optimal and st.bound_method == "per_step", st
+    top1 = quick.solutions[0].total_cost
+    assert st.lower_bound <= exact[0].total_cost <= top1, (st, exact[0].total_cost)
+    assert abs(st.gap_bound - max(0.0, top1 - st.lower_bound)) < 1e-9
+
+    # k=1：松弛 DP 下界在 shift 权重非负时就是最优，greedy 一旦达到即可判定最优并提前结束
+    one = optimize_anytime(graph=graph, k=1, locks=[], weights=Weights(), budget_ms=60_000)
+    assert one.stats.optimal and one.stats.gap_bound == 0.0 and one.stats.passes == ["beam:1"], one.stats
+    assert one.solutions[0].total_cost == optimize_topk(graph=graph, k=1, locks=[], weights=Weights())[0].total_cost
+
+    # 精确轮次被预算截断：丢弃该轮，返回此前最好的 beam 结果
+    original = so._topk_paths
+
+    def interrupted(*_a: Any, **_k: Any) -> Any:
+        raise so._BudgetExceeded
+
+    so._topk_paths = interrupted
+    try:
+        cut = optimize_anytime(graph=graph, k=3, locks=[], weights=w, budget_ms=60_000)
+    finally:
+        so._topk_paths = original
+    assert cut.stats.interrupted == "exact" and "exact" not in cut.stats.passes, cut.stats
+    assert not cut.stats.optimal and cut.stats.bound_method == "relaxed_dp", cut.stats
+    assert cut.stats.lower_bound <= exact[0].total_cost <= cut.solutions[0].total_cost
+
+    for bad in (0, -5):
+        try:
+            optimize_anytime(graph=graph, k=1, locks=[], weights=w, budget_ms=bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("非正预算应当失败")
+
+    print(f"[OK] stage2 anytime: exact within budget, bounds valid on {len(profiles)} profiles, greedy fallback gap={st.gap_bound:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+stage2 多偏好批量求解（optimize_topk_batch）的回归测试。
+
+覆盖：
+- 每组 weights 的结果与逐个调用 `optimize_topk` 完全一致（代价、assignments、explain；含 window 与 chord）
+- 大量同代价解（整数/零权重、重复乐句）时先后顺序也与逐个求解一致；检查点模式同样一致
+- chord 组合被截断时按 (harmonic_penalty, cents_error) 分组构建候选，结果仍与逐个求解一致
+- 空 profiles 必须失败
+
+用法：
+  python scripts/test_stage2_batch.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _pin(choice: dict[str, Any]) -> dict[str, Any]:
+    return {"string": choice["string"], "technique": choice["technique"], "pos_ratio": choice["pos"]["pos_ratio"] or 0.0}
+
+
+def _key(sols: list[Any]) -> list[Any]:
+    return [(s.total_cost, s.assignments, s.explain) for s in sols]
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Candidate,
+        CandidateGraph,
+        GraphEvent,
+        Weights,
+        Window,
+        candidate_graph_from_stage1,
+        optimize_topk,
+        optimize_topk_batch,
+    )
+
+    rng = random.Random(37)
+    profiles = [Weights()] + [Weights(*(round(rng.uniform(-0.2, 2.0), 3) for _ in range(5))) for _ in range(11)]
+
+    for path in EXAMPLES:
+        graph = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+        batch = optimize_topk_batch(graph=graph, k=5, locks=[], profiles=profiles)
+        assert len(batch) == len(profiles)
+        for w, sols in zip(profiles, batch):
+            assert _key(sols) == _key(optimize_topk(graph=graph, k=5, locks=[], weights=w)), (path.name, w)
+
+    # window（含左右边界）
+    graph = candidate_graph_from_stage1(_stage1_events(EXAMPLES[0], include_harmonics=True))
+    eids = [ev.eid for ev in graph.events]
+    best = optimize_topk(graph=graph, k=1, locks=[], weights=Weights())[0].assignments
+    win = Window(from_eid=eids[4], to_eid=eids[12], left=(_pin(best[3]["choice"]),), right=(_pin(best[13]["choice"]),))
+    batch = optimize_topk_batch(graph=graph, k=4, locks=[], profiles=profiles, window=win)
+    for w, sols in zip(profiles, batch):
+        assert _key(sols) == _key(optimize_topk(graph=graph, k=4, locks=[], weights=w, window=win))
+
+    # 同代价解：整数与零权重、重复乐句下第 K 名附近大量并列，先后顺序也必须一致
+    tie_profiles = [
+        Weights(shift=0.0, string_change=1.0, technique_change=1.0, harmonic_penalty=0.0, cents_error=0.0),
+        Weights(shift=0.0, string_change=0.0, technique_change=1.0, harmonic_penalty=2.0, cents_error=0.0),
+        Weights(shift=0.0, string_change=0.0, technique_change=0.0, harmonic_penalty=0.0, cents_error=0.0),
+    ]
+    tied = 0
+    for k in (1, 8):
+        batch = optimize_topk_batch(graph=graph, k=k, locks=[], profiles=tie_profiles)
+        for w, sols in zip(tie_profiles, batch):
+            assert _key(sols) == _key(optimize_topk(graph=graph, k=k, locks=[], weights=w)), (k, w)
+            tied += sum(a.total_cost == b.total_cost for a, b in zip(sols, sols[1:]))
+    assert tied > 0, "并列用例没有产生同代价解"
+
+    # 检查点模式（表项数超过阈值时自动切换）：查表与现算同样逐位一致
+    saved = so.CHECKPOINT_MIN_STATES
+    so.CHECKPOINT_MIN_STATES = 1
+    try:
+        batch = optimize_topk_batch(graph=graph, k=6, locks=[], profiles=tie_profiles + profiles[:3])
+    finally:
+        so.CHECKPOINT_MIN_STATES = saved
+    for w, sols in zip(tie_profiles + profiles[:3], batch):
+        assert _key(sols) == _key(optimize_topk(graph=graph, k=6, locks=[], weights=w)), w
+
+    # chord 截断：保留的组合取决于 harmonic_penalty/cents_error，必须分组构建
+    def cand(string: int) -> Candidate:
+        technique = rng.choice(["open", "press", "harmonic"])
+        pos = 0.0 if technique == "open" else round(rng.uniform(0.1, 0.9), 4)
+        ce = round(rng.uniform(-30, 30), 3)
+        return Candidate(string=string, technique=technique, pos_ratio=pos, cents_error=ce, raw={"string": string})
+
+    chord = GraphEvent(
+        eid="C",
+        slots=tuple(f"N{i}" for i in range(6)),
+        candidates=tuple(tuple(cand(s) for s in range(1, 8)) for _ in range(6)),
+    )
+    single = tuple(cand(s) for s in (2, 4, 6))
+    synthetic = CandidateGraph(
+        events=(
+            GraphEvent(eid="S", slots=(None,), candidates=(single,)),
+            chord,
+            GraphEvent(eid="T", slots=(None,), candidates=(single,)),
+        )
+    )
+    chord_profiles = [Weights(), Weights(harmonic_penalty=5.0), Weights(cents_error=0.5), Weights(shift=3.0)]
+    batch = optimize_topk_batch(graph=synthetic, k=3, locks=[], profiles=chord_profiles)
+    assert batch[0][0].explain["chord_truncated"] == ["C"]
+    for w, sols in zip(chord_profiles, batch):
+        assert _key(sols) == _key(optimize_topk(graph=synthetic, k=3, locks=[], weights=w))
+
+    try:
+        optimize_topk_batch(graph=graph, k=1, locks=[], profiles=[])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("空 profiles 应当失败")
+
+    print(f"[OK] stage2 batch: {len(profiles)} profiles match per-profile optimize_topk (incl. window/chord/truncation)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+stage2 beam search（solver=beam）的回归测试。
+
+覆盖：
+- width 不小于每个事件的候选数时，与精确 DP 的 Top-K 代价一致，gap=0
+- 窄 beam：统计自洽（保留 + 剪枝 = 总状态数），gap >= 0，且转移次数少于精确 DP
+- threshold=0：每个事件只保留与当前最优并列的状态
+- 分项（beam 状态不带分项，最终路径上重算）：与同一路径的精确 DP 分项逐位一致，且分项之和等于总代价
+
+用法：
+  python scripts/test_stage2_beam.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import BeamOptions, Weights, candidate_graph_from_stage1, optimize_beam, optimize_topk
+
+    w = Weights()
+    # 单音 + chord 交替的片段：chord 事件的组合候选远多于单音
+    mary = _stage1_events(EXAMPLES[0], include_harmonics=True)
+    chord = _stage1_events(EXAMPLES[1], include_harmonics=True)[0]
+    events = []
+    for i, e in enumerate(mary):
+        events.append(e)
+        if i % 4 == 3:
+            events.append({**chord, "eid": f"C{i:04d}"})
+
+    graph = candidate_graph_from_stage1(events)
+    exact = optimize_topk(graph=graph, k=5, locks=[], weights=w)
+
+    wide = optimize_beam(graph=graph, k=5, locks=[], weights=w, beam=BeamOptions(width=100_000))
+    assert all(abs(a.total_cost - b.total_cost) < 1e-9 for a, b in zip(exact, wide.solutions))
+    assert wide.stats.pruned_by_width == 0 and wide.stats.gap == 0.0, wide.stats
+
+    for a, b in zip(exact, wide.solutions):
+        if a.assignments == b.assignments:
+            assert a.explain["cost_breakdown"] == b.explain["cost_breakdown"]
+
+    narrow = optimize_beam(graph=graph, k=5, locks=[], weights=w, beam=BeamOptions(width=8))
+    for sol in wide.solutions + narrow.solutions:
+        assert abs(sum(sol.explain["cost_breakdown"].values()) - sol.total_cost) < 1e-9
+    st = narrow.stats
+    assert st.states_kept + st.pruned_by_width + st.pruned_by_threshold == st.states_total, st
+    assert st.pruned_by_width > 0 and st.transitions_evaluated < st.transitions_exact, st
+    assert st.gap is not None and st.gap >= 0.0 and st.exact_total_cost is not None
+    assert abs(narrow.solutions[0].total_cost - (st.exact_total_cost + st.gap)) < 1e-9
+    assert [a["eid"] for a in narrow.solutions[0].assignments] == [e["eid"] for e in events]
+
+    tight = optimize_beam(graph=graph, k=1, locks=[], weights=w, beam=BeamOptions(width=1000, threshold=0.0))
+    assert tight.stats.pruned_by_threshold > 0, tight.stats
+
+    print(
+        f"[OK] stage2 beam: states={st.states_total} pruned={st.pruned_fraction:.2%} "
+        f"transitions={st.transitions_evaluated}/{st.transitions_exact} gap={st.gap:.4f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+stage2 候选属性位集（CandidateMasks：lock 过滤与 chord 弦号互斥的位运算）的回归测试。
+
+覆盖：
+- lock 过滤与逐字段列表过滤逐位一致（string/technique/pos_ratio 任意组合、非 nearest 节点、容差边界）
+- chord 弦号互斥：位集匹配与穷举一致；chord 组合中同一时刻不重复用弦
+- 可行性预检与求解对 nearest 的处理一致：string + pos_ratio 命中非 nearest 节点时既不报冲突，也能求解
+- 位集随事件对象缓存，不参与相等比较；replace 后按新候选重建
+
+用法：
+  python scripts/test_stage2_bitmask.py
+"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import itertools
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _reference_filter(cands: list[Any], fields: list[tuple[str, Any]], tol: float) -> list[Any]:
+    out = list(cands)
+    for name, v in fields:
+        if name == "string":
+            out = [c for c in out if c.string == int(v)]
+        elif name == "technique":
+            out = [c for c in out if c.technique == str(v)]
+        else:
+            out = [c for c in out if abs(c.pos_ratio - float(v)) <= tol]
+    if not any(name == "pos_ratio" for name, _v in fields):
+        out = [c for c in out if c.nearest]
+    return out
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import (
+        POS_RATIO_LOCK_TOLERANCE,
+        Candidate,
+        CandidateGraph,
+        GraphEvent,
+        Lock,
+        Weights,
+        _distinct_strings_possible,
+        _event_candidates,
+        _lock_selection,
+        _pick,
+        _string_bit,
+        check_feasibility,
+        optimize_topk,
+    )
+
+    rng = random.Random(50)
+    tol = POS_RATIO_LOCK_TOLERANCE
+    positions = [0.0, 0.125, 0.25, 1 / 3, 0.5, 0.75]
+
+    def cand(s: int, t: str, pos: float, nearest: bool = True) -> Candidate:
+        raw = {"string": s, "pos_ratio": pos}
+        return Candidate(string=s, technique=t, pos_ratio=pos, cents_error=rng.uniform(-5, 5), raw=raw, nearest=nearest)
+
+    # lock 过滤：位集 == 逐字段列表过滤
+    checked = 0
+    for _ in range(400):
+        cands = tuple(
+            cand(rng.randint(1, 7), rng.choice(["open", "press", "harmonic"]), rng.choice(positions), rng.random() < 0.7)
+            for _ in range(rng.randint(1, 80))
+        )
+        masks = GraphEvent(eid="E", slots=(None,), candidates=(cands,)).masks[0]
+        for _ in range(10):
+            pick = rng.choice(cands)
+            fields: list[tuple[str, Any]] = []
+            if rng.random() < 0.6:
+                fields.append(("string", rng.choice([pick.string, rng.randint(1, 7)])))
+            if rng.random() < 0.5:
+                fields.append(("technique", rng.choice([pick.technique, "press"])))
+            if rng.random() < 0.5:
+                fields.append(("pos_ratio", pick.pos_ratio + rng.choice([0.0, tol * 0.999, -tol * 0.999, tol * 1.5])))
+            got = _pick(cands, _lock_selection(masks, fields))
+            assert got == _reference_filter(list(cands), fields, tol), fields
+            checked += 1
+
+    # chord 弦号互斥：位集匹配 == 穷举
+    for _ in range(500):
+        per_slot = [rng.sample(range(1, 8), rng.randint(1, 3)) for _ in range(rng.randint(1, 5))]
+        brute = any(len(set(p)) == len(p) for p in itertools.product(*per_slot))
+        bits = [sum(_string_bit(s) for s in ss) for ss in per_slot]
+        assert _distinct_strings_possible(bits) == brute, per_slot
+
+    chord = GraphEvent(
+        eid="C",
+        slots=("a", "b", "c"),
+        candidates=tuple(tuple(cand(rng.randint(1, 4), "press", rng.choice(positions)) for _ in range(12)) for _ in range(3)),
+    )
+    for ch in _event_candidates(chord, [], Weights()):
+        strings = [c.string for c in ch.slot_to_cand.values()]
+        assert len(set(strings)) == len(strings)
+
+    # 预检与求解一致：string + pos_ratio 命中非 nearest 节点
+    far = cand(3, "harmonic", 0.75, nearest=False)
+    single = GraphEvent(eid="S", slots=(None,), candidates=((cand(3, "harmonic", 0.25), far, cand(2, "press", 0.5)),))
+    graph = CandidateGraph(events=(single, GraphEvent(eid="T", slots=(None,), candidates=((cand(1, "open", 0.0),),))))
+    locks = [Lock(eid="S", fields={"string": 3}), Lock(eid="S", fields={"pos_ratio": 0.75})]
+    assert check_feasibility(graph=graph, locks=locks) == []
+    sol = optimize_topk(graph=graph, k=1, locks=locks, weights=Weights())[0]
+    assert sol.assignments[0]["choice"] is far.raw
+    conflicts = check_feasibility(graph=graph, locks=[Lock(eid="S", fields={"string": 3, "technique": "press"})])
+    assert [c.reason for c in conflicts] == ["locks_combined_empty"], conflicts
+
+    # 位集缓存：随事件对象复用，不参与相等比较；replace 后重建
+    ev = graph.events[0]
+    assert ev.masks is ev.masks
+    assert ev == GraphEvent(eid="S", slots=(None,), candidates=single.candidates)
+    trimmed = replace(ev, candidates=(ev.candidates[0][:2],))
+    assert trimmed.masks[0].full == 0b11 and ev.masks[0].full == 0b111
+
+    print(f"[OK] stage2 bitmask: {checked} lock selections equal list filtering; string matching equals brute force")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+stage2 候选图（CandidateGraph）与 stage1 会话复用的回归测试。
+
+覆盖：
+- `optimize_topk(graph=...)` 与 `optimize_topk(events=...)` 结果完全一致（含 locks、chord）
+- stage1 会话的候选图只解析一次；handle 由输入确定性派生，任一输入变化都得到不同 handle
+
+用法：
+  python scripts/test_stage2_candidate_graph.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.api.sessions import Stage1Session, stage1_handle
+    from guqinauto_backend.engines.stage2_optimizer import Lock, Weights, candidate_graph_from_stage1, optimize_topk
+
+    for path in EXAMPLES:
+        events = _stage1_events(path, include_harmonics=True)
+        graph = candidate_graph_from_stage1(events)
+        assert [ev.eid for ev in graph.events] == [e["eid"] for e in events]
+
+        first = events[0]
+        if len(first["targets"]) == 1:
+            locks = [Lock(eid=first["eid"], fields={"technique": "press"})]
+        else:
+            locks = [Lock(eid=first["eid"], fields={"slot": first["targets"][0]["slot"], "technique": "press"})]
+        for lk in ([], locks):
+            a = optimize_topk(events=events, k=5, locks=lk, weights=Weights())
+            b = optimize_topk(graph=graph, k=5, locks=lk, weights=Weights())
+            assert [(s.total_cost, s.assignments) for s in a] == [(s.total_cost, s.assignments) for s in b], path.name
+
+    try:
+        optimize_topk(events=events, graph=graph, k=1, locks=[], weights=Weights())
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("events 与 graph 同时给出应当失败")
+
+    # 会话：由类型化 stage1 结果惰性构建一次
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import run_stage1
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="P", revision="R000001", musicxml_bytes=EXAMPLES[0].read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    result = run_stage1(view=view, engine=engine, options=PositionEngineOptions())
+    session = Stage1Session(handle="s1.x", project_id="P", revision="R000001", tuning={}, options={}, result=result)
+    assert session.graph() is session.graph()
+    assert session.payload() is session.payload()
+
+    base = {"project_id": "P", "revision": "R000001", "tuning": {"open_pitches_midi": [1]}, "options": {"include_harmonics": False}}
+    h0 = stage1_handle(**base)
+    assert h0 == stage1_handle(**base)
+    assert h0 != stage1_handle(**{**base, "revision": "R000002"})
+    assert h0 != stage1_handle(**{**base, "options": {"include_harmonics": True}})
+
+    print(f"[OK] stage2 candidate graph: graph/events parity on {len(EXAMPLES)} examples; session handle stable")
+
+
+if __name__ == "__main__":
+    main()
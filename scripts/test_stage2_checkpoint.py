@@ -0,0 +1,121 @@
+"""
+stage2 检查点（√N）低内存 DP 的回归测试。
+
+覆盖：
+- checkpoint=True 与完整表模式结果逐位一致（各种长度、K、窗口边界、chord）
+- 表项数超过 CHECKPOINT_MIN_STATES 时自动启用，且 optimize_topk 结果不变
+- 长序列上检查点模式的峰值内存（tracemalloc）明显低于完整表
+
+用法：
+  python scripts/test_stage2_checkpoint.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import random
+import sys
+import tracemalloc
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _peak(fn: Any) -> float:
+    tracemalloc.start()
+    fn()
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(peak)
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Weights,
+        _event_candidates,
+        _topk_paths,
+        candidate_graph_from_stage1,
+        optimize_topk,
+    )
+
+    rng = random.Random(40)
+    w = Weights()
+    for path in EXAMPLES:
+        graph = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+        cands = [_event_candidates(ev, [], w) for ev in graph.events]
+        long_cands = cands * (1 + 600 // len(cands))
+        for _ in range(15):
+            n = rng.randint(1, min(len(long_cands), 200))
+            lo = rng.randint(0, len(long_cands) - n)
+            seq = long_cands[lo : lo + n]
+            k = rng.randint(1, 9)
+            left = rng.choice(long_cands[0]) if rng.random() < 0.3 else None
+            right = rng.choice(long_cands[-1]) if rng.random() < 0.3 else None
+            full = _topk_paths(seq, k=k, weights=w, left=left, right=right, checkpoint=False)
+            cp = _topk_paths(seq, k=k, weights=w, left=left, right=right, checkpoint=True)
+            assert full == cp, (path.name, n, k)
+
+    # 自动选择：阈值调低后 optimize_topk 走检查点模式，结果不变
+    graph = candidate_graph_from_stage1(_stage1_events(EXAMPLES[0], include_harmonics=True))
+    expected = optimize_topk(graph=graph, k=5, locks=[], weights=w)
+    saved = so.CHECKPOINT_MIN_STATES
+    so.CHECKPOINT_MIN_STATES = 1
+    try:
+        cands = [_event_candidates(ev, [], w) for ev in graph.events]
+        assert so._use_checkpoint(cands, 5)
+        got = optimize_topk(graph=graph, k=5, locks=[], weights=w)
+    finally:
+        so.CHECKPOINT_MIN_STATES = saved
+    assert [(s.total_cost, s.assignments, s.explain) for s in got] == [(s.total_cost, s.assignments, s.explain) for s in expected]
+
+    # 峰值内存：长序列上检查点模式显著更低
+    long_seq = cands * 40
+    peak_full = _peak(lambda: _topk_paths(long_seq, k=5, weights=w, checkpoint=False, breakdown=False))
+    peak_cp = _peak(lambda: _topk_paths(long_seq, k=5, weights=w, checkpoint=True, breakdown=False))
+    assert peak_cp * 3 < peak_full, (peak_cp, peak_full)
+
+    print(
+        f"[OK] stage2 checkpoint: matches full tables; {len(long_seq)} events peak "
+        f"{peak_full / 1024:.0f} KiB -> {peak_cp / 1024:.0f} KiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+stage2 N-note chord 组合生成器（分支定界）的回归测试。
+
+覆盖：
+- 组合按 intrinsic 代价非降序产出，且与暴力枚举（去掉弦号冲突）得到的代价序列一致
+- 同一组合内弦号互不相同
+- 3/4 音 chord 可参与 stage2 求解；slot lock 生效
+- 组合数超过 max_products 时截断，并在 explain.chord_truncated 中显式标注
+
+用法：
+  python scripts/test_stage2_chord_generator.py
+"""
+
+from __future__ import annotations
+
+import itertools
+from pathlib import Path
+import random
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Candidate,
+        CandidateGraph,
+        GraphEvent,
+        Lock,
+        Weights,
+        _build_chord_candidates,
+        _chord_combinations,
+        optimize_topk,
+    )
+
+    rng = random.Random(20261019)
+
+    def cand(string: int) -> Candidate:
+        technique = rng.choice(["open", "press", "press", "harmonic"])
+        pos = 0.0 if technique == "open" else round(rng.uniform(0.1, 0.9), 4)
+        ce = round(rng.uniform(-30, 30), 3)
+        return Candidate(string=string, technique=technique, pos_ratio=pos, cents_error=ce, raw={"string": string, "technique": technique})
+
+    def intrinsic(combo: tuple[Candidate, ...], w: Weights) -> float:
+        h = w.harmonic_penalty if any(c.technique == "harmonic" for c in combo) else 0.0
+        return h + w.cents_error * abs(sum(c.cents_error for c in combo))
+
+    # 与暴力枚举对拍（含负权重：下界仍需可采纳）
+    for trial in range(40):
+        n_slots = rng.randint(2, 4)
+        per_slot = [[cand(rng.randint(1, 7)) for _ in range(rng.randint(1, 6))] for _ in range(n_slots)]
+        w = Weights(harmonic_penalty=rng.choice([0.1, 2.0, -0.5]), cents_error=rng.choice([0.01, 1.0, -0.02]))
+        got = list(_chord_combinations(per_slot, w))
+        brute = sorted(
+            intrinsic(p, w) for p in itertools.product(*per_slot) if len({c.string for c in p}) == len(p)
+        )
+        assert len(got) == len(brute), (trial, len(got), len(brute))
+        costs = [c for c, _combo in got]
+        assert all(a <= b + 1e-9 for a, b in zip(costs, costs[1:])), f"非降序被破坏：trial={trial}"
+        assert all(abs(a - b) <= 1e-9 for a, b in zip(costs, brute)), f"与暴力枚举不一致：trial={trial}"
+        for c, combo in got:
+            assert len({x.string for x in combo}) == len(combo)
+            assert abs(c - intrinsic(combo, w)) <= 1e-9
+
+    # 3/4 音 chord 参与求解
+    def chord_event(eid: str, strings_by_slot: list[list[int]]) -> GraphEvent:
+        slots = tuple(f"N{i}" for i in range(len(strings_by_slot)))
+        return GraphEvent(eid=eid, slots=slots, candidates=tuple(tuple(cand(s) for s in ss) for ss in strings_by_slot))
+
+    graph = CandidateGraph(
+        events=(
+            chord_event("E1", [[1, 2, 3], [2, 3, 4], [4, 5, 6]]),
+            GraphEvent(eid="E2", slots=(None,), candidates=((cand(3), cand(5)),)),
+            chord_event("E3", [[1, 2], [2, 3], [3, 4], [4, 5, 6, 7]]),
+        )
+    )
+    sols = optimize_topk(graph=graph, k=3, locks=[], weights=Weights())
+    assert sols and "chord_truncated" not in sols[0].explain
+    for sol in sols:
+        for a in (sol.assignments[0], sol.assignments[2]):
+            strings = [x["choice"]["string"] for x in a["choices"]]
+            assert len(set(strings)) == len(strings), a
+
+    locked = optimize_topk(graph=graph, k=1, locks=[Lock(eid="E3", fields={"slot": "N3", "string": 7})], weights=Weights())
+    n3 = [x for x in locked[0].assignments[2]["choices"] if x["slot"] == "N3"]
+    assert n3 and n3[0]["choice"]["string"] == 7, locked[0].assignments[2]
+
+    try:
+        optimize_topk(graph=graph, k=1, locks=[Lock(eid="E3", fields={"string": 7})], weights=Weights())
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("chord lock 缺 slot 应当失败")
+
+    try:
+        optimize_topk(graph=CandidateGraph(events=(chord_event("X", [[1], [1], [2]]),)), k=1, locks=[], weights=Weights())
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("弦号冲突导致无组合应当失败")
+
+    # 截断：显式标注
+    big = chord_event("B", [[1, 2, 3, 4, 5, 6, 7]] * 4)
+    chords, truncated = _build_chord_candidates(event=big, locks=[], weights=Weights(), max_products=50)
+    assert truncated and len(chords) == 50
+    full, truncated_full = _build_chord_candidates(event=big, locks=[], weights=Weights(), max_products=10_000)
+    assert not truncated_full and len(full) == 7 * 6 * 5 * 4
+    assert [c.cents_error_sum for c in chords] == [c.cents_error_sum for c in full[:50]]
+
+    huge = CandidateGraph(events=(chord_event("H", [[1, 2, 3, 4, 5, 6, 7]] * 6),))
+    sols = optimize_topk(graph=huge, k=1, locks=[], weights=Weights())
+    assert sols[0].explain["chord_truncated"] == ["H"], sols[0].explain
+
+    print("[OK] stage2 chord generator: branch-and-bound matches brute force; 3/4-note chords; truncation reported")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+stage2 可行性预检（check_feasibility / Stage2Infeasible）的回归测试。
+
+覆盖：
+- 多处冲突（空候选、字段组合无解、非法 lock、未知 eid、chord 弦号冲突）一次性全部报告
+- 预检在计算任何转移代价之前失败（把转移代价函数替换为“调用即失败”来验证）
+- 增量求解器遇到不可行 locks 时同样一次性报错，且不破坏已缓存状态
+- 可行输入不报冲突
+
+用法：
+  python scripts/test_stage2_feasibility.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Candidate,
+        CandidateGraph,
+        GraphEvent,
+        IncrementalTopK,
+        Lock,
+        Stage2Infeasible,
+        Weights,
+        candidate_graph_from_stage1,
+        check_feasibility,
+        optimize_topk,
+    )
+
+    base = candidate_graph_from_stage1(_stage1_events(EXAMPLE, include_harmonics=False))
+
+    def c(string: int, technique: str = "press", pos: float = 0.5) -> Candidate:
+        return Candidate(string=string, technique=technique, pos_ratio=pos, cents_error=0.0, raw={"string": string})
+
+    chord = GraphEvent(eid="C1", slots=("L", "R"), candidates=((c(1), c(2)), (c(2), c(3, "open", 0.0))))
+    graph = CandidateGraph(events=base.events[:5] + (chord,) + base.events[5:])
+    e0, e1, e2 = (ev.eid for ev in base.events[:3])
+    first = base.events[0].candidates[0][0]
+
+    assert check_feasibility(graph=graph, locks=[], window=None) == []
+
+    locks = [
+        Lock(eid=e0, fields={"string": 99}),
+        Lock(eid=e1, fields={"string": first.string, "technique": "harmonic"}),
+        Lock(eid=e2, fields={"slot": "L"}),
+        Lock(eid="NOPE", fields={"string": 1}),
+        # L 只剩弦 2、R 锁到弦 2：两个 slot 无法取到不同的弦
+        Lock(eid="C1", fields={"slot": "L", "string": 2}),
+        Lock(eid="C1", fields={"slot": "R", "technique": "press"}),
+    ]
+    conflicts = check_feasibility(graph=graph, locks=locks)
+    reasons = {(x.eid, x.reason) for x in conflicts}
+    assert (e0, "lock_empty") in reasons, reasons
+    assert (e1, "lock_empty") in reasons, reasons  # harmonic 不在候选中（include_harmonics=False）
+    assert (e2, "invalid_lock") in reasons, reasons
+    assert ("NOPE", "unknown_eid") in reasons, reasons
+    assert ("C1", "string_collision") in reasons, reasons
+    assert len(conflicts) == 5, conflicts
+
+    # 各字段单独可行，合起来无解
+    other = next(
+        x for x in base.events[0].candidates[0] if x.string != first.string and abs(x.pos_ratio - first.pos_ratio) > 1e-3
+    )
+    combo = check_feasibility(graph=graph, locks=[Lock(eid=e0, fields={"string": first.string, "pos_ratio": other.pos_ratio})])
+    assert [(x.reason, x.field) for x in combo] == [("locks_combined_empty", "string,pos_ratio")], combo
+
+    # 预检发生在任何转移代价之前
+    original = so._transition_cost_chord
+
+    def boom(*_a: Any, **_k: Any) -> Any:
+        raise AssertionError("预检失败前不应计算转移代价")
+
+    so._transition_cost_chord = boom
+    try:
+        try:
+            optimize_topk(graph=graph, k=3, locks=locks, weights=Weights())
+        except Stage2Infeasible as e:
+            assert len(e.conflicts) == 5
+            assert isinstance(e, ValueError)
+        else:
+            raise AssertionError("应当不可行")
+    finally:
+        so._transition_cost_chord = original
+
+    # 增量求解器：一次性报错，且之后仍可正常求解
+    solver = IncrementalTopK(graph=graph, k=3, weights=Weights())
+    ok = solver.solve(locks=[])
+    try:
+        solver.solve(locks=locks)
+    except Stage2Infeasible as e:
+        assert len(e.conflicts) == 5
+    else:
+        raise AssertionError("增量求解器应当不可行")
+    again = solver.solve(locks=[])
+    assert [s.total_cost for s in again] == [s.total_cost for s in ok]
+
+    print(f"[OK] stage2 feasibility: {len(conflicts)} conflicts reported in one pass, before any transition cost")
+
+
+if __name__ == "__main__":
+    main()
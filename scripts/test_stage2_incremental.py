@@ -0,0 +1,180 @@
+"""
+stage2 增量求解器（IncrementalTopK）的回归测试。
+
+覆盖：
+- 随机 lock 增删序列：每一步的 Top-K（代价、路径与先后次序）与全量 `optimize_topk` 一致
+- 大量同代价路径（候选两两并列）：同代价次序与 `optimize_topk` 一致（汇合点在中间、锁定后重算）
+- 在同一事件反复 lock/求解：只重算该事件附近（前向/后向各 1 步）
+- 常驻表平铺在 array 里：tracemalloc 实测不超过 resident_states × INCREMENTAL_STATE_BYTES
+- 候选图替换（模拟改音高产生新 revision）：只重建变化的事件
+- lock 导致无解时失败，且不破坏已缓存的表（下一次求解仍正确）
+
+用法：
+  python scripts/test_stage2_incremental.py
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import replace
+from pathlib import Path
+import sys
+import tracemalloc
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _same_costs(a: list[Any], b: list[Any]) -> bool:
+    return len(a) == len(b) and all(abs(x.total_cost - y.total_cost) < 1e-9 for x, y in zip(a, b))
+
+
+def _same_ranking(a: list[Any], b: list[Any]) -> bool:
+    """逐条相同：代价（容许末位舍入）、路径与先后次序。"""
+
+    return _same_costs(a, b) and [x.assignments for x in a] == [y.assignments for y in b]
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Candidate,
+        CandidateGraph,
+        GraphEvent,
+        INCREMENTAL_STATE_BYTES,
+        IncrementalTopK,
+        Lock,
+        Weights,
+        candidate_graph_from_stage1,
+        optimize_topk,
+        table_states,
+    )
+
+    w = Weights()
+    rnd = random.Random(0)
+    for path in EXAMPLES:
+        graph = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+        solver = IncrementalTopK(graph=graph, k=4, weights=w)
+        locks: list[Any] = []
+        for _step in range(30):
+            ev = rnd.choice(graph.events)
+            c = rnd.choice(ev.candidates[0])
+            fields: dict[str, Any] = {"string": c.string} if len(ev.slots) == 1 else {"slot": ev.slots[0], "string": c.string}
+            if locks and rnd.random() < 0.3:
+                locks.pop(rnd.randrange(len(locks)))
+            else:
+                locks = [lk for lk in locks if lk.eid != ev.eid] + [Lock(eid=ev.eid, fields=fields)]
+            try:
+                ref = optimize_topk(graph=graph, k=4, locks=locks, weights=w)
+            except ValueError:
+                try:
+                    solver.solve(locks=locks)
+                except ValueError:
+                    locks.pop()
+                    continue
+                raise AssertionError("全量求解失败时增量求解也必须失败")
+            assert _same_ranking(ref, solver.solve(locks=locks)), path.name
+
+    # 同代价路径：每个事件的候选只在弦号上不同（shift 相同），关闭换弦代价后大量路径并列
+    def tied_event(i: int) -> GraphEvent:
+        pos = (0.25, 0.5, 0.75)[i % 3]
+        cands = tuple(
+            Candidate(string=s, technique="press", pos_ratio=pos, cents_error=0.0, raw={"string": s}) for s in rnd.sample(range(1, 8), 3)
+        )
+        return GraphEvent(eid=f"T{i:03d}", slots=(None,), candidates=(cands,))
+
+    tied = CandidateGraph(events=tuple(tied_event(i) for i in range(12)))
+    tw = Weights(string_change=0.0)
+    for k in (1, 5, 40):
+        solver = IncrementalTopK(graph=tied, k=k, weights=tw)
+        for lk in ([], [Lock(eid="T006", fields={"string": tied.events[6].candidates[0][1].string})], []):
+            ref = optimize_topk(graph=tied, k=k, locks=lk, weights=tw)
+            assert len({s.total_cost for s in ref}) < len(ref) or k == 1, "测试图应有同代价路径"
+            assert _same_ranking(ref, solver.solve(locks=lk)), (k, lk)
+
+    # 同一事件反复 lock：前向/后向各只算 1 步
+    path = EXAMPLES[0]
+    graph = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=False))
+    solver = IncrementalTopK(graph=graph, k=3, weights=w)
+    solver.solve(locks=[])
+    mid = graph.events[len(graph.events) // 2]
+    for c in mid.candidates[0]:
+        lk = [Lock(eid=mid.eid, fields={"string": c.string, "technique": c.technique})]
+        got = solver.solve(locks=lk)
+        assert _same_ranking(optimize_topk(graph=graph, k=3, locks=lk, weights=w), got)
+    assert solver.last_solve["events_rebuilt"] == 1, solver.last_solve
+    assert solver.last_solve["forward_steps"] + solver.last_solve["backward_steps"] <= 2, solver.last_solve
+
+    # 常驻表内存（含求解时构建的候选列表与解释器的空闲对象池）：示例重复 20 遍，前向、后向表都覆盖全部事件
+    long_graph = CandidateGraph(events=tuple(replace(ev, eid=f"{ev.eid}.{r}") for r in range(20) for ev in graph.events))
+    first = long_graph.events[0]
+    table_states(long_graph, 3)  # 先建好候选图自身缓存的 masks（不属于求解器）
+    tracemalloc.start()
+    try:
+        probe = IncrementalTopK(graph=long_graph, k=3, weights=w)
+        probe.solve(locks=[])
+        probe.solve(locks=[Lock(eid=first.eid, fields={"string": first.candidates[0][0].string})])
+        used, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert all(t is not None for t in probe._fwd + probe._bwd)
+    assert used <= probe.resident_states * INCREMENTAL_STATE_BYTES, (used, probe.resident_states)
+
+    # 候选图替换：只有被改动的事件重建
+    target = graph.events[5]
+    changed = replace(target, candidates=(target.candidates[0][:1],))
+    graph2 = CandidateGraph(events=graph.events[:5] + (changed,) + graph.events[6:])
+    got = solver.solve(locks=[], graph=graph2)
+    assert solver.last_solve["events_rebuilt"] == 2, solver.last_solve  # 被改事件 + 上一轮被 lock 的 mid
+    assert _same_ranking(optimize_topk(graph=graph2, k=3, locks=[], weights=w), got)
+
+    # 无解失败后状态不被破坏
+    bad = [Lock(eid=mid.eid, fields={"string": 99})]
+    try:
+        solver.solve(locks=bad, graph=graph2)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("lock 导致无候选应当失败")
+    assert _same_ranking(optimize_topk(graph=graph2, k=3, locks=[], weights=w), solver.solve(locks=[], graph=graph2))
+
+    print(f"[OK] stage2 incremental: random lock sequences match full solve on {len(EXAMPLES)} examples")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+stage2 min-marginal（mode=marginals）的回归测试。
+
+覆盖：
+- 每个事件每个候选的 marginal 代价 == 对该候选 lock 后 Top-1 的代价（单音 + 2-note chord）
+- optimum 与 Top-1 一致；delta 最小值为 0（最优路径上的候选）
+- index 能回到 stage1 的候选下标
+
+用法：
+  python scripts/test_stage2_marginals.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _pin(c: dict[str, Any]) -> dict[str, Any]:
+    return {"string": c["string"], "technique": c["technique"], "pos_ratio": c["pos"]["pos_ratio"] or 0.0}
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import Lock, Weights, candidate_graph_from_stage1, min_marginals, optimize_topk
+
+    w = Weights()
+    checked = 0
+    for path in EXAMPLES:
+        events = _stage1_events(path, include_harmonics=True)
+        graph = candidate_graph_from_stage1(events)
+        mm = min_marginals(graph=graph, locks=[], weights=w)
+        top1 = optimize_topk(graph=graph, k=1, locks=[], weights=w)[0]
+        assert abs(mm.optimum - top1.total_cost) < 1e-9
+        assert [em.eid for em in mm.events] == [e["eid"] for e in events]
+
+        for em, ev in zip(mm.events, events):
+            assert min(em.delta) == 0.0 or min(em.delta) < 1e-12, em.eid
+            # chord 组合很多：只抽查前几个
+            for idx, cost in list(zip(em.index, em.cost))[:6]:
+                if len(idx) == 1:
+                    locks = [Lock(eid=em.eid, fields=_pin(ev["targets"][0]["candidates"][idx[0]]))]
+                else:
+                    locks = [
+                        Lock(eid=em.eid, fields={"slot": t["slot"], **_pin(t["candidates"][i])}) for t, i in zip(ev["targets"], idx)
+                    ]
+                forced = optimize_topk(graph=graph, k=1, locks=locks, weights=w)[0].total_cost
+                assert abs(forced - cost) < 1e-9, (path.name, em.eid, idx, forced, cost)
+                checked += 1
+
+    print(f"[OK] stage2 marginals: {checked} forced solves match the single forward-backward pass")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+stage2 重复材料记忆化（optimize_topk(k=1, memo=True) / optimize_top1_memo / `_top1_memo_path`）的回归测试。
+
+覆盖：
+- 重复的示例曲（含 chord、harmonic）上 memo 与普通 DP 的 Top-1 逐位一致：代价、assignments、explain
+  （随机 weights，含负权重；locks；window 带边界；prune on/off）
+- 大量同代价路径（整数/零权重、重复乐句）时选到的路径也与普通 DP 相同
+- 转移代价按签名对缓存：重复 24 次的示例曲里不同的转移只占一小部分
+- 没有重复材料时不走 memo（返回 None，optimize_topk 回退到普通 DP）
+
+用法：
+  python scripts/test_stage2_memo.py
+"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _repeated(graph: Any, times: int) -> Any:
+    from guqinauto_backend.engines.stage2_optimizer import CandidateGraph
+
+    return CandidateGraph(events=tuple(replace(ev, eid=f"{ev.eid}_{r:03d}") for r in range(times) for ev in graph.events))
+
+
+def _pin(choice: dict[str, Any]) -> tuple[dict[str, Any], ...]:
+    return ({"string": choice["string"], "technique": choice["technique"], "pos_ratio": choice["pos"]["pos_ratio"] or 0.0},)
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Candidate,
+        CandidateGraph,
+        GraphEvent,
+        Lock,
+        Weights,
+        Window,
+        _prepare_sequence,
+        _top1_memo_path,
+        _topk_paths,
+        candidate_graph_from_stage1,
+        optimize_top1_memo,
+        optimize_topk,
+    )
+
+    rng = random.Random(46)
+    profiles = [Weights(), Weights(shift=-0.3, harmonic_penalty=-0.2)]
+    profiles += [Weights(*(round(rng.uniform(-0.3, 2.0), 3) for _ in range(5))) for _ in range(5)]
+    # 整数/零权重：同代价路径很多，检验同代价时的选择
+    profiles += [Weights(0.0, 1.0, 1.0, 0.0, 0.0), Weights(0.0, 0.0, 0.0, 0.0, 0.0)]
+    checked = 0
+    for path in EXAMPLES:
+        base = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+        graph = _repeated(base, 24)
+        eids = [ev.eid for ev in graph.events]
+        plain = optimize_topk(graph=graph, k=1, locks=[], weights=Weights(), memo=False)[0].assignments
+        locks: list[Any] = []
+        windows: list[Any] = [None]
+        if "choice" in plain[0]:
+            mid = len(eids) // 3
+            locks.append(Lock(eid=eids[mid], fields={"string": plain[mid]["choice"]["string"]}))
+            windows.append(Window(from_eid=eids[5], to_eid=eids[-6], left=_pin(plain[4]["choice"]), right=_pin(plain[-5]["choice"])))
+        for w in profiles:
+            for win in windows:
+                for lk in ([], locks):
+                    for prune in ("on", "off"):
+                        ref = optimize_topk(graph=graph, k=1, locks=lk, weights=w, window=win, prune=prune, memo=False)
+                        got = optimize_top1_memo(graph=graph, locks=lk, weights=w, window=win, prune=prune)  # type: ignore[arg-type]
+                        assert got is not None and got == ref, (path.name, w, win, lk, prune)
+                        assert optimize_topk(graph=graph, k=1, locks=lk, weights=w, window=win, prune=prune, memo=True) == ref
+                        checked += 1
+            seq = _prepare_sequence(graph, [], None, w)
+            found = _top1_memo_path(seq.cands, w, None, None)
+            assert found is not None
+            idxs, stats = found
+            assert stats["unique_transitions"] * 10 < stats["transitions"], stats
+            assert idxs == _topk_paths(seq.cands, k=1, weights=w)[0][0]
+
+    try:
+        optimize_top1_memo(graph=graph, locks=[], weights=Weights(), prune="verify")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("optimize_top1_memo 不支持 prune=verify，应当失败")
+
+    # 没有重复材料：每个事件候选都不同
+    def cand(s: int) -> Candidate:
+        return Candidate(string=s, technique="press", pos_ratio=round(rng.uniform(0.05, 0.95), 6), cents_error=0.0, raw={"string": s})
+
+    unique = CandidateGraph(
+        events=tuple(GraphEvent(eid=f"U{i:03d}", slots=(None,), candidates=(tuple(cand(s) for s in range(1, 6)),)) for i in range(64))
+    )
+    useq = _prepare_sequence(unique, [], None, Weights())
+    assert _top1_memo_path(useq.cands, Weights(), None, None) is None
+    assert optimize_top1_memo(graph=unique, locks=[], weights=Weights()) is None
+    a = optimize_topk(graph=unique, k=1, locks=[], weights=Weights(), memo=True)
+    assert a == optimize_topk(graph=unique, k=1, locks=[], weights=Weights(), memo=False)
+
+    print(f"[OK] stage2 memo: {checked} top-1 solves identical to plain DP on {len(profiles)} profiles")
+
+
+if __name__ == "__main__":
+    main()
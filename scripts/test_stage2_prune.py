@@ -0,0 +1,212 @@
+"""
+stage2 dominance 剪枝（optimize_topk(prune=...)）的回归测试。
+
+覆盖：
+- 随机 weights（含负权重）、K、window、chord 下 prune="on" 与 "off" 的 Top-K 逐位一致（代价、路径、explain）
+- prune="verify" 在上述输入上通过比对
+- 偏重 harmonic 惩罚时确实剪掉了候选（合成的密集 chord/harmonic 序列）
+- 增量求解器（IncrementalTopK）同样剪枝：随机 lock 序列下与 optimize_topk(prune="off") 逐位一致
+- 探测：前 DOMINANCE_PROBE_EVENTS 个事件剪得太少（shift 主导的 weights）时其余事件不再判定
+- 剪枝出错（人为去掉最优候选）时 verify 模式按 RuntimeError 失败；未知模式按 ValueError 失败
+
+用法：
+  python scripts/test_stage2_prune.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _pin(choice: dict[str, Any]) -> dict[str, Any]:
+    return {"string": choice["string"], "technique": choice["technique"], "pos_ratio": choice["pos"]["pos_ratio"] or 0.0}
+
+
+def _dense_graph(seed: int) -> Any:
+    """合成的密集序列：每 3 个事件一个 3-slot chord（每 slot 7 个候选），其余为 60 个候选的单音。"""
+
+    from guqinauto_backend.engines.stage2_optimizer import Candidate, CandidateGraph, GraphEvent
+
+    rng = random.Random(seed)
+
+    def cand(string: int) -> Any:
+        technique = rng.choice(["open", "press", "harmonic"])
+        pos = 0.0 if technique == "open" else round(rng.uniform(0.1, 0.9), 4)
+        return Candidate(string=string, technique=technique, pos_ratio=pos, cents_error=round(rng.uniform(-30, 30), 3), raw={"string": string})
+
+    events = []
+    for e in range(18):
+        if e % 3 == 0:
+            per_slot = tuple(tuple(cand(s) for s in range(1, 8)) for _ in range(3))
+            events.append(GraphEvent(eid=f"C{e:03d}", slots=("a", "b", "c"), candidates=per_slot))
+        else:
+            events.append(GraphEvent(eid=f"S{e:03d}", slots=(None,), candidates=(tuple(cand(rng.randint(1, 7)) for _ in range(60)),)))
+    return CandidateGraph(events=tuple(events))
+
+
+def _same(a: list[Any], b: list[Any]) -> bool:
+    return [(s.total_cost, s.assignments, s.explain) for s in a] == [(s.total_cost, s.assignments, s.explain) for s in b]
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.engines.stage2_optimizer import (
+        IncrementalTopK,
+        Lock,
+        Weights,
+        Window,
+        _prepare_sequence,
+        candidate_graph_from_stage1,
+        optimize_topk,
+    )
+
+    rng = random.Random(43)
+    profiles = [Weights(), Weights(harmonic_penalty=2.0, cents_error=0.2)]
+    profiles += [Weights(*(round(rng.uniform(-0.3, 2.0), 3) for _ in range(5))) for _ in range(10)]
+
+    # 示例曲的事件都很小：临时取消最小候选数门槛，让剪枝在每个事件上都生效
+    saved = so.DOMINANCE_MIN_CANDIDATES
+    so.DOMINANCE_MIN_CANDIDATES = 1
+    checked = 0
+    try:
+        for path in EXAMPLES:
+            graph = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+            eids = [ev.eid for ev in graph.events]
+            best = optimize_topk(graph=graph, k=1, locks=[], weights=Weights(), prune="off")[0].assignments
+            windows: list[Any] = [None]
+            if len(eids) > 8 and "choice" in best[1] and "choice" in best[6]:
+                left, right = (_pin(best[1]["choice"]),), (_pin(best[6]["choice"]),)
+                windows.append(Window(from_eid=eids[2], to_eid=eids[5], left=left, right=right))
+            for w in profiles:
+                for win in windows:
+                    for k in (1, 3, 8):
+                        off = optimize_topk(graph=graph, k=k, locks=[], weights=w, window=win, prune="off")
+                        on = optimize_topk(graph=graph, k=k, locks=[], weights=w, window=win, prune="on")
+                        assert _same(on, off), (path.name, w, k, win)
+                        optimize_topk(graph=graph, k=k, locks=[], weights=w, window=win, prune="verify")
+                        checked += 1
+    finally:
+        so.DOMINANCE_MIN_CANDIDATES = saved
+
+    # 密集 chord/harmonic：偏重 harmonic 惩罚时大量候选被支配
+    dense = _dense_graph(7)
+    heavy = Weights(harmonic_penalty=1.0, cents_error=0.1)
+    pruned = {k: _prepare_sequence(dense, [], None, heavy, prune_k=k).pruned for k in (1, 5)}
+    assert pruned[1] > 0 and pruned[5] > 0 and pruned[1] >= pruned[5], pruned
+    for w in (Weights(), heavy, Weights(shift=-0.2, harmonic_penalty=0.8)):
+        for k in (1, 5):
+            off = optimize_topk(graph=dense, k=k, locks=[], weights=w, prune="off")
+            assert _same(optimize_topk(graph=dense, k=k, locks=[], weights=w, prune="on"), off), (w, k)
+
+    # 增量求解器：lock 改变事件自身或相邻事件的候选时重新判定剪枝，结果与不剪枝的全量求解逐位一致
+    for k in (1, 5):
+        solver = IncrementalTopK(graph=dense, k=k, weights=heavy)
+        locks: list[Any] = []
+        for _step in range(10):
+            ev = rng.choice(dense.events)
+            c = rng.choice(ev.candidates[0])
+            fields: dict[str, Any] = {"string": c.string, "technique": c.technique}
+            if ev.slots != (None,):
+                fields["slot"] = ev.slots[0]
+            locks = [lk for lk in locks if lk.eid != ev.eid] + [Lock(eid=ev.eid, fields=fields)]
+            try:
+                ref = optimize_topk(graph=dense, k=k, locks=locks, weights=heavy, prune="off")
+            except ValueError:
+                locks.pop()
+                continue
+            assert _same(solver.solve(locks=locks), ref), (k, locks)
+            assert solver.last_solve["pruned"] > 0, solver.last_solve
+        unpruned = IncrementalTopK(graph=dense, k=k, weights=heavy, prune=False)
+        assert _same(unpruned.solve(locks=locks), ref) and unpruned.last_solve["pruned"] == 0
+
+    # 人为破坏剪枝（去掉每个事件的最优候选）：verify 必须发现
+    original = so._prune_dominated
+
+    def broken(cands: Any, w: Any, k: Any, prev: Any, nxt: Any) -> Any:
+        ranked = sorted(cands, key=lambda c: so._node_cost(c, w)["harmonic"] + so._node_cost(c, w)["cents_error"])
+        return [c for c in cands if c is not ranked[0]] if len(cands) > 1 else cands
+
+    graph = candidate_graph_from_stage1(_stage1_events(EXAMPLES[0], include_harmonics=True))
+    so._prune_dominated = broken
+    try:
+        optimize_topk(graph=graph, k=3, locks=[], weights=heavy, prune="verify")
+    except RuntimeError as e:
+        assert "dominance" in str(e)
+    else:
+        raise AssertionError("剪枝结果不一致时 verify 应当失败")
+    finally:
+        so._prune_dominated = original
+
+    try:
+        optimize_topk(graph=graph, k=1, locks=[], weights=heavy, prune="maybe")  # type: ignore[arg-type]
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("未知 prune 模式应当失败")
+
+    # 探测：默认 weights（shift 主导）在密集序列上几乎剪不掉，判定 DOMINANCE_PROBE_EVENTS 个事件后停止
+    calls = [0]
+
+    def counting(cands: Any, w: Any, k: Any, prev: Any, nxt: Any) -> Any:
+        calls[0] += 1
+        return original(cands, w, k, prev, nxt)
+
+    so._prune_dominated = counting
+    try:
+        _prepare_sequence(dense, [], None, Weights(), prune_k=5)
+        assert calls[0] == so.DOMINANCE_PROBE_EVENTS, calls
+        calls[0] = 0
+        _prepare_sequence(dense, [], None, heavy, prune_k=5)
+        assert calls[0] == len(dense.events), calls
+    finally:
+        so._prune_dominated = original
+
+    # 候选数门槛：小事件不做判定
+    assert _prepare_sequence(graph, [], None, heavy, prune_k=1).pruned == 0
+
+    print(f"[OK] stage2 prune: on == off on {checked} cases; dense graph pruned k=1:{pruned[1]} k=5:{pruned[5]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+stage2 惰性解集的名次上限与缓存限重（api/server.py 的 /stage2/results，api/sessions.py 的 new_stage2_result_cache）的回归测试。
+
+覆盖：
+- stage2_result_rank_limit：不超过 STAGE2_RESULT_MAX_RANK，且名次 × 事件数不超过总权重的一半
+- 解集缓存按已求出的名次 × 事件数计重；取页后重新登记，权重随之增长
+- offset+limit 超过上限时 400，且不开始枚举；offset 超过 STAGE2_RESULT_MAX_RANK 时按参数校验失败（422）
+- 创建时第一页超过上限同样 400
+- TtlLruCache：已缓存的条目重新登记时超过总上限，则整条移除（不按旧权重继续占位）
+
+用法：
+  python scripts/test_stage2_result_limits.py
+
+注意：
+- 测试工程写入 backend/workspace，结束时删除。
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import shutil
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from fastapi.testclient import TestClient
+
+    import guqinauto_backend.api.server as server
+    from guqinauto_backend.api.sessions import STAGE2_RESULT_MAX_RANK, STAGE2_RESULT_MAX_WEIGHT, stage2_result_rank_limit
+    from guqinauto_backend.infra.workspace import create_project_from_musicxml_bytes, project_dir
+    from guqinauto_backend.utils.ttl_lru import TtlLruCache
+
+    assert stage2_result_rank_limit(1) == STAGE2_RESULT_MAX_RANK
+    assert stage2_result_rank_limit(1000) * 1000 <= STAGE2_RESULT_MAX_WEIGHT // 2
+    assert stage2_result_rank_limit(1000) < STAGE2_RESULT_MAX_RANK
+
+    # 重新登记时超重：移除旧条目
+    sizes = {"a": 3}
+    cache: TtlLruCache[str, str] = TtlLruCache(max_entries=4, max_weight=10, weigh=lambda v: sizes[v])
+    cache.put("k", "a")
+    assert cache.stats()["weight"] == 3
+    sizes["a"] = 11
+    cache.put("k", "a")
+    assert cache.get("k") is None and cache.stats()["weight"] == 0
+
+    meta = create_project_from_musicxml_bytes(name="test_stage2_result_limits", musicxml_bytes=EXAMPLE.read_bytes())
+    pid, rev = meta.project_id, meta.current_revision
+    try:
+        client = TestClient(server.app)
+        r = client.post(f"/projects/{pid}/stage2/results", json={"base_revision": rev, "limit": 5})
+        assert r.status_code == 200, r.text
+        handle = r.json()["result_handle"]
+        results = server._STAGE2_RESULTS.get(handle)
+        assert results is not None
+        events = results.enumerator.events
+        cap = stage2_result_rank_limit(events)
+        assert events == len(r.json()["pool"]) and cap == STAGE2_RESULT_MAX_RANK
+
+        def weight() -> int:
+            return int(server._STAGE2_RESULTS.stats()["weight"] or 0)
+
+        before = weight()
+        assert results.enumerator.ranks >= 5
+        r = client.get(f"/projects/{pid}/stage2/results/{handle}/solutions", params={"offset": 200, "limit": 10})
+        assert r.status_code == 200 and [s["rank"] for s in r.json()["solutions"]] == list(range(201, 211))
+        assert results.enumerator.ranks >= 210
+        assert weight() - before >= (210 - 5) * events, "取页后应按新求出的名次重新计重"
+
+        ranks = results.enumerator.ranks
+        r = client.get(f"/projects/{pid}/stage2/results/{handle}/solutions", params={"offset": cap - 5, "limit": 10})
+        assert r.status_code == 400 and "名次上限" in r.json()["detail"], r.text
+        assert results.enumerator.ranks == ranks, "超过上限时不应开始枚举"
+        r = client.get(f"/projects/{pid}/stage2/results/{handle}/solutions", params={"offset": STAGE2_RESULT_MAX_RANK + 1})
+        assert r.status_code == 422
+
+        saved = server.stage2_result_rank_limit
+        server.stage2_result_rank_limit = lambda _events: 3  # type: ignore[assignment]
+        try:
+            r = client.post(f"/projects/{pid}/stage2/results", json={"base_revision": rev, "limit": 5, "preferences": {"shift": 0.5}})
+            assert r.status_code == 400 and "名次上限" in r.json()["detail"], r.text
+        finally:
+            server.stage2_result_rank_limit = saved  # type: ignore[assignment]
+    finally:
+        shutil.rmtree(project_dir(pid))
+
+    print(f"[OK] stage2 result limits: rank cap {cap} on {events} events; cache weight tracks ranks x events")
+
+
+if __name__ == "__main__":
+    main()
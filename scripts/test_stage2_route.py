@@ -0,0 +1,193 @@
+"""
+全曲 stage2 求解的路由（api/server.py 的 compute_stage2：增量求解器 / 段并行 / optimize_topk）的回归测试。
+
+覆盖：
+- segment_cut_count：按 lock 位集数出的切点与 `_segment_cuts` 同规则；非法 lock 不算切点
+- 长曲目、lock 切出独立段时，compute_stage2 走段并行：explain.segments 列出切点，代价与串行求解逐位一致
+- 段并行进程池的进程数：缺省 min(4, CPU 数)，环境变量覆盖，非法值明确失败
+- 无切点时仍走增量求解器（登记到求解器缓存，explain 中无 segments）
+- table_states 与求解后的 IncrementalTopK.resident_states 一致；求解器缓存按该值限重，超重的求解器不缓存
+- k=1 且重复材料足够时走记忆化（不建增量求解器），结果与 optimize_topk(k=1) 逐项一致
+- 表项数超过 INCREMENTAL_MAX_STATES 时不建增量求解器，改走 optimize_topk（超过 CHECKPOINT_MIN_STATES 时为检查点模式）
+
+用法：
+  python scripts/test_stage2_route.py
+
+注意：
+- 测试工程写入 backend/workspace，结束时删除。
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import re
+import shutil
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _long_musicxml(repeat: int) -> bytes:
+    """把示例的全部小节重复 repeat 次（eid / note id / 小节号重新编号）。"""
+
+    text = EXAMPLE.read_text(encoding="utf-8")
+    head, rest = text.split("<measure ", 1)
+    body, tail = ("<measure " + rest).rsplit("</measure>", 1)
+    body += "</measure>"
+    parts: list[str] = []
+    for r in range(repeat):
+        block = re.sub(r"eid=E(\d{6})", lambda m: f"eid=E{r * 1000 + int(m.group(1)):06d}", body)
+        block = re.sub(r'id="N(\d{6})([AB])"', lambda m: f'id="N{r * 1000 + int(m.group(1)):06d}{m.group(2)}"', block)
+        if r:
+            block = re.sub(r"<attributes>.*?</attributes>", "", block, flags=re.S)
+        parts.append(block)
+    out = head + "\n".join(parts) + tail
+    counter = iter(range(1, 1_000_000))
+    out = re.sub(r'<measure number="\d+"', lambda _m: f'<measure number="{next(counter)}"', out)
+    return out.encode("utf-8")
+
+
+def _pin(choice: dict[str, Any]) -> dict[str, Any]:
+    return {"string": choice["string"], "technique": choice["technique"], "pos_ratio": choice["pos"]["pos_ratio"] or 0.0}
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import guqinauto_backend.api.server as server
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.api.serializers import serialize_solution
+    from guqinauto_backend.api.server import Stage2Request, compute_stage2
+    from guqinauto_backend.api.sessions import new_stage2_solver_cache
+    from guqinauto_backend.engines.stage2_optimizer import (
+        SEGMENT_MIN_EVENTS,
+        IncrementalTopK,
+        Lock,
+        Weights,
+        _prepare_sequence,
+        _segment_cuts,
+        optimize_topk,
+        segment_cut_count,
+        table_states,
+    )
+    from guqinauto_backend.infra.workspace import create_project_from_musicxml_bytes, project_dir
+
+    # 进程池的进程数上限
+    env = server.STAGE2_POOL_WORKERS_ENV
+    saved_env = os.environ.pop(env, None)
+    try:
+        assert server.stage2_pool_max_workers() == min(server.STAGE2_POOL_DEFAULT_WORKERS, os.cpu_count() or 1)
+        os.environ[env] = "2"
+        assert server.stage2_pool_max_workers() == 2
+        for bad in ("0", "-1", "x", ""):
+            os.environ[env] = bad
+            try:
+                server.stage2_pool_max_workers()
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError(f"{env}={bad!r} 应当失败")
+    finally:
+        os.environ.pop(env, None)
+        if saved_env is not None:
+            os.environ[env] = saved_env
+
+    meta = create_project_from_musicxml_bytes(name="test_stage2_route", musicxml_bytes=_long_musicxml(10))
+    pid, rev = meta.project_id, meta.current_revision
+    try:
+        solvers_before = server._STAGE2_SOLVERS.stats()["entries"]
+        plain = compute_stage2(pid, Stage2Request(base_revision=rev, k=3))
+        assert plain["stage2"]["search"] == {"solver": "exact"}
+        assigns = plain["stage2"]["solutions"][0]["assignments"]
+        assert len(assigns) >= 3 * SEGMENT_MIN_EVENTS, len(assigns)
+        assert all("segments" not in s["explain"] for s in plain["stage2"]["solutions"])
+        assert server._STAGE2_SOLVERS.stats()["entries"] == solvers_before + 1
+
+        session = server._resolve_stage1_session(pid, meta, Stage2Request(base_revision=rev))
+        graph = session.graph()
+        pinned_at = [SEGMENT_MIN_EVENTS + 10, 2 * SEGMENT_MIN_EVENTS + 20]
+        locks = [{"eid": assigns[i]["eid"], "fields": _pin(assigns[i]["choice"])} for i in pinned_at]
+        engine_locks = [Lock(eid=l["eid"], fields=l["fields"]) for l in locks]
+
+        # 切点计数与 `_segment_cuts`（在施加 lock 后的序列上）一致
+        seq = _prepare_sequence(graph, engine_locks, None, Weights(), prune_k=None)
+        assert segment_cut_count(graph, engine_locks) == len(_segment_cuts(seq.cands)) == len(pinned_at)
+        bad = [Lock(eid=locks[0]["eid"], fields={**locks[0]["fields"], "slot": "L"}), engine_locks[1]]
+        assert segment_cut_count(graph, bad) == 1
+
+        got = compute_stage2(pid, Stage2Request(base_revision=rev, k=3, locks=locks))["stage2"]["solutions"]
+        assert got[0]["explain"]["segments"] == {"count": 3, "cut_eids": [l["eid"] for l in locks]}
+        assert server._STAGE2_POOL is not None and server._STAGE2_POOL._max_workers == server.stage2_pool_max_workers()
+        ref = optimize_topk(graph=graph, k=3, locks=engine_locks, weights=Weights())
+        assert [s["total_cost"] for s in got] == [s.total_cost for s in ref]
+        assert server._STAGE2_SOLVERS.stats()["entries"] == solvers_before + 1, "段并行不应新建增量求解器"
+
+        # 求解器缓存按常驻表项数限重（求解后登记）；超重的求解器不缓存
+        solver = IncrementalTopK(graph=graph, k=3, weights=Weights())
+        solver.solve(locks=[])
+        states = table_states(graph, 3)
+        assert solver.resident_states == states > 0
+        cache = new_stage2_solver_cache(max_states=states)
+        cache.put("a", solver)
+        assert cache.stats()["weight"] == states and cache.get("a") is solver
+        small = new_stage2_solver_cache(max_states=states - 1)
+        small.put("a", solver)
+        assert small.get("a") is None
+
+        # k=1：重复材料足够（示例重复 10 次）时走记忆化，不建增量求解器
+        memo_calls = [0]
+        saved_memo = so._top1_memo_path
+
+        def counting_memo(*args: Any, **kw: Any) -> Any:
+            memo_calls[0] += 1
+            return saved_memo(*args, **kw)
+
+        so._top1_memo_path = counting_memo  # type: ignore[assignment]
+        try:
+            top1 = compute_stage2(pid, Stage2Request(base_revision=rev, k=1))["stage2"]["solutions"]
+        finally:
+            so._top1_memo_path = saved_memo  # type: ignore[assignment]
+        assert memo_calls[0] == 1, "k=1 全曲求解应当先试记忆化"
+        assert server._STAGE2_SOLVERS.stats()["entries"] == solvers_before + 1, "走记忆化时不应新建增量求解器"
+        ref = optimize_topk(graph=graph, k=1, locks=[], weights=Weights(), memo=False)
+        assert top1 == [serialize_solution(s) for s in ref]
+
+        # 表项数超过 INCREMENTAL_MAX_STATES：不建增量求解器，改走（检查点模式的）optimize_topk
+        checkpointed = [0]
+        saved = (so.INCREMENTAL_MAX_STATES, so.CHECKPOINT_MIN_STATES, so._topk_backtrack_checkpointed)
+
+        def counting(*args: Any, **kw: Any) -> Any:
+            checkpointed[0] += 1
+            return saved[2](*args, **kw)
+
+        so.INCREMENTAL_MAX_STATES = table_states(graph, 4) - 1
+        so.CHECKPOINT_MIN_STATES = table_states(graph, 4) - len(graph.events) * so.INCREMENTAL_EVENT_STATES  # Σ候选数 × K
+        so._topk_backtrack_checkpointed = counting  # type: ignore[assignment]
+        try:
+            big = compute_stage2(pid, Stage2Request(base_revision=rev, k=4))["stage2"]["solutions"]
+        finally:
+            so.INCREMENTAL_MAX_STATES, so.CHECKPOINT_MIN_STATES, so._topk_backtrack_checkpointed = saved
+        assert server._STAGE2_SOLVERS.stats()["entries"] == solvers_before + 1, "超过阈值不应新建增量求解器"
+        assert checkpointed[0] > 0, "超过 CHECKPOINT_MIN_STATES 时应走检查点模式"
+        ref = optimize_topk(graph=graph, k=4, locks=[], weights=Weights())
+        assert [s["total_cost"] for s in big] == [s.total_cost for s in ref]
+    finally:
+        shutil.rmtree(project_dir(pid))
+        if server._STAGE2_POOL is not None:
+            server._STAGE2_POOL.shutdown()
+
+    print(f"[OK] stage2 route: {len(assigns)}-event piece with {len(pinned_at)} pinned events solved in 3 parallel segments")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+给定指法打分（score_fingering / read_fingering_v0_3）的回归测试。
+
+覆盖：
+- 把 optimize_topk 的每条解当作指法打分：代价与分项逐位一致（随机 weights，含负权重、chord）
+- 未打分事件处路径断开：其后的事件按段首计 node cost，complete=False，总代价为各事件代价之和
+- 泛音未给出节点时取离前一事件最近的节点、pos_ratio 偏离时取最近位置：都在 assumed 中显式标注
+- 映射不到候选 / slot 不一致按原因记为未打分；引用未知 eid 按 ValueError 失败
+- staff2 v0.3 真值读取：simple 单弦/多弦、complex、泛音节点（harmonic_k 优先于 pos_ratio）、缺字段
+
+用法：
+  python scripts/test_stage2_score.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _synthetic_result(pitches: list[int]) -> Any:
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import Stage1Event, Stage1Result, Stage1Target
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=True, max_harmonic_n=32, max_harmonic_cents_error=100.0)
+    events = []
+    for i, p in enumerate(pitches):
+        cands = tuple(engine.enumerate_candidates(pitch_midi=p, options=opt))
+        events.append(Stage1Event(eid=f"E{i:04d}", targets=(Stage1Target(slot=None, target_midi=p, candidates=cands),)))
+    return Stage1Result(events=tuple(events))
+
+
+def _fields(choice: dict[str, Any], slot: str | None = None) -> dict[str, Any]:
+    out = {"slot": slot, "string": choice["string"], "technique": choice["technique"], "pos_ratio": choice["pos"]["pos_ratio"] or 0.0}
+    if choice["technique"] == "harmonic":
+        out["harmonic_n"] = choice["harmonic_n"]
+    return out
+
+
+def _fingering(solution: Any) -> dict[str, list[dict[str, Any]]]:
+    out: dict[str, list[dict[str, Any]]] = {}
+    for a in solution.assignments:
+        if "choice" in a:
+            out[a["eid"]] = [_fields(a["choice"])]
+        else:
+            out[a["eid"]] = [_fields(it["choice"], it["slot"]) for it in a["choices"]]
+    return out
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.guqin_fingering_pitch import read_fingering_v0_3
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Weights,
+        candidate_graph_from_stage1,
+        candidate_graph_from_stage1_result,
+        optimize_topk,
+        score_fingering,
+    )
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    rng = random.Random(45)
+    profiles = [Weights(), Weights(harmonic_penalty=-0.5)]
+    profiles += [Weights(*(round(rng.uniform(-0.3, 2.0), 3) for _ in range(5))) for _ in range(6)]
+    checked = 0
+    for path in EXAMPLES:
+        graph = candidate_graph_from_stage1(_stage1_events(path, include_harmonics=True))
+        for w in profiles:
+            for sol in optimize_topk(graph=graph, k=5, locks=[], weights=w):
+                got = score_fingering(graph=graph, fingering=_fingering(sol), weights=w)
+                assert got.complete and got.total_cost == sol.total_cost, (path.name, w, got.total_cost, sol.total_cost)
+                assert got.cost_breakdown == sol.explain["cost_breakdown"]
+                assert [e.assignment for e in got.events] == sol.assignments
+                assert not any(e.assumed for e in got.events)
+                checked += 1
+
+    # 路径断开：缺一个事件的指法
+    graph = candidate_graph_from_stage1(_stage1_events(EXAMPLES[0], include_harmonics=True))
+    w = Weights(harmonic_penalty=-0.5)
+    best = optimize_topk(graph=graph, k=1, locks=[], weights=w)[0]
+    fingering = _fingering(best)
+    gap_eid = graph.events[3].eid
+    del fingering[gap_eid]
+    cut = score_fingering(graph=graph, fingering=fingering, weights=w, reasons={gap_eid: "truth_unreadable:x"})
+    assert not cut.complete and cut.events[3].assignment is None and cut.events[3].reason == "truth_unreadable:x"
+    after = cut.events[4]
+    assert after.segment_start and after.cost == sum(after.cost_breakdown.values()) and after.cost_breakdown["shift"] == 0.0
+    assert [e.segment_start for e in cut.events].count(True) == 2
+    assert abs(cut.total_cost - sum(e.cost for e in cut.events)) < 1e-9
+
+    # 泛音不给节点：取离前一事件最近的节点；pos_ratio 偏离：取最近位置
+    hgraph = candidate_graph_from_stage1_result(_synthetic_result([67, 98, 79]))
+    hbest = optimize_topk(graph=hgraph, k=1, locks=[], weights=w)[0]
+    groups: dict[tuple[int, int], list[float]] = {}
+    for c in hgraph.events[1].candidates[0]:
+        if c.technique == "harmonic":
+            groups.setdefault((c.string, c.raw.harmonic_n), []).append(c.pos_ratio)
+    (string, n), nodes = max(groups.items(), key=lambda kv: len(kv[1]))
+    assert len(nodes) > 1
+    loose = {a["eid"]: [_fields(serialize_stage1_candidate(a["choice"]))] for a in hbest.assignments}
+    loose[hgraph.events[1].eid] = [{"slot": None, "string": string, "technique": "harmonic", "harmonic_n": n}]
+    got = score_fingering(graph=hgraph, fingering=loose, weights=w)
+    prev_pos = hbest.assignments[0]["choice"].pos_ratio or 0.0
+    i = 1
+    chosen = got.events[i].assignment["choice"].pos_ratio  # type: ignore[index]
+    assert got.complete and got.events[i].assumed == ("harmonic_node",)
+    assert abs(chosen - prev_pos) == min(abs(x - prev_pos) for x in nodes), (chosen, prev_pos, nodes)
+
+    j = next(i for i, a in enumerate(best.assignments) if a["choice"]["technique"] == "press")
+    snapped = _fingering(best)
+    snapped[graph.events[j].eid][0]["pos_ratio"] += 1e-4
+    got = score_fingering(graph=graph, fingering=snapped, weights=w)
+    assert got.events[j].assumed == ("pos_ratio_snapped",) and got.total_cost == best.total_cost
+
+    # 映射不到候选 / slot 不一致 / 未知 eid
+    bad = _fingering(best)
+    bad[graph.events[0].eid][0]["string"] = 99
+    bad[graph.events[1].eid][0]["slot"] = "L"
+    got = score_fingering(graph=graph, fingering=bad, weights=w)
+    assert [e.reason for e in got.events[:2]] == ["not_a_candidate", "slot_mismatch"], got.events[:2]
+    head = got.events[2]
+    assert head.segment_start and head.cost_breakdown["shift"] == head.cost_breakdown["string_change"] == 0.0
+    try:
+        score_fingering(graph=graph, fingering={"NOPE": []}, weights=w)
+    except ValueError as e:
+        assert "NOPE" in str(e)
+    else:
+        raise AssertionError("未知 eid 应当失败")
+
+    # staff2 v0.3 真值读取
+    tuning = ProjectTuning.default_demo()
+    readings, _ = read_fingering_v0_3({"form": "simple", "xian": "3", "sound": "pressed", "pos_ratio": "0.25"}, tuning=tuning)
+    assert [(r.slot, r.string, r.sound, r.pos_ratio) for r in readings] == [(None, 3, "pressed", 0.25)]
+    readings, _ = read_fingering_v0_3(
+        {"form": "simple", "xian": "1", "sound": "harmonic", "harmonic_n": "5", "harmonic_k": "2", "pos_ratio": "0.9"}, tuning=tuning
+    )
+    assert readings[0].pos_ratio == 2 / 5 and readings[0].harmonic_k == 2 and readings[0].harmonic_n == 5
+    readings, _ = read_fingering_v0_3({"form": "simple", "xian": "1", "sound": "harmonic", "harmonic_n": "4"}, tuning=tuning)
+    assert readings[0].pos_ratio is None and readings[0].expected_midi == tuning.open_pitches_midi[0] + 24
+    readings, notes = read_fingering_v0_3({"form": "simple", "xian": "2,4", "sound": "harmonic", "harmonic_n": "2"}, tuning=tuning)
+    assert [(r.slot, r.string, r.pos_ratio) for r in readings] == [("1", 2, None), ("2", 4, None)] and notes
+    readings, _ = read_fingering_v0_3(
+        {"form": "simple", "xian": "2,4", "sound": "pressed", "pos_ratio_1": "0.1", "pos_ratio_2": "0.2"}, tuning=tuning
+    )
+    assert [(r.slot, r.pos_ratio) for r in readings] == [("1", 0.1), ("2", 0.2)]
+    readings, _ = read_fingering_v0_3(
+        {"form": "complex", "l_xian": "3", "r_xian": "4", "l_sound": "pressed", "l_pos_ratio": "0.3", "r_sound": "open"}, tuning=tuning
+    )
+    assert [(r.slot, r.string, r.sound, r.pos_ratio) for r in readings] == [("L", 3, "pressed", 0.3), ("R", 4, "open", 0.0)]
+    assert read_fingering_v0_3({"form": "simple", "xian": "3", "hui_finger": "散音"}, tuning=tuning) == ([], ["missing_v0_3_truth"])
+    assert read_fingering_v0_3({"form": "simple", "xian": "3", "sound": "pressed"}, tuning=tuning) == ([], ["missing_pos_ratio_for_pressed"])
+    try:
+        read_fingering_v0_3({"form": "simple", "xian": "1", "sound": "harmonic", "harmonic_n": "4", "harmonic_k": "4"}, tuning=tuning)
+    except ValueError as e:
+        assert "harmonic_k" in str(e)
+    else:
+        raise AssertionError("harmonic_k 超界应当失败")
+
+    print(f"[OK] stage2 score: given-fingering cost equals solver cost on {checked} solutions; gaps/assumptions explicit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+stage2 段并行（切点拆段 + k-best 和合并）的回归测试。
+
+覆盖：
+- 切点只选单候选事件，且相邻切点间隔不少于 SEGMENT_MIN_EVENTS
+- `optimize_topk(executor=ProcessPoolExecutor)` 与串行求解的 Top-K 逐位一致（代价、路径与同代价次序），且每个解的代价可复现
+- 某段第 K 名处有并列时不拆段（结果仍与串行一致）
+- 无切点时不拆段（explain 中无 segments）
+- `_merge_kbest` 与暴力枚举一致（第 k 条之后只多出与之并列的组合）
+
+用法：
+  python scripts/test_stage2_segments.py
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import (
+        SEGMENT_MIN_EVENTS,
+        CandidateGraph,
+        Lock,
+        Weights,
+        _merge_kbest,
+        _segment_cuts,
+        candidate_graph_from_stage1,
+        optimize_topk,
+    )
+
+    base = candidate_graph_from_stage1(_stage1_events(EXAMPLE, include_harmonics=True))
+    # 拼接成长曲（eid 加前缀保持唯一）
+    events = tuple(replace(ev, eid=f"R{r:02d}_{ev.eid}") for r in range(12) for ev in base.events)
+    graph = CandidateGraph(events=events)
+    n = len(events)
+    assert n >= 4 * SEGMENT_MIN_EVENTS, n
+
+    rng = random.Random(36)
+    lock_at = sorted(rng.sample(range(1, n - 1), 12))
+    locks: list[Lock] = []
+    for i in lock_at:
+        c = rng.choice(events[i].candidates[0])
+        locks.append(Lock(eid=events[i].eid, fields={"string": c.string, "technique": c.technique, "pos_ratio": c.pos_ratio}))
+
+    w = Weights()
+    serial = optimize_topk(graph=graph, k=8, locks=locks, weights=w)
+    # 各段内部候选两两并列（关闭换弦代价、弦号不同而位置相同）：第 K 名处并列时不拆段
+    tw = Weights(string_change=0.0)
+    flat = CandidateGraph(
+        events=tuple(
+            replace(ev, candidates=(tuple(replace(c, pos_ratio=0.5, cents_error=0.0) for c in ev.candidates[0] if c.technique == "press")[:3] or ev.candidates[0][:1],))
+            for ev in events
+        )
+    )
+    flat_locks = [Lock(eid=flat.events[i].eid, fields={"string": flat.events[i].candidates[0][0].string}) for i in lock_at]
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        parallel = optimize_topk(graph=graph, k=8, locks=locks, weights=w, executor=pool)
+        no_cut = optimize_topk(graph=graph, k=3, locks=[], weights=w, executor=pool)
+        tied = optimize_topk(graph=flat, k=6, locks=flat_locks, weights=tw, executor=pool)
+    tied_serial = optimize_topk(graph=flat, k=6, locks=flat_locks, weights=tw)
+    assert len({s.total_cost for s in tied_serial}) == 1, "测试图的 Top-K 应全部并列"
+    assert "segments" not in tied[0].explain
+    assert [s.assignments for s in tied] == [s.assignments for s in tied_serial]
+
+    seg = parallel[0].explain["segments"]
+    assert seg["count"] >= 2, seg
+    index = {ev.eid: i for i, ev in enumerate(events)}
+    cut_idx = [index[e] for e in seg["cut_eids"]]
+    assert all(i in lock_at for i in cut_idx), (cut_idx, lock_at)
+    assert all(b - a >= SEGMENT_MIN_EVENTS for a, b in zip([-1, *cut_idx], cut_idx)), cut_idx
+
+    assert [s.total_cost for s in parallel] == [s.total_cost for s in serial]
+    # 长曲由重复段拼成，同代价路径很多：并列解的先后也与串行一致
+    assert [s.assignments for s in parallel] == [s.assignments for s in serial]
+    assert len({str(s.assignments) for s in parallel}) == len(parallel)
+    for sol in parallel[:2]:
+        pinned = [
+            Lock(
+                eid=a["eid"],
+                fields={
+                    "string": a["choice"]["string"],
+                    "technique": a["choice"]["technique"],
+                    "pos_ratio": a["choice"]["pos"]["pos_ratio"] or 0.0,
+                },
+            )
+            for a in sol.assignments
+        ]
+        again = optimize_topk(graph=graph, k=1, locks=pinned, weights=w)
+        assert again[0].total_cost == sol.total_cost
+        assert again[0].explain["cost_breakdown"] == sol.explain["cost_breakdown"]
+    assert "segments" not in no_cut[0].explain
+    assert [s.total_cost for s in no_cut] == [s.total_cost for s in optimize_topk(graph=graph, k=3, locks=[], weights=w)]
+
+    # 切点选择：单候选且间隔足够
+    cands = [[0] * (1 if i in (3, 5, 40, 41, 70) else 2) for i in range(100)]
+    assert _segment_cuts(cands, min_events=4) == [3, 40, 70], _segment_cuts(cands, min_events=4)
+
+    # k-best 和与暴力一致
+    for _ in range(50):
+        a = sorted((round(rng.uniform(0, 10), 3), [i]) for i in range(rng.randint(1, 6)))
+        b = sorted((round(rng.uniform(0, 10), 3), [i]) for i in range(rng.randint(1, 6)))
+        k = rng.randint(1, 10)
+        got = [c for c, _ in _merge_kbest(a, b, k)]
+        brute = sorted(x[0] + y[0] for x in a for y in b)
+        assert got[:k] == brute[:k], (got, brute)
+        assert all(abs(c - brute[k - 1]) < 1e-9 for c in got[k:]), (got, brute)
+
+    print(f"[OK] stage2 segments: {n} events, {seg['count']} segments, parallel == serial")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+stage2 Top-K 结果缓存（api/sessions.py 的 Stage2SolutionCache 与 server 的 key 规范化）的回归测试。
+
+覆盖：
+- key 是输入的稳定指纹：与 dict 键顺序无关；stage1 会话（含 revision）/locks/偏好/window/k/solver 任一变化都换 key
+- 规范化：prune on/off 同 key；solver=exact 时 beam 参数不进 key；budget_ms、prune=verify 不缓存
+- 按 assignment 总数限重：超过上限的结果不缓存，新结果按 LRU 挤掉旧结果；命中率进入 stats
+
+用法：
+  python scripts/test_stage2_solution_cache.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.api.server import Stage2Request, _stage2_solution_key
+    from guqinauto_backend.api.sessions import (
+        Stage1Session,
+        Stage2CachedSolve,
+        new_stage2_solution_cache,
+        stage1_handle,
+        stage2_solution_key,
+    )
+    from guqinauto_backend.engines.stage1 import Stage1Result
+    from guqinauto_backend.engines.stage2_optimizer import Solution
+
+    # 稳定指纹
+    a = stage2_solution_key(handle="s1.x", inputs={"k": 5, "preferences": {"shift": 1.0, "cents_error": 0.01}})
+    b = stage2_solution_key(handle="s1.x", inputs={"preferences": {"cents_error": 0.01, "shift": 1.0}, "k": 5})
+    assert a == b
+    assert a != stage2_solution_key(handle="s1.y", inputs={"k": 5, "preferences": {"shift": 1.0, "cents_error": 0.01}})
+
+    def session(revision: str) -> Stage1Session:
+        handle = stage1_handle(project_id="P1", revision=revision, tuning={"t": 1}, options={"o": 1})
+        return Stage1Session(handle=handle, project_id="P1", revision=revision, tuning={"t": 1}, options={"o": 1}, result=Stage1Result(events=()))
+
+    s1, s2 = session("R000001"), session("R000002")
+    base = {"base_revision": "R000001", "k": 5}
+    key = _stage2_solution_key(s1, Stage2Request(**base))
+    assert key is not None
+    assert key == _stage2_solution_key(s1, Stage2Request(**base, prune="off"))
+    assert key == _stage2_solution_key(s1, Stage2Request(**base, beam_width=8))
+    assert key != _stage2_solution_key(s2, Stage2Request(**base))
+    variants = [
+        {"k": 6},
+        {"locks": [{"eid": "E000001", "fields": {"string": 3}}]},
+        {"preferences": {"shift": 2.0}},
+        {"window": {"from_eid": "E000001", "to_eid": "E000003"}},
+        {"solver": "beam"},
+    ]
+    keys = {key} | {_stage2_solution_key(s1, Stage2Request(**{**base, **v})) for v in variants}
+    assert len(keys) == len(variants) + 1
+    beam = {**base, "solver": "beam"}
+    assert _stage2_solution_key(s1, Stage2Request(**beam)) != _stage2_solution_key(s1, Stage2Request(**beam, beam_width=8))
+    assert _stage2_solution_key(s1, Stage2Request(**base, prune="verify")) is None
+    assert _stage2_solution_key(s1, Stage2Request(**base, budget_ms=100)) is None
+
+    # 按 assignment 总数限重
+    def entry(k: int, n: int) -> Stage2CachedSolve:
+        sols = tuple(
+            Solution(solution_id=f"S{i:04d}", total_cost=float(i), assignments=[{"eid": f"E{j}"} for j in range(n)], explain={})
+            for i in range(1, k + 1)
+        )
+        return Stage2CachedSolve(solutions=sols, search={"solver": "exact"}, exact=True)
+
+    cache = new_stage2_solution_cache(max_entries=8, max_assignments=100)
+    cache.put("big", entry(5, 30))
+    assert cache.get("big") is None
+    cache.put("a", entry(2, 20))
+    cache.put("b", entry(2, 20))
+    assert cache.get("a") is not None
+    cache.put("c", entry(2, 20))
+    assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["weight"] == 80 and stats["hits"] == 3 and stats["misses"] == 2 and stats["evictions"] == 1, stats
+
+    print("[OK] stage2 solution cache: stable keys, normalized inputs, assignment-weighted bound")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+stage2 流式会话（StreamingTop1：逐事件输入的固定延迟在线 Viterbi）的回归测试。
+
+覆盖：
+- flush 与 optimize_topk(k=1) 逐位一致（代价、分项、路径；随机 weights，含负权重；chord；locks）
+- 分组泛音逐事件展开全部节点：最优代价与不分组一致
+- 定稿：第 i 个事件在第 i+lag 个事件输入后给出，等于当时最优前缀的选择；lag=0 时与精确最优不同的事件列在 revised
+- 每次输入的转移代价计算量只取决于相邻两事件的候选数，与已输入事件数无关
+- extend 原子：重复 eid / 不可行 lock 时整批失败、状态不变
+
+用法：
+  python scripts/test_stage2_stream.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import random
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLES = [
+    REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml",
+    REPO_ROOT / "docs/data/old/guqin_jzp_profile_v0.2_complex_chord.musicxml",
+]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_result(path: Path, *, include_harmonics: bool) -> Any:
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import run_stage1
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    return run_stage1(view=view, engine=engine, options=PositionEngineOptions(include_harmonics=include_harmonics))
+
+
+def _synthetic_result(pitches: list[int], *, group: bool, prefix: str = "E") -> Any:
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.engines.stage1 import Stage1Event, Stage1Result, Stage1Target
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=True, max_harmonic_n=32, max_harmonic_cents_error=100.0, group_harmonics=group)
+    events = []
+    for i, p in enumerate(pitches):
+        cands = tuple(engine.enumerate_candidates(pitch_midi=p, options=opt))
+        events.append(Stage1Event(eid=f"{prefix}{i:04d}", targets=(Stage1Target(slot=None, target_midi=p, candidates=cands),)))
+    return Stage1Result(events=tuple(events))
+
+
+def _stream(result: Any, weights: Any, lag: int, locks: list[Any] | None = None) -> tuple[Any, list[Any]]:
+    from guqinauto_backend.engines.stage2_optimizer import StreamingTop1, stream_graph_event
+
+    s = StreamingTop1(weights=weights, lag=lag)
+    steps = [s.push(stream_graph_event(ev), [lk for lk in locks or [] if lk.eid == ev.eid]) for ev in result.events]
+    return s, steps
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    import guqinauto_backend.engines.stage2_optimizer as so
+    from guqinauto_backend.engines.stage2_optimizer import (
+        Lock,
+        Stage2Infeasible,
+        Weights,
+        candidate_graph_from_stage1_result,
+        optimize_topk,
+        stream_graph_event,
+    )
+
+    rng = random.Random(47)
+    profiles = [Weights(), Weights(shift=-0.3, harmonic_penalty=-0.2)]
+    profiles += [Weights(*(round(rng.uniform(-0.3, 2.0), 3) for _ in range(5))) for _ in range(5)]
+    checked = 0
+    for path in EXAMPLES:
+        result = _stage1_result(path, include_harmonics=True)
+        graph = candidate_graph_from_stage1_result(result)
+        plain = optimize_topk(graph=graph, k=1, locks=[], weights=Weights())[0].assignments
+        lock_sets: list[list[Any]] = [[]]
+        if "choice" in plain[0]:
+            mid = len(plain) // 2
+            lock_sets.append([Lock(eid=plain[mid]["eid"], fields={"string": plain[mid]["choice"].string})])
+        for w in profiles:
+            for locks in lock_sets:
+                ref = optimize_topk(graph=graph, k=1, locks=locks, weights=w, prune="off", memo=False)[0]
+                for lag in (0, 1, 4, 64):
+                    s, steps = _stream(result, w, lag, locks)
+                    got = s.flush()
+                    assert got.total_cost == ref.total_cost and got.assignments == ref.assignments, (path.name, w, lag)
+                    assert got.explain["cost_breakdown"] == ref.explain["cost_breakdown"]
+                    assert steps[-1].frontier_cost == ref.total_cost
+                    checked += 1
+
+    # 分组泛音：全部节点参与，最优代价与不分组一致
+    pitches = [rng.randint(70, 100) for _ in range(60)]
+    flat = candidate_graph_from_stage1_result(_synthetic_result(pitches, group=False))
+    grouped = _synthetic_result(pitches, group=True)
+    assert any(stream_graph_event(ev).stage1_index is not None for ev in grouped.events)
+    for w in profiles:
+        ref = optimize_topk(graph=flat, k=1, locks=[], weights=w)[0].total_cost
+        got = _stream(grouped, w, 4)[0].flush().total_cost
+        assert abs(got - ref) <= 1e-9 * (1 + abs(ref)), (w, got, ref)
+
+    # 定稿时机与内容：第 i 个事件在第 i+lag 个事件输入时定稿，等于当时前缀最优在事件 i 上的选择
+    result = _synthetic_result(pitches, group=False)
+    w = Weights(shift=2.0)
+    for lag in (0, 3):
+        s, steps = _stream(result, w, lag)
+        decided = [a for st in steps for a in st.decided]
+        assert [a["eid"] for a in decided] == [ev.eid for ev in result.events[: len(steps) - lag]]
+        assert all(len(st.decided) == (1 if i >= lag else 0) for i, st in enumerate(steps))
+        assert all(len(st.tentative) == min(lag, i + 1) for i, st in enumerate(steps))
+        for i in range(lag, len(steps), 7):
+            prefix = candidate_graph_from_stage1_result(type(result)(events=result.events[: i + 1]))
+            best = optimize_topk(graph=prefix, k=1, locks=[], weights=w, prune="off", memo=False)[0]
+            assert steps[i].decided == [best.assignments[i - lag]]
+            assert steps[i].tentative == best.assignments[i - lag + 1 :]
+        exact = s.flush()
+        revised = [a["eid"] for a, b in zip(decided, exact.assignments) if a != b]
+        assert exact.explain["revised"] == revised
+    s0 = _stream(result, w, 0)[0]
+    assert s0.flush().explain["revised"], "lag=0 的定稿在随机高音序列上应当与精确最优有差异"
+
+    # 每次输入的转移代价计算量与已输入事件数无关
+    calls = [0]
+    saved = so._transition_cost_chord
+
+    def counting(a: Any, b: Any, w: Any) -> Any:
+        calls[0] += 1
+        return saved(a, b, w)
+
+    so._transition_cost_chord = counting
+    try:
+        s = so.StreamingTop1(weights=Weights(), lag=8)
+        per_push = []
+        events = [stream_graph_event(ev) for ev in result.events]
+        for ev in events:
+            before = calls[0]
+            s.push(ev)
+            per_push.append(calls[0] - before)
+    finally:
+        so._transition_cost_chord = saved
+    sizes = [len(ev.candidates[0]) for ev in events]
+    assert per_push == [0] + [a * b for a, b in zip(sizes, sizes[1:])], per_push
+
+    # extend 原子：失败时状态不变
+    s, _ = _stream(result, Weights(), 2)
+    before = s.flush()
+    extra = [stream_graph_event(ev) for ev in _synthetic_result([67, 69], group=False, prefix="N").events]
+    try:
+        s.extend([(extra[0], []), (stream_graph_event(result.events[0]), [])])
+    except ValueError as e:
+        assert "重复" in str(e)
+    else:
+        raise AssertionError("重复 eid 应当失败")
+    try:
+        s.push(extra[1], [Lock(eid=extra[1].eid, fields={"string": 99})])
+    except Stage2Infeasible as e:
+        assert e.conflicts and e.conflicts[0].eid == extra[1].eid
+    else:
+        raise AssertionError("不可行 lock 应当失败")
+    assert s.size == len(result.events) and s.flush() == before
+    try:
+        so.StreamingTop1(weights=Weights(), lag=1).flush()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("空会话 flush 应当失败")
+
+    print(f"[OK] stage2 stream: flush equals optimize_topk(k=1) on {checked} runs; per-event work independent of length")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+stage2 局部窗口重优化（Window）的回归测试。
+
+覆盖：
+- 窗口覆盖全曲且不固定边界：与全曲求解完全一致
+- 固定左右边界为全曲最优解的选择：窗口最优解与全曲最优解在窗口内逐事件一致（最优子结构）
+- 边界未被收窄到唯一候选、窗口越界/倒置：必须失败
+
+用法：
+  python scripts/test_stage2_window.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXAMPLE = REPO_ROOT / "docs/data/examples/guqin_jzp_profile_v0.3_mary_had_a_little_lamb_input.musicxml"
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def _stage1_events(path: Path, *, include_harmonics: bool) -> list[dict[str, Any]]:
+    from guqinauto_backend.api.serializers import serialize_stage1_candidate
+    from guqinauto_backend.domain.musicxml_profile_v0_2 import build_score_view
+    from guqinauto_backend.domain.pitch import MusicXmlPitch
+    from guqinauto_backend.engines.position_engine import PositionEngine, PositionEngineOptions
+    from guqinauto_backend.infra.workspace import ProjectTuning
+
+    view = build_score_view(project_id="TEST", revision="R000001", musicxml_bytes=path.read_bytes())
+    engine = PositionEngine(open_pitches_midi=list(ProjectTuning.default_demo().open_pitches_midi))
+    opt = PositionEngineOptions(include_harmonics=include_harmonics)
+    events: list[dict[str, Any]] = []
+    for m in view.measures:
+        for e in m.events:
+            targets: list[dict[str, Any]] = []
+            for n in e.staff1_notes:
+                p = n["pitch"]
+                midi = MusicXmlPitch(step=p["step"], alter=int(p.get("alter", 0)), octave=int(p["octave"])).to_midi()
+                cands = engine.enumerate_candidates(pitch_midi=midi, options=opt)
+                targets.append({"slot": n.get("slot"), "candidates": [serialize_stage1_candidate(c) for c in cands]})
+            events.append({"eid": e.eid, "targets": targets})
+    return events
+
+
+def _pin(choice: dict[str, Any]) -> dict[str, Any]:
+    return {"string": choice["string"], "technique": choice["technique"], "pos_ratio": choice["pos"]["pos_ratio"] or 0.0}
+
+
+def _expect_fail(fn: Any, what: str) -> None:
+    try:
+        fn()
+    except ValueError:
+        return
+    raise AssertionError(f"期望失败：{what}")
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.engines.stage2_optimizer import Weights, Window, candidate_graph_from_stage1, optimize_topk
+
+    graph = candidate_graph_from_stage1(_stage1_events(EXAMPLE, include_harmonics=True))
+    eids = [ev.eid for ev in graph.events]
+    assert len(eids) >= 8, len(eids)
+    w = Weights()
+
+    full = optimize_topk(graph=graph, k=5, locks=[], weights=w)
+    whole = optimize_topk(graph=graph, k=5, locks=[], weights=w, window=Window(from_eid=eids[0], to_eid=eids[-1]))
+    assert [(s.total_cost, s.assignments) for s in full] == [(s.total_cost, s.assignments) for s in whole]
+
+    best = full[0].assignments
+    lo, hi = 3, 6
+    win = Window(
+        from_eid=eids[lo],
+        to_eid=eids[hi],
+        left=(_pin(best[lo - 1]["choice"]),),
+        right=(_pin(best[hi + 1]["choice"]),),
+    )
+    sols = optimize_topk(graph=graph, k=3, locks=[], weights=w, window=win)
+    assert [a["eid"] for a in sols[0].assignments] == eids[lo : hi + 1]
+    assert sols[0].assignments == best[lo : hi + 1], "固定边界后窗口最优解应与全曲最优解一致"
+    assert sols[0].explain["window"]["left_eid"] == eids[lo - 1]
+    assert sols[0].explain["window"]["right_eid"] == eids[hi + 1]
+    assert all(a.total_cost <= b.total_cost for a, b in zip(sols, sols[1:]))
+
+    _expect_fail(
+        lambda: optimize_topk(graph=graph, k=1, locks=[], weights=w, window=Window(from_eid=eids[lo], to_eid=eids[hi], left=())),
+        "左边界未固定到唯一候选",
+    )
+    _expect_fail(
+        lambda: optimize_topk(graph=graph, k=1, locks=[], weights=w, window=Window(from_eid=eids[hi], to_eid=eids[lo])),
+        "窗口倒置",
+    )
+    _expect_fail(
+        lambda: optimize_topk(graph=graph, k=1, locks=[], weights=w, window=Window(from_eid=eids[0], to_eid=eids[1], left=())),
+        "首事件左侧无边界",
+    )
+    _expect_fail(
+        lambda: optimize_topk(graph=graph, k=1, locks=[], weights=w, window=Window(from_eid="NOPE", to_eid=eids[1])),
+        "未知 eid",
+    )
+
+    print(f"[OK] stage2 window: {len(eids)} events, window [{lo},{hi}] matches full solve")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+进程内缓存（TtlLruCache）最小回归测试。
+
+覆盖：
+- LRU 淘汰顺序（最近访问的条目保留）
+- TTL 过期（用可控时钟，不 sleep）
+- 总权重上限（例如按字节数）与“单条超限不缓存”
+- stats() 的命中/未命中/淘汰计数（/metrics 直接暴露这些数）
+
+用法：
+  python scripts/test_ttl_lru_cache.py
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _ensure_backend_src_on_path(repo_root: Path) -> None:
+    src_dir = repo_root / "backend" / "src"
+    if not src_dir.exists():
+        raise RuntimeError(f"找不到 backend/src：{src_dir}")
+    sys.path.insert(0, str(src_dir))
+
+
+def main() -> None:
+    _ensure_backend_src_on_path(REPO_ROOT)
+
+    from guqinauto_backend.utils.ttl_lru import TtlLruCache
+
+    # LRU
+    c: TtlLruCache[str, int] = TtlLruCache(max_entries=2)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1
+    c.put("c", 3)  # 淘汰最久未访问的 b
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    st = c.stats()
+    assert st["evictions"] == 1 and st["hits"] == 3 and st["misses"] == 1, st
+
+    # TTL
+    now = [100.0]
+    t: TtlLruCache[str, str] = TtlLruCache(max_entries=8, ttl_seconds=10.0, clock=lambda: now[0])
+    t.put("k", "v")
+    now[0] += 9.9
+    assert t.get("k") == "v"
+    now[0] += 0.2
+    assert t.get("k") is None
+    assert t.stats()["expirations"] == 1
+
+    # 权重上限
+    w: TtlLruCache[str, bytes] = TtlLruCache(max_entries=100, max_weight=10, weigh=len)
+    w.put("x", b"12345")
+    w.put("y", b"123456")  # 总权重 11 > 10：淘汰 x
+    assert w.get("x") is None and w.get("y") == b"123456"
+    w.put("huge", b"0" * 11)  # 单条超限：不缓存，也不挤掉已有条目
+    assert w.get("huge") is None and w.get("y") == b"123456"
+    assert w.stats()["weight"] == 6
+
+    print("[OK] ttl_lru cache: lru/ttl/weight/stats")
+
+
+if __name__ == "__main__":
+    main()